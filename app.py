@@ -3,7 +3,7 @@ import streamlit as st
 import time
 import base64
 import json
-import requests
+import httpx
 import tempfile
 import logging
 import traceback
@@ -15,8 +15,9 @@ from datetime import datetime
 from pathlib import Path
 from io import BytesIO
 from PIL import Image
-from openai import OpenAI
 import uuid
+from collections.abc import Mapping
+from contextlib import nullcontext
 import streamlit.components.v1 as components
 
 # Importar configuración predefinida
@@ -32,6 +33,55 @@ except ImportError:
 # Importar módulo de selección de expertos
 import expert_selection
 
+# Importar módulo de ejecución de runs del asistente
+import assistant_runs
+
+# Importar módulo de clientes OpenAI compartidos
+import openai_clients
+
+# Importar módulo de contexto de documentos
+import document_context
+
+# Importar módulo de recuperación de pasajes
+import document_retrieval
+
+# Importar módulo de almacenamiento de documentos
+import document_store
+
+# Importar módulo de caché de resultados OCR
+import ocr_cache
+
+# Importar módulos de ingesta paralela y preparación de imágenes
+import document_ingestion
+import image_preprocessing
+
+# Importar módulo de procesamiento de PDFs por rangos de páginas
+import pdf_pages
+
+# Importar módulos de acceso a la API de Mistral y control de tasa
+import mistral_client
+import rate_limit
+
+# Importar módulo de artefactos de depuración del OCR
+import debug_artifacts
+
+# Importar módulo de OCR por mosaicos de imágenes grandes
+import image_tiling
+
+# Importar módulo de caché de exportaciones de conversaciones
+import export_cache
+
+# Importar registro de motores PDF (se detectan una vez por proceso, en segundo plano)
+import pdf_backends
+
+pdf_backends.detect_in_background()
+
+# Importar motores de exportación a PDF y sus procesos de renderizado
+import pdf_export
+import render_pool
+
+render_pool.warm_in_background()
+
 # ==============================================
 # APPLICATION IDENTITY DICTIONARY
 # ==============================================
@@ -527,12 +577,17 @@ st.markdown("""
 
 
 # Decorador para manejo de errores con retries
-def handle_error(max_retries=2):
+def handle_error(max_retries=2, error_result=None):
     """
     Decorador avanzado para manejo de errores con capacidad de reintento
 
     Parámetros:
         max_retries: Número máximo de reintentos ante fallos
+        error_result: Función opcional (mensaje) que construye el valor a
+                      devolver tras el último fallo. Se usa en las funciones
+                      que corren en hilos de trabajo, donde st.error no tiene
+                      contexto de script: el error se devuelve y el hilo
+                      principal lo muestra
     """
 
     def decorator(func):
@@ -556,6 +611,8 @@ def handle_error(max_retries=2):
                         logging.error(
                             f"Error final después de {max_retries+1} intentos: {traceback.format_exc()}"
                         )
+                        if error_result is not None:
+                            return error_result(error_msg)
                         st.error(error_msg)
                         break
 
@@ -603,8 +660,8 @@ def rerun_app():
 @handle_error(max_retries=1)
 def create_openai_client(api_key):
     """
-    Crea un cliente OpenAI con encabezados compatibles con Assistants API v2
-    y verificación de conectividad
+    Obtiene el cliente OpenAI compartido con encabezados compatibles con
+    Assistants API v2 y verificación de conectividad con TTL
     """
     try:
         # Verificar que la clave API no sea un placeholder
@@ -622,18 +679,14 @@ def create_openai_client(api_key):
         # Mostrar información de depuración (sin exponer la clave completa)
         logging.info(f"Intentando crear cliente OpenAI con clave: {api_key[:7]}...{api_key[-4:]}")
 
-        client = OpenAI(
-            api_key=api_key, default_headers={"OpenAI-Beta": "assistants=v2"}
-        )
+        # Cliente compartido por el proceso con pool de conexiones persistentes
+        client = openai_clients.get_openai_client(api_key)
 
-        # Verificar conectividad con una llamada simple
+        # Verificar conectividad (solo cuando vence la verificación previa)
         try:
-            models = client.models.list()
-            if not models:
-                raise Exception("No se pudo obtener la lista de modelos")
+            model_ids = openai_clients.check_connectivity(api_key)
 
             # Mostrar los modelos disponibles para depuración
-            model_ids = [model.id for model in models.data[:5]]
             logging.info(f"Modelos disponibles (primeros 5): {model_ids}")
 
             logging.info("Cliente OpenAI inicializado correctamente")
@@ -656,1415 +709,71 @@ def create_openai_client(api_key):
 
 
 # Sistema multicapa para exportación de conversaciones
-def _export_chat_to_pdf_streamlit_cloud(messages):
-    """
-    Método optimizado para Streamlit Cloud usando pdfkit.
-    Esta implementación es compatible con el entorno de Streamlit Cloud
-    y no requiere dependencias del sistema.
+def start_pdf_export(messages):
     """
-    try:
-        import pdfkit
-        import markdown2
-        import tempfile
-        from pygments import highlight
-        from pygments.lexers import get_lexer_by_name, guess_lexer
-        from pygments.formatters import HtmlFormatter
-        import re
-
-        # Generar el contenido Markdown
-        md_content = export_chat_to_markdown(messages)
-
-        # Preprocesar el contenido Markdown para manejar casos especiales
-
-        # 1. Preservar diagramas ASCII
-        ascii_diagrams = []
-
-        def preserve_ascii_diagram(match):
-            diagram = match.group(1)
-            ascii_diagrams.append(diagram)
-            return f"\n\n```ascii-diagram-{len(ascii_diagrams)-1}\n{diagram}\n```\n\n"
-
-        # Detectar diagramas ASCII (bloques con caracteres como │, ┌, └, ┐, ┘, ─, etc.)
-        ascii_pattern = r"```(?:ascii|diagram)?\n((?:[^\n]*?[│┌└┐┘─┬┴┼┤├]+[^\n]*\n)+)```"
-        md_content = re.sub(ascii_pattern, preserve_ascii_diagram, md_content)
-
-        # 2. Manejar bloques de código con resaltado de sintaxis personalizado
-        code_blocks = []
-
-        def process_code_block(match):
-            language = match.group(1) or ""
-            code = match.group(2)
-
-            # Guardar el bloque de código para procesamiento posterior
-            code_blocks.append((language.strip(), code))
-            return f"\n\n{{code-block-{len(code_blocks)-1}}}\n\n"
-
-        # Extraer bloques de código
-        md_content = re.sub(r"```([a-zA-Z0-9_+-]*)\n(.*?)```", process_code_block, md_content, flags=re.DOTALL)
-
-        # 3. Convertir Markdown a HTML con markdown2 (más compatible con Streamlit Cloud)
-        html_content = markdown2.markdown(
-            md_content,
-            extras=[
-                "tables",
-                "fenced-code-blocks",
-                "code-friendly",
-                "toc",
-                "break-on-newline",
-                "smarty-pants",
-                "cuddled-lists",
-                "footnotes"
-            ]
-        )
-
-        # 4. Reemplazar los marcadores de código con HTML resaltado
-        for i, (language, code) in enumerate(code_blocks):
-            try:
-                # Manejar diagramas ASCII preservados
-                if language.startswith("ascii-diagram-"):
-                    idx = int(language.split("-")[-1])
-                    html_code = f'<pre class="ascii-diagram"><code>{ascii_diagrams[idx]}</code></pre>'
-                else:
-                    # Resaltar código con Pygments
-                    if language and language != "text":
-                        try:
-                            lexer = get_lexer_by_name(language)
-                        except:
-                            lexer = guess_lexer(code)
-                    else:
-                        lexer = guess_lexer(code)
-
-                    formatter = HtmlFormatter(style='default', cssclass='codehilite')
-                    html_code = highlight(code, lexer, formatter)
-            except Exception as e:
-                # Si falla el resaltado, usar un bloque de código simple
-                html_code = f'<pre><code>{code}</code></pre>'
-
-            html_content = html_content.replace(f"{{code-block-{i}}}", html_code)
-
-        # 5. Añadir estilos CSS avanzados para mejorar la apariencia
-        css_styles = """
-        body {
-            font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif;
-            line-height: 1.6;
-            font-size: 11pt;
-            color: #333;
-            max-width: 100%;
-            margin: 2cm;
-            overflow-wrap: break-word;
-        }
-
-        h1, h2, h3, h4, h5, h6 {
-            font-weight: 600;
-            margin-top: 24px;
-            margin-bottom: 16px;
-            line-height: 1.25;
-        }
-
-        h1 {
-            font-size: 2em;
-            padding-bottom: 0.3em;
-            border-bottom: 1px solid #eaecef;
-            color: #24292e;
-        }
-
-        h2 {
-            font-size: 1.5em;
-            padding-bottom: 0.3em;
-            border-bottom: 1px solid #eaecef;
-            color: #24292e;
-        }
-
-        h3 {
-            font-size: 1.25em;
-            color: #24292e;
-        }
-
-        h4 {
-            font-size: 1em;
-            color: #24292e;
-        }
-
-        p, ul, ol, dl, table, pre {
-            margin-top: 0;
-            margin-bottom: 16px;
-        }
-
-        ul, ol {
-            padding-left: 2em;
-        }
-
-        li + li {
-            margin-top: 0.25em;
-        }
-
-        a {
-            color: #0366d6;
-            text-decoration: none;
-        }
-
-        table {
-            border-spacing: 0;
-            border-collapse: collapse;
-            width: 100%;
-            overflow: auto;
-            margin-bottom: 16px;
-        }
-
-        table th {
-            font-weight: 600;
-            padding: 6px 13px;
-            border: 1px solid #dfe2e5;
-            background-color: #f6f8fa;
-        }
-
-        table td {
-            padding: 6px 13px;
-            border: 1px solid #dfe2e5;
-        }
-
-        table tr:nth-child(2n) {
-            background-color: #f6f8fa;
-        }
-
-        img {
-            max-width: 100%;
-            height: auto;
-            box-sizing: content-box;
-            background-color: #fff;
-        }
-
-        code {
-            font-family: "SFMono-Regular", Consolas, "Liberation Mono", Menlo, monospace;
-            padding: 0.2em 0.4em;
-            margin: 0;
-            font-size: 85%;
-            background-color: rgba(27, 31, 35, 0.05);
-            border-radius: 3px;
-        }
-
-        pre {
-            font-family: "SFMono-Regular", Consolas, "Liberation Mono", Menlo, monospace;
-            word-wrap: normal;
-            padding: 16px;
-            overflow: auto;
-            font-size: 85%;
-            line-height: 1.45;
-            background-color: #f6f8fa;
-            border-radius: 3px;
-            margin-bottom: 16px;
-        }
-
-        pre code {
-            background-color: transparent;
-            padding: 0;
-            margin: 0;
-            font-size: inherit;
-            word-break: normal;
-            white-space: pre;
-            overflow: visible;
-        }
-
-        .codehilite {
-            background-color: #f6f8fa;
-            border-radius: 3px;
-            padding: 16px;
-            overflow: auto;
-        }
-
-        .codehilite .hll { background-color: #ffffcc }
-        .codehilite .c { color: #999988; font-style: italic } /* Comment */
-        .codehilite .err { color: #a61717; background-color: #e3d2d2 } /* Error */
-        .codehilite .k { color: #000000; font-weight: bold } /* Keyword */
-        .codehilite .o { color: #000000; font-weight: bold } /* Operator */
-        .codehilite .cm { color: #999988; font-style: italic } /* Comment.Multiline */
-        .codehilite .cp { color: #999999; font-weight: bold; font-style: italic } /* Comment.Preproc */
-        .codehilite .c1 { color: #999988; font-style: italic } /* Comment.Single */
-        .codehilite .cs { color: #999999; font-weight: bold; font-style: italic } /* Comment.Special */
-        .codehilite .gd { color: #000000; background-color: #ffdddd } /* Generic.Deleted */
-        .codehilite .ge { color: #000000; font-style: italic } /* Generic.Emph */
-        .codehilite .gr { color: #aa0000 } /* Generic.Error */
-        .codehilite .gh { color: #999999 } /* Generic.Heading */
-        .codehilite .gi { color: #000000; background-color: #ddffdd } /* Generic.Inserted */
-        .codehilite .go { color: #888888 } /* Generic.Output */
-        .codehilite .gp { color: #555555 } /* Generic.Prompt */
-        .codehilite .gs { font-weight: bold } /* Generic.Strong */
-        .codehilite .gu { color: #aaaaaa } /* Generic.Subheading */
-        .codehilite .gt { color: #aa0000 } /* Generic.Traceback */
-        .codehilite .kc { color: #000000; font-weight: bold } /* Keyword.Constant */
-        .codehilite .kd { color: #000000; font-weight: bold } /* Keyword.Declaration */
-        .codehilite .kn { color: #000000; font-weight: bold } /* Keyword.Namespace */
-        .codehilite .kp { color: #000000; font-weight: bold } /* Keyword.Pseudo */
-        .codehilite .kr { color: #000000; font-weight: bold } /* Keyword.Reserved */
-        .codehilite .kt { color: #445588; font-weight: bold } /* Keyword.Type */
-        .codehilite .m { color: #009999 } /* Literal.Number */
-        .codehilite .s { color: #d01040 } /* Literal.String */
-        .codehilite .na { color: #008080 } /* Name.Attribute */
-        .codehilite .nb { color: #0086B3 } /* Name.Builtin */
-        .codehilite .nc { color: #445588; font-weight: bold } /* Name.Class */
-        .codehilite .no { color: #008080 } /* Name.Constant */
-        .codehilite .nd { color: #3c5d5d; font-weight: bold } /* Name.Decorator */
-        .codehilite .ni { color: #800080 } /* Name.Entity */
-        .codehilite .ne { color: #990000; font-weight: bold } /* Name.Exception */
-        .codehilite .nf { color: #990000; font-weight: bold } /* Name.Function */
-        .codehilite .nl { color: #990000; font-weight: bold } /* Name.Label */
-        .codehilite .nn { color: #555555 } /* Name.Namespace */
-        .codehilite .nt { color: #000080 } /* Name.Tag */
-        .codehilite .nv { color: #008080 } /* Name.Variable */
-        .codehilite .ow { color: #000000; font-weight: bold } /* Operator.Word */
-        .codehilite .w { color: #bbbbbb } /* Text.Whitespace */
-        .codehilite .mf { color: #009999 } /* Literal.Number.Float */
-        .codehilite .mh { color: #009999 } /* Literal.Number.Hex */
-        .codehilite .mi { color: #009999 } /* Literal.Number.Integer */
-        .codehilite .mo { color: #009999 } /* Literal.Number.Oct */
-        .codehilite .sb { color: #d01040 } /* Literal.String.Backtick */
-        .codehilite .sc { color: #d01040 } /* Literal.String.Char */
-        .codehilite .sd { color: #d01040 } /* Literal.String.Doc */
-        .codehilite .s2 { color: #d01040 } /* Literal.String.Double */
-        .codehilite .se { color: #d01040 } /* Literal.String.Escape */
-        .codehilite .sh { color: #d01040 } /* Literal.String.Heredoc */
-        .codehilite .si { color: #d01040 } /* Literal.String.Interpol */
-        .codehilite .sx { color: #d01040 } /* Literal.String.Other */
-        .codehilite .sr { color: #009926 } /* Literal.String.Regex */
-        .codehilite .s1 { color: #d01040 } /* Literal.String.Single */
-        .codehilite .ss { color: #990073 } /* Literal.String.Symbol */
-        .codehilite .bp { color: #999999 } /* Name.Builtin.Pseudo */
-        .codehilite .vc { color: #008080 } /* Name.Variable.Class */
-        .codehilite .vg { color: #008080 } /* Name.Variable.Global */
-        .codehilite .vi { color: #008080 } /* Name.Variable.Instance */
-        .codehilite .il { color: #009999 } /* Literal.Number.Integer.Long */
-
-        .ascii-diagram {
-            font-family: "SFMono-Regular", Consolas, "Liberation Mono", Menlo, monospace;
-            line-height: 1.2;
-            white-space: pre;
-            background-color: #f6f8fa;
-            padding: 16px;
-            border-radius: 3px;
-        }
-
-        blockquote {
-            padding: 0 1em;
-            color: #6a737d;
-            border-left: 0.25em solid #dfe2e5;
-            margin: 0 0 16px 0;
-        }
-
-        hr {
-            height: 0.25em;
-            padding: 0;
-            margin: 24px 0;
-            background-color: #e1e4e8;
-            border: 0;
-        }
-
-        .footnote {
-            font-size: 0.8em;
-            color: #6a737d;
-        }
-
-        /* Estilos específicos para la conversación */
-        .message {
-            margin-bottom: 20px;
-            padding: 10px;
-            border-radius: 5px;
-        }
-
-        .user-message {
-            background-color: #f1f8ff;
-            border-left: 4px solid #0366d6;
-        }
-
-        .assistant-message {
-            background-color: #f6f8fa;
-            border-left: 4px solid #28a745;
-        }
-
-        .message-header {
-            font-weight: bold;
-            margin-bottom: 5px;
-            color: #24292e;
-        }
-
-        .timestamp {
-            font-size: 0.8em;
-            color: #6a737d;
-        }
-        """
-
-        # 6. Crear HTML completo con estilos
-        full_html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>{APP_IDENTITY["conversation_export_name"]}</title>
-            <style>
-                {css_styles}
-            </style>
-        </head>
-        <body>
-            <h1>{APP_IDENTITY["conversation_export_name"]}</h1>
-            <p class="timestamp">Exportado el {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}</p>
-            <hr>
-            {html_content}
-        </body>
-        </html>
-        """
-
-        # 7. Crear un archivo temporal para el HTML
-        with tempfile.NamedTemporaryFile(suffix='.html', delete=False) as html_file:
-            html_file.write(full_html.encode('utf-8'))
-            html_path = html_file.name
-
-        # 8. Configurar opciones para pdfkit
-        options = {
-            'page-size': 'A4',
-            'margin-top': '2cm',
-            'margin-right': '2cm',
-            'margin-bottom': '2cm',
-            'margin-left': '2cm',
-            'encoding': 'UTF-8',
-            'no-outline': None,
-            'enable-local-file-access': None
-        }
-
-        # 9. Crear un archivo temporal para el PDF
-        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as pdf_file:
-            pdf_path = pdf_file.name
-
-        # 10. Convertir HTML a PDF usando pdfkit o métodos alternativos
-        pdf_generated = False
-
-        # Método 1: Intentar usar pdfkit con wkhtmltopdf del sistema
-        try:
-            pdfkit.from_file(html_path, pdf_path, options=options)
-            pdf_generated = True
-            logging.info("PDF generado con pdfkit usando wkhtmltopdf del sistema")
-        except Exception as e:
-            logging.warning(f"Error al usar wkhtmltopdf del sistema: {str(e)}")
-
-            # Método 2: Intentar usar pdfkit con wkhtmltopdf en ubicaciones alternativas
-            try:
-                import os
-                import platform
-
-                # Diferentes ubicaciones según el sistema operativo
-                wkhtmltopdf_path = None
-                system = platform.system().lower()
-
-                if system == 'darwin':  # macOS
-                    possible_paths = [
-                        '/usr/local/bin/wkhtmltopdf',
-                        '/opt/homebrew/bin/wkhtmltopdf',
-                        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bin', 'wkhtmltopdf')
-                    ]
-                elif system == 'linux':
-                    possible_paths = [
-                        '/usr/bin/wkhtmltopdf',
-                        '/usr/local/bin/wkhtmltopdf',
-                        '/app/.heroku/python/bin/wkhtmltopdf',  # Streamlit Cloud
-                        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bin', 'wkhtmltopdf')
-                    ]
-                else:  # Windows
-                    possible_paths = [
-                        'C:\\Program Files\\wkhtmltopdf\\bin\\wkhtmltopdf.exe',
-                        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bin', 'wkhtmltopdf.exe')
-                    ]
-
-                # Probar cada ubicación
-                for path in possible_paths:
-                    if os.path.exists(path):
-                        wkhtmltopdf_path = path
-                        logging.info(f"wkhtmltopdf encontrado en: {path}")
-                        break
-
-                if wkhtmltopdf_path:
-                    config = pdfkit.configuration(wkhtmltopdf=wkhtmltopdf_path)
-                    pdfkit.from_file(html_path, pdf_path, options=options, configuration=config)
-                    pdf_generated = True
-                    logging.info(f"PDF generado con pdfkit usando wkhtmltopdf en: {wkhtmltopdf_path}")
-                else:
-                    logging.warning("No se encontró wkhtmltopdf en ninguna ubicación conocida")
-            except Exception as e2:
-                logging.warning(f"Error al usar wkhtmltopdf alternativo: {str(e2)}")
-
-            # Método 3: Usar un método alternativo si pdfkit falló
-            if not pdf_generated:
-                try:
-                    # Intentar usar FPDF para convertir el HTML a PDF
-                    from fpdf import FPDF
-                    import html2text
-
-                    # Convertir HTML a texto plano
-                    h = html2text.HTML2Text()
-                    h.ignore_links = False
-                    text_content = h.handle(full_html)
-
-                    # Crear PDF con FPDF
-                    pdf = FPDF()
-                    pdf.add_page()
-                    pdf.set_font("Arial", size=12)
-
-                    # Dividir el texto en líneas y añadirlas al PDF
-                    for line in text_content.split('\n'):
-                        if line.strip():
-                            pdf.multi_cell(0, 10, line)
-
-                    # Guardar el PDF
-                    pdf.output(pdf_path)
-                    pdf_generated = True
-                    logging.info("PDF generado con FPDF como alternativa")
-                except Exception as e3:
-                    logging.warning(f"Error al usar FPDF como alternativa: {str(e3)}")
-
-                    # Si todo lo anterior falló, lanzar la excepción original
-                    if not pdf_generated:
-                        raise e
-
-        # 11. Leer el contenido del PDF
-        with open(pdf_path, 'rb') as f:
-            pdf_content = f.read()
-
-        # 12. Limpiar archivos temporales
-        try:
-            os.unlink(html_path)
-            os.unlink(pdf_path)
-        except Exception as e:
-            logging.warning(f"Error al eliminar archivos temporales: {str(e)}")
-
-        return pdf_content, "pdf"
-
-    except Exception as e:
-        logging.error(f"Error en la conversión de Markdown a PDF con pdfkit: {str(e)}")
-        raise e
-
-def export_chat_to_pdf(messages):
-    """
-    Sistema multicapa para exportación de conversaciones a PDF.
-    Implementa múltiples estrategias de generación con manejo de fallos.
-
-    Ahora con soporte para conversión de Markdown a PDF usando MDPDFusion.
-    """
-    # Importar módulos necesarios
-    import os
-    import tempfile
-
-    # Detectar si estamos en Streamlit Cloud
-    is_streamlit_cloud = False
-    if os.environ.get('STREAMLIT_SHARING_MODE') == 'streamlit_cloud':
-        is_streamlit_cloud = True
-        logging.info("Detectado entorno Streamlit Cloud")
-
-    # Verificar si MDPDFusion está disponible
-    mdpdfusion_available = False
-    try:
-        from mdpdfusion import convert_md_to_pdf
-        mdpdfusion_available = True
-        logging.info("MDPDFusion disponible para exportación a PDF")
-    except ImportError:
-        logging.info("MDPDFusion no disponible, se usarán métodos alternativos")
-
-    # Verificar dependencias necesarias para los diferentes métodos
-    pdfkit_available = False
-    try:
-        import pdfkit
-        pdfkit_available = True
-        logging.info("pdfkit disponible para exportación a PDF")
-    except ImportError:
-        logging.info("pdfkit no disponible")
-
-    markdown2_available = False
-    try:
-        import markdown2
-        markdown2_available = True
-        logging.info("markdown2 disponible para exportación a PDF")
-    except ImportError:
-        logging.info("markdown2 no disponible")
-
-    # Método MDPDFusion (primera opción)
-    if mdpdfusion_available:
-        try:
-            logging.info("Usando método MDPDFusion para exportación a PDF")
-
-            # Generar el contenido Markdown
-            md_content = export_chat_to_markdown(messages)
-
-            # Guardar el contenido Markdown en un archivo temporal
-            with tempfile.NamedTemporaryFile(suffix='.md', delete=False) as md_file:
-                md_file.write(md_content.encode('utf-8'))
-                md_path = md_file.name
-
-            # Crear un directorio temporal para el PDF
-            temp_dir = tempfile.mkdtemp()
-
-            # Convertir el archivo Markdown a PDF
-            output_pdf = convert_md_to_pdf(md_path, temp_dir)
-
-            # Leer el contenido del PDF
-            if output_pdf and os.path.exists(output_pdf):
-                with open(output_pdf, 'rb') as pdf_file:
-                    pdf_content = pdf_file.read()
-
-                # Limpiar archivos temporales
-                os.unlink(md_path)
-                os.unlink(output_pdf)
-                os.rmdir(temp_dir)
-
-                logging.info("Conversión exitosa con MDPDFusion")
-                return pdf_content, "pdf"
-            else:
-                logging.warning("MDPDFusion no generó un archivo PDF válido")
-        except Exception as e:
-            logging.warning(f"Método MDPDFusion falló: {str(e)}")
-
-    # Método optimizado para Streamlit Cloud
-    if is_streamlit_cloud and pdfkit_available and markdown2_available:
-        try:
-            logging.info("Usando método pdfkit optimizado para Streamlit Cloud")
-            return _export_chat_to_pdf_streamlit_cloud(messages)
-        except Exception as e:
-            logging.warning(f"Método pdfkit para Streamlit Cloud falló: {str(e)}")
+    Inicia la exportación a PDF en los procesos de renderizado sin esperar
+    su resultado. El Markdown se genera aquí porque depende del estado de
+    la sesión; el renderizado (el trabajo lento) ocurre fuera del hilo del
+    script, con el plazo de RENDER_DEADLINE_SECONDS.
 
-    # Intentar con pdfkit como método principal en entorno local
-    if pdfkit_available and markdown2_available:
-        try:
-            logging.info("Intentando método pdfkit como método principal")
-            return _export_chat_to_pdf_streamlit_cloud(messages)
-        except Exception as e:
-            logging.warning(f"Método pdfkit falló: {str(e)}")
+    Con PDF_EXPORT_RACE activo, los mejores motores disponibles compiten en
+    paralelo y gana el primero que genera un PDF con la calidad mínima. Con
+    PDF_FRAGMENTS activo, los mensajes ya renderizados en exportaciones
+    anteriores se reutilizan desde la caché de fragmentos.
 
-    # Métodos alternativos que no dependen de bibliotecas del sistema
-    try:
-        # Método 1: FPDF con manejo mejorado
-        logging.info("Intentando método FPDF para exportación a PDF")
-        return _export_chat_to_pdf_primary(messages)
-    except Exception as e1:
-        logging.warning(f"Método FPDF falló: {str(e1)}")
-        try:
-            # Método 2: ReportLab como alternativa
-            logging.info("Intentando método ReportLab para exportación a PDF")
-            return _export_chat_to_pdf_secondary(messages)
-        except Exception as e2:
-            logging.warning(f"Método ReportLab falló: {str(e2)}")
-            try:
-                # Método 3: Conversión simple como último recurso
-                logging.info("Intentando método de respaldo simple para exportación a PDF")
-                return _export_chat_to_pdf_fallback(messages)
-            except Exception as e3:
-                logging.error(f"Todos los métodos de exportación a PDF fallaron: {str(e3)}")
-                # Último recurso: Devolver contenido en markdown codificado
-                logging.info("Fallback a exportación Markdown")
-                md_content = export_chat_to_markdown(messages)
-                st.warning("No fue posible generar un PDF. Se ha creado un archivo markdown en su lugar.")
-                return base64.b64encode(md_content.encode()).decode(), "markdown"
-
-
-def _export_chat_to_pdf_from_markdown(messages):
-    """
-    Método avanzado basado en WeasyPrint para convertir Markdown a PDF.
-    Utiliza la técnica del proyecto MDPDFusion con soporte mejorado para:
-    - Sintaxis Markdown completa
-    - Bloques de código con resaltado de sintaxis
-    - Tablas con formato visual adecuado
-    - Enlaces internos funcionales
-    - Imágenes con ajuste automático
-    - Diagramas ASCII preservados
+    Retorno:
+        render_pool.RenderJob o render_pool.RaceJob: Manejador del renderizado
     """
-    try:
-        # Importar las bibliotecas necesarias
-        import os
-        import tempfile
-        import re
-        import base64
-        import markdown
-
-        # Intentar importar WeasyPrint y sus dependencias
-        try:
-            from weasyprint import HTML, CSS
-            from weasyprint.text.fonts import FontConfiguration
-        except ImportError:
-            logging.warning("WeasyPrint no está disponible. No se puede usar el método avanzado de conversión.")
-            raise
-
-        # Intentar importar Pygments para resaltado de sintaxis
-        try:
-            from pygments import highlight
-            from pygments.lexers import get_lexer_by_name, guess_lexer
-            from pygments.formatters import HtmlFormatter
-        except ImportError:
-            logging.warning("Pygments no está disponible. El resaltado de sintaxis será limitado.")
-            raise
-
-        # Generar el contenido Markdown
-        md_content = export_chat_to_markdown(messages)
-
-        # Preprocesar el contenido Markdown para manejar casos especiales
-
-        # 1. Preservar diagramas ASCII
-        ascii_diagrams = []
-
-        def preserve_ascii_diagram(match):
-            diagram = match.group(1)
-            ascii_diagrams.append(diagram)
-            return f"\n\n```ascii-diagram-{len(ascii_diagrams)-1}\n{diagram}\n```\n\n"
-
-        # Detectar diagramas ASCII (bloques con caracteres como │, ┌, └, ┐, ┘, ─, etc.)
-        ascii_pattern = r"```(?:ascii|diagram)?\n((?:[^\n]*?[│┌└┐┘─┬┴┼┤├]+[^\n]*\n)+)```"
-        md_content = re.sub(ascii_pattern, preserve_ascii_diagram, md_content)
-
-        # 2. Manejar bloques de código con resaltado de sintaxis personalizado
-        code_blocks = []
-
-        def process_code_block(match):
-            language = match.group(1) or ""
-            code = match.group(2)
-
-            # Guardar el bloque de código para procesamiento posterior
-            code_blocks.append((language.strip(), code))
-            return f"\n\n{{code-block-{len(code_blocks)-1}}}\n\n"
-
-        # Extraer bloques de código
-        md_content = re.sub(r"```([a-zA-Z0-9_+-]*)\n(.*?)```", process_code_block, md_content, flags=re.DOTALL)
-
-        # 3. Convertir Markdown a HTML con extensiones avanzadas
-        # Definir las extensiones básicas que siempre están disponibles
-        extensions = [
-            'markdown.extensions.tables',
-            'markdown.extensions.fenced_code',
-            'markdown.extensions.codehilite',
-            'markdown.extensions.toc',
-            'markdown.extensions.nl2br'
-        ]
-
-        # Intentar añadir extensiones adicionales si están disponibles
-        try:
-            import importlib
-            additional_extensions = [
-                'markdown.extensions.sane_lists',
-                'markdown.extensions.smarty',
-                'markdown.extensions.attr_list',
-                'markdown.extensions.def_list',
-                'markdown.extensions.abbr',
-                'markdown.extensions.footnotes',
-                'markdown.extensions.md_in_html'
-            ]
-
-            # Verificar cada extensión antes de añadirla
-            for ext in additional_extensions:
-                try:
-                    importlib.import_module(ext)
-                    extensions.append(ext)
-                except ImportError:
-                    logging.warning(f"Extensión Markdown no disponible: {ext}")
-        except Exception as e:
-            logging.warning(f"Error al cargar extensiones adicionales de Markdown: {str(e)}")
-
-        # Convertir Markdown a HTML con las extensiones disponibles
-        html_content = markdown.markdown(
-            md_content,
-            extensions=extensions,
-            extension_configs={
-                'markdown.extensions.codehilite': {
-                    'linenums': False,
-                    'guess_lang': False
-                }
-            }
+    header, sections, footer = conversation_markdown_sections(messages)
+    markdown_text = header + "".join(sections) + footer
+    parts = (header, sections, footer)
+    identity = dict(APP_IDENTITY)
+    if pdf_export.race_enabled():
+        return render_pool.race_render(
+            pdf_export.race_candidates(messages, markdown_text, identity, parts=parts),
+            min_score=pdf_export.race_min_quality(),
         )
+    return render_pool.submit_render(pdf_export.render_pdf, messages, markdown_text, identity, parts)
 
-        # 4. Reemplazar los marcadores de código con HTML resaltado
-        for i, (language, code) in enumerate(code_blocks):
-            try:
-                # Manejar diagramas ASCII preservados
-                if language.startswith("ascii-diagram-"):
-                    idx = int(language.split("-")[-1])
-                    html_code = f'<pre class="ascii-diagram"><code>{ascii_diagrams[idx]}</code></pre>'
-                else:
-                    # Resaltar código con Pygments
-                    if language and language != "text":
-                        try:
-                            lexer = get_lexer_by_name(language)
-                        except:
-                            lexer = guess_lexer(code)
-                    else:
-                        lexer = guess_lexer(code)
-
-                    formatter = HtmlFormatter(style='default', cssclass='codehilite')
-                    html_code = highlight(code, lexer, formatter)
-            except Exception as e:
-                # Si falla el resaltado, usar un bloque de código simple
-                html_code = f'<pre><code>{code}</code></pre>'
-
-            html_content = html_content.replace(f"{{code-block-{i}}}", html_code)
-
-        # 5. Añadir estilos CSS avanzados para mejorar la apariencia
-        css_styles = """
-        @page {
-            margin: 2cm;
-            @top-right {
-                content: "Expert Nexus";
-                font-size: 9pt;
-                color: #888;
-            }
-            @bottom-center {
-                content: counter(page);
-                font-size: 9pt;
-            }
-        }
-
-        body {
-            font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif;
-            line-height: 1.6;
-            font-size: 11pt;
-            color: #333;
-            max-width: 100%;
-            overflow-wrap: break-word;
-        }
-
-        h1, h2, h3, h4, h5, h6 {
-            font-weight: 600;
-            margin-top: 24px;
-            margin-bottom: 16px;
-            line-height: 1.25;
-        }
-
-        h1 {
-            font-size: 2em;
-            padding-bottom: 0.3em;
-            border-bottom: 1px solid #eaecef;
-            color: #24292e;
-        }
-
-        h2 {
-            font-size: 1.5em;
-            padding-bottom: 0.3em;
-            border-bottom: 1px solid #eaecef;
-            color: #24292e;
-        }
-
-        h3 {
-            font-size: 1.25em;
-            color: #24292e;
-        }
-
-        h4 {
-            font-size: 1em;
-            color: #24292e;
-        }
-
-        p, ul, ol, dl, table, pre {
-            margin-top: 0;
-            margin-bottom: 16px;
-        }
-
-        ul, ol {
-            padding-left: 2em;
-        }
-
-        li + li {
-            margin-top: 0.25em;
-        }
-
-        a {
-            color: #0366d6;
-            text-decoration: none;
-        }
-
-        a:hover {
-            text-decoration: underline;
-        }
-
-        table {
-            border-spacing: 0;
-            border-collapse: collapse;
-            width: 100%;
-            overflow: auto;
-            margin-bottom: 16px;
-        }
-
-        table th {
-            font-weight: 600;
-            padding: 6px 13px;
-            border: 1px solid #dfe2e5;
-            background-color: #f6f8fa;
-        }
-
-        table td {
-            padding: 6px 13px;
-            border: 1px solid #dfe2e5;
-        }
-
-        table tr:nth-child(2n) {
-            background-color: #f6f8fa;
-        }
-
-        img {
-            max-width: 100%;
-            height: auto;
-            box-sizing: content-box;
-            background-color: #fff;
-        }
-
-        code {
-            font-family: "SFMono-Regular", Consolas, "Liberation Mono", Menlo, monospace;
-            padding: 0.2em 0.4em;
-            margin: 0;
-            font-size: 85%;
-            background-color: rgba(27, 31, 35, 0.05);
-            border-radius: 3px;
-        }
 
-        pre {
-            font-family: "SFMono-Regular", Consolas, "Liberation Mono", Menlo, monospace;
-            word-wrap: normal;
-            padding: 16px;
-            overflow: auto;
-            font-size: 85%;
-            line-height: 1.45;
-            background-color: #f6f8fa;
-            border-radius: 3px;
-            margin-bottom: 16px;
-        }
-
-        pre code {
-            background-color: transparent;
-            padding: 0;
-            margin: 0;
-            font-size: inherit;
-            word-break: normal;
-            white-space: pre;
-            overflow: visible;
-        }
-
-        .codehilite {
-            background-color: #f6f8fa;
-            border-radius: 3px;
-            padding: 16px;
-            overflow: auto;
-        }
-
-        .codehilite .hll { background-color: #ffffcc }
-        .codehilite .c { color: #999988; font-style: italic } /* Comment */
-        .codehilite .err { color: #a61717; background-color: #e3d2d2 } /* Error */
-        .codehilite .k { color: #000000; font-weight: bold } /* Keyword */
-        .codehilite .o { color: #000000; font-weight: bold } /* Operator */
-        .codehilite .cm { color: #999988; font-style: italic } /* Comment.Multiline */
-        .codehilite .cp { color: #999999; font-weight: bold; font-style: italic } /* Comment.Preproc */
-        .codehilite .c1 { color: #999988; font-style: italic } /* Comment.Single */
-        .codehilite .cs { color: #999999; font-weight: bold; font-style: italic } /* Comment.Special */
-        .codehilite .gd { color: #000000; background-color: #ffdddd } /* Generic.Deleted */
-        .codehilite .ge { color: #000000; font-style: italic } /* Generic.Emph */
-        .codehilite .gr { color: #aa0000 } /* Generic.Error */
-        .codehilite .gh { color: #999999 } /* Generic.Heading */
-        .codehilite .gi { color: #000000; background-color: #ddffdd } /* Generic.Inserted */
-        .codehilite .go { color: #888888 } /* Generic.Output */
-        .codehilite .gp { color: #555555 } /* Generic.Prompt */
-        .codehilite .gs { font-weight: bold } /* Generic.Strong */
-        .codehilite .gu { color: #aaaaaa } /* Generic.Subheading */
-        .codehilite .gt { color: #aa0000 } /* Generic.Traceback */
-        .codehilite .kc { color: #000000; font-weight: bold } /* Keyword.Constant */
-        .codehilite .kd { color: #000000; font-weight: bold } /* Keyword.Declaration */
-        .codehilite .kn { color: #000000; font-weight: bold } /* Keyword.Namespace */
-        .codehilite .kp { color: #000000; font-weight: bold } /* Keyword.Pseudo */
-        .codehilite .kr { color: #000000; font-weight: bold } /* Keyword.Reserved */
-        .codehilite .kt { color: #445588; font-weight: bold } /* Keyword.Type */
-        .codehilite .m { color: #009999 } /* Literal.Number */
-        .codehilite .s { color: #d01040 } /* Literal.String */
-        .codehilite .na { color: #008080 } /* Name.Attribute */
-        .codehilite .nb { color: #0086B3 } /* Name.Builtin */
-        .codehilite .nc { color: #445588; font-weight: bold } /* Name.Class */
-        .codehilite .no { color: #008080 } /* Name.Constant */
-        .codehilite .nd { color: #3c5d5d; font-weight: bold } /* Name.Decorator */
-        .codehilite .ni { color: #800080 } /* Name.Entity */
-        .codehilite .ne { color: #990000; font-weight: bold } /* Name.Exception */
-        .codehilite .nf { color: #990000; font-weight: bold } /* Name.Function */
-        .codehilite .nl { color: #990000; font-weight: bold } /* Name.Label */
-        .codehilite .nn { color: #555555 } /* Name.Namespace */
-        .codehilite .nt { color: #000080 } /* Name.Tag */
-        .codehilite .nv { color: #008080 } /* Name.Variable */
-        .codehilite .ow { color: #000000; font-weight: bold } /* Operator.Word */
-        .codehilite .w { color: #bbbbbb } /* Text.Whitespace */
-        .codehilite .mf { color: #009999 } /* Literal.Number.Float */
-        .codehilite .mh { color: #009999 } /* Literal.Number.Hex */
-        .codehilite .mi { color: #009999 } /* Literal.Number.Integer */
-        .codehilite .mo { color: #009999 } /* Literal.Number.Oct */
-        .codehilite .sb { color: #d01040 } /* Literal.String.Backtick */
-        .codehilite .sc { color: #d01040 } /* Literal.String.Char */
-        .codehilite .sd { color: #d01040 } /* Literal.String.Doc */
-        .codehilite .s2 { color: #d01040 } /* Literal.String.Double */
-        .codehilite .se { color: #d01040 } /* Literal.String.Escape */
-        .codehilite .sh { color: #d01040 } /* Literal.String.Heredoc */
-        .codehilite .si { color: #d01040 } /* Literal.String.Interpol */
-        .codehilite .sx { color: #d01040 } /* Literal.String.Other */
-        .codehilite .sr { color: #009926 } /* Literal.String.Regex */
-        .codehilite .s1 { color: #d01040 } /* Literal.String.Single */
-        .codehilite .ss { color: #990073 } /* Literal.String.Symbol */
-        .codehilite .bp { color: #999999 } /* Name.Builtin.Pseudo */
-        .codehilite .vc { color: #008080 } /* Name.Variable.Class */
-        .codehilite .vg { color: #008080 } /* Name.Variable.Global */
-        .codehilite .vi { color: #008080 } /* Name.Variable.Instance */
-        .codehilite .il { color: #009999 } /* Literal.Number.Integer.Long */
-
-        .ascii-diagram {
-            font-family: "SFMono-Regular", Consolas, "Liberation Mono", Menlo, monospace;
-            line-height: 1.2;
-            white-space: pre;
-            background-color: #f6f8fa;
-            padding: 16px;
-            border-radius: 3px;
-        }
-
-        blockquote {
-            padding: 0 1em;
-            color: #6a737d;
-            border-left: 0.25em solid #dfe2e5;
-            margin: 0 0 16px 0;
-        }
-
-        hr {
-            height: 0.25em;
-            padding: 0;
-            margin: 24px 0;
-            background-color: #e1e4e8;
-            border: 0;
-        }
-
-        .footnote {
-            font-size: 0.8em;
-            color: #6a737d;
-        }
-
-        /* Estilos específicos para la conversación */
-        .message {
-            margin-bottom: 20px;
-            padding: 10px;
-            border-radius: 5px;
-        }
-
-        .user-message {
-            background-color: #f1f8ff;
-            border-left: 4px solid #0366d6;
-        }
-
-        .assistant-message {
-            background-color: #f6f8fa;
-            border-left: 4px solid #28a745;
-        }
-
-        .message-header {
-            font-weight: bold;
-            margin-bottom: 5px;
-            color: #24292e;
-        }
-
-        .timestamp {
-            font-size: 0.8em;
-            color: #6a737d;
-        }
-        """
-
-        # 6. Crear HTML completo con estilos
-        full_html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>{APP_IDENTITY["conversation_export_name"]}</title>
-            <style>
-                {css_styles}
-            </style>
-        </head>
-        <body>
-            <h1>{APP_IDENTITY["conversation_export_name"]}</h1>
-            <p class="timestamp">Exportado el {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}</p>
-            <hr>
-            {html_content}
-        </body>
-        </html>
-        """
-
-        # 7. Configurar fuentes
-        font_config = FontConfiguration()
-
-        # 8. Crear PDF desde HTML
-        html = HTML(string=full_html)
-
-        # 9. Crear un archivo temporal para el PDF
-        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
-            # Generar el PDF
-            html.write_pdf(
-                tmp.name,
-                font_config=font_config,
-                presentational_hints=True
-            )
-
-            # Leer el contenido del PDF
-            tmp.seek(0)
-            pdf_content = tmp.read()
-
-        return pdf_content, "pdf"
-
-    except Exception as e:
-        logging.error(f"Error en la conversión de Markdown a PDF: {str(e)}")
-        raise e
-
-
-def _export_chat_to_pdf_primary(messages):
-    """
-    Método primario: FPDF optimizado con manejo de errores mejorado
-    y división inteligente de texto para evitar problemas de espacio.
-    Este método está optimizado para funcionar en Streamlit Cloud.
+def finish_pdf_export(job, messages, wait=None):
     """
-    try:
-        from fpdf import FPDF
-    except ImportError:
-        # Intentar con fpdf2 que es más compatible con Streamlit Cloud
-        from fpdf2 import FPDF
-    import re
-
-    class CustomPDF(FPDF):
-        def header(self):
-            self.set_font("helvetica", "B", 12)
-            self.cell(
-                0,
-                10,
-                f'{APP_IDENTITY["name"]} - Historial de Conversación',
-                0,
-                new_y="NEXT",
-                align="C",
-            )
-            self.ln(5)
-
-        def footer(self):
-            self.set_y(-15)
-            self.set_font("helvetica", "I", 8)
-            self.cell(0, 10, f"Página {self.page_no()}", 0, 0, "C")
-
-        def add_message(self, role, content):
-            # Añadir título del mensaje
-            self.set_font("helvetica", "B", 11)
-            self.cell(0, 10, role, 0, new_y="NEXT", align="L")
-            self.ln(2)
-
-            # Añadir contenido con procesamiento seguro
-            self.set_font("helvetica", "", 10)
-            self._safe_add_content(content)
-            self.ln(5)
-
-        def _safe_add_content(self, content):
-            # Procesar markdown básico
-            content = self._process_markdown(content)
-
-            # Dividir en párrafos
-            paragraphs = content.split("\n\n")
-
-            for paragraph in paragraphs:
-                if not paragraph.strip():
-                    self.ln(5)
-                    continue
-
-                # Dividir párrafos largos en líneas seguras
-                lines = self._safe_wrap_text(paragraph, max_width=180)
-
-                for line in lines:
-                    if not line.strip():
-                        continue
-
-                    if line.startswith("- ") or line.startswith("* "):
-                        # Elemento de lista
-                        self.cell(5, 10, "", 0, 0)
-                        self.cell(5, 10, "•", 0, 0)
-                        self._safe_multi_cell(0, 10, line[2:])
-                    else:
-                        # Párrafo normal
-                        self._safe_multi_cell(0, 10, line)
-
-                # Espacio entre párrafos
-                self.ln(2)
-
-        def _process_markdown(self, text):
-            # Simplificar encabezados
-            text = re.sub(r"^#{1,6}\s+(.*?)$", r"\1", text, flags=re.MULTILINE)
-
-            # Eliminar elementos multimedia
-            text = re.sub(r"!\[.*?\]\(.*?\)", "[IMAGEN]", text)
-
-            # Simplificar enlaces
-            text = re.sub(r"\[(.*?)\]\(.*?\)", r"\1", text)
-
-            return text
-
-        def _safe_wrap_text(self, text, max_width=180):
-            """Divide texto en líneas seguras para renderizar"""
-            lines = []
-            for raw_line in text.split("\n"):
-                if len(raw_line) < max_width:
-                    lines.append(raw_line)
-                    continue
-
-                # Dividir líneas largas en palabras
-                words = raw_line.split(" ")
-                current_line = ""
-
-                for word in words:
-                    test_line = current_line + " " + word if current_line else word
-
-                    if len(test_line) <= max_width:
-                        current_line = test_line
-                    else:
-                        lines.append(current_line)
-                        current_line = word
-
-                if current_line:
-                    lines.append(current_line)
-
-            return lines
-
-        def _safe_multi_cell(self, w, h, txt, border=0, align="J", fill=False):
-            """Versión segura de multi_cell con manejo de errores integrado"""
-            try:
-                # Eliminar caracteres no ASCII si es necesario
-                if not all(ord(c) < 128 for c in txt):
-                    txt = "".join(c if ord(c) < 128 else "?" for c in txt)
-
-                # Limitar longitud de línea si es necesario
-                if len(txt) > 200:
-                    chunks = [txt[i : i + 200] for i in range(0, len(txt), 200)]
-                    for chunk in chunks:
-                        self.multi_cell(w, h, chunk, border, align, fill)
-                else:
-                    self.multi_cell(w, h, txt, border, align, fill)
-            except Exception as e:
-                logging.warning(
-                    f"Error en multi_cell: {str(e)}. Intentando versión simplificada."
-                )
-                # Versión de respaldo extremadamente simplificada
-                safe_txt = "".join(c for c in txt if c.isalnum() or c in " .,;:-?!()")
-                self.multi_cell(w, h, safe_txt[:100] + "...", border, align, fill)
-
-    # Crear el PDF
-    pdf = CustomPDF()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.add_page()
-
-    # Añadir fecha
-    pdf.set_font("helvetica", "I", 10)
-    pdf.cell(
-        0, 10, f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", 0, new_y="NEXT"
-    )
-    pdf.ln(5)
-
-    # Añadir mensajes
-    for msg in messages:
-        role = "Usuario" if msg["role"] == "user" else APP_IDENTITY["name"]
-        pdf.add_message(role, msg["content"])
-
-    # Generar PDF
-    output = io.BytesIO()
-    pdf.output(output)
-    return output.getvalue(), "pdf"
+    Recoge el resultado de una exportación a PDF iniciada con start_pdf_export.
 
+    Parámetros:
+        job: Manejador devuelto por start_pdf_export
+        messages: Mensajes exportados (para el respaldo en Markdown)
+        wait: Segundos máximos de espera (por defecto, hasta el plazo del trabajo)
 
-def _export_chat_to_pdf_secondary(messages):
-    """
-    Método secundario: ReportLab para generación alternativa de PDF
-    con manejo mejorado de texto extenso.
-    Este método está optimizado para funcionar en Streamlit Cloud.
+    Retorno:
+        tuple o None: (contenido en bytes, "pdf"), el respaldo en Markdown
+                      (bytes, "markdown") si el PDF falló o venció el plazo,
+                      o None si el PDF sigue generándose
     """
     try:
-        # Importar con manejo de errores para mayor compatibilidad
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-        from reportlab.platypus import PageBreak  # Importar por separado para evitar errores
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.pagesizes import letter
-        from reportlab.lib.units import inch
-    except ImportError as e:
-        logging.error(f"Error importando ReportLab: {str(e)}")
-        raise e
-    from reportlab.lib import colors
-
-    # Crear buffer y documento
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=letter,
-        rightMargin=72,
-        leftMargin=72,
-        topMargin=72,
-        bottomMargin=72,
-    )
-
-    # Configurar estilos
-    styles = getSampleStyleSheet()
-    styles.add(
-        ParagraphStyle(
-            name="Title",
-            fontName="Helvetica-Bold",
-            fontSize=14,
-            alignment=1,
-            spaceAfter=12,
-        )
-    )
-    styles.add(
-        ParagraphStyle(
-            name="User",
-            fontName="Helvetica-Bold",
-            fontSize=12,
-            textColor=colors.blue,
-            spaceAfter=6,
-        )
-    )
-    styles.add(
-        ParagraphStyle(
-            name="Assistant",
-            fontName="Helvetica-Bold",
-            fontSize=12,
-            textColor=colors.green,
-            spaceAfter=6,
-        )
-    )
-
-    # Elementos del documento
-    elements = []
-
-    # Título y fecha
-    elements.append(
-        Paragraph(
-            f"{APP_IDENTITY['name']} - Historial de Conversación", styles["Title"]
-        )
-    )
-    elements.append(Spacer(1, 0.25 * inch))
-    elements.append(
-        Paragraph(
-            f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles["Italic"]
-        )
-    )
-    elements.append(Spacer(1, 0.25 * inch))
-
-    # Función de seguridad para procesar texto
-    def safe_process_text(text, max_chunk=2000):
-        # Escapar caracteres especiales HTML
-        text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-
-        # Convertir newlines a <br/>
-        text = text.replace("\n", "<br/>")
-
-        # Dividir texto muy largo en secciones manejables
-        if len(text) > max_chunk:
-            chunks = []
-            for i in range(0, len(text), max_chunk):
-                chunks.append(text[i : i + max_chunk])
-            return chunks
-        return [text]
-
-    # Procesar mensajes
-    for msg in messages:
-        role = "Usuario" if msg["role"] == "user" else APP_IDENTITY["name"]
-        style = styles["User"] if msg["role"] == "user" else styles["Assistant"]
-
-        # Título del mensaje
-        elements.append(Paragraph(role, style))
-
-        # Contenido procesado en porciones seguras
-        content_chunks = safe_process_text(msg["content"])
-        for i, chunk in enumerate(content_chunks):
-            try:
-                elements.append(Paragraph(chunk, styles["Normal"]))
-                if i < len(content_chunks) - 1:
-                    elements.append(Spacer(1, 0.1 * inch))
-            except Exception as e:
-                logging.warning(f"Error al procesar chunk {i}: {str(e)}")
-                # Versión ultra simplificada como respaldo
-                elements.append(
-                    Paragraph(
-                        "[Contenido simplificado debido a error de formato]",
-                        styles["Normal"],
-                    )
-                )
-
-        elements.append(Spacer(1, 0.2 * inch))
-
-    # Generar documento con manejo de errores
-    try:
-        doc.build(elements)
-        pdf_data = buffer.getvalue()
-        buffer.close()
-        return pdf_data, "pdf"
+        return job.result(timeout=wait)
+    except render_pool.RenderDeadlineExceeded as e:
+        logging.error(f"Exportación a PDF cancelada: {str(e)}")
+    except TimeoutError:
+        return None
     except Exception as e:
-        logging.error(f"Error en ReportLab: {str(e)}")
-        raise e
+        logging.error(f"Error en la exportación a PDF: {str(e)}")
 
+    # Último recurso: Devolver contenido en markdown
+    logging.info("Fallback a exportación Markdown")
+    return export_chat_to_markdown(messages).encode("utf-8"), "markdown"
 
-def _export_chat_to_pdf_fallback(messages):
-    """
-    Método de último recurso: PDF simple sin formato avanzado
-    diseñado para máxima compatibilidad y robustez
-    """
-    from fpdf import FPDF
-
-    # PDF básico con manejo mínimo
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("helvetica", size=12)
-
-    # Título
-    pdf.set_font("helvetica", style="B", size=16)
-    pdf.cell(
-        200,
-        10,
-        f"{APP_IDENTITY['name']} - Historial de Conversación",
-        ln=True,
-        align="C",
-    )
-    pdf.ln(5)
-
-    # Fecha
-    pdf.set_font("helvetica", style="I", size=10)
-    pdf.cell(200, 10, f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", ln=True)
-    pdf.ln(10)
-
-    # Mensajes - formato mínimo con máxima seguridad
-    pdf.set_font("helvetica", size=11)
-    for msg in messages:
-        role = "Usuario" if msg["role"] == "user" else APP_IDENTITY["name"]
-
-        # Encabezado del mensaje
-        pdf.set_font("helvetica", style="B", size=12)
-        pdf.cell(200, 10, role, ln=True)
-        pdf.ln(2)
-
-        # Contenido ultra-simple, sin formato
-        pdf.set_font("helvetica", size=10)
-
-        # Extraer texto plano con máxima seguridad
-        simple_text = "".join(c if ord(c) < 128 else "?" for c in msg["content"])
-        simple_text = simple_text.replace("\n", " ").replace("\r", "")
 
-        # Dividir texto en líneas muy cortas para evitar errores
-        line_length = 50  # Longitud muy conservadora
-        for i in range(0, len(simple_text), line_length):
-            chunk = simple_text[i : i + line_length]
-            try:
-                pdf.cell(0, 10, chunk, ln=True)
-            except:
-                # Si falla incluso con texto simplificado, usar solo alfanuméricos
-                ultra_safe = "".join(c for c in chunk if c.isalnum() or c == " ")
-                try:
-                    pdf.cell(0, 10, ultra_safe, ln=True)
-                except:
-                    # Abandonar este chunk si todo falla
-                    pass
-
-        pdf.ln(10)
+def export_chat_to_pdf(messages):
+    """
+    Sistema multicapa para exportación de conversaciones a PDF.
+    Implementa múltiples estrategias de generación con manejo de fallos.
 
-    # Generar PDF
-    try:
-        output = io.BytesIO()
-        pdf.output(output)
-        return output.getvalue(), "pdf"
-    except Exception as e:
-        logging.error(f"Error incluso en fallback: {str(e)}")
-        raise e
+    Los motores se ejecutan en los procesos de renderizado (render_pool.py)
+    en el orden de pdf_export.PDF_EXPORT_STRATEGIES; esta función espera el
+    resultado hasta el plazo del trabajo.
+    """
+    return finish_pdf_export(start_pdf_export(messages), messages)
 
 
 def export_chat_to_markdown(messages):
@@ -2073,6 +782,21 @@ def export_chat_to_markdown(messages):
     con mejoras de formato y legibilidad, incluyendo información del experto
     que respondió cada mensaje
     """
+    header, sections, footer = conversation_markdown_sections(messages)
+    return header + "".join(sections) + footer
+
+
+def conversation_markdown_sections(messages):
+    """
+    Genera el Markdown de la conversación en partes: el encabezado (título,
+    fecha e historial de expertos), una sección por mensaje y el pie con los
+    archivos adjuntos. La sección de un mensaje solo cambia si cambian el
+    mensaje o el experto que lo respondió, lo que permite reutilizar su
+    renderizado entre exportaciones (pdf_export.render_fragments).
+
+    Retorno:
+        tuple: (encabezado, lista de secciones por mensaje, pie)
+    """
     md_content = f"# {APP_IDENTITY['name']} - Historial de Conversación\n\n"
     md_content += f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
 
@@ -2145,10 +869,13 @@ def export_chat_to_markdown(messages):
         })
 
     # Procesar mensajes con información de experto correcta
+    header = md_content
+    sections = []
     message_index = 0
     user_message_count = 0
 
     for msg in messages:
+        md_content = ""
         if msg["role"] == "user":
             # Contar mensajes de usuario para sincronizar con respuestas
             user_message_count += 1
@@ -2180,9 +907,11 @@ def export_chat_to_markdown(messages):
             md_content += f"{msg['content']}\n\n"
 
         md_content += "---\n\n"  # Separador para mejorar legibilidad
+        sections.append(md_content)
         message_index += 1
 
     # Añadir sección de archivos adjuntos si existen
+    md_content = ""
     has_attachments = False
     attachment_files = []
 
@@ -2267,7 +996,84 @@ def export_chat_to_markdown(messages):
 
         md_content += "\n"
 
-    return md_content
+    return header, sections, md_content
+
+
+def conversation_export_key(messages, export_format):
+    """
+    Calcula la huella de una exportación de la conversación: mensajes,
+    historial de expertos, adjuntos y formato.
+
+    Retorno:
+        string: Clave de la caché de exportaciones
+    """
+    attachments = [
+        [getattr(item, "name", item), getattr(item, "size", None)]
+        for item in st.session_state.get("uploaded_files") or []
+    ]
+    return export_cache.export_key(
+        messages, st.session_state.get("expert_history", []), export_format, extra=attachments
+    )
+
+
+def export_conversation(messages, export_format, wait=None):
+    """
+    Exporta la conversación reutilizando la caché de exportaciones: si los
+    mensajes, el historial de expertos, los adjuntos y el formato no
+    cambiaron desde la última exportación, se devuelven los mismos bytes
+    sin volver a generarlos.
+
+    Parámetros:
+        messages: Lista de mensajes de la conversación
+        export_format: "Markdown" o "PDF"
+        wait: Segundos máximos de espera del PDF (por defecto, hasta su plazo)
+
+    Retorno:
+        tuple o manejador: (contenido en bytes, tipo de contenido "pdf" o
+        "markdown"), o el trabajo de renderizado (ver start_pdf_export) si el
+        PDF sigue generándose tras ``wait`` segundos (ver collect_pdf_export)
+    """
+    cache = export_cache.get_export_cache()
+    key = conversation_export_key(messages, export_format)
+    if cache:
+        cached = cache.get(key)
+        if cached is not None:
+            logging.info(f"Exportación {export_format} obtenida de la caché ({cache.get_stats()})")
+            return cached
+
+    if export_format == "Markdown":
+        content, content_type = export_chat_to_markdown(messages).encode("utf-8"), "markdown"
+        if cache:
+            cache.put(key, content, content_type)
+        return content, content_type
+
+    job = start_pdf_export(messages)
+    return collect_pdf_export(job, messages, key, wait) or job
+
+
+def collect_pdf_export(job, messages, key, wait=None):
+    """
+    Recoge un PDF en curso de export_conversation y lo guarda en la caché
+    de exportaciones cuando termina.
+
+    Parámetros:
+        job: Trabajo de renderizado
+        messages: Mensajes exportados
+        key: Clave de la exportación (conversation_export_key)
+        wait: Segundos máximos de espera (por defecto, hasta el plazo del trabajo)
+
+    Retorno:
+        tuple o None: (contenido en bytes, tipo de contenido), o None si sigue en curso
+    """
+    result = finish_pdf_export(job, messages, wait)
+    if result is None:
+        return None
+    content, content_type = result
+    cache = export_cache.get_export_cache()
+    # El respaldo en Markdown no se guarda: el siguiente intento vuelve a probar el PDF
+    if cache and content_type == "pdf":
+        cache.put(key, content, content_type)
+    return content, content_type
 
 
 # Definición de formatos permitidos y sus extensiones
@@ -2443,57 +1249,36 @@ def detect_document_type(file):
 
 
 @handle_error(max_retries=1)
-def prepare_image_for_ocr(file_data):
+def prepare_image_for_ocr(file_data=None, path=None, content_hash=None):
     """
     Prepara una imagen para ser procesada con OCR,
-    optimizando formato y calidad para mejorar resultados
+    optimizando formato y calidad para mejorar resultados.
+    La transformación se ejecuta en el pool de procesos de ingesta (que lee
+    la imagen de disco si se indica su ruta) y el resultado se guarda en
+    caché por la huella de la imagen original.
 
     Parámetros:
-        file_data: Datos binarios de la imagen
+        file_data: Datos binarios de la imagen (None si se indica path)
+        path: Ruta de la imagen en disco (opcional)
+        content_hash: Huella SHA-256 ya calculada de la imagen (opcional)
 
     Retorno:
         tuple: (datos_optimizados, mime_type)
     """
-    try:
-        # Abrir la imagen con PIL
-        img = Image.open(BytesIO(file_data))
-
-        # Optimizaciones avanzadas para OCR
-        # 1. Convertir a escala de grises si tiene más de un canal
-        if img.mode != "L" and img.mode != "1":
-            img = img.convert("L")
-
-        # 2. Ajustar tamaño si es muy grande (límite 4000px)
-        max_dimension = 4000
-        if img.width > max_dimension or img.height > max_dimension:
-            ratio = min(max_dimension / img.width, max_dimension / img.height)
-            new_width = int(img.width * ratio)
-            new_height = int(img.height * ratio)
-            img = img.resize((new_width, new_height), Image.LANCZOS)
-
-        # 3. Evaluar y determinar mejor formato
-        # JPEG para imágenes fotográficas, PNG para documentos/texto
-        save_format = "JPEG"
-        save_quality = 95
-
-        # Detectar si es más probable que sea un documento (blanco/negro predominante)
-        histogram = img.histogram()
-        if img.mode == "L" and (histogram[0] + histogram[-1]) > sum(histogram) * 0.8:
-            save_format = "PNG"
-
-        # 4. Guardar con parámetros optimizados
-        buffer = BytesIO()
-        if save_format == "JPEG":
-            img.save(buffer, format=save_format, quality=save_quality, optimize=True)
-        else:
-            img.save(buffer, format=save_format, optimize=True)
-
-        buffer.seek(0)
-        return buffer.read(), f"image/{save_format.lower()}"
-
-    except Exception as e:
-        logging.warning(f"Optimización de imagen fallida: {str(e)}")
-        return file_data, "image/jpeg"  # Formato por defecto
+    cache = image_preprocessing.get_prepared_image_cache()
+    if cache and content_hash is None and file_data is not None:
+        content_hash = image_preprocessing.image_hash(file_data)
+    if cache and content_hash:
+        prepared = cache.get(content_hash)
+        if prepared is not None:
+            return prepared
+
+    prepared = document_ingestion.run_cpu_bound(
+        image_preprocessing.optimize_image_for_ocr, path if file_data is None else file_data
+    )
+    if cache and content_hash:
+        cache.put(content_hash, prepared)
+    return prepared
 
 
 @handle_error(max_retries=1)
@@ -2543,9 +1328,14 @@ def extract_text_from_ocr_response(response):
     if "pages" in response and isinstance(response["pages"], list):
         pages = response["pages"]
         if pages and "markdown" in pages[0]:
-            markdown_text = "\n\n".join(page.get("markdown", "") for page in pages)
+            page_texts = [page.get("markdown", "") for page in pages]
+            markdown_text = "\n\n".join(page_texts)
             if markdown_text.strip():
-                return {"text": markdown_text, "format": "markdown"}
+                return {
+                    "text": markdown_text,
+                    "format": "markdown",
+                    "page_offsets": document_retrieval.page_offsets_for(page_texts),
+                }
 
     # Caso 2: Si hay un texto plano en la respuesta
     if "text" in response:
@@ -2621,39 +1411,566 @@ def extract_all_text_fields(data, prefix="", max_depth=5, current_depth=0):
                 )
                 result.extend(child_results)
 
-    elif isinstance(data, list):
-        # Limitar número de elementos procesados en listas muy grandes
-        max_items = 20
-        for i, item in enumerate(data[:max_items]):
-            new_prefix = f"{prefix}[{i}]"
-            if isinstance(item, (dict, list)) and item:
-                child_results = extract_all_text_fields(
-                    item, new_prefix, max_depth, current_depth + 1
-                )
-                result.extend(child_results)
-            elif isinstance(item, str) and len(item) > 1:
-                result.append(f"{new_prefix}: {item}")
+    elif isinstance(data, list):
+        # Limitar número de elementos procesados en listas muy grandes
+        max_items = 20
+        for i, item in enumerate(data[:max_items]):
+            new_prefix = f"{prefix}[{i}]"
+            if isinstance(item, (dict, list)) and item:
+                child_results = extract_all_text_fields(
+                    item, new_prefix, max_depth, current_depth + 1
+                )
+                result.extend(child_results)
+            elif isinstance(item, str) and len(item) > 1:
+                result.append(f"{new_prefix}: {item}")
+
+        # Indicar si se truncó la lista
+        if len(data) > max_items:
+            result.append(
+                f"{prefix}: [... {len(data) - max_items} elementos adicionales omitidos]"
+            )
+
+    return "\n".join(result)
+
+
+# Modelo de OCR de Mistral (forma parte de la clave de la caché OCR)
+MISTRAL_OCR_MODEL = "mistral-ocr-latest"
+
+
+def get_debug_recorder():
+    """
+    Obtiene el registro de artefactos de depuración del OCR, o None si está
+    desactivado (DEBUG_ARTIFACTS). Por defecto usa el directorio de
+    depuración de la aplicación en la carpeta temporal.
+    """
+    return debug_artifacts.get_debug_recorder(
+        os.path.join(tempfile.gettempdir(), f"{APP_IDENTITY['document_prefix']}_debug")
+    )
+
+
+def request_mistral_ocr(api_key, document, file_name, status, job_id, queue_key=None):
+    """
+    Envía un documento a la API de OCR de Mistral con reintentos ante
+    límites de tasa, timeouts y errores de red. Los límites de tasa los
+    gestiona el planificador compartido (rate_limit.py): un 429 pausa la
+    cola de todas las sesiones el tiempo que indica Retry-After.
+
+    Parámetros:
+        api_key: API key de Mistral
+        document: Documento en el formato de la API ({"type": ..., ...})
+        file_name: Nombre del archivo (para registros y depuración)
+        status: Objeto con método update() para reportar el progreso
+        job_id: Identificador del procesamiento (decide el muestreo de depuración)
+        queue_key: Sesión que origina la solicitud (reparto justo de la cuota)
+
+    Retorno:
+        dict: {"response": respuesta JSON de la API} o {"error": mensaje}
+    """
+    status.update(
+        label="Enviando documento a la API de Mistral...", state="running"
+    )
+
+    # Cliente compartido con pool de conexiones persistentes
+    client = mistral_client.get_mistral_client(api_key)
+    scheduler = client.scheduler
+    debug = get_debug_recorder()
+
+    # Preparar payload
+    payload = {"model": MISTRAL_OCR_MODEL, "document": document}
+
+    # Guardar payload para depuración (excluyendo contenido base64 por tamaño)
+    debug_payload = {
+        "model": payload["model"],
+        "document": {
+            "type": payload["document"]["type"],
+            "content_size": len(payload["document"][payload["document"]["type"]]),
+            "content_format": "base64"
+            if payload["document"][payload["document"]["type"]].startswith("data:")
+            else "url",
+        },
+    }
+    logging.info(f"Payload para OCR: {json.dumps(debug_payload)}")
+
+    # Sistema de retry interno para la API de Mistral
+    max_retries = 2
+    last_error = None
+
+    for retry in range(max_retries + 1):
+        try:
+            # Hacer la solicitud a Mistral OCR API
+            response = client.ocr(payload, queue_key=queue_key)
+
+            logging.info(
+                f"Respuesta de OCR API - Estado: {response.status_code}"
+            )
+
+            if response.status_code == 200:
+                try:
+                    result = response.json()
+                    # Guardar respuesta para depuración (en segundo plano)
+                    if debug:
+                        debug.record(job_id, f"response_{job_id}_{file_name}.json", result)
+
+                    status.update(
+                        label=f"Documento {file_name} procesado exitosamente",
+                        state="complete",
+                    )
+
+                    # Verificar existencia de contenido
+                    if not result or (isinstance(result, dict) and not result):
+                        return {
+                            "error": "La API no devolvió contenido",
+                            "raw_response": str(result),
+                        }
+
+                    return {"response": result}
+                except Exception as e:
+                    error_message = (
+                        f"Error al procesar respuesta JSON: {str(e)}"
+                    )
+                    logging.error(error_message)
+                    # Guardar respuesta cruda para depuración
+                    if debug:
+                        debug.record(
+                            job_id, f"raw_response_{job_id}_{file_name}.txt", response.text[:10000]
+                        )
+                    status.update(label=error_message, state="error")
+                    last_error = e
+            elif response.status_code == 429:  # Rate limit
+                if retry < max_retries:
+                    # El planificador ya pausó la cola; el reintento espera su turno
+                    wait_time = round(scheduler.pause_remaining(), 1)
+                    logging.warning(
+                        f"Rate limit alcanzado. Esperando {wait_time}s antes de reintentar..."
+                    )
+                    status.update(
+                        label=f"Límite de tasa alcanzado. Reintentando en {wait_time}s...",
+                        state="running",
+                    )
+                    continue
+                else:
+                    error_message = "Límite de tasa alcanzado. No se pudo procesar después de reintentos."
+                    logging.error(error_message)
+                    status.update(label=error_message, state="error")
+                    return {
+                        "error": error_message,
+                        "raw_response": response.text,
+                    }
+            else:
+                error_message = f"Error en API OCR ({response.status_code}): {response.text[:500]}"
+                logging.error(error_message)
+                status.update(label=f"Error: {error_message}", state="error")
+                last_error = Exception(error_message)
+                break
+        except httpx.TimeoutException:
+            if retry < max_retries:
+                wait_time = round(scheduler.backoff_delay(retry + 1), 1)
+                logging.warning(
+                    f"Timeout al contactar API. Esperando {wait_time}s antes de reintentar..."
+                )
+                status.update(
+                    label=f"Timeout. Reintentando en {wait_time}s...",
+                    state="running",
+                )
+                time.sleep(wait_time)
+            else:
+                error_message = (
+                    "Timeout al contactar API después de múltiples intentos."
+                )
+                logging.error(error_message)
+                status.update(label=error_message, state="error")
+                return {"error": error_message}
+        except Exception as e:
+            if retry < max_retries:
+                wait_time = round(scheduler.backoff_delay(retry + 1), 1)
+                logging.warning(
+                    f"Error: {str(e)}. Esperando {wait_time}s antes de reintentar..."
+                )
+                status.update(
+                    label=f"Error. Reintentando en {wait_time}s...",
+                    state="running",
+                )
+                time.sleep(wait_time)
+            else:
+                error_message = f"Error al procesar documento: {str(e)}"
+                logging.error(error_message)
+                status.update(label=f"Error: {error_message}", state="error")
+                last_error = e
+                break
+
+    # Si llegamos aquí después de reintentos, devolver último error
+    return {
+        "error": f"Error después de reintentos: {str(last_error)}",
+        "details": traceback.format_exc(),
+    }
+
+
+def prepare_ocr_document(client, file_name, mime_type, status, data=None, path=None, queue_key=None):
+    """
+    Prepara la referencia a un documento para OCR eligiendo el medio según
+    su tamaño: los documentos grandes se cargan en Mistral con una solicitud
+    multipart leída por bloques y el OCR recibe una URL firmada; los
+    pequeños se envían en base64.
+
+    Parámetros:
+        client: mistral_client.MistralClient compartido
+        file_name: Nombre del archivo
+        mime_type: Tipo MIME del documento
+        status: Objeto con método update() para reportar el progreso
+        data: Bytes del documento (si está en memoria)
+        path: Ruta del documento en disco (si no está en memoria)
+        queue_key: Sesión que origina la solicitud
+
+    Retorno:
+        tuple: (documento en el formato de la API, ID del archivo cargado
+                que se debe eliminar después o None)
+    """
+    document_type = "image_url" if mime_type.startswith("image/") else "document_url"
+    size = len(data) if data is not None else os.path.getsize(path)
+    file_id = None
+
+    if mistral_client.use_file_upload(size):
+        status.update(label=f"Cargando {file_name} en Mistral...", state="running")
+        try:
+            with (open(path, "rb") if data is None else BytesIO(data)) as fileobj:
+                file_id = client.upload_file(fileobj, file_name, queue_key=queue_key)
+            document = {
+                "type": document_type,
+                document_type: client.get_signed_url(file_id, queue_key=queue_key),
+            }
+        except Exception as e:
+            logging.warning(f"Carga de {file_name} fallida, se envía en base64: {str(e)}")
+            if file_id:
+                client.delete_file(file_id)
+                file_id = None
+
+    if file_id is None:
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        encoded_file = base64.b64encode(data).decode("utf-8")
+        document = {
+            "type": document_type,
+            document_type: f"data:{mime_type};base64,{encoded_file}",
+        }
+    return document, file_id
+
+
+def send_document_to_ocr(
+    api_key, file_name, mime_type, status, job_id, data=None, path=None, queue_key=None
+):
+    """
+    Envía un documento a OCR por carga de archivo o en base64 según su
+    tamaño (ver prepare_ocr_document). El archivo cargado se elimina al
+    terminar.
+
+    Parámetros:
+        api_key: API key de Mistral
+        file_name: Nombre del archivo
+        mime_type: Tipo MIME del documento
+        status: Objeto con método update() para reportar el progreso
+        job_id: Identificador del procesamiento
+        data: Bytes del documento (si está en memoria)
+        path: Ruta del documento en disco (si no está en memoria)
+        queue_key: Sesión que origina la solicitud
+
+    Retorno:
+        dict: {"response": respuesta JSON de la API} o {"error": mensaje}
+    """
+    client = mistral_client.get_mistral_client(api_key)
+    document, file_id = prepare_ocr_document(client, file_name, mime_type, status, data, path, queue_key)
+    try:
+        return request_mistral_ocr(api_key, document, file_name, status, job_id, queue_key)
+    finally:
+        if file_id:
+            client.delete_file(file_id)
+
+
+def ocr_ranges_in_batch(api_key, analysis, file_name, file_bytes=None, file_path=None, queue_key=None):
+    """
+    Primera pasada de OCR de los rangos de un PDF con el cliente asíncrono:
+    todos los rangos quedan en curso a la vez (con el límite de concurrencia
+    del proceso) sin ocupar un hilo por solicitud. Los rangos que fallan no
+    se reintentan aquí; se devuelven ausentes para la pasada con reintentos.
+
+    Parámetros:
+        api_key: API key de Mistral
+        analysis: Resultado de pdf_pages.analyze_pdf
+        file_name: Nombre del archivo
+        file_bytes: Bytes del PDF (opcional)
+        file_path: Ruta del PDF en disco (opcional)
+        queue_key: Sesión que origina las solicitudes
+
+    Retorno:
+        dict: {índice_rango: lista de páginas} de los rangos completados
+    """
+    ranges = analysis["ocr_ranges"]
+    client = mistral_client.get_mistral_client(api_key)
+    prepared = []
+    results = {}
+    try:
+        for index, (start, end) in enumerate(ranges):
+            # Un rango sin PDF propio es el documento completo
+            range_bytes = analysis["range_pdfs"][index]
+            if range_bytes is None:
+                range_bytes = file_bytes
+            prepared.append(
+                prepare_ocr_document(
+                    client,
+                    f"{file_name} (págs. {start + 1}-{end})",
+                    "application/pdf",
+                    document_ingestion.NullProgress(),
+                    data=range_bytes,
+                    path=file_path if range_bytes is None else None,
+                    queue_key=queue_key,
+                )
+            )
+        responses = mistral_client.run_ocr_batch(
+            api_key,
+            [{"model": MISTRAL_OCR_MODEL, "document": document} for document, _ in prepared],
+            queue_key=queue_key,
+        )
+    except Exception as e:
+        logging.warning(f"OCR en lote de {file_name} no disponible: {str(e)}")
+        return results
+    finally:
+        for _, file_id in prepared:
+            if file_id:
+                client.delete_file(file_id)
+
+    for index, response in enumerate(responses):
+        start, end = ranges[index]
+        if isinstance(response, Exception):
+            logging.warning(f"OCR en lote de las páginas {start + 1}-{end} fallido: {repr(response)}")
+        elif response.status_code != 200:
+            logging.warning(
+                f"OCR en lote de las páginas {start + 1}-{end} fallido ({response.status_code})"
+            )
+        else:
+            try:
+                results[index] = response.json().get("pages", [])
+            except ValueError as e:
+                logging.warning(f"Respuesta de OCR ilegible para las páginas {start + 1}-{end}: {str(e)}")
+    return results
+
+
+def ocr_image_tiles(api_key, tiles, file_name, status, job_id, queue_key=None):
+    """
+    Aplica OCR a los mosaicos de una imagen grande en paralelo y une sus
+    textos en orden de lectura (ver image_tiling.py). La primera pasada usa
+    el cliente asíncrono; los mosaicos que fallan se reenvían con reintentos.
+
+    Parámetros:
+        api_key: API key de Mistral
+        tiles: Mosaicos de image_tiling.split_image
+        file_name: Nombre del archivo
+        status: Objeto con método update() para reportar el progreso
+        job_id: Identificador del procesamiento
+        queue_key: Sesión que origina las solicitudes
+
+    Retorno:
+        dict: {"response": {"pages": [...]}} o {"error": mensaje}; si algún
+              mosaico falló, además "partial": True y "missing_tiles" con
+              sus números (desde 1)
+    """
+    status.update(
+        label=f"Enviando {len(tiles)} mosaicos de {file_name} a la API de Mistral...", state="running"
+    )
+
+    def tile_text(pages):
+        return "\n\n".join(page.get("markdown", "") for page in pages)
+
+    texts = {}
+    try:
+        responses = mistral_client.run_ocr_batch(
+            api_key,
+            [
+                {
+                    "model": MISTRAL_OCR_MODEL,
+                    "document": {
+                        "type": "image_url",
+                        "image_url": f"data:{tile['mime_type']};base64,"
+                        + base64.b64encode(tile["data"]).decode("utf-8"),
+                    },
+                }
+                for tile in tiles
+            ],
+            queue_key=queue_key,
+        )
+    except Exception as e:
+        logging.warning(f"OCR en lote de los mosaicos de {file_name} no disponible: {str(e)}")
+        responses = []
+    for index, response in enumerate(responses):
+        if isinstance(response, Exception) or response.status_code != 200:
+            continue
+        try:
+            texts[index] = tile_text(response.json().get("pages", []))
+        except ValueError as e:
+            logging.warning(f"Respuesta de OCR ilegible para el mosaico {index + 1}: {str(e)}")
+
+    # Los mosaicos pendientes se envían con los reintentos de request_mistral_ocr
+    last_error = None
+    for index, tile in enumerate(tiles):
+        if index in texts:
+            continue
+        response = send_document_to_ocr(
+            api_key, f"{file_name} (mosaico {index + 1})", tile["mime_type"],
+            document_ingestion.NullProgress(), job_id, data=tile["data"], queue_key=queue_key,
+        )
+        if "error" in response:
+            last_error = response["error"]
+            logging.warning(f"Fallo el OCR del mosaico {index + 1} de {file_name}: {last_error}")
+        else:
+            texts[index] = tile_text(response["response"].get("pages", []))
+        status.update(
+            label=f"OCR de {file_name}: {len(texts)}/{len(tiles)} mosaicos completados", state="running"
+        )
+
+    if not texts:
+        error_message = f"Error en OCR de todos los mosaicos: {last_error}"
+        status.update(label=error_message, state="error")
+        return {"error": error_message}
+    response = {"pages": [{"index": 0, "markdown": image_tiling.stitch_tile_texts(tiles, texts)}]}
+    if len(texts) < len(tiles):
+        missing_tiles = [index + 1 for index in range(len(tiles)) if index not in texts]
+        logging.warning(f"{len(missing_tiles)} mosaicos de {file_name} no se pudieron procesar")
+        status.update(
+            label=f"⚠️ Documento {file_name} procesado parcialmente: mosaicos sin OCR "
+            f"{', '.join(map(str, missing_tiles))} de {len(tiles)}",
+            state="complete",
+        )
+        return {"response": response, "partial": True, "missing_tiles": missing_tiles}
+
+    status.update(
+        label=f"Documento {file_name} procesado exitosamente ({len(tiles)} mosaicos)", state="complete"
+    )
+    return {"response": response}
+
+
+def ocr_pdf_pages(
+    api_key, file_bytes, analysis, file_name, status, job_id, file_path=None, queue_key=None
+):
+    """
+    Aplica OCR solo a las páginas de un PDF que no tienen capa de texto,
+    enviando sus rangos de forma concurrente. Con varios rangos, la primera
+    pasada usa el cliente asíncrono (variable OCR_ASYNC); los rangos que
+    fallan pasan por el envío con reintentos. Las páginas se unen en su
+    orden original junto con las que conservan su capa de texto.
+
+    Parámetros:
+        api_key: API key de Mistral
+        file_bytes: Bytes del PDF (None si se indica file_path)
+        analysis: Resultado de pdf_pages.analyze_pdf
+        file_name: Nombre del archivo
+        status: Objeto con método update() para reportar el progreso
+        job_id: Identificador del procesamiento
+        file_path: Ruta del PDF en disco (opcional)
+        queue_key: Sesión que origina las solicitudes
+
+    Retorno:
+        dict: {"response": {"pages": [...]}} o {"error": mensaje}; si algún
+              rango falló, además "partial": True y "failed_ranges" con los
+              rangos (inicio, fin) cuyas páginas quedaron sin OCR
+    """
+    ranges = analysis["ocr_ranges"]
+    page_count = analysis["page_count"]
+    logging.info(
+        f"PDF {file_name}: {sum(analysis['needs_ocr'])} de {page_count} páginas "
+        f"requieren OCR en {len(ranges)} rangos"
+    )
 
-        # Indicar si se truncó la lista
-        if len(data) > max_items:
-            result.append(
-                f"{prefix}: [... {len(data) - max_items} elementos adicionales omitidos]"
+    def ocr_range(index):
+        start, end = ranges[index]
+        # Un rango sin PDF propio es el documento completo
+        range_bytes = analysis["range_pdfs"][index]
+        if range_bytes is None:
+            range_bytes = file_bytes
+        response = send_document_to_ocr(
+            api_key,
+            f"{file_name} (págs. {start + 1}-{end})",
+            "application/pdf",
+            document_ingestion.NullProgress(),
+            job_id,
+            data=range_bytes,
+            path=file_path if range_bytes is None else None,
+            queue_key=queue_key,
+        )
+        if "error" in response:
+            raise Exception(response["error"])
+        return response["response"].get("pages", [])
+
+    def show_range_progress(completed, total):
+        status.update(
+            label=f"OCR de {file_name}: {completed}/{total} rangos de páginas completados",
+            state="running",
+        )
+
+    results, errors = {}, {}
+    if ranges:
+        status.update(
+            label=f"Enviando {len(ranges)} rangos de páginas a la API de Mistral...", state="running"
+        )
+        if len(ranges) > 1 and os.environ.get("OCR_ASYNC", "true").lower() not in ("0", "false", "no"):
+            results = ocr_ranges_in_batch(api_key, analysis, file_name, file_bytes, file_path, queue_key)
+            show_range_progress(len(results), len(ranges))
+
+        # Los rangos pendientes se envían con reintentos
+        pending = [index for index in range(len(ranges)) if index not in results]
+        if pending:
+            done_before = len(results)
+            retried, failed = pdf_pages.ocr_page_ranges(
+                [ranges[index] for index in pending],
+                lambda position: ocr_range(pending[position]),
+                on_progress=lambda completed, total: show_range_progress(done_before + completed, len(ranges)),
             )
+            results.update({pending[position]: pages for position, pages in retried.items()})
+            errors = {pending[position]: error for position, error in failed.items()}
 
-    return "\n".join(result)
+        if not results and all(analysis["needs_ocr"]):
+            error_message = f"Error en OCR de todos los rangos de páginas: {str(next(iter(errors.values())))}"
+            status.update(label=error_message, state="error")
+            return {"error": error_message}
+
+    pages = pdf_pages.merge_range_pages(ranges, results, analysis["page_texts"])
+    if errors:
+        failed_ranges = [ranges[index] for index in sorted(errors)]
+        logging.warning(f"{len(errors)} rangos de páginas de {file_name} no se pudieron procesar")
+        status.update(
+            label=f"⚠️ Documento {file_name} procesado parcialmente: páginas sin OCR "
+            f"{pdf_pages.describe_ranges(failed_ranges)} de {page_count}",
+            state="complete",
+        )
+        return {"response": {"pages": pages}, "partial": True, "failed_ranges": failed_ranges}
+
+    status.update(
+        label=f"Documento {file_name} procesado exitosamente ({page_count} páginas)",
+        state="complete",
+    )
+    return {"response": {"pages": pages}}
 
 
-@handle_error(max_retries=1)
-def process_document_with_mistral_ocr(api_key, file_bytes, file_type, file_name):
+@handle_error(max_retries=1, error_result=lambda message: {"error": message})
+def process_document_with_mistral_ocr(
+    api_key, file_bytes, file_type, file_name, status=None, pdf_analysis=None, upload=None,
+    queue_key=None,
+):
     """
     Procesa un documento con OCR de Mistral
-    con sistema de recuperación ante fallos
+    con sistema de recuperación ante fallos.
+    En los PDFs solo se envían a OCR las páginas sin capa de texto.
 
     Parámetros:
         api_key: API key de Mistral
-        file_bytes: Bytes del archivo
+        file_bytes: Bytes del archivo (None si se indica upload)
         file_type: Tipo de archivo ("PDF", "Imagen", "Texto" o "Word")
         file_name: Nombre del archivo
+        status: Objeto con método update() para reportar el progreso
+                (por defecto se crea un st.status)
+        pdf_analysis: Resultado de pdf_pages.analyze_pdf si el PDF ya se leyó
+        upload: document_ingestion.SpooledUpload con el archivo en disco, para
+                no cargarlo completo en memoria (opcional)
+        queue_key: Sesión que origina el procesamiento (reparto justo de la
+                   cuota de Mistral)
 
     Retorno:
         dict: Texto extraído del documento
@@ -2661,44 +1978,59 @@ def process_document_with_mistral_ocr(api_key, file_bytes, file_type, file_name)
     job_id = str(uuid.uuid4())
     logging.info(f"Procesando documento {file_name} con Mistral OCR (ID: {job_id})")
 
-    # Mostrar estado
-    with st.status(f"Procesando documento {file_name}...", expanded=True) as status:
+    # Consultar la caché OCR compartida antes de llamar a la API
+    cache = ocr_cache.get_ocr_cache()
+    cache_options = {"file_type": file_type}
+    if file_type == "PDF":
+        cache_options["pdf_text_min_chars"] = pdf_pages.text_min_chars()
+    elif file_type == "Imagen" and image_tiling.tiling_enabled():
+        cache_options["tiles"] = image_tiling.tile_settings()
+    cache_key = ocr_cache.cache_key(
+        file_bytes, MISTRAL_OCR_MODEL, cache_options,
+        content_hash=upload.sha256 if upload else None,
+    )
+    if cache:
+        cached_result = cache.get(cache_key)
+        if cached_result is not None:
+            logging.info(f"Resultado OCR de {file_name} obtenido de la caché ({cache.get_stats()})")
+            cache_message = f"Documento {file_name} recuperado de la caché OCR"
+            if status is not None:
+                status.update(label=cache_message, state="complete")
+            else:
+                st.success(cache_message)
+            return cached_result
+
+    # Mostrar estado (en el contenedor recibido o en uno nuevo)
+    if status is None:
+        status_box = st.status(f"Procesando documento {file_name}...", expanded=True)
+    else:
+        status_box = nullcontext(status)
+    with status_box as status:
         try:
             status.update(label="Preparando documento para OCR...", state="running")
 
-            # Guardar una copia del archivo para depuración
-            debug_dir = os.path.join(
-                tempfile.gettempdir(), f"{APP_IDENTITY['document_prefix']}_debug"
-            )
-            os.makedirs(debug_dir, exist_ok=True)
-            debug_file_path = os.path.join(debug_dir, f"debug_{job_id}_{file_name}")
-
-            with open(debug_file_path, "wb") as f:
-                f.write(file_bytes)
-
-            logging.info(f"Archivo de depuración guardado en: {debug_file_path}")
+            # Guardar una copia del archivo para depuración (si está activado y en la muestra)
+            debug = get_debug_recorder()
+            if debug and debug.record(
+                job_id, f"debug_{job_id}_{file_name}",
+                data=None if upload else file_bytes, path=upload.path if upload else None,
+            ):
+                logging.info(f"Copia de depuración de {file_name} programada en: {debug.directory}")
 
             # Sistema de procesamiento con verificación según tipo
             if file_type == "PDF":
-                # Verificar que el PDF sea válido
+                # Leer el PDF una sola vez (o reutilizar la lectura de la ingesta)
                 try:
-                    import PyPDF2
-
-                    reader = PyPDF2.PdfReader(io.BytesIO(file_bytes))
-                    page_count = len(reader.pages)
-                    sample_text = ""
-                    if page_count > 0:
-                        sample_text = reader.pages[0].extract_text()[:100]
+                    if pdf_analysis is None:
+                        pdf_analysis = pdf_pages.analyze_pdf(upload.path if upload else file_bytes)
+                    ocr_pages = sum(pdf_analysis["needs_ocr"])
                     logging.info(
-                        f"PDF válido con {page_count} páginas. Muestra: {sample_text}"
+                        f"PDF válido con {pdf_analysis['page_count']} páginas, "
+                        f"{ocr_pages} sin capa de texto"
                     )
 
-                    # Codificar PDF en base64
-                    encoded_file = base64.b64encode(file_bytes).decode("utf-8")
-                    document = {
-                        "type": "document_url",
-                        "document_url": f"data:application/pdf;base64,{encoded_file}",
-                    }
+                    # Se enviarán solo los rangos de páginas que requieren OCR
+                    document = None
                 except Exception as e:
                     logging.error(f"Error al validar PDF: {str(e)}")
                     status.update(
@@ -2708,14 +2040,23 @@ def process_document_with_mistral_ocr(api_key, file_bytes, file_type, file_name)
             elif file_type == "Imagen":
                 # Optimizar imagen para mejores resultados
                 try:
-                    optimized_bytes, mime_type = prepare_image_for_ocr(file_bytes)
-
-                    # Codificar en base64
-                    encoded_file = base64.b64encode(optimized_bytes).decode("utf-8")
-                    document = {
-                        "type": "image_url",
-                        "image_url": f"data:{mime_type};base64,{encoded_file}",
-                    }
+                    # Desde disco, el proceso de preparación lee la imagen directamente
+                    image_source = upload.path if file_bytes is None else file_bytes
+                    image_tiles = None
+                    if image_tiling.tiling_enabled():
+                        # Las imágenes grandes se dividen en mosaicos en lugar de reducirse
+                        image_tiles = document_ingestion.run_cpu_bound(
+                            image_tiling.split_image, image_source, *image_tiling.tile_settings()
+                        )
+                    if image_tiles:
+                        document = "tiles"
+                    else:
+                        document_bytes, mime_type = prepare_image_for_ocr(
+                            file_bytes,
+                            path=upload.path if upload else None,
+                            content_hash=upload.sha256 if upload else None,
+                        )
+                        document = "image"
                 except Exception as e:
                     logging.error(f"Error al procesar imagen: {str(e)}")
                     status.update(
@@ -2725,6 +2066,8 @@ def process_document_with_mistral_ocr(api_key, file_bytes, file_type, file_name)
             elif file_type == "Texto":
                 # Para archivos de texto, extraer contenido directamente
                 try:
+                    if file_bytes is None:
+                        file_bytes = upload.read_bytes()
                     # Intentar leer con diferentes codificaciones
                     text_content = None
                     try:
@@ -2750,12 +2093,9 @@ def process_document_with_mistral_ocr(api_key, file_bytes, file_type, file_name)
                         state="running",
                     )
 
-                    # Codificar en base64 y enviar como documento
-                    encoded_file = base64.b64encode(file_bytes).decode("utf-8")
-                    document = {
-                        "type": "document_url",
-                        "document_url": f"data:text/plain;base64,{encoded_file}",
-                    }
+                    # Enviar como documento de texto plano
+                    document_bytes, mime_type = file_bytes, "text/plain"
+                    document = "text"
                 except Exception as e:
                     logging.error(f"Error al procesar documento de texto: {str(e)}")
                     status.update(
@@ -2769,169 +2109,52 @@ def process_document_with_mistral_ocr(api_key, file_bytes, file_type, file_name)
                 status.update(label=error_msg, state="error")
                 return {"error": error_msg}
 
-            status.update(
-                label="Enviando documento a la API de Mistral...", state="running"
-            )
-
-            # Configurar los headers
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}",
-            }
-
-            # Preparar payload
-            payload = {"model": "mistral-ocr-latest", "document": document}
-
-            # Guardar payload para depuración (excluyendo contenido base64 por tamaño)
-            debug_payload = {
-                "model": payload["model"],
-                "document": {
-                    "type": payload["document"]["type"],
-                    "content_size": len(encoded_file),
-                    "content_format": "base64",
-                },
-            }
-            logging.info(f"Payload para OCR: {json.dumps(debug_payload)}")
-
-            # Sistema de retry interno para la API de Mistral
-            max_retries = 2
-            retry_delay = 2
-            last_error = None
-
-            for retry in range(max_retries + 1):
-                try:
-                    # Hacer la solicitud a Mistral OCR API
-                    response = requests.post(
-                        "https://api.mistral.ai/v1/ocr",
-                        json=payload,
-                        headers=headers,
-                        timeout=90,  # Timeout ampliado para documentos grandes
-                    )
-
-                    logging.info(
-                        f"Respuesta de OCR API - Estado: {response.status_code}"
-                    )
+            # Los PDFs se procesan por rangos de páginas y las imágenes grandes por mosaicos, en paralelo
+            if document == "tiles":
+                ocr_response = ocr_image_tiles(
+                    api_key, image_tiles, file_name, status, job_id, queue_key=queue_key
+                )
+            elif document is None:
+                ocr_response = ocr_pdf_pages(
+                    api_key, file_bytes, pdf_analysis, file_name, status, job_id,
+                    file_path=upload.path if upload else None, queue_key=queue_key,
+                )
+            else:
+                ocr_response = send_document_to_ocr(
+                    api_key, file_name, mime_type, status, job_id,
+                    data=document_bytes, queue_key=queue_key,
+                )
+            if "error" in ocr_response:
+                return ocr_response
+            result = ocr_response["response"]
 
-                    if response.status_code == 200:
-                        try:
-                            result = response.json()
-                            # Guardar respuesta para depuración
-                            with open(
-                                os.path.join(
-                                    debug_dir, f"response_{job_id}_{file_name}.json"
-                                ),
-                                "w",
-                            ) as f:
-                                json.dump(result, f, indent=2)
-
-                            status.update(
-                                label=f"Documento {file_name} procesado exitosamente",
-                                state="complete",
-                            )
+            # Extraer texto de la respuesta
+            extracted_content = extract_text_from_ocr_response(result)
 
-                            # Verificar existencia de contenido
-                            if not result or (isinstance(result, dict) and not result):
-                                return {
-                                    "error": "La API no devolvió contenido",
-                                    "raw_response": str(result),
-                                }
-
-                            # Extraer texto de la respuesta
-                            extracted_content = extract_text_from_ocr_response(result)
-
-                            if "error" in extracted_content:
-                                status.update(
-                                    label=f"Error al extraer texto: {extracted_content['error']}",
-                                    state="error",
-                                )
-                                return {
-                                    "error": extracted_content["error"],
-                                    "raw_response": result,
-                                }
-
-                            return extracted_content
-                        except Exception as e:
-                            error_message = (
-                                f"Error al procesar respuesta JSON: {str(e)}"
-                            )
-                            logging.error(error_message)
-                            # Guardar respuesta cruda para depuración
-                            with open(
-                                os.path.join(
-                                    debug_dir, f"raw_response_{job_id}_{file_name}.txt"
-                                ),
-                                "w",
-                            ) as f:
-                                f.write(response.text[:10000])  # Limitar tamaño
-                            status.update(label=error_message, state="error")
-                            last_error = e
-                    elif response.status_code == 429:  # Rate limit
-                        if retry < max_retries:
-                            wait_time = retry_delay * (retry + 1)
-                            logging.warning(
-                                f"Rate limit alcanzado. Esperando {wait_time}s antes de reintentar..."
-                            )
-                            status.update(
-                                label=f"Límite de tasa alcanzado. Reintentando en {wait_time}s...",
-                                state="running",
-                            )
-                            time.sleep(wait_time)
-                            continue
-                        else:
-                            error_message = "Límite de tasa alcanzado. No se pudo procesar después de reintentos."
-                            logging.error(error_message)
-                            status.update(label=error_message, state="error")
-                            return {
-                                "error": error_message,
-                                "raw_response": response.text,
-                            }
-                    else:
-                        error_message = f"Error en API OCR ({response.status_code}): {response.text[:500]}"
-                        logging.error(error_message)
-                        status.update(label=f"Error: {error_message}", state="error")
-                        last_error = Exception(error_message)
-                        break
-                except requests.exceptions.Timeout:
-                    if retry < max_retries:
-                        wait_time = retry_delay * (retry + 1)
-                        logging.warning(
-                            f"Timeout al contactar API. Esperando {wait_time}s antes de reintentar..."
-                        )
-                        status.update(
-                            label=f"Timeout. Reintentando en {wait_time}s...",
-                            state="running",
-                        )
-                        time.sleep(wait_time)
-                    else:
-                        error_message = (
-                            "Timeout al contactar API después de múltiples intentos."
-                        )
-                        logging.error(error_message)
-                        status.update(label=error_message, state="error")
-                        return {"error": error_message}
-                except Exception as e:
-                    if retry < max_retries:
-                        wait_time = retry_delay * (retry + 1)
-                        logging.warning(
-                            f"Error: {str(e)}. Esperando {wait_time}s antes de reintentar..."
-                        )
-                        status.update(
-                            label=f"Error. Reintentando en {wait_time}s...",
-                            state="running",
-                        )
-                        time.sleep(wait_time)
-                    else:
-                        error_message = f"Error al procesar documento: {str(e)}"
-                        logging.error(error_message)
-                        status.update(label=f"Error: {error_message}", state="error")
-                        last_error = e
-                        break
+            if "error" in extracted_content:
+                status.update(
+                    label=f"Error al extraer texto: {extracted_content['error']}",
+                    state="error",
+                )
+                return {
+                    "error": extracted_content["error"],
+                    "raw_response": result,
+                }
 
-            # Si llegamos aquí después de reintentos, devolver último error
-            return {
-                "error": f"Error después de reintentos: {str(last_error)}",
-                "details": traceback.format_exc(),
-            }
+            # Indicar si el PDF combinó capa de texto y OCR
+            if pdf_analysis and not all(pdf_analysis["needs_ocr"]):
+                extracted_content["format"] = "pdf_hybrid"
+
+            # Un resultado incompleto no se guarda: la próxima carga reintenta el OCR
+            if ocr_response.get("partial"):
+                extracted_content["partial"] = True
+                for key in ("failed_ranges", "missing_tiles"):
+                    if key in ocr_response:
+                        extracted_content[key] = ocr_response[key]
+                logging.warning(f"Resultado OCR parcial de {file_name}; no se guarda en la caché")
+            elif cache:
+                cache.put(cache_key, extracted_content)
+            return extracted_content
 
         except Exception as e:
             error_message = f"Error general al procesar documento: {str(e)}"
@@ -2941,6 +2164,128 @@ def process_document_with_mistral_ocr(api_key, file_bytes, file_type, file_name)
             return {"error": error_message}
 
 
+def describe_missing_content(extracted_content):
+    """
+    Describe la parte de un resultado OCR parcial que quedó sin procesar.
+
+    Parámetros:
+        extracted_content: Resultado con "partial" y "failed_ranges" (PDF)
+                           o "missing_tiles" (imagen por mosaicos)
+
+    Retorno:
+        string: Por ejemplo "páginas sin OCR: 3-5" o "mosaicos sin OCR: 2, 4"
+    """
+    if extracted_content.get("failed_ranges"):
+        return f"páginas sin OCR: {pdf_pages.describe_ranges(extracted_content['failed_ranges'])}"
+    if extracted_content.get("missing_tiles"):
+        return f"mosaicos sin OCR: {', '.join(map(str, extracted_content['missing_tiles']))}"
+    return "contenido incompleto"
+
+
+def ingest_uploaded_file(file, mistral_api_key, status, queue_key=None):
+    """
+    Valida y extrae el texto de un archivo cargado. Se ejecuta en un hilo
+    del pipeline de ingesta, por lo que reporta el progreso mediante
+    ``status`` y no escribe en la sesión.
+
+    Parámetros:
+        file: Archivo cargado por el usuario mediante Streamlit
+        mistral_api_key: API key de Mistral
+        status: Objeto con método update() para reportar el progreso
+        queue_key: Sesión que origina la carga (reparto justo de la cuota)
+
+    Retorno:
+        dict: {"valid": bool, "error": mensaje si no es válido,
+               "content": texto extraído o None}
+    """
+    status.update(label=f"{file.name}: validando...", state="running")
+
+    # Validar el formato del archivo antes de procesarlo
+    is_valid, file_type, error_message = validate_file_format(file)
+    if not is_valid:
+        status.update(label=f"{file.name}: {error_message}", state="error")
+        return {"valid": False, "error": error_message}
+
+    # Volcar el archivo a disco por bloques calculando su huella, en lugar
+    # de crear más copias completas en memoria
+    upload = document_ingestion.spool_upload(file)
+
+    try:
+        # Registrar información detallada para depuración
+        logging.info(f"Iniciando procesamiento de {file.name} (tipo: {file_type}, tamaño: {upload.size} bytes)")
+
+        # Intentar extraer texto directamente para PDFs y Markdown antes de OCR
+        extracted_text = None
+        error_msg = None
+        pdf_analysis = None
+        if file_type == "PDF":
+            try:
+                # Leer el PDF una sola vez y clasificar sus páginas
+                status.update(label=f"{file.name}: analizando páginas del PDF...")
+                pdf_analysis = document_ingestion.run_cpu_bound(pdf_pages.analyze_pdf, upload.path)
+                page_texts = pdf_analysis["page_texts"]
+
+                # Si todas las páginas tienen capa de texto no hace falta OCR
+                if page_texts and not any(pdf_analysis["needs_ocr"]):
+                    pdf_text = "".join(page_text + "\n\n" for page_text in page_texts)
+                    logging.info(f"Texto extraído directamente del PDF {file.name}: {len(pdf_text)} caracteres")
+                    extracted_text = {
+                        "text": pdf_text,
+                        "format": "pdf_direct",
+                        "page_offsets": document_retrieval.page_offsets_for(page_texts),
+                    }
+            except Exception as pdf_error:
+                logging.warning(f"Error extrayendo texto directo del PDF: {str(pdf_error)}")
+        elif file_type == "Markdown":
+            try:
+                # Procesar archivo Markdown
+                markdown_text = process_markdown_file(upload.read_bytes())
+                if markdown_text and "text" in markdown_text:
+                    logging.info(f"Texto extraído del archivo Markdown {file.name}: {len(markdown_text['text'])} caracteres")
+                    extracted_text = markdown_text
+            except Exception as md_error:
+                logging.warning(f"Error procesando archivo Markdown: {str(md_error)}")
+
+        # Si no pudimos extraer texto directamente, usar OCR
+        if not extracted_text:
+            ocr_results = process_document_with_mistral_ocr(
+                mistral_api_key, None, file_type, file.name,
+                status=status, pdf_analysis=pdf_analysis, upload=upload,
+                queue_key=queue_key,
+            ) or {"error": "Error desconocido durante el procesamiento"}
+
+            if "error" not in ocr_results:
+                extracted_text = ocr_results
+            else:
+                error_msg = ocr_results.get("error", "Error desconocido durante el procesamiento")
+                logging.error(f"Error en OCR para {file.name}: {error_msg}")
+                # Intentar guardar el contenido crudo como respaldo
+                if "raw_response" in ocr_results:
+                    extracted_text = {"text": f"Error en OCR: {error_msg}\n\nRespuesta cruda: {str(ocr_results['raw_response'])[:1000]}", "format": "error_with_raw"}
+                else:
+                    extracted_text = {"text": f"Error en OCR: {error_msg}", "format": "error"}
+
+        if extracted_text and extracted_text.get("partial"):
+            status.update(
+                label=f"⚠️ {file.name}: procesado parcialmente ({describe_missing_content(extracted_text)})",
+                state="complete",
+            )
+            return {"valid": True, "content": extracted_text}
+        if extracted_text and extracted_text.get("format") not in ("error", "error_with_raw"):
+            status.update(label=f"{file.name}: procesado correctamente", state="complete")
+            return {"valid": True, "content": extracted_text}
+        status.update(label=f"{file.name}: no se pudo extraer el texto", state="error")
+        # El error se devuelve para que el hilo principal lo muestre
+        return {"valid": True, "content": extracted_text, "error": error_msg or "No se pudo extraer el texto"}
+    except Exception as e:
+        logging.error(f"Excepción procesando {file.name}: {str(e)}")
+        logging.error(traceback.format_exc())
+        status.update(label=f"{file.name}: error - {str(e)}", state="error")
+        return {"valid": True, "content": None, "error": str(e)}
+    finally:
+        upload.cleanup()
+
+
 # Función segura para gestionar el contexto de documentos
 @handle_error(max_retries=0)
 def manage_document_context():
@@ -3003,8 +2348,11 @@ def verify_document_context():
                 potential_temp_files.append(doc_name)
                 st.warning(f"⚠️ {doc_name}: Posible archivo temporal")
 
-            if isinstance(doc_content, dict) and "text" in doc_content:
-                text_length = len(doc_content["text"])
+            if isinstance(doc_content, Mapping) and "text" in doc_content:
+                # Los documentos del almacén conocen su longitud sin leer el texto
+                text_length = getattr(doc_content, "length", None)
+                if text_length is None:
+                    text_length = len(doc_content["text"])
                 format_type = doc_content.get("format", "desconocido")
 
                 # Mostrar estado con color según el tamaño del texto
@@ -3014,11 +2362,21 @@ def verify_document_context():
                     st.warning(f"⚠️ {doc_name}: Solo {text_length} caracteres, formato: {format_type}")
                 else:
                     st.error(f"❌ {doc_name}: No se extrajo texto (0 caracteres)")
-            elif isinstance(doc_content, dict) and "error" in doc_content:
+            elif isinstance(doc_content, Mapping) and "error" in doc_content:
                 st.error(f"❌ {doc_name}: Error - {doc_content.get('error', 'Error desconocido')}")
             else:
                 st.warning(f"⚠️ {doc_name}: Formato no reconocido")
 
+            # Mostrar cuánto del documento se incluyó en el último envío
+            report = st.session_state.get("document_context_report", {}).get(doc_name)
+            if report and report["truncated"]:
+                percent = 100 * report["included_tokens"] // max(1, report["total_tokens"])
+                detail = f"{report['passages']} pasajes relevantes, " if report["passages"] else ""
+                st.caption(
+                    f"Último envío: {detail}{percent}% del documento "
+                    f"({report['included_tokens']}/{report['total_tokens']} tokens)"
+                )
+
         # Opción para eliminar archivos temporales si se detectaron
         if potential_temp_files:
             st.write("### Archivos temporales detectados")
@@ -3049,6 +2407,24 @@ def verify_document_context():
                 else:
                     st.info("No se seleccionaron archivos para eliminar.")
 
+        # Estadísticas de la caché OCR compartida
+        cache = ocr_cache.get_ocr_cache()
+        if cache:
+            stats = cache.get_stats()
+            st.caption(
+                f"Caché OCR: {stats['memory_hits'] + stats['disk_hits']} aciertos, "
+                f"{stats['misses']} fallos ({stats['hit_rate']:.0%})"
+            )
+
+        # Estado de la cola compartida de solicitudes a Mistral
+        queue_stats = rate_limit.get_scheduler().get_stats()
+        if queue_stats["granted"]:
+            st.caption(
+                f"Cola de Mistral: {queue_stats['queue_depth']} en espera, "
+                f"espera media {queue_stats['avg_wait']:.1f}s (máx. {queue_stats['max_wait']:.1f}s), "
+                f"{queue_stats['throttled']} límites de tasa, {queue_stats['rate']:.1f} solicitudes/s"
+            )
+
         # Botón para refrescar documentos
         if st.button("Refrescar documentos en contexto"):
             st.success("Contexto de documentos actualizado")
@@ -3157,6 +2533,57 @@ def process_message_with_citations(message):
 
 # Función para enviar mensaje a OpenAI con contexto de documentos
 @handle_error(max_retries=1)
+def build_document_context_block(prompt, documents, header):
+    """
+    Construye el bloque de contexto de documentos para un mensaje, repartiendo
+    entre los documentos el presupuesto de tokens disponible según el prompt
+    y el historial de la conversación. Los documentos que no caben completos
+    se representan con los pasajes más relevantes para el prompt.
+
+    Parámetros:
+        prompt: Texto del mensaje del usuario
+        documents: Diccionario {nombre: contenido} de documentos a incluir
+        header: Encabezado del bloque de contexto
+
+    Retorno:
+        tuple: (bloque de contexto o cadena vacía, documentos enviados completos)
+    """
+    if not documents:
+        return "", {}
+
+    counter = document_context.get_token_counter()
+    history = [
+        msg.get("content", "")
+        for msg in st.session_state.get("messages", [])
+        if isinstance(msg.get("content"), str)
+    ]
+    budget = document_context.document_token_budget(prompt, history, counter)
+
+    retriever = None
+    if os.environ.get("DOCUMENT_RETRIEVAL", "true").lower() not in ("0", "false", "no"):
+        index = st.session_state.document_index
+        index.sync(st.session_state.document_contents, document_context.document_text)
+        top_k = int(os.environ.get("DOCUMENT_RETRIEVAL_TOP_K", document_retrieval.DEFAULT_TOP_K))
+
+        def retriever(doc_names, _budget):
+            passages = index.search(prompt, top_k=top_k, doc_names=doc_names)
+            for passage in passages:
+                passage["label"] = document_retrieval.passage_label(passage)
+            return passages
+
+    context = document_context.assemble_document_context(
+        documents, budget, counter, retriever=retriever
+    )
+
+    # Guardar cuánto de cada documento se incluyó para mostrarlo en la interfaz
+    st.session_state.document_context_report = context["report"]
+
+    complete_docs = {name: documents[name] for name in context["complete"]}
+    if not context["text"]:
+        return "", complete_docs
+    return f"\n\n{header}\n\n{context['text']}", complete_docs
+
+
 def send_message_with_document_context(
     client, thread_id, assistant_id, prompt, current_doc_contents=None
 ):
@@ -3183,53 +2610,32 @@ def send_message_with_document_context(
                 st.session_state.document_contents = {}
             st.session_state.document_contents.update(current_doc_contents)
 
-        # Si hay contenido de documentos, añadirlo al prompt
-        if all_doc_contents and len(all_doc_contents) > 0:
-            document_context = "\n\n### Contexto de documentos procesados:\n\n"
-
-            for doc_name, doc_content in all_doc_contents.items():
-                # Extraer el texto del documento procesado por OCR
-                if isinstance(doc_content, dict):
-                    if "text" in doc_content:
-                        # Limitamos el contenido para no exceder el contexto de OpenAI
-                        doc_text = (
-                            doc_content["text"][:5000] + "..."
-                            if len(doc_content["text"]) > 5000
-                            else doc_content["text"]
-                        )
-                        document_context += (
-                            f"-- Documento: {doc_name} --\n{doc_text}\n\n"
-                        )
-                    elif "error" in doc_content and "raw_response" in doc_content:
-                        # Intentar extraer texto de la respuesta cruda si está disponible
-                        raw_response = doc_content["raw_response"]
-                        if isinstance(raw_response, dict) and "text" in raw_response:
-                            doc_text = (
-                                raw_response["text"][:5000] + "..."
-                                if len(raw_response["text"]) > 5000
-                                else raw_response["text"]
-                            )
-                            document_context += (
-                                f"-- Documento: {doc_name} --\n{doc_text}\n\n"
-                            )
-                        else:
-                            document_context += f"-- Documento: {doc_name} -- (Error al extraer texto: {doc_content['error']})\n\n"
-                    else:
-                        document_context += f"-- Documento: {doc_name} -- (No se pudo extraer texto)\n\n"
-                else:
-                    document_context += (
-                        f"-- Documento: {doc_name} -- (Formato no reconocido)\n\n"
-                    )
+        # Los documentos ya enviados a este thread solo se referencian
+        docs_ledger = document_context.get_thread_ledger(
+            st.session_state.document_ledger, thread_id
+        )
+        pending_docs, shared_docs = document_context.partition_documents(
+            all_doc_contents, docs_ledger
+        )
+
+        # Si hay contenido de documentos pendiente, añadirlo al prompt
+        sent_docs = {}
+        if pending_docs:
+            docs_context, sent_docs = build_document_context_block(
+                prompt, pending_docs, "### Contexto de documentos procesados:"
+            )
 
             # Verificar si hay contenido real antes de añadirlo al prompt
-            if len(document_context) > 60:  # Más que solo el encabezado
-                full_prompt = f"{prompt}\n\n{document_context}"
+            if docs_context:
+                full_prompt = f"{prompt}\n\n{docs_context}"
                 logging.info(
-                    f"Prompt enriquecido con contexto de {len(all_doc_contents)} documentos. Tamaño total: {len(full_prompt)} caracteres"
+                    f"Prompt enriquecido con contexto de {len(pending_docs)} documentos nuevos. Tamaño total: {len(full_prompt)} caracteres"
                 )
             else:
                 logging.warning("No se pudo extraer texto útil de los documentos")
 
+        full_prompt += document_context.shared_documents_note(shared_docs)
+
         # Crear mensaje con el prompt completo (con sistema de retry)
         message = None
         for attempt in range(2):
@@ -3249,74 +2655,89 @@ def send_message_with_document_context(
 
         if not message:
             raise Exception("No se pudo crear el mensaje después de reintentos")
+        document_context.mark_documents_sent(docs_ledger, sent_docs)
 
-        # Crear la ejecución
         run = None
-        for attempt in range(2):
-            try:
-                run = client.beta.threads.runs.create(
-                    thread_id=thread_id, assistant_id=assistant_id
-                )
-                break
-            except Exception as e:
-                if attempt == 0:
+        new_messages = None
+
+        # Modo streaming: mostrar la respuesta a medida que el modelo la genera
+        if os.environ.get("OPENAI_STREAMING", "true").lower() not in ("0", "false", "no"):
+            with st.chat_message("assistant"):
+                response_placeholder = st.empty()
+                try:
+                    stream_result = assistant_runs.stream_run(
+                        client,
+                        thread_id,
+                        assistant_id,
+                        on_text=lambda text: response_placeholder.markdown(text + "▌"),
+                    )
+                    run = stream_result["run"]
+                    new_messages = stream_result["messages"]
+                except assistant_runs.RunStreamError as e:
+                    # Si el run alcanzó a crearse, se sigue esperando por consulta de estado
                     logging.warning(
-                        f"Error al crear ejecución (intento 1): {str(e)}. Reintentando..."
+                        f"Streaming no disponible, usando consulta de estado: {str(e)}"
                     )
-                    time.sleep(2)
-                else:
-                    raise Exception(f"Error al crear ejecución: {str(e)}")
+                    run = e.run
+                    response_placeholder.empty()
+
+        # Crear la ejecución (modo sin streaming)
+        if run is None:
+            for attempt in range(2):
+                try:
+                    run = client.beta.threads.runs.create(
+                        thread_id=thread_id, assistant_id=assistant_id
+                    )
+                    break
+                except Exception as e:
+                    if attempt == 0:
+                        logging.warning(
+                            f"Error al crear ejecución (intento 1): {str(e)}. Reintentando..."
+                        )
+                        time.sleep(2)
+                    else:
+                        raise Exception(f"Error al crear ejecución: {str(e)}")
 
         if not run:
             raise Exception("No se pudo iniciar la ejecución después de reintentos")
 
         # Esperar a que se complete la ejecución
-        with st.status(
-            "Analizando consulta y procesando información...", expanded=True
-        ) as status:
-            run_counter = 0
-            max_run_time = 120  # Tiempo máximo de espera (2 minutos)
-            start_time = time.time()
+        if run.status not in assistant_runs.TERMINAL_RUN_STATUSES:
+            with st.status(
+                "Analizando consulta y procesando información...", expanded=True
+            ) as status:
+                def show_run_status(current_run):
+                    # Mostrar mensajes según el estado
+                    if current_run.status == "in_progress":
+                        status.update(
+                            label="Procesando consulta y analizando documentos...",
+                            state="running",
+                        )
+                    elif current_run.status == "requires_action":
+                        status.update(
+                            label="Realizando acciones requeridas...", state="running"
+                        )
 
-            while run.status not in ["completed", "failed", "cancelled", "expired"]:
-                run_counter += 1
-                time.sleep(1)
+                wait_result = assistant_runs.wait_for_run(
+                    client,
+                    thread_id,
+                    run,
+                    timeout=120,  # Tiempo máximo de espera (2 minutos)
+                    on_status=show_run_status,
+                )
+                run = wait_result["run"]
 
                 # Verificar timeout
-                elapsed_time = time.time() - start_time
-                if elapsed_time > max_run_time:
+                if wait_result["timed_out"]:
                     status.update(
                         label="La operación está tomando demasiado tiempo. Intente nuevamente.",
                         state="error",
                     )
                     logging.error(
-                        f"Timeout después de {max_run_time}s esperando completar ejecución."
+                        f"Timeout después de {wait_result['elapsed']:.0f}s esperando completar ejecución ({wait_result['polls']} consultas)."
                     )
                     return None
 
-                # Actualizar el estado cada 2 segundos para no sobrecargar la API
-                if run_counter % 2 == 0:
-                    try:
-                        run = client.beta.threads.runs.retrieve(
-                            thread_id=thread_id, run_id=run.id
-                        )
-                    except Exception as e:
-                        logging.warning(
-                            f"Error al recuperar estado de ejecución: {str(e)}"
-                        )
-                        # Continuar intentando, podría ser un error temporal
-
-                # Mostrar mensajes según el estado
-                if run.status == "in_progress":
-                    status.update(
-                        label="Procesando consulta y analizando documentos...",
-                        state="running",
-                    )
-                elif run.status == "requires_action":
-                    status.update(
-                        label="Realizando acciones requeridas...", state="running"
-                    )
-
                 # Manejar errores
                 if run.status == "failed":
                     error_msg = f"Error en la ejecución: {getattr(run, 'last_error', 'Desconocido')}"
@@ -3324,29 +2745,31 @@ def send_message_with_document_context(
                     status.update(label="Error en el procesamiento", state="error")
                     return None
 
-            # Actualizar estado final
-            if run.status == "completed":
-                status.update(label="Análisis completado", state="complete")
-            else:
-                status.update(label=f"Estado final: {run.status}", state="error")
+                # Actualizar estado final
+                if run.status == "completed":
+                    status.update(label="Análisis completado", state="complete")
+                else:
+                    status.update(label=f"Estado final: {run.status}", state="error")
 
         # Recuperar mensajes agregados por el asistente
         if run.status == "completed":
             try:
-                messages = client.beta.threads.messages.list(thread_id=thread_id)
+                # En modo streaming los mensajes del run ya llegaron con los eventos
+                if new_messages is None:
+                    new_messages = assistant_runs.list_run_messages(
+                        client, thread_id, run.id
+                    )
 
                 # Buscar el mensaje más reciente del asistente
-                for message in messages.data:
-                    if message.role == "assistant" and not any(
-                        msg["role"] == "assistant" and msg.get("id") == message.id
-                        for msg in st.session_state.messages
-                    ):
-                        full_response = process_message_with_citations(message)
-                        return {
-                            "role": "assistant",
-                            "content": full_response,
-                            "id": message.id,
-                        }
+                for message in assistant_runs.select_new_messages(
+                    new_messages, st.session_state.message_ids
+                ):
+                    full_response = process_message_with_citations(message)
+                    return {
+                        "role": "assistant",
+                        "content": full_response,
+                        "id": message.id,
+                    }
 
                 # Si no se encontró un mensaje nuevo
                 logging.warning("No se encontraron nuevos mensajes del asistente")
@@ -3383,7 +2806,7 @@ def clean_current_session():
         # Limpiar documentos procesados
         if "document_contents" in st.session_state:
             resources_cleaned["documents"] = len(st.session_state.document_contents)
-            st.session_state.document_contents = {}
+            st.session_state.document_contents.clear()
 
         # Limpiar lista de archivos
         if "uploaded_files" in st.session_state:
@@ -3392,12 +2815,21 @@ def clean_current_session():
         # Limpiar historial de mensajes
         if "messages" in st.session_state:
             st.session_state.messages = []
+            st.session_state.message_ids = set()
 
         # Limpiar otros estados relacionados con documentos
         for key in ["file_metadata"]:
             if key in st.session_state:
                 st.session_state[key] = {}
 
+        # Olvidar qué documentos se enviaron a cada thread y sus pasajes indexados,
+        # para que una carga nueva con el mismo nombre o contenido se envíe de nuevo
+        if "document_ledger" in st.session_state:
+            st.session_state.document_ledger.clear()
+        if "document_index" in st.session_state:
+            st.session_state.document_index.clear()
+        st.session_state.pop("document_context_report", None)
+
         # Verificar limpieza exitosa
         clean_success = True
         if (
@@ -3453,14 +2885,40 @@ if "assistants_config" not in st.session_state:
 if "thread_id" not in st.session_state:
     st.session_state.thread_id = None
 
+# Identificador de la sesión para el reparto justo de la cuota de Mistral
+if "session_key" not in st.session_state:
+    st.session_state.session_key = str(uuid.uuid4())
+
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+# Índice de IDs de mensajes conocidos para detectar respuestas nuevas sin recorrer el historial
+if "message_ids" not in st.session_state:
+    st.session_state.message_ids = {
+        msg["id"] for msg in st.session_state.messages if msg.get("id")
+    }
+
 if "uploaded_files" not in st.session_state:
     st.session_state.uploaded_files = []
 
+# Documentos de la sesión: el texto se guarda comprimido en el almacén de
+# documentos y la sesión solo conserva sus identificadores
 if "document_contents" not in st.session_state:
-    st.session_state.document_contents = {}
+    st.session_state.document_contents = document_store.SessionDocuments(
+        document_store.get_document_store()
+    )
+else:
+    st.session_state.document_contents.touch()
+
+# Registro por thread de los documentos cuyo contenido ya se envió al asistente
+if "document_ledger" not in st.session_state:
+    st.session_state.document_ledger = {}
+
+# Índice BM25 de fragmentos de los documentos cargados
+if "document_index" not in st.session_state:
+    st.session_state.document_index = document_retrieval.DocumentIndex(
+        text_reader=st.session_state.document_contents.read_text
+    )
 
 if "file_metadata" not in st.session_state:
     st.session_state.file_metadata = {}
@@ -3595,6 +3053,7 @@ with st.sidebar:
             st.session_state.thread_id = thread.id
             # Limpiar mensajes y mantener el experto actual
             st.session_state.messages = []
+            st.session_state.message_ids = set()
             st.session_state.expert_history = []
             # Registrar el experto actual en el historial con formato de 12 horas
             st.session_state.expert_history.append({
@@ -3621,41 +3080,80 @@ with st.sidebar:
     st.subheader("💾 Exportar Conversación")
     export_format = st.radio("Formato de exportación:", ("Markdown", "PDF"))
 
+    # El archivo se genera solo al pulsar el botón; la descarga se sirve
+    # como bytes por la ruta de archivos de Streamlit, no como URL data:
     if st.button("Descargar conversación"):
         if "messages" in st.session_state and st.session_state.messages:
-            if export_format == "Markdown":
-                md_content = export_chat_to_markdown(st.session_state.messages)
-                b64 = base64.b64encode(md_content.encode()).decode()
-                href = f'<a href="data:text/markdown;base64,{b64}" download="{APP_IDENTITY["conversation_export_name"]}.md">Descargar archivo Markdown</a>'
-                st.markdown(href, unsafe_allow_html=True)
-            else:  # PDF
-                try:
-                    with st.spinner("Generando PDF..."):
-                        try:
-                            # Sistema de generación multicapa
-                            content, content_type = export_chat_to_pdf(
-                                st.session_state.messages
-                            )
-                            if content_type == "pdf":
-                                b64 = base64.b64encode(content).decode()
-                                href = f'<a href="data:application/pdf;base64,{b64}" download="{APP_IDENTITY["conversation_export_name"]}.pdf">Descargar archivo PDF</a>'
-                                st.markdown(href, unsafe_allow_html=True)
-                            else:
-                                # Si devuelve markdown, mostrar alternativa
-                                b64 = content  # Ya viene en base64
-                                href = f'<a href="data:text/markdown;base64,{b64}" download="{APP_IDENTITY["conversation_export_name"]}.md">Descargar archivo Markdown</a>'
-                                st.markdown(href, unsafe_allow_html=True)
-                                st.warning(
-                                    "No se pudo generar el PDF. Se ha creado un archivo markdown en su lugar."
-                                )
-                        except Exception as e:
-                            st.error(f"Error durante la exportación: {str(e)}")
-                            logging.error(f"Error detallado: {traceback.format_exc()}")
-                except Exception as e:
-                    st.error(f"Error al generar PDF: {str(e)}")
+            st.session_state.export_request = (
+                export_format, conversation_export_key(st.session_state.messages, export_format)
+            )
         else:
+            st.session_state.export_request = None
             st.warning("No hay conversación para exportar.")
 
+    # La descarga sigue disponible en las siguientes recargas mientras la conversación no cambie
+    export_request = st.session_state.get("export_request")
+    if (
+        export_request
+        and st.session_state.get("messages")
+        and export_request == (export_format, conversation_export_key(st.session_state.messages, export_format))
+    ):
+        export_name = APP_IDENTITY["conversation_export_name"]
+        try:
+            export_result = st.session_state.get("export_result")
+            export_job = st.session_state.get("export_job")
+            result = None
+            if export_result and export_result[0] == export_request:
+                # Recarga: reutilizar el archivo ya generado (incluido el respaldo en Markdown)
+                result = export_result[1:]
+            elif export_job and export_job[0] == export_request:
+                # El PDF se sigue generando en los procesos de renderizado
+                result = collect_pdf_export(
+                    export_job[1], st.session_state.messages, export_request[1], wait=0
+                )
+            else:
+                with st.spinner("Generando PDF..." if export_format == "PDF" else "Generando archivo..."):
+                    # Sistema de generación multicapa (o caché de exportaciones)
+                    result = export_conversation(
+                        st.session_state.messages, export_format, wait=render_pool.inline_wait_seconds()
+                    )
+                if not isinstance(result, tuple):
+                    st.session_state.export_job = (export_request, result)
+                    result = None
+
+            if result is None:
+                # La sesión sigue respondiendo; cualquier interacción vuelve a consultar el trabajo
+                job = st.session_state.export_job[1]
+                st.info(f"Generando PDF en segundo plano ({job.elapsed():.0f} s)...")
+                st.button("Comprobar exportación")
+                content_type = None
+            else:
+                content, content_type = result
+                st.session_state.export_result = (export_request, content, content_type)
+                st.session_state.export_job = None
+
+            if content_type == "pdf":
+                st.download_button(
+                    "Descargar archivo PDF", data=content,
+                    file_name=f"{export_name}.pdf", mime="application/pdf",
+                )
+            elif content_type == "markdown":
+                st.download_button(
+                    "Descargar archivo Markdown", data=content,
+                    file_name=f"{export_name}.md", mime="text/markdown",
+                )
+                if export_format == "PDF":
+                    # Si devuelve markdown, mostrar alternativa
+                    st.warning(
+                        "No se pudo generar el PDF. Se ha creado un archivo markdown en su lugar."
+                    )
+        except Exception as e:
+            st.session_state.export_request = None
+            st.session_state.export_result = None
+            st.session_state.export_job = None
+            st.error(f"Error durante la exportación: {str(e)}")
+            logging.error(f"Error detallado: {traceback.format_exc()}")
+
     # Administrador de contexto de documentos
     st.subheader("📄 Gestión de Documentos")
     manage_document_context()
@@ -3812,10 +3310,14 @@ def process_message(message, expert_key):
     # Enriquecer el mensaje con el contenido de los documentos
     full_message = message
 
+    # Documentos cuyo contenido se envía completo en este turno
+    sent_docs = {}
+    docs_ledger = document_context.get_thread_ledger(
+        st.session_state.document_ledger, st.session_state.thread_id
+    )
+
     # SIEMPRE verificar si hay documentos en la sesión
     if "document_contents" in st.session_state and st.session_state.document_contents:
-        document_context = "\n\n### Contenido de documentos adjuntos:\n\n"
-
         # Filtrar archivos temporales
         temp_file_patterns = ["img-", "temp", "~$", ".tmp"]
         filtered_docs = {}
@@ -3825,20 +3327,19 @@ def process_message(message, expert_key):
             if not is_temp_file:
                 filtered_docs[doc_name] = doc_content
 
-        # Usar los documentos filtrados
-        for doc_name, doc_content in filtered_docs.items():
-            # Extraer el texto del documento
-            if isinstance(doc_content, dict) and "text" in doc_content:
-                # Limitar el contenido para no exceder el contexto
-                doc_text = doc_content["text"][:10000] + "..." if len(doc_content["text"]) > 10000 else doc_content["text"]
-                document_context += f"-- Documento: {doc_name} --\n{doc_text}\n\n"
-            elif isinstance(doc_content, dict) and "error" in doc_content:
-                document_context += f"-- Documento: {doc_name} -- (Error: {doc_content.get('error', 'Error desconocido')})\n\n"
+        # Los documentos ya enviados a este thread solo se referencian
+        pending_docs, shared_docs = document_context.partition_documents(filtered_docs, docs_ledger)
+
+        # Incluir los documentos pendientes dentro del presupuesto de tokens
+        docs_context, sent_docs = build_document_context_block(
+            message, pending_docs, "### Contenido de documentos adjuntos:"
+        )
 
         # Añadir el contexto de documentos al mensaje si hay contenido real
-        if len(document_context) > 60:  # Más que solo el encabezado
-            full_message = f"{message}\n\n{document_context}"
-            logging.info(f"Mensaje enriquecido con {len(filtered_docs)} documentos (filtrados de {len(st.session_state.document_contents)}). Tamaño total: {len(full_message)} caracteres")
+        if docs_context:
+            full_message = f"{message}\n\n{docs_context}"
+        full_message += document_context.shared_documents_note(shared_docs)
+        logging.info(f"Mensaje enriquecido con {len(pending_docs)} documentos nuevos y {len(shared_docs)} ya compartidos (filtrados de {len(st.session_state.document_contents)}). Tamaño total: {len(full_message)} caracteres")
 
     # Añadir el mensaje a la conversación
     st.session_state.client.beta.threads.messages.create(
@@ -3846,61 +3347,81 @@ def process_message(message, expert_key):
         role="user",
         content=full_message
     )
+    document_context.mark_documents_sent(docs_ledger, sent_docs)
 
-    # Ejecutar el asistente con el thread actual
-    run = st.session_state.client.beta.threads.runs.create(
-        thread_id=st.session_state.thread_id,
-        assistant_id=assistant_id
-    )
+    run = None
+    new_messages = None
+
+    # Modo streaming: mostrar la respuesta a medida que el modelo la genera
+    if os.environ.get("OPENAI_STREAMING", "true").lower() not in ("0", "false", "no"):
+        with st.chat_message("assistant"):
+            response_placeholder = st.empty()
+            try:
+                stream_result = assistant_runs.stream_run(
+                    st.session_state.client,
+                    st.session_state.thread_id,
+                    assistant_id,
+                    on_text=lambda text: response_placeholder.markdown(text + "▌"),
+                )
+                run = stream_result["run"]
+                new_messages = stream_result["messages"]
+            except assistant_runs.RunStreamError as e:
+                # Si el run alcanzó a crearse, se sigue esperando por consulta de estado
+                logging.warning(f"Streaming no disponible, usando consulta de estado: {str(e)}")
+                run = e.run
+                response_placeholder.empty()
+
+    # Ejecutar el asistente con el thread actual (modo sin streaming)
+    if run is None:
+        run = st.session_state.client.beta.threads.runs.create(
+            thread_id=st.session_state.thread_id,
+            assistant_id=assistant_id
+        )
 
     # Esperar a que el asistente termine de procesar
-    with st.status("Procesando tu mensaje...", expanded=True) as status:
-        run_counter = 0
-        max_run_time = 120  # Tiempo máximo de espera (2 minutos)
-        start_time = time.time()
-
-        while run.status not in ["completed", "failed", "cancelled", "expired"]:
-            run_counter += 1
-            time.sleep(1)
-
-            # Verificar timeout
-            elapsed_time = time.time() - start_time
-            if elapsed_time > max_run_time:
+    if run.status not in assistant_runs.TERMINAL_RUN_STATUSES:
+        with st.status("Procesando tu mensaje...", expanded=True) as status:
+            wait_result = assistant_runs.wait_for_run(
+                st.session_state.client,
+                st.session_state.thread_id,
+                run,
+                timeout=120,  # Tiempo máximo de espera (2 minutos)
+                on_status=lambda current_run: status.update(
+                    label=f"Procesando mensaje... ({current_run.status})"
+                ),
+            )
+            run = wait_result["run"]
+
+            if wait_result["timed_out"]:
                 status.update(
                     label="La operación está tomando demasiado tiempo. Intente nuevamente.",
                     state="error"
                 )
-                logging.error(f"Timeout después de {max_run_time}s esperando completar ejecución.")
+                logging.error(
+                    f"Timeout después de {wait_result['elapsed']:.0f}s esperando completar ejecución ({wait_result['polls']} consultas)."
+                )
                 return None
 
-            # Actualizar el estado cada 2 segundos para no sobrecargar la API
-            if run_counter % 2 == 0:
-                try:
-                    run = st.session_state.client.beta.threads.runs.retrieve(
-                        thread_id=st.session_state.thread_id, run_id=run.id
-                    )
-                    status.update(label=f"Procesando mensaje... ({run.status})")
-                except Exception as e:
-                    logging.warning(f"Error al recuperar estado de ejecución: {str(e)}")
-
     # Obtener los mensajes actualizados
     if run.status == "completed":
-        messages = st.session_state.client.beta.threads.messages.list(
-            thread_id=st.session_state.thread_id
-        )
+        # En modo streaming los mensajes del run ya llegaron con los eventos
+        if new_messages is None:
+            new_messages = assistant_runs.list_run_messages(
+                st.session_state.client, st.session_state.thread_id, run.id
+            )
 
         # Extraer la última respuesta del asistente
-        for msg in messages.data:
-            if msg.role == "assistant" and not any(m.get("id") == msg.id for m in st.session_state.messages):
-                # Guardar el mensaje en el estado de la sesión
-                new_message = {
-                    "id": msg.id,
-                    "role": "assistant",
-                    "content": msg.content[0].text.value,
-                    "expert": expert_key
-                }
-                st.session_state.messages.append(new_message)
-                return new_message["content"]
+        for msg in assistant_runs.select_new_messages(new_messages, st.session_state.message_ids):
+            # Guardar el mensaje en el estado de la sesión
+            new_message = {
+                "id": msg.id,
+                "role": "assistant",
+                "content": msg.content[0].text.value,
+                "expert": expert_key
+            }
+            st.session_state.messages.append(new_message)
+            st.session_state.message_ids.add(msg.id)
+            return new_message["content"]
     else:
         logging.error(f"La ejecución falló con estado: {run.status}")
 
@@ -4023,95 +3544,62 @@ if prompt:
     elif isinstance(prompt, dict) and "files" in prompt and prompt["files"]:
         user_files = prompt["files"]
 
-    # Documentos para compartir en el contexto
-    current_doc_contents = {}
-
-    # Si hay archivos adjuntos, procesarlos con OCR
+    # Si hay archivos adjuntos, procesarlos con OCR en paralelo
     if user_files:
         with st.spinner("Procesando documentos con OCR..."):
             valid_files = 0
             invalid_files = 0
 
-            for file in user_files:
-                # Validar el formato del archivo antes de procesarlo
-                is_valid, file_type, error_message = validate_file_format(file)
+            # Un contenedor de estado por archivo, en orden de carga
+            file_statuses = [
+                st.status(f"{file.name}: en cola", expanded=False) for file in user_files
+            ]
+
+            def show_ingestion_progress(index, changes):
+                file_statuses[index].update(**changes)
+
+            session_key = st.session_state.session_key
+            results = document_ingestion.ingest_files(
+                user_files,
+                lambda file, status: ingest_uploaded_file(file, mistral_api_key, status, session_key),
+                on_progress=show_ingestion_progress,
+            )
 
-                if not is_valid:
+            # Guardar los resultados en el orden de carga
+            for file, result in zip(user_files, results):
+                if not result.get("valid", False):
                     # Mostrar error y continuar con el siguiente archivo
-                    st.error(f"Error en archivo {file.name}: {error_message}")
+                    st.error(f"Error en archivo {file.name}: {result.get('error', 'Error desconocido')}")
                     invalid_files += 1
                     continue
 
-                # Si el archivo es válido, procesarlo
                 if file.name not in st.session_state.uploaded_files:
                     st.session_state.uploaded_files.append(file.name)
 
-                # Leer el contenido del archivo
-                file_bytes = file.read()
-                file.seek(0)  # Restaurar el puntero del archivo
+                # Los hilos de ingesta no usan la interfaz: sus errores se muestran aquí
+                if result.get("error"):
+                    st.error(f"Error procesando {file.name}: {result['error']}")
 
-                # Procesar con OCR de Mistral
-                try:
-                    # Registrar información detallada para depuración
-                    logging.info(f"Iniciando procesamiento de {file.name} (tipo: {file_type}, tamaño: {len(file_bytes)} bytes)")
-
-                    # Intentar extraer texto directamente para PDFs y Markdown antes de OCR
-                    extracted_text = None
-                    if file_type == "PDF":
-                        try:
-                            import PyPDF2
-                            pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_bytes))
-                            pdf_text = ""
-                            for page in pdf_reader.pages:
-                                pdf_text += page.extract_text() + "\n\n"
-
-                            if pdf_text.strip():
-                                logging.info(f"Texto extraído directamente del PDF {file.name}: {len(pdf_text)} caracteres")
-                                extracted_text = {"text": pdf_text, "format": "pdf_direct"}
-                        except Exception as pdf_error:
-                            logging.warning(f"Error extrayendo texto directo del PDF: {str(pdf_error)}")
-                    elif file_type == "Markdown":
-                        try:
-                            # Procesar archivo Markdown
-                            markdown_text = process_markdown_file(file_bytes)
-                            if markdown_text and "text" in markdown_text:
-                                logging.info(f"Texto extraído del archivo Markdown {file.name}: {len(markdown_text['text'])} caracteres")
-                                extracted_text = markdown_text
-                        except Exception as md_error:
-                            logging.warning(f"Error procesando archivo Markdown: {str(md_error)}")
-
-                    # Si no pudimos extraer texto directamente, usar OCR
-                    if not extracted_text:
-                        ocr_results = process_document_with_mistral_ocr(
-                            mistral_api_key, file_bytes, file_type, file.name
+                extracted_text = result.get("content")
+                if extracted_text and extracted_text.get("partial"):
+                    st.warning(
+                        f"⚠️ {file.name}: parte del documento no se pudo procesar con OCR "
+                        f"({describe_missing_content(extracted_text)}); "
+                        "vuelva a cargar el archivo para reintentarlo"
+                    )
+                if extracted_text:
+                    # Guardar en la sesión para referencia futura
+                    st.session_state.document_contents[file.name] = extracted_text
+                    # Fragmentar e indexar el documento para la recuperación de pasajes
+                    if "text" in extracted_text:
+                        st.session_state.document_index.add_document(
+                            file.name, extracted_text["text"], extracted_text.get("page_offsets")
                         )
-
-                        if ocr_results and "error" not in ocr_results:
-                            extracted_text = ocr_results
-                        else:
-                            error_msg = ocr_results.get("error", "Error desconocido durante el procesamiento")
-                            logging.error(f"Error en OCR para {file.name}: {error_msg}")
-                            # Intentar guardar el contenido crudo como respaldo
-                            if "raw_response" in ocr_results:
-                                extracted_text = {"text": f"Error en OCR: {error_msg}\n\nRespuesta cruda: {str(ocr_results['raw_response'])[:1000]}", "format": "error_with_raw"}
-                            else:
-                                extracted_text = {"text": f"Error en OCR: {error_msg}", "format": "error"}
-
-                    # Guardar el resultado final
-                    if extracted_text:
-                        current_doc_contents[file.name] = extracted_text
-                        # Guardar en la sesión para referencia futura
-                        st.session_state.document_contents[file.name] = extracted_text
-                        st.success(f"Documento {file.name} procesado correctamente")
-                        logging.info(f"Documento {file.name} procesado exitosamente con formato {extracted_text.get('format', 'desconocido')}")
-                        valid_files += 1
-                    else:
-                        st.warning(f"No se pudo extraer texto de {file.name}")
-                        logging.warning(f"No se pudo extraer texto de {file.name}")
-                except Exception as e:
-                    st.error(f"Error procesando {file.name}: {str(e)}")
-                    logging.error(f"Excepción procesando {file.name}: {str(e)}")
-                    logging.error(traceback.format_exc())
+                    logging.info(f"Documento {file.name} procesado exitosamente con formato {extracted_text.get('format', 'desconocido')}")
+                    valid_files += 1
+                else:
+                    st.warning(f"No se pudo extraer texto de {file.name}")
+                    logging.warning(f"No se pudo extraer texto de {file.name}")
 
             # Mostrar resumen de procesamiento
             if invalid_files > 0:
@@ -4126,43 +3614,15 @@ if prompt:
                     )
 
     # Generar un mensaje automático si solo hay archivos sin texto
+    # (el contenido de los documentos lo añade process_message una sola vez por thread)
     if not user_text and user_files:
         file_names = [f.name for f in user_files]
 
-        # Verificar si hay contenido de archivos para incluirlo en el mensaje
-        file_contents = ""
-        for file_name, content in current_doc_contents.items():
-            # Procesar archivos de texto
-            if file_name.lower().endswith('.txt') and 'text' in content:
-                file_contents += f"\n\nContenido de {file_name}:\n```\n{content['text'][:5000]}\n```"
-                if len(content['text']) > 5000:
-                    file_contents += "\n[Contenido truncado por longitud...]\n"
-            # Procesar archivos PDF
-            elif (file_name.lower().endswith('.pdf') and 'text' in content):
-                file_contents += f"\n\nContenido del PDF {file_name}:\n```\n{content['text'][:5000]}\n```"
-                if len(content['text']) > 5000:
-                    file_contents += "\n[Contenido truncado por longitud...]\n"
-            # Procesar archivos Markdown
-            elif (file_name.lower().endswith('.md') and 'text' in content):
-                file_contents += f"\n\nContenido del Markdown {file_name}:\n```markdown\n{content['text'][:5000]}\n```"
-                if len(content['text']) > 5000:
-                    file_contents += "\n[Contenido truncado por longitud...]\n"
-            # Procesar otros tipos de archivos con texto
-            elif 'text' in content and content['text']:
-                file_contents += f"\n\nContenido de {file_name}:\n```\n{content['text'][:5000]}\n```"
-                if len(content['text']) > 5000:
-                    file_contents += "\n[Contenido truncado por longitud...]\n"
-
         # Mensaje base
         user_text = APP_IDENTITY["file_upload_default_message"].format(
             files=", ".join(file_names)
         )
 
-        # Añadir contenido de archivos si existe
-        if file_contents:
-            user_text += file_contents
-            logging.info(f"Mensaje generado con contenido de {len(current_doc_contents)} archivos")
-
     # Si no hay ni texto ni archivos, no hacemos nada
     if not user_text and not user_files:
         st.warning("Por favor, ingrese un mensaje o adjunte un archivo para continuar.")
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Módulo para ejecutar runs de OpenAI Assistants en Expert Nexus.
+Este módulo contiene las funciones para lanzar una ejecución del asistente
+y recibir su respuesta, ya sea en modo streaming o mediante consulta de estado.
+"""
+
+import logging
+import random
+import time
+
+logger = logging.getLogger("assistant_runs")
+
+# Estados en los que un run ya no cambiará
+TERMINAL_RUN_STATUSES = ("completed", "failed", "cancelled", "expired", "incomplete")
+
+# Máximo de mensajes a recuperar por run (un run suele crear uno solo)
+DEFAULT_RUN_MESSAGES_LIMIT = 20
+
+# Parámetros predeterminados de la consulta de estado adaptativa
+DEFAULT_POLL_INITIAL_INTERVAL = 0.2  # Primera espera en segundos
+DEFAULT_POLL_MAX_INTERVAL = 3.0  # Espera máxima entre consultas
+DEFAULT_POLL_BACKOFF = 1.5  # Factor de crecimiento de la espera
+DEFAULT_POLL_JITTER = 0.2  # Variación aleatoria relativa (±20%)
+
+
+class RunStreamError(Exception):
+    """
+    Error durante la ejecución de un run en modo streaming.
+
+    Si el run alcanzó a crearse en el servidor, se expone en el atributo
+    ``run`` para que el llamador pueda continuar esperándolo por consulta
+    de estado en lugar de crear uno nuevo.
+    """
+
+    def __init__(self, message, run=None):
+        super().__init__(message)
+        self.run = run
+
+
+def stream_run(client, thread_id, assistant_id, on_text=None):
+    """
+    Ejecuta el asistente sobre un thread usando el flujo de eventos de la API
+    y entrega el texto a medida que el modelo lo produce.
+
+    Parámetros:
+        client: Cliente OpenAI con encabezados de Assistants v2
+        thread_id: ID del thread de la conversación
+        assistant_id: ID del asistente que debe responder
+        on_text: Función opcional que recibe el texto acumulado tras cada delta
+
+    Retorno:
+        dict: {"run": run final, "messages": mensajes creados por el run, "text": texto acumulado}
+
+    Excepciones:
+        RunStreamError: Si el streaming no está disponible o se interrumpe
+    """
+    text = ""
+    stream = None
+    try:
+        with client.beta.threads.runs.stream(
+            thread_id=thread_id, assistant_id=assistant_id
+        ) as stream:
+            for delta in stream.text_deltas:
+                text += delta
+                if on_text:
+                    on_text(text)
+
+            run = stream.get_final_run()
+            messages = stream.get_final_messages()
+    except Exception as e:
+        current_run = getattr(stream, "current_run", None) if stream else None
+        logger.warning(f"Streaming de run interrumpido: {str(e)}")
+        raise RunStreamError(
+            f"Error durante el streaming del run: {str(e)}", run=current_run
+        ) from e
+
+    logger.info(
+        f"Run {run.id} finalizado por streaming con estado {run.status} ({len(text)} caracteres)"
+    )
+    return {"run": run, "messages": messages, "text": text}
+
+
+def _header_seconds(headers, name, scale=1.0):
+    """
+    Lee un encabezado numérico de la respuesta y lo convierte a segundos.
+
+    Retorno:
+        float o None: Valor en segundos, o None si no existe o no es numérico
+    """
+    if not headers:
+        return None
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value) * scale)
+    except (TypeError, ValueError):
+        return None
+
+
+def _retrieve_run(client, thread_id, run_id):
+    """
+    Consulta el estado de un run junto con la pista de espera del servidor.
+
+    Retorno:
+        tuple: (run, segundos_sugeridos o None)
+    """
+    raw = client.beta.threads.runs.with_raw_response.retrieve(
+        thread_id=thread_id, run_id=run_id
+    )
+    hint = _header_seconds(raw.headers, "openai-poll-after-ms", scale=0.001)
+    return raw.parse(), hint
+
+
+def _error_retry_hint(error):
+    """
+    Extrae la espera sugerida (Retry-After) de un error de la API, si existe.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    hint = _header_seconds(headers, "retry-after-ms", scale=0.001)
+    if hint is None:
+        hint = _header_seconds(headers, "retry-after")
+    return hint
+
+
+def wait_for_run(
+    client,
+    thread_id,
+    run,
+    timeout=120,
+    initial_interval=DEFAULT_POLL_INITIAL_INTERVAL,
+    max_interval=DEFAULT_POLL_MAX_INTERVAL,
+    backoff=DEFAULT_POLL_BACKOFF,
+    jitter=DEFAULT_POLL_JITTER,
+    on_status=None,
+    sleep=time.sleep,
+    clock=time.monotonic,
+):
+    """
+    Espera a que un run llegue a un estado final consultando su estado
+    con intervalos adaptativos: consultas rápidas al inicio que se espacian
+    progresivamente con variación aleatoria.
+
+    Si el servidor sugiere un intervalo (encabezado openai-poll-after-ms)
+    o un tiempo de reintento (Retry-After), se respeta esa indicación,
+    nunca por debajo de la primera espera. Todas las esperas se acotan a un
+    único plazo total.
+
+    Parámetros:
+        client: Cliente OpenAI con encabezados de Assistants v2
+        thread_id: ID del thread de la conversación
+        run: Run creado previamente
+        timeout: Tiempo máximo total de espera en segundos
+        initial_interval: Primera espera entre consultas en segundos
+        max_interval: Espera máxima entre consultas en segundos
+        backoff: Factor de crecimiento de la espera tras cada consulta
+        jitter: Variación aleatoria relativa aplicada a cada espera
+        on_status: Función opcional que recibe el run tras cada consulta
+        sleep: Función de espera (inyectable para pruebas)
+        clock: Reloj monotónico (inyectable para pruebas)
+
+    Retorno:
+        dict: {"run": último run obtenido, "polls": consultas realizadas,
+               "elapsed": segundos transcurridos, "timed_out": bool}
+    """
+    start = clock()
+    deadline = start + timeout
+    interval = initial_interval
+    hint = None
+    polls = 0
+    timed_out = False
+
+    while run.status not in TERMINAL_RUN_STATUSES:
+        remaining = deadline - clock()
+        if remaining <= 0:
+            timed_out = True
+            break
+
+        if hint is not None:
+            # Una pista nula no debe convertir la espera en un bucle sin pausa
+            wait_time = max(initial_interval, hint)
+        else:
+            wait_time = interval * random.uniform(1 - jitter, 1 + jitter)
+            interval = min(max_interval, interval * backoff)
+        sleep(min(wait_time, remaining))
+
+        polls += 1
+        try:
+            run, hint = _retrieve_run(client, thread_id, run.id)
+        except Exception as e:
+            hint = _error_retry_hint(e)
+            logger.warning(f"Error al recuperar estado de ejecución: {str(e)}")
+            continue
+
+        if on_status:
+            on_status(run)
+
+    elapsed = clock() - start
+    logger.info(
+        f"Run {run.id} en estado {run.status} tras {polls} consultas en {elapsed:.2f}s"
+    )
+    return {"run": run, "polls": polls, "elapsed": elapsed, "timed_out": timed_out}
+
+
+def list_run_messages(client, thread_id, run_id, limit=DEFAULT_RUN_MESSAGES_LIMIT):
+    """
+    Recupera únicamente los mensajes del asistente creados por un run,
+    en orden cronológico, sin listar el historial completo del thread.
+
+    Parámetros:
+        client: Cliente OpenAI con encabezados de Assistants v2
+        thread_id: ID del thread de la conversación
+        run_id: ID del run cuyos mensajes se quieren obtener
+        limit: Número máximo de mensajes a recuperar
+
+    Retorno:
+        list: Mensajes del asistente creados por el run
+    """
+    page = client.beta.threads.messages.list(
+        thread_id=thread_id, run_id=run_id, order="asc", limit=limit
+    )
+    return [message for message in page.data if message.role == "assistant"]
+
+
+def select_new_messages(messages, seen_ids):
+    """
+    Filtra los mensajes del asistente que aún no están en el historial
+    de la sesión usando un índice de IDs conocidos.
+
+    Parámetros:
+        messages: Mensajes recuperados de la API
+        seen_ids: Conjunto de IDs de mensajes ya registrados en la sesión
+
+    Retorno:
+        list: Mensajes del asistente cuyos IDs no se habían visto
+    """
+    return [
+        message
+        for message in messages
+        if message.role == "assistant" and message.id not in seen_ids
+    ]
@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Módulo de artefactos de depuración del OCR para Expert Nexus.
+Las copias de los archivos cargados y las respuestas de la API se guardan
+solo si se activa DEBUG_ARTIFACTS y solo para una muestra de los
+procesamientos. Se comprimen con gzip y las escribe un hilo en segundo
+plano, de modo que no añaden E/S a la ruta de la solicitud; el directorio
+se limita por tamaño total y antigüedad, desalojando lo menos usado.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("debug_artifacts")
+
+# Valores predeterminados (configurables por variables de entorno)
+DEFAULT_SAMPLE_RATE = 0.1  # Fracción de procesamientos que se guardan
+DEFAULT_MAX_MB = 200  # Tamaño máximo del directorio de depuración
+DEFAULT_MAX_AGE_HOURS = 24  # Antigüedad máxima de un artefacto
+DEFAULT_QUEUE_SIZE = 64  # Escrituras pendientes antes de descartar
+DEFAULT_DEBUG_DIR = os.path.join(tempfile.gettempdir(), "expert_nexus_debug")
+
+_ARTIFACT_SUFFIX = ".gz"
+_SNAPSHOT_SUFFIX = ".pending"
+
+# Registro compartido por el proceso
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def _safe_name(name):
+    """Convierte un nombre de artefacto en un nombre de archivo seguro."""
+    return re.sub(r"[^\w.\-]+", "_", os.path.basename(name)) or "artefacto"
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    try:
+        return float(value) if value else default
+    except ValueError:
+        logger.warning(f"Valor inválido para {name}: {value}. Usando {default}")
+        return default
+
+
+class DebugRecorder:
+    """
+    Registro de artefactos de depuración con escritura en segundo plano.
+
+    Los artefactos de un mismo procesamiento se guardan o se omiten juntos:
+    la decisión de muestreo depende solo de su identificador. Si la cola de
+    escritura está llena, el artefacto se descarta en lugar de bloquear.
+    """
+
+    def __init__(self, directory=DEFAULT_DEBUG_DIR, sample_rate=DEFAULT_SAMPLE_RATE,
+                 max_bytes=DEFAULT_MAX_MB * 1024 * 1024, max_age_hours=DEFAULT_MAX_AGE_HOURS,
+                 queue_size=DEFAULT_QUEUE_SIZE):
+        self.directory = directory
+        self.sample_rate = min(1.0, max(0.0, sample_rate))
+        self.max_bytes = max_bytes
+        self.max_age = max_age_hours * 3600
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._entries = OrderedDict()  # Ruta -> tamaño, de menos a más reciente
+        self._total = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            "written": 0,
+            "skipped": 0,
+            "dropped": 0,
+            "errors": 0,
+            "evictions": 0,
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_entries()
+        self._writer = threading.Thread(target=self._run, name="debug-artifacts", daemon=True)
+        self._writer.start()
+
+    def _load_entries(self):
+        """Registra los artefactos existentes en orden de último uso."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(_SNAPSHOT_SUFFIX):
+                # Copia de un archivo que quedó sin escribir en una ejecución anterior
+                self._remove_file(os.path.join(self.directory, name))
+                continue
+            if not name.endswith(_ARTIFACT_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            entries.append((info.st_mtime, info.st_size, path))
+        for _, size, path in sorted(entries):
+            self._entries[path] = size
+            self._total += size
+
+    def sampled(self, job_id):
+        """Indica si los artefactos de un procesamiento deben guardarse."""
+        if self.sample_rate >= 1:
+            return True
+        digest = hashlib.sha256(str(job_id).encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") / 2 ** 64 < self.sample_rate
+
+    def record(self, job_id, name, data=None, path=None):
+        """
+        Programa la escritura de un artefacto si el procesamiento está en la muestra.
+
+        Parámetros:
+            job_id: Identificador del procesamiento (decide el muestreo)
+            name: Nombre del artefacto
+            data: Contenido en bytes, texto o un objeto serializable a JSON
+            path: Ruta de un archivo a copiar (en lugar de data)
+
+        Retorno:
+            bool: True si el artefacto quedó en la cola de escritura
+        """
+        if not self.sampled(job_id):
+            with self._lock:
+                self.stats["skipped"] += 1
+            return False
+
+        source = None
+        if path is not None:
+            # Copia propia del archivo: quien lo cargó puede eliminarlo antes
+            # de que se escriba, y no se deja ningún descriptor abierto
+            source = self._snapshot(path)
+            if source is None:
+                return False
+        elif isinstance(data, str):
+            source = data.encode("utf-8")
+        elif isinstance(data, (bytes, bytearray)):
+            source = bytes(data)
+        else:
+            source = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+
+        try:
+            self._queue.put_nowait((_safe_name(name), source))
+            return True
+        except queue.Full:
+            if path is not None:
+                self._remove_file(source)
+            with self._lock:
+                self.stats["dropped"] += 1
+            return False
+
+    def _run(self):
+        while True:
+            name, source = self._queue.get()
+            try:
+                self._write(name, source)
+            except Exception as e:
+                with self._lock:
+                    self.stats["errors"] += 1
+                logger.warning(f"No se pudo guardar el artefacto de depuración {name}: {str(e)}")
+            finally:
+                if isinstance(source, str):
+                    self._remove_file(source)
+                self._queue.task_done()
+
+    def _write(self, name, source):
+        target = os.path.join(self.directory, name + _ARTIFACT_SUFFIX)
+        # Escritura atómica para no dejar artefactos a medio escribir
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as f:
+                if isinstance(source, bytes):
+                    f.write(source)
+                else:
+                    with open(source, "rb") as snapshot:
+                        shutil.copyfileobj(snapshot, f, 1024 * 1024)
+            size = os.path.getsize(temp_path)
+            if size > self.max_bytes:
+                raise OSError(f"supera el tamaño máximo ({size} bytes)")
+            os.replace(temp_path, target)
+        except BaseException:
+            self._remove_file(temp_path)
+            raise
+
+        with self._lock:
+            self._total -= self._entries.pop(target, 0)
+            self._entries[target] = size
+            self._total += size
+            self.stats["written"] += 1
+            self._enforce_retention()
+
+    def _snapshot(self, path):
+        """
+        Enlaza (o, si no es posible, copia) un archivo a una ruta privada del
+        directorio de depuración.
+
+        Retorno:
+            string o None: Ruta de la copia, o None si no se pudo leer
+        """
+        fd, snapshot = tempfile.mkstemp(dir=self.directory, suffix=_SNAPSHOT_SUFFIX)
+        os.close(fd)
+        try:
+            os.remove(snapshot)
+            os.link(path, snapshot)
+            return snapshot
+        except OSError:
+            pass
+        try:
+            shutil.copyfile(path, snapshot)
+            return snapshot
+        except OSError as e:
+            self._remove_file(snapshot)
+            logger.warning(f"No se pudo leer {path} para depuración: {str(e)}")
+            return None
+
+    def _remove_file(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _enforce_retention(self):
+        """Elimina los artefactos vencidos y luego los menos usados hasta respetar el tamaño máximo."""
+        cutoff = time.time() - self.max_age
+        for path in list(self._entries):
+            try:
+                expired = os.path.getmtime(path) < cutoff
+            except OSError:
+                expired = True
+            if expired:
+                self._evict(path)
+        while self._total > self.max_bytes and self._entries:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, path):
+        self._total -= self._entries.pop(path)
+        self._remove_file(path)
+        self.stats["evictions"] += 1
+
+    def read(self, name):
+        """
+        Lee un artefacto guardado y lo marca como usado recientemente.
+
+        Retorno:
+            bytes o None: Contenido descomprimido, o None si no existe
+        """
+        path = os.path.join(self.directory, _safe_name(name) + _ARTIFACT_SUFFIX)
+        try:
+            with gzip.open(path, "rb") as f:
+                content = f.read()
+            os.utime(path, None)
+        except OSError:
+            return None
+        with self._lock:
+            if path in self._entries:
+                self._entries.move_to_end(path)
+        return content
+
+    def flush(self):
+        """Espera a que se escriban los artefactos pendientes."""
+        self._queue.join()
+
+    def get_stats(self):
+        """
+        Retorno:
+            dict: Artefactos escritos, omitidos por muestreo, descartados,
+                  desalojados, errores, pendientes y bytes ocupados
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["artifacts"] = len(self._entries)
+            stats["stored_bytes"] = self._total
+        stats["pending"] = self._queue.qsize()
+        return stats
+
+
+def get_debug_recorder(directory=None):
+    """
+    Obtiene el registro de depuración compartido por el proceso, creándolo
+    la primera vez.
+
+    Parámetros:
+        directory: Directorio predeterminado si no se define DEBUG_ARTIFACTS_DIR
+
+    Variables de entorno:
+        DEBUG_ARTIFACTS: Activa los artefactos de depuración (false por defecto)
+        DEBUG_ARTIFACTS_DIR: Directorio de los artefactos
+        DEBUG_ARTIFACTS_SAMPLE_RATE: Fracción de procesamientos que se guardan
+        DEBUG_ARTIFACTS_MAX_MB: Tamaño máximo del directorio
+        DEBUG_ARTIFACTS_MAX_AGE_HOURS: Antigüedad máxima de un artefacto
+
+    Retorno:
+        DebugRecorder o None: Registro compartido, o None si está desactivado
+    """
+    global _recorder
+    if os.environ.get("DEBUG_ARTIFACTS", "false").lower() not in ("1", "true", "yes"):
+        return None
+
+    with _recorder_lock:
+        if _recorder is None:
+            try:
+                _recorder = DebugRecorder(
+                    directory=os.environ.get("DEBUG_ARTIFACTS_DIR") or directory or DEFAULT_DEBUG_DIR,
+                    sample_rate=_env_float("DEBUG_ARTIFACTS_SAMPLE_RATE", DEFAULT_SAMPLE_RATE),
+                    max_bytes=int(_env_float("DEBUG_ARTIFACTS_MAX_MB", DEFAULT_MAX_MB) * 1024 * 1024),
+                    max_age_hours=_env_float("DEBUG_ARTIFACTS_MAX_AGE_HOURS", DEFAULT_MAX_AGE_HOURS),
+                )
+            except OSError as e:
+                logger.warning(f"No se pudo crear el directorio de depuración: {str(e)}")
+                return None
+            logger.info(
+                f"Artefactos de depuración activos en {_recorder.directory} "
+                f"(muestra {_recorder.sample_rate:.0%})"
+            )
+        return _recorder
@@ -0,0 +1,426 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Módulo para gestionar el contexto de documentos enviado a los asistentes
+en Expert Nexus. Lleva un registro por thread de los documentos cuyo
+contenido ya fue enviado, para que cada documento se comparta una sola vez
+y los turnos posteriores solo lo referencien, y arma el contexto de
+documentos dentro de un presupuesto de tokens repartido entre documentos.
+"""
+
+import functools
+import hashlib
+import logging
+import os
+from collections import defaultdict
+from collections.abc import Mapping
+
+logger = logging.getLogger("document_context")
+
+# Presupuesto de tokens (configurable por variables de entorno)
+DEFAULT_DOCUMENT_TOKEN_BUDGET = 12000  # Tokens máximos de documentos por mensaje
+DEFAULT_CONTEXT_WINDOW = 128000  # Ventana de contexto del modelo
+DEFAULT_RESPONSE_RESERVE = 4000  # Tokens reservados para la respuesta
+CHARS_PER_TOKEN = 4  # Estimación sin tokenizador: ~4 caracteres por token
+
+
+def document_hash(doc_content):
+    """
+    Calcula la huella SHA-256 del contenido extraído de un documento.
+
+    Parámetros:
+        doc_content: Diccionario del documento procesado ({"text": ...} o {"error": ...})
+
+    Retorno:
+        string: Huella hexadecimal, o None si el documento no tiene contenido
+    """
+    if not isinstance(doc_content, Mapping):
+        return None
+    # Los documentos del almacén conservan su huella sin leer el texto
+    stored_hash = getattr(doc_content, "content_hash", None)
+    if stored_hash:
+        return stored_hash
+    payload = doc_content.get("text") or doc_content.get("error")
+    if not payload:
+        return None
+    return hashlib.sha256(str(payload).encode("utf-8")).hexdigest()
+
+
+def get_thread_ledger(ledgers, thread_id):
+    """
+    Obtiene el registro de documentos enviados a un thread, creándolo si no existe.
+
+    Parámetros:
+        ledgers: Diccionario {thread_id: {huella: nombre}} guardado en la sesión
+        thread_id: ID del thread de la conversación
+
+    Retorno:
+        dict: Registro {huella: nombre_documento} del thread
+    """
+    return ledgers.setdefault(thread_id, {})
+
+
+def partition_documents(documents, ledger):
+    """
+    Separa los documentos cuyo contenido aún no se envió al thread
+    de los que ya fueron compartidos en turnos anteriores.
+
+    Parámetros:
+        documents: Diccionario {nombre: contenido} de documentos en contexto
+        ledger: Registro {huella: nombre} del thread
+
+    Retorno:
+        tuple: (documentos_pendientes, nombres_ya_compartidos)
+    """
+    pending = {}
+    shared = []
+    for doc_name, doc_content in documents.items():
+        content_hash = document_hash(doc_content)
+        if content_hash is not None and content_hash in ledger:
+            shared.append(doc_name)
+        else:
+            pending[doc_name] = doc_content
+    return pending, shared
+
+
+def mark_documents_sent(ledger, documents):
+    """
+    Registra en el thread los documentos cuyo contenido acaba de enviarse.
+
+    Parámetros:
+        ledger: Registro {huella: nombre} del thread
+        documents: Diccionario {nombre: contenido} de documentos enviados
+    """
+    for doc_name, doc_content in documents.items():
+        content_hash = document_hash(doc_content)
+        if content_hash is not None:
+            ledger[content_hash] = doc_name
+    if documents:
+        logger.info(f"Documentos registrados como enviados al thread: {list(documents)}")
+
+
+def shared_documents_note(shared_names):
+    """
+    Construye la referencia a documentos ya compartidos en el thread.
+
+    Retorno:
+        string: Nota para añadir al mensaje, o cadena vacía si no hay documentos
+    """
+    if not shared_names:
+        return ""
+    return (
+        "\n\n### Documentos ya compartidos en esta conversación:\n"
+        + ", ".join(shared_names)
+        + "\n(Su contenido está en mensajes anteriores de este hilo.)"
+    )
+
+
+def _env_int(name, default):
+    """
+    Lee una variable de entorno entera, usando el valor predeterminado
+    si no existe o no es válida.
+    """
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return int(float(value))
+    except ValueError:
+        logger.warning(f"Valor inválido para {name}: {value}. Usando {default}")
+        return default
+
+
+class HeuristicTokenCounter:
+    """
+    Contador de tokens sin conexión basado en la longitud del texto.
+    Se usa cuando no hay un tokenizador disponible.
+    """
+
+    name = "heuristic"
+
+    def __init__(self, chars_per_token=CHARS_PER_TOKEN):
+        self.chars_per_token = chars_per_token
+
+    def count(self, text):
+        return (len(text) + self.chars_per_token - 1) // self.chars_per_token
+
+    def truncate(self, text, max_tokens):
+        return text[: max(0, max_tokens) * self.chars_per_token]
+
+
+class TiktokenCounter:
+    """
+    Contador de tokens exacto basado en una codificación de tiktoken.
+    """
+
+    name = "tiktoken"
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+
+    def count(self, text):
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text, max_tokens):
+        tokens = self.encoding.encode(text, disallowed_special=())
+        return self.encoding.decode(tokens[: max(0, max_tokens)])
+
+
+@functools.lru_cache(maxsize=8)
+def get_token_counter(model=None):
+    """
+    Obtiene el contador de tokens para un modelo. Usa tiktoken si está
+    instalado y su codificación está disponible; en caso contrario recurre
+    a la estimación sin conexión.
+
+    Parámetros:
+        model: Nombre del modelo (opcional)
+
+    Retorno:
+        objeto con métodos count(text) y truncate(text, max_tokens)
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return HeuristicTokenCounter()
+
+    try:
+        if model:
+            try:
+                return TiktokenCounter(tiktoken.encoding_for_model(model))
+            except KeyError:
+                pass
+        return TiktokenCounter(tiktoken.get_encoding("o200k_base"))
+    except Exception as e:
+        logger.warning(f"Tokenizador no disponible, usando estimación: {str(e)}")
+        return HeuristicTokenCounter()
+
+
+def document_token_budget(prompt="", history=(), counter=None):
+    """
+    Calcula los tokens disponibles para documentos en un mensaje, acotando el
+    presupuesto configurado por el espacio libre en la ventana del modelo.
+
+    Variables de entorno:
+        DOCUMENT_CONTEXT_TOKENS: Presupuesto máximo de tokens de documentos
+        OPENAI_CONTEXT_WINDOW: Ventana de contexto del modelo en tokens
+        OPENAI_RESPONSE_RESERVE_TOKENS: Tokens reservados para la respuesta
+
+    Parámetros:
+        prompt: Texto del mensaje del usuario
+        history: Textos de los mensajes previos de la conversación
+        counter: Contador de tokens (get_token_counter() por defecto)
+
+    Retorno:
+        int: Tokens disponibles para el contenido de documentos
+    """
+    counter = counter or get_token_counter()
+    configured = _env_int("DOCUMENT_CONTEXT_TOKENS", DEFAULT_DOCUMENT_TOKEN_BUDGET)
+    window = _env_int("OPENAI_CONTEXT_WINDOW", DEFAULT_CONTEXT_WINDOW)
+    reserve = _env_int("OPENAI_RESPONSE_RESERVE_TOKENS", DEFAULT_RESPONSE_RESERVE)
+
+    # El historial solo se estima por longitud para no tokenizarlo en cada turno
+    history_tokens = sum(len(text) for text in history) // CHARS_PER_TOKEN
+    available = window - reserve - history_tokens - counter.count(prompt)
+    return max(0, min(configured, available))
+
+
+def allocate_budget(sizes, budget):
+    """
+    Reparte un presupuesto de tokens entre documentos de forma equitativa:
+    los documentos que caben en su parte se incluyen completos y el
+    sobrante se redistribuye entre los demás.
+
+    Parámetros:
+        sizes: Diccionario {nombre: tokens del documento}
+        budget: Tokens disponibles
+
+    Retorno:
+        dict: {nombre: tokens asignados}
+    """
+    allocation = {}
+    remaining = max(0, budget)
+    pending = sorted(sizes.items(), key=lambda item: item[1])
+
+    while pending:
+        share = remaining // len(pending)
+        doc_name, size = pending[0]
+        if size > share:
+            break
+        allocation[doc_name] = size
+        remaining -= size
+        pending.pop(0)
+
+    for doc_name, _ in pending:
+        allocation[doc_name] = remaining // len(pending)
+
+    return allocation
+
+
+def document_text(doc_content):
+    """
+    Extrae el texto utilizable de un documento procesado, incluida la
+    respuesta cruda de OCR cuando el procesamiento terminó con error.
+
+    Retorno:
+        string: Texto del documento, o None si no hay texto disponible
+    """
+    if not isinstance(doc_content, Mapping):
+        return None
+    if "text" in doc_content:
+        return doc_content["text"]
+    raw_response = doc_content.get("raw_response")
+    if isinstance(raw_response, dict) and "text" in raw_response:
+        return raw_response["text"]
+    return None
+
+
+def document_tokens(doc_content, counter):
+    """
+    Tokens del texto de un documento. Los documentos del almacén reutilizan
+    el conteo guardado en lugar de leer el texto completo en cada turno.
+
+    Retorno:
+        int: Tokens del texto (0 si no hay texto)
+    """
+    count_tokens = getattr(doc_content, "count_tokens", None)
+    if count_tokens is not None:
+        return count_tokens(counter)
+    text = document_text(doc_content)
+    return counter.count(text) if text else 0
+
+
+def document_prefix(doc_content, max_tokens, counter):
+    """
+    Inicio del texto de un documento recortado a un máximo de tokens. En los
+    documentos del almacén solo se lee el fragmento inicial necesario.
+
+    Retorno:
+        string: Texto recortado
+    """
+    read_text = getattr(doc_content, "read_text", None)
+    if read_text is None:
+        return counter.truncate(document_text(doc_content), max_tokens)
+
+    chars = max(1, max_tokens) * CHARS_PER_TOKEN * 2
+    while True:
+        text = read_text(0, chars)
+        if counter.count(text) > max_tokens or len(text) < chars:
+            return counter.truncate(text, max_tokens)
+        chars *= 2
+
+
+def assemble_document_context(documents, budget, counter=None, retriever=None):
+    """
+    Construye el bloque de contexto de documentos dentro de un presupuesto
+    de tokens, repartido equitativamente entre los documentos.
+
+    Los documentos que caben en su parte se incluyen completos. Si se indica
+    un recuperador, los que no caben se representan con sus pasajes más
+    relevantes; en caso contrario (o si no hay pasajes) se truncan.
+
+    Parámetros:
+        documents: Diccionario {nombre: contenido} de documentos a incluir
+        budget: Tokens disponibles para el contenido de los documentos
+        counter: Contador de tokens (get_token_counter() por defecto)
+        retriever: Función opcional (nombres, presupuesto) que devuelve pasajes
+                   {"doc_name", "text", "label"} ordenados por relevancia
+
+    Retorno:
+        dict: {"text": bloque de contexto, "tokens": tokens incluidos,
+               "complete": nombres enviados completos,
+               "report": {nombre: {"total_tokens", "included_tokens",
+                                   "truncated", "passages"}}}
+    """
+    counter = counter or get_token_counter()
+
+    sizes = {}
+    notes = {}
+    for doc_name, doc_content in documents.items():
+        tokens = document_tokens(doc_content, counter)
+        if tokens:
+            sizes[doc_name] = tokens
+        elif isinstance(doc_content, Mapping) and "error" in doc_content:
+            notes[doc_name] = f"(Error: {doc_content.get('error', 'Error desconocido')})"
+        else:
+            notes[doc_name] = "(No se pudo extraer texto)"
+
+    allocation = allocate_budget(sizes, budget)
+    oversized = [name for name in sizes if sizes[name] > allocation.get(name, 0)]
+
+    # Los pasajes recuperados ocupan el presupuesto que no usan los documentos completos
+    passages_by_doc = defaultdict(list)
+    if retriever and oversized:
+        remaining = budget - sum(sizes[name] for name in sizes if name not in oversized)
+        for passage in retriever(oversized, remaining):
+            tokens = counter.count(passage["text"])
+            if tokens > remaining:
+                continue
+            remaining -= tokens
+            passages_by_doc[passage["doc_name"]].append((passage, tokens))
+
+    prefix_allocation = allocation
+    if passages_by_doc:
+        # Los documentos sin pasajes solo reciben lo que los pasajes dejaron libre
+        prefix_allocation = allocate_budget(
+            {name: sizes[name] for name in oversized if name not in passages_by_doc}, remaining
+        )
+
+    sections = []
+    report = {}
+    complete = []
+    included_total = 0
+    for doc_name in documents:
+        if doc_name in notes:
+            sections.append(f"-- Documento: {doc_name} -- {notes[doc_name]}\n\n")
+            complete.append(doc_name)
+            continue
+
+        passages = sorted(
+            passages_by_doc.get(doc_name, []), key=lambda item: item[0].get("start", 0)
+        )
+        if passages:
+            included = sum(tokens for _, tokens in passages)
+            for passage, _ in passages:
+                sections.append(
+                    f"-- Documento: {doc_name} ({passage['label']}) --\n{passage['text']}\n\n"
+                )
+        elif doc_name in oversized and prefix_allocation.get(doc_name, 0) <= 0:
+            included = 0
+            sections.append(
+                f"-- Documento: {doc_name} -- [contenido omitido: no queda presupuesto de tokens]\n\n"
+            )
+        elif doc_name in oversized:
+            text = document_prefix(documents[doc_name], prefix_allocation[doc_name], counter)
+            included = counter.count(text) if text else 0
+            percent = 100 * included // max(1, sizes[doc_name])
+            text += f"\n[... contenido truncado: se incluye {percent}% del documento]"
+            sections.append(f"-- Documento: {doc_name} --\n{text}\n\n")
+        else:
+            included = sizes[doc_name]
+            complete.append(doc_name)
+            text = document_text(documents[doc_name])
+            sections.append(f"-- Documento: {doc_name} --\n{text}\n\n")
+
+        included_total += included
+        report[doc_name] = {
+            "total_tokens": sizes[doc_name],
+            "included_tokens": included,
+            "truncated": doc_name in oversized,
+            "passages": len(passages),
+        }
+
+    logger.info(
+        f"Contexto de documentos: {included_total}/{budget} tokens ({counter.name}), "
+        + ", ".join(
+            f"{name}: {info['included_tokens']}/{info['total_tokens']}"
+            for name, info in report.items()
+        )
+    )
+    return {
+        "text": "".join(sections),
+        "tokens": included_total,
+        "complete": complete,
+        "report": report,
+    }
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Módulo de ingesta de documentos para Expert Nexus.
+Procesa en paralelo los archivos cargados en un mismo mensaje: un pool de
+hilos acotado atiende las llamadas de red (OCR) y un pool de procesos
+compartido ejecuta el trabajo de CPU (lectura de PDFs, preparación de
+imágenes). El progreso de cada archivo se entrega al hilo principal, que
+es el único que actualiza la interfaz, y los resultados se devuelven en el
+orden de carga.
+"""
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger("document_ingestion")
+
+# Valores predeterminados (configurables por variables de entorno)
+DEFAULT_MAX_WORKERS = 4  # Archivos procesados simultáneamente
+DEFAULT_PROCESS_WORKERS = min(4, os.cpu_count() or 1)  # Procesos para trabajo de CPU
+PROGRESS_POLL_INTERVAL = 0.1  # Segundos entre revisiones del progreso
+SPOOL_CHUNK_SIZE = 1024 * 1024  # Bytes copiados por bloque al volcar una carga a disco
+
+# Pool de procesos compartido por el proceso de la aplicación
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    try:
+        return max(1, int(value)) if value else default
+    except ValueError:
+        logger.warning(f"Valor inválido para {name}: {value}. Usando {default}")
+        return default
+
+
+def get_process_pool():
+    """
+    Obtiene el pool de procesos compartido, creándolo la primera vez.
+    Se usa el método "spawn" porque la aplicación tiene hilos activos.
+
+    Variables de entorno:
+        INGEST_PROCESS_WORKERS: Número de procesos (0 desactiva el pool)
+
+    Retorno:
+        ProcessPoolExecutor o None: Pool compartido, o None si está desactivado
+    """
+    global _process_pool
+    if os.environ.get("INGEST_PROCESS_WORKERS") == "0":
+        return None
+
+    with _process_pool_lock:
+        if _process_pool is None:
+            workers = _env_int("INGEST_PROCESS_WORKERS", DEFAULT_PROCESS_WORKERS)
+            _process_pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"Pool de procesos de ingesta creado con {workers} procesos")
+        return _process_pool
+
+
+def _discard_process_pool(pool):
+    """Descarta un pool roto para que la siguiente llamada cree uno nuevo."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_cpu_bound(func, *args):
+    """
+    Ejecuta una función de CPU en el pool de procesos compartido y espera su
+    resultado. Si el pool no está disponible, la ejecuta en el hilo actual.
+
+    Parámetros:
+        func: Función definida a nivel de módulo (serializable)
+        *args: Argumentos de la función
+
+    Retorno:
+        Resultado de la función
+    """
+    pool = get_process_pool()
+    if pool is not None:
+        try:
+            return pool.submit(func, *args).result()
+        except BrokenProcessPool as e:
+            logger.warning(f"Pool de procesos no disponible, se ejecuta localmente: {str(e)}")
+            _discard_process_pool(pool)
+        except (OSError, RuntimeError) as e:
+            logger.warning(f"No se pudo usar el pool de procesos: {str(e)}")
+    return func(*args)
+
+
+class SpooledUpload:
+    """
+    Archivo cargado volcado a un archivo temporal, con su huella SHA-256
+    calculada durante la copia.
+    """
+
+    def __init__(self, name, path, sha256, size):
+        self.name = name
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+
+    def open(self):
+        return open(self.path, "rb")
+
+    def read_bytes(self):
+        with self.open() as f:
+            return f.read()
+
+    def cleanup(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def spool_upload(file, directory=None, chunk_size=SPOOL_CHUNK_SIZE):
+    """
+    Copia un archivo cargado a un archivo temporal por bloques, calculando
+    su huella mientras se copia, para no mantener copias completas en memoria.
+
+    Variables de entorno:
+        UPLOAD_SPOOL_DIR: Directorio de los archivos temporales
+
+    Parámetros:
+        file: Archivo cargado (objeto con read y seek)
+        directory: Directorio de destino (opcional)
+        chunk_size: Tamaño de cada bloque en bytes
+
+    Retorno:
+        SpooledUpload: Referencia al archivo temporal
+    """
+    directory = directory or os.environ.get("UPLOAD_SPOOL_DIR") or tempfile.gettempdir()
+    suffix = os.path.splitext(getattr(file, "name", ""))[1]
+    digest = hashlib.sha256()
+    size = 0
+
+    fd, path = tempfile.mkstemp(prefix="upload_", suffix=suffix, dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            while True:
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                spool.write(chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        if hasattr(file, "seek"):
+            file.seek(0)
+
+    return SpooledUpload(getattr(file, "name", os.path.basename(path)), path, digest.hexdigest(), size)
+
+
+class ProgressReporter:
+    """
+    Reporta el progreso de un archivo desde un hilo de trabajo.
+
+    Tiene la misma firma que ``update`` de ``st.status`` para poder pasarse
+    en su lugar; las actualizaciones se encolan y el hilo principal las
+    aplica a la interfaz.
+    """
+
+    def __init__(self, updates, index):
+        self._updates = updates
+        self.index = index
+
+    def update(self, label=None, state=None, expanded=None):
+        changes = {
+            key: value
+            for key, value in (("label", label), ("state", state), ("expanded", expanded))
+            if value is not None
+        }
+        self._updates.put((self.index, changes))
+
+
+class NullProgress:
+    """
+    Reporter que descarta las actualizaciones, para subtareas cuyo progreso
+    se resume en el reporter del archivo.
+    """
+
+    def update(self, label=None, state=None, expanded=None):
+        pass
+
+
+def _drain(updates, on_progress):
+    while True:
+        try:
+            index, changes = updates.get_nowait()
+        except queue.Empty:
+            return
+        if on_progress:
+            on_progress(index, changes)
+
+
+def ingest_files(jobs, process_file, max_workers=None, on_progress=None):
+    """
+    Procesa varios archivos en paralelo y devuelve sus resultados en el
+    orden de carga.
+
+    Parámetros:
+        jobs: Lista de archivos a procesar (en orden de carga)
+        process_file: Función (archivo, reporter) que procesa un archivo en un
+                      hilo de trabajo; no debe usar la interfaz directamente
+        max_workers: Archivos simultáneos (INGEST_MAX_WORKERS por defecto)
+        on_progress: Función (índice, cambios) llamada en el hilo actual con
+                     cada actualización de progreso
+
+    Retorno:
+        list: Resultado de cada archivo; si la función lanza una excepción,
+              {"error": mensaje} en su posición
+    """
+    if not jobs:
+        return []
+
+    max_workers = max_workers or _env_int("INGEST_MAX_WORKERS", DEFAULT_MAX_WORKERS)
+    updates = queue.Queue()
+    results = [None] * len(jobs)
+
+    with ThreadPoolExecutor(
+        max_workers=min(max_workers, len(jobs)), thread_name_prefix="ingest"
+    ) as executor:
+        futures = {
+            executor.submit(process_file, job, ProgressReporter(updates, index)): index
+            for index, job in enumerate(jobs)
+        }
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=PROGRESS_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            _drain(updates, on_progress)
+            for future in done:
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    logger.error(f"Error procesando el archivo {index + 1}: {str(e)}")
+                    results[index] = {"error": str(e)}
+                    if on_progress:
+                        on_progress(index, {"label": f"Error: {str(e)}", "state": "error"})
+        _drain(updates, on_progress)
+
+    return results
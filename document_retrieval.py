@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Módulo de recuperación de pasajes para Expert Nexus.
+Divide los documentos cargados en fragmentos al procesarlos y mantiene un
+índice invertido BM25 en memoria, con tokenización adaptada al español
+(minúsculas, eliminación de tildes y palabras vacías), para enviar al
+asistente solo los pasajes relevantes a cada pregunta junto con su página
+y posición en el documento.
+"""
+
+import bisect
+import hashlib
+import logging
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from collections.abc import Mapping
+
+logger = logging.getLogger("document_retrieval")
+
+# Parámetros de fragmentación y de BM25
+DEFAULT_CHUNK_CHARS = 1200  # Tamaño objetivo de cada fragmento en caracteres
+DEFAULT_CHUNK_OVERLAP = 150  # Caracteres compartidos entre fragmentos consecutivos
+DEFAULT_TOP_K = 8  # Pasajes máximos por turno
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Palabras vacías frecuentes en español (ya sin tildes)
+SPANISH_STOPWORDS = frozenset(
+    """
+    a al algo algun alguna algunas alguno algunos ante antes aqui asi aun cada
+    como con contra cual cuales cuando de del desde donde durante e el ella
+    ellas ello ellos en entre era eran es esa esas ese eso esos esta estaba
+    estan estar estas este esto estos fue fueron ha habia han hasta hay la las
+    le les lo los mas me mi mis mucho muy nada ni no nos o os otra otras otro
+    otros para pero poco por porque que quien se sea segun ser si sido sin
+    sobre son su sus tambien tan te tiene tienen todo todos tu tus u un una
+    unas uno unos y ya yo
+    """.split()
+)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fold_accents(text):
+    """
+    Elimina tildes y diacríticos del texto (por ejemplo, "acción" → "accion").
+    """
+    normalized = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in normalized if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    """
+    Tokeniza texto en español para búsqueda: minúsculas, sin tildes, sin
+    palabras vacías y con una reducción simple de plurales.
+
+    Parámetros:
+        text: Texto a tokenizar
+
+    Retorno:
+        list: Términos normalizados
+    """
+    terms = []
+    for token in _TOKEN_RE.findall(fold_accents(text.lower())):
+        if token in SPANISH_STOPWORDS or len(token) < 2:
+            continue
+        # Reducción mínima de plurales: "acciones" → "accion", "normas" → "norma"
+        if len(token) > 5 and token.endswith("es"):
+            token = token[:-2]
+        elif len(token) > 4 and token.endswith("s"):
+            token = token[:-1]
+        terms.append(token)
+    return terms
+
+
+def page_offsets_for(pages, separator="\n\n"):
+    """
+    Calcula la posición inicial de cada página en el texto resultante de
+    unir las páginas con un separador.
+
+    Parámetros:
+        pages: Lista de textos de página
+        separator: Separador usado al unir las páginas
+
+    Retorno:
+        list: Posición inicial (en caracteres) de cada página
+    """
+    offsets = []
+    position = 0
+    for page_text in pages:
+        offsets.append(position)
+        position += len(page_text) + len(separator)
+    return offsets
+
+
+def chunk_text(text, chunk_chars=DEFAULT_CHUNK_CHARS, overlap=DEFAULT_CHUNK_OVERLAP):
+    """
+    Divide un texto en fragmentos de tamaño aproximado, cortando en saltos
+    de párrafo o espacios cuando es posible.
+
+    Parámetros:
+        text: Texto completo del documento
+        chunk_chars: Tamaño objetivo de cada fragmento
+        overlap: Caracteres compartidos entre fragmentos consecutivos
+
+    Retorno:
+        list: Tuplas (inicio, fin) de cada fragmento en el texto
+    """
+    spans = []
+    length = len(text)
+    start = 0
+    while start < length:
+        end = min(length, start + chunk_chars)
+        if end < length:
+            # Preferir un corte de párrafo y, si no hay, un espacio
+            cut = text.rfind("\n\n", start + chunk_chars // 2, end)
+            if cut == -1:
+                cut = text.rfind(" ", start + chunk_chars // 2, end)
+            if cut != -1:
+                end = cut
+        if text[start:end].strip():
+            spans.append((start, end))
+        if end >= length:
+            break
+        start = max(end - overlap, start + 1)
+    return spans
+
+
+def _content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class DocumentIndex:
+    """
+    Índice invertido BM25 sobre los fragmentos de los documentos cargados.
+
+    Cada fragmento conserva el documento de origen, la página (si se
+    conoce) y su posición en el texto extraído. Si se indica ``text_reader``
+    (función (nombre, inicio, fin) que lee un fragmento del documento), los
+    fragmentos no guardan su texto y los pasajes se leen al buscar.
+    """
+
+    def __init__(self, chunk_chars=DEFAULT_CHUNK_CHARS, overlap=DEFAULT_CHUNK_OVERLAP, text_reader=None):
+        self.chunk_chars = chunk_chars
+        self.overlap = overlap
+        self.text_reader = text_reader
+        self.chunks = {}  # {id_fragmento: datos del fragmento}
+        self.postings = defaultdict(dict)  # {término: {id_fragmento: frecuencia}}
+        self.documents = {}  # {nombre: {"hash": huella, "chunk_ids": [...]}}
+        self.total_length = 0
+        self._next_id = 0
+
+    def __contains__(self, doc_name):
+        return doc_name in self.documents
+
+    def add_document(self, doc_name, text, page_offsets=None):
+        """
+        Fragmenta un documento y lo añade al índice, reemplazando la versión
+        anterior si ya estaba indexado con otro contenido.
+
+        Parámetros:
+            doc_name: Nombre del documento
+            text: Texto extraído del documento
+            page_offsets: Posición inicial de cada página en el texto (opcional)
+
+        Retorno:
+            int: Número de fragmentos indexados
+        """
+        content_hash = _content_hash(text)
+        existing = self.documents.get(doc_name)
+        if existing and existing["hash"] == content_hash:
+            return len(existing["chunk_ids"])
+        if existing:
+            self.remove_document(doc_name)
+
+        chunk_ids = []
+        for start, end in chunk_text(text, self.chunk_chars, self.overlap):
+            terms = tokenize(text[start:end])
+            if not terms:
+                continue
+
+            chunk_id = self._next_id
+            self._next_id += 1
+            page = None
+            if page_offsets:
+                page = bisect.bisect_right(page_offsets, start)
+
+            self.chunks[chunk_id] = {
+                "doc_name": doc_name,
+                "text": None if self.text_reader else text[start:end].strip(),
+                "start": start,
+                "end": end,
+                "page": page,
+                "length": len(terms),
+            }
+            for term, frequency in Counter(terms).items():
+                self.postings[term][chunk_id] = frequency
+            self.total_length += len(terms)
+            chunk_ids.append(chunk_id)
+
+        self.documents[doc_name] = {"hash": content_hash, "chunk_ids": chunk_ids}
+        logger.info(f"Documento {doc_name} indexado en {len(chunk_ids)} fragmentos")
+        return len(chunk_ids)
+
+    def remove_document(self, doc_name):
+        """
+        Elimina un documento y sus fragmentos del índice.
+        """
+        entry = self.documents.pop(doc_name, None)
+        if not entry:
+            return
+        chunk_ids = set(entry["chunk_ids"])
+        for chunk_id in chunk_ids:
+            self.total_length -= self.chunks.pop(chunk_id)["length"]
+        for term in list(self.postings):
+            postings = self.postings[term]
+            for chunk_id in chunk_ids.intersection(postings):
+                del postings[chunk_id]
+            if not postings:
+                del self.postings[term]
+
+    def clear(self):
+        """
+        Vacía el índice, por ejemplo al limpiar la sesión.
+        """
+        self.chunks.clear()
+        self.postings.clear()
+        self.documents.clear()
+        self.total_length = 0
+
+    def sync(self, documents, text_of):
+        """
+        Alinea el índice con los documentos de la sesión: indexa los nuevos o
+        modificados y descarta los que ya no están.
+
+        Parámetros:
+            documents: Diccionario {nombre: contenido} de documentos en la sesión
+            text_of: Función que obtiene el texto de un contenido (o None)
+        """
+        for doc_name in list(self.documents):
+            if doc_name not in documents:
+                self.remove_document(doc_name)
+        for doc_name, doc_content in documents.items():
+            # Los documentos del almacén indican su huella sin leer el texto
+            known = self.documents.get(doc_name)
+            if known and known["hash"] == getattr(doc_content, "content_hash", None):
+                continue
+            text = text_of(doc_content)
+            if text:
+                page_offsets = None
+                if isinstance(doc_content, Mapping):
+                    page_offsets = doc_content.get("page_offsets")
+                self.add_document(doc_name, text, page_offsets)
+
+    def search(self, query, top_k=DEFAULT_TOP_K, doc_names=None):
+        """
+        Busca los fragmentos más relevantes para una consulta con BM25.
+
+        Parámetros:
+            query: Texto de la pregunta del usuario
+            top_k: Número máximo de pasajes a devolver
+            doc_names: Documentos en los que buscar (todos si es None)
+
+        Retorno:
+            list: Pasajes {"doc_name", "text", "page", "start", "end", "score"}
+                  ordenados por relevancia descendente
+        """
+        if not self.chunks:
+            return []
+
+        allowed = None
+        if doc_names is not None:
+            allowed = set()
+            for doc_name in doc_names:
+                entry = self.documents.get(doc_name)
+                if entry:
+                    allowed.update(entry["chunk_ids"])
+
+        chunk_count = len(self.chunks)
+        average_length = self.total_length / chunk_count
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (chunk_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, frequency in postings.items():
+                if allowed is not None and chunk_id not in allowed:
+                    continue
+                length = self.chunks[chunk_id]["length"]
+                norm = frequency + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                scores[chunk_id] += idf * frequency * (BM25_K1 + 1) / norm
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+        passages = []
+        for chunk_id, score in ranked:
+            chunk = self.chunks[chunk_id]
+            text = chunk["text"]
+            if text is None:
+                text = self.text_reader(chunk["doc_name"], chunk["start"], chunk["end"]).strip()
+            passages.append(
+                {
+                    "doc_name": chunk["doc_name"],
+                    "text": text,
+                    "page": chunk["page"],
+                    "start": chunk["start"],
+                    "end": chunk["end"],
+                    "score": score,
+                }
+            )
+        return passages
+
+
+def passage_label(passage):
+    """
+    Describe la procedencia de un pasaje (página y posición).
+
+    Retorno:
+        string: Etiqueta como "pág. 3, caracteres 1200-2400"
+    """
+    location = f"caracteres {passage['start']}-{passage['end']}"
+    if passage.get("page"):
+        return f"pág. {passage['page']}, {location}"
+    return location
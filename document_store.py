@@ -0,0 +1,409 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Módulo de almacenamiento de documentos para Expert Nexus.
+Guarda el texto extraído de los documentos fuera de la memoria de la sesión,
+en una base SQLite compartida por el proceso: el texto se divide en bloques
+comprimidos con sus posiciones, de modo que leer un fragmento (una página,
+un pasaje o el inicio de un documento truncado) solo descomprime los bloques
+que lo contienen. La sesión conserva únicamente los identificadores de sus
+documentos y los de sesiones inactivas se eliminan al vencer su TTL.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+import zlib
+from collections.abc import Mapping, MutableMapping
+
+logger = logging.getLogger("document_store")
+
+# Valores predeterminados (configurables por variables de entorno)
+DEFAULT_STORE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "expert_nexus", "documents")
+DEFAULT_TTL_HOURS = 24  # Horas de inactividad tras las que se eliminan los documentos de una sesión
+DEFAULT_BLOCK_CHARS = 64 * 1024  # Caracteres por bloque comprimido
+CLEANUP_INTERVAL = 600  # Segundos mínimos entre limpiezas por TTL
+
+EXPIRED_DOCUMENT = {"error": "El documento ya no está disponible; vuelva a cargarlo"}
+
+# Almacén compartido por el proceso
+_store = None
+_store_lock = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT PRIMARY KEY,
+    session_key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    content_hash TEXT,
+    meta TEXT NOT NULL,
+    token_counts TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_session ON documents (session_key);
+CREATE TABLE IF NOT EXISTS blocks (
+    doc_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (doc_id, seq)
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_key TEXT PRIMARY KEY,
+    last_seen REAL NOT NULL
+);
+"""
+
+
+def content_hash(doc_content):
+    """
+    Huella SHA-256 del contenido de un documento, calculada igual que
+    document_context.document_hash para que el registro de documentos
+    enviados no necesite leer el texto completo.
+    """
+    payload = doc_content.get("text") or doc_content.get("error")
+    if not payload:
+        return None
+    return hashlib.sha256(str(payload).encode("utf-8")).hexdigest()
+
+
+class DocumentStore:
+    """
+    Almacén SQLite de documentos con texto comprimido por bloques.
+
+    Una única conexión protegida por un lock atiende a todas las sesiones
+    del proceso (cada sesión de Streamlit ejecuta su script en otro hilo).
+    """
+
+    def __init__(self, path, block_chars=DEFAULT_BLOCK_CHARS, clock=time.time):
+        self.path = path
+        self.block_chars = block_chars
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    # Escritura -------------------------------------------------------
+
+    def put(self, session_key, name, doc_content):
+        """
+        Guarda un documento procesado.
+
+        Parámetros:
+            session_key: Sesión propietaria del documento
+            name: Nombre del documento
+            doc_content: Diccionario del documento ({"text", "format",
+                         "page_offsets", ...} o {"error": ...})
+
+        Retorno:
+            string: Identificador del documento
+        """
+        doc_id = uuid.uuid4().hex
+        text = doc_content.get("text") or ""
+        meta = {key: value for key, value in doc_content.items() if key != "text"}
+        meta["has_text"] = "text" in doc_content
+        blocks = [
+            (doc_id, seq, start, len(text[start:start + self.block_chars]),
+             zlib.compress(text[start:start + self.block_chars].encode("utf-8")))
+            for seq, start in enumerate(range(0, len(text), self.block_chars))
+        ]
+        now = self._clock()
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.execute(
+                    "INSERT INTO documents (doc_id, session_key, name, length, content_hash, meta, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (doc_id, session_key, name, len(text), content_hash(doc_content),
+                     json.dumps(meta, ensure_ascii=False, default=str), now),
+                )
+                self._db.executemany("INSERT INTO blocks VALUES (?, ?, ?, ?, ?)", blocks)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO sessions (session_key, last_seen) VALUES (?, ?)", (session_key, now)
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        logger.info(f"Documento {name} guardado ({len(text)} caracteres en {len(blocks)} bloques)")
+        return doc_id
+
+    def delete(self, doc_id):
+        with self._lock:
+            self._db.execute("DELETE FROM blocks WHERE doc_id = ?", (doc_id,))
+            self._db.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+
+    def delete_session(self, session_key):
+        """Elimina todos los documentos de una sesión."""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM blocks WHERE doc_id IN (SELECT doc_id FROM documents WHERE session_key = ?)",
+                (session_key,),
+            )
+            self._db.execute("DELETE FROM documents WHERE session_key = ?", (session_key,))
+            self._db.execute("DELETE FROM sessions WHERE session_key = ?", (session_key,))
+
+    def set_token_count(self, doc_id, counter_name, tokens):
+        """Guarda el número de tokens de un documento según un contador."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT token_counts FROM documents WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+            if row is None:
+                return
+            counts = json.loads(row[0])
+            counts[counter_name] = tokens
+            self._db.execute(
+                "UPDATE documents SET token_counts = ? WHERE doc_id = ?", (json.dumps(counts), doc_id)
+            )
+
+    # Lectura ---------------------------------------------------------
+
+    def info(self, doc_id):
+        """
+        Metadatos de un documento sin leer su texto.
+
+        Retorno:
+            dict o None: {"name", "length", "content_hash", "meta",
+                          "token_counts"}, o None si no existe
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT name, length, content_hash, meta, token_counts FROM documents WHERE doc_id = ?",
+                (doc_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "name": row[0],
+            "length": row[1],
+            "content_hash": row[2],
+            "meta": json.loads(row[3]),
+            "token_counts": json.loads(row[4]),
+        }
+
+    def read_text(self, doc_id, start=0, end=None):
+        """
+        Lee un fragmento del texto descomprimiendo solo los bloques que lo
+        contienen.
+
+        Parámetros:
+            doc_id: Identificador del documento
+            start: Posición inicial (carácter)
+            end: Posición final exclusiva (None para leer hasta el final)
+
+        Retorno:
+            string: Texto del fragmento
+        """
+        query = "SELECT start, data FROM blocks WHERE doc_id = ? AND start + length > ?"
+        params = [doc_id, start]
+        if end is not None:
+            query += " AND start < ?"
+            params.append(end)
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY seq", params).fetchall()
+        if not rows:
+            return ""
+        first = rows[0][0]
+        text = "".join(zlib.decompress(data).decode("utf-8") for _, data in rows)
+        return text[start - first:None if end is None else end - first]
+
+    # Sesiones --------------------------------------------------------
+
+    def touch_session(self, session_key):
+        """
+        Marca una sesión como activa y, como mucho cada CLEANUP_INTERVAL
+        segundos, elimina las sesiones inactivas.
+        """
+        now = self._clock()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (session_key, last_seen) VALUES (?, ?)", (session_key, now)
+            )
+        if now - self._last_cleanup >= CLEANUP_INTERVAL:
+            self.cleanup()
+
+    def cleanup(self, ttl_hours=None):
+        """
+        Elimina los documentos de las sesiones inactivas durante más de TTL.
+
+        Variables de entorno:
+            DOCUMENT_STORE_TTL_HOURS: Horas de inactividad permitidas
+
+        Retorno:
+            int: Número de sesiones eliminadas
+        """
+        if ttl_hours is None:
+            try:
+                ttl_hours = float(os.environ.get("DOCUMENT_STORE_TTL_HOURS", DEFAULT_TTL_HOURS))
+            except ValueError:
+                ttl_hours = DEFAULT_TTL_HOURS
+        now = self._clock()
+        self._last_cleanup = now
+        with self._lock:
+            expired = [
+                row[0]
+                for row in self._db.execute(
+                    "SELECT session_key FROM sessions WHERE last_seen < ?", (now - ttl_hours * 3600,)
+                )
+            ]
+        for session_key in expired:
+            self.delete_session(session_key)
+        if expired:
+            logger.info(f"Almacén de documentos: {len(expired)} sesiones inactivas eliminadas")
+        return len(expired)
+
+    def get_stats(self):
+        """
+        Retorno:
+            dict: Documentos, sesiones, caracteres y bytes comprimidos guardados
+        """
+        with self._lock:
+            documents, characters = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM documents"
+            ).fetchone()
+            sessions = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            stored = self._db.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM blocks").fetchone()[0]
+        return {"documents": documents, "sessions": sessions, "characters": characters, "stored_bytes": stored}
+
+
+class StoredDocument(Mapping):
+    """
+    Documento guardado en el almacén, con la misma interfaz de lectura que
+    el diccionario del documento procesado. El texto solo se lee cuando se
+    accede a la clave "text" o a un fragmento con read_text.
+    """
+
+    def __init__(self, store, doc_id, info):
+        self.store = store
+        self.doc_id = doc_id
+        self.length = info["length"]
+        self.content_hash = info["content_hash"]
+        self._meta = info["meta"]
+        self._token_counts = info["token_counts"]
+
+    def _keys(self):
+        keys = [key for key in self._meta if key != "has_text"]
+        if self._meta.get("has_text"):
+            keys.append("text")
+        return keys
+
+    def __getitem__(self, key):
+        if key == "text" and self._meta.get("has_text"):
+            return self.store.read_text(self.doc_id)
+        if key == "has_text" or key not in self._meta:
+            raise KeyError(key)
+        return self._meta[key]
+
+    def __contains__(self, key):
+        return key in self._keys()
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self):
+        return len(self._keys())
+
+    def read_text(self, start=0, end=None):
+        return self.store.read_text(self.doc_id, start, end)
+
+    def count_tokens(self, counter):
+        """
+        Tokens del texto según un contador, calculados una vez y guardados
+        en el almacén.
+        """
+        if counter.name not in self._token_counts:
+            self._token_counts[counter.name] = counter.count(self["text"]) if self.length else 0
+            self.store.set_token_count(self.doc_id, counter.name, self._token_counts[counter.name])
+        return self._token_counts[counter.name]
+
+
+class SessionDocuments(MutableMapping):
+    """
+    Documentos de una sesión: un diccionario {nombre: identificador} que se
+    guarda en st.session_state y entrega los documentos como StoredDocument.
+    Al asignar un documento se guarda en el almacén y al eliminarlo (o al
+    liberarse la sesión) se borra de él.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        # Clave propia de esta colección en el almacén
+        self.session_key = uuid.uuid4().hex
+        self.ids = {}
+        store.touch_session(self.session_key)
+        # Borrar los documentos cuando Streamlit libere la sesión
+        weakref.finalize(self, store.delete_session, self.session_key)
+
+    def __setitem__(self, name, doc_content):
+        if isinstance(doc_content, StoredDocument):
+            if self.ids.get(name) == doc_content.doc_id:
+                return
+            doc_content = dict(doc_content)
+        old_id = self.ids.get(name)
+        self.ids[name] = self.store.put(self.session_key, name, doc_content)
+        if old_id:
+            self.store.delete(old_id)
+
+    def __getitem__(self, name):
+        doc_id = self.ids[name]
+        info = self.store.info(doc_id)
+        if info is None:
+            return dict(EXPIRED_DOCUMENT)
+        return StoredDocument(self.store, doc_id, info)
+
+    def __delitem__(self, name):
+        self.store.delete(self.ids.pop(name))
+
+    def __iter__(self):
+        return iter(list(self.ids))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def read_text(self, name, start=0, end=None):
+        """Lee un fragmento del texto de un documento de la sesión."""
+        doc_id = self.ids.get(name)
+        return self.store.read_text(doc_id, start, end) if doc_id else ""
+
+    def touch(self):
+        self.store.touch_session(self.session_key)
+
+
+def get_document_store():
+    """
+    Obtiene el almacén de documentos compartido por el proceso, creándolo
+    la primera vez. Si el directorio no es utilizable se usa una base en
+    memoria (el texto sigue comprimido y fuera del estado de la sesión).
+
+    Variables de entorno:
+        DOCUMENT_STORE_DIR: Directorio de la base de documentos
+
+    Retorno:
+        DocumentStore: Almacén compartido
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            directory = os.environ.get("DOCUMENT_STORE_DIR", DEFAULT_STORE_DIR)
+            try:
+                _store = DocumentStore(os.path.join(directory, "documents.sqlite3"))
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"No se pudo abrir el almacén de documentos en {directory}: {str(e)}")
+                _store = DocumentStore(":memory:")
+            logger.info(f"Almacén de documentos inicializado en {_store.path}")
+        return _store
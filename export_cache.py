@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Módulo de caché de exportaciones de conversaciones para Expert Nexus.
+Guarda los archivos exportados (Markdown o PDF) indexados por la huella de
+los mensajes, el historial de expertos y el formato, en dos niveles:
+memoria (LRU acotado por bytes, compartido por las sesiones del proceso) y
+disco (con tamaño máximo y desalojo de lo menos usado), de modo que volver
+a descargar una conversación sin cambios no repite la generación.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("export_cache")
+
+# Valores predeterminados (configurables por variables de entorno)
+DEFAULT_MEMORY_MB = 64  # Tamaño máximo de la caché en memoria
+DEFAULT_DISK_MAX_MB = 256  # Tamaño máximo de la caché en disco
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "expert_nexus", "exports")
+
+# Tipos de contenido exportables (también son la extensión en disco)
+CONTENT_TYPES = ("pdf", "markdown")
+
+# Caché compartida por el proceso
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def export_key(messages, expert_history, export_format, extra=None):
+    """
+    Calcula la clave de caché de una exportación.
+
+    Parámetros:
+        messages: Lista de mensajes de la conversación
+        expert_history: Historial de cambios de experto
+        export_format: Formato solicitado ("Markdown", "PDF")
+        extra: Otros datos que afectan el resultado, como los adjuntos (opcional)
+
+    Retorno:
+        string: Clave hexadecimal SHA-256
+    """
+    payload = json.dumps(
+        {
+            "messages": messages,
+            "expert_history": expert_history,
+            "format": export_format,
+            "extra": extra,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ExportCache:
+    """
+    Caché de exportaciones con un nivel en memoria y otro en disco.
+
+    Las entradas son pares (bytes, tipo de contenido); los bytes son
+    inmutables, por lo que se comparten sin copiar entre sesiones.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, memory_max_bytes=DEFAULT_MEMORY_MB * 1024 * 1024,
+                 disk_max_bytes=DEFAULT_DISK_MAX_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"No se pudo crear el directorio de caché de exportaciones: {str(e)}")
+                self.cache_dir = None
+
+    def _path(self, key, content_type):
+        return os.path.join(self.cache_dir, f"{key}.{content_type}")
+
+    def _remember(self, key, entry):
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key)[0])
+        if len(entry[0]) > self.memory_max_bytes:
+            return
+        self._memory[key] = entry
+        self._memory_bytes += len(entry[0])
+        while self._memory_bytes > self.memory_max_bytes:
+            _, (evicted, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def get(self, key):
+        """
+        Busca una exportación en memoria y, si no está, en disco.
+
+        Retorno:
+            tuple o None: (contenido en bytes, tipo de contenido), o None si no existe
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return self._memory[key]
+
+            if self.cache_dir:
+                for content_type in CONTENT_TYPES:
+                    path = self._path(key, content_type)
+                    try:
+                        with open(path, "rb") as f:
+                            entry = (f.read(), content_type)
+                    except FileNotFoundError:
+                        continue
+                    except OSError as e:
+                        logger.warning(f"Exportación en caché ilegible, se descarta: {str(e)}")
+                        self._remove_file(path)
+                        continue
+                    # Actualizar la fecha de uso para el desalojo LRU
+                    os.utime(path, None)
+                    self._remember(key, entry)
+                    self.stats["disk_hits"] += 1
+                    return entry
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key, content, content_type):
+        """
+        Guarda una exportación en memoria y en disco, desalojando las
+        entradas menos usadas si se supera el tamaño máximo.
+        """
+        if content_type not in CONTENT_TYPES:
+            raise ValueError(f"Tipo de contenido no soportado: {content_type}")
+        entry = (bytes(content), content_type)
+        with self._lock:
+            self._remember(key, entry)
+            self.stats["stores"] += 1
+            if not self.cache_dir:
+                return
+
+            # Escritura atómica para no dejar entradas a medio escribir
+            temp_path = None
+            try:
+                fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(entry[0])
+                os.replace(temp_path, self._path(key, content_type))
+            except OSError as e:
+                logger.warning(f"No se pudo guardar la exportación en disco: {str(e)}")
+                if temp_path:
+                    self._remove_file(temp_path)
+                return
+
+            self._evict_disk()
+
+    def _remove_file(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _evict_disk(self):
+        """Elimina las entradas de disco menos usadas hasta respetar el tamaño máximo."""
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if os.path.splitext(name)[1].lstrip(".") not in CONTENT_TYPES:
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            entries.append((info.st_mtime, info.st_size, path))
+            total += info.st_size
+
+        entries.sort()
+        while total > self.disk_max_bytes and entries:
+            _, size, path = entries.pop(0)
+            self._remove_file(path)
+            total -= size
+            self.stats["evictions"] += 1
+
+    def get_stats(self):
+        """
+        Retorno:
+            dict: Contadores de aciertos, fallos, escrituras y desalojos
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_items"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    try:
+        return int(value) if value else default
+    except ValueError:
+        logger.warning(f"Valor inválido para {name}: {value}. Usando {default}")
+        return default
+
+
+def get_export_cache():
+    """
+    Obtiene la caché de exportaciones compartida por el proceso, creándola la primera vez.
+
+    Variables de entorno:
+        EXPORT_CACHE: Activa la caché (true por defecto)
+        EXPORT_CACHE_DIR: Directorio de la caché en disco (vacío para solo memoria)
+        EXPORT_CACHE_MEMORY_MB: Tamaño máximo de la caché en memoria
+        EXPORT_CACHE_MAX_MB: Tamaño máximo de la caché en disco
+
+    Retorno:
+        ExportCache o None: Caché compartida, o None si está desactivada
+    """
+    global _cache
+    if os.environ.get("EXPORT_CACHE", "true").lower() in ("0", "false", "no"):
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = ExportCache(
+                cache_dir=os.environ.get("EXPORT_CACHE_DIR", DEFAULT_CACHE_DIR),
+                memory_max_bytes=_env_int("EXPORT_CACHE_MEMORY_MB", DEFAULT_MEMORY_MB) * 1024 * 1024,
+                disk_max_bytes=_env_int("EXPORT_CACHE_MAX_MB", DEFAULT_DISK_MAX_MB) * 1024 * 1024,
+            )
+            logger.info(f"Caché de exportaciones inicializada en {_cache.cache_dir or 'memoria'}")
+        return _cache
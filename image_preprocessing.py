@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Módulo de preparación de imágenes para OCR en Expert Nexus.
+Contiene las transformaciones de imagen que consumen CPU; se mantienen
+fuera de app.py para poder ejecutarlas en el pool de procesos de ingesta.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from PIL import Image
+
+logger = logging.getLogger("image_preprocessing")
+
+# Dimensión máxima (en píxeles) de las imágenes enviadas a OCR
+MAX_OCR_DIMENSION = 4000
+
+# Tamaño máximo de la caché de imágenes preparadas (configurable por IMAGE_CACHE_MAX_MB)
+DEFAULT_CACHE_MB = 64
+
+# Formatos que la API de OCR acepta sin convertir
+_PASSTHROUGH_FORMATS = ("JPEG", "PNG")
+
+# Caché compartida por el proceso
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _target_size(width, height, max_dimension=MAX_OCR_DIMENSION):
+    """Tamaño final de una imagen que supera la dimensión máxima, o None si no la supera."""
+    if width <= max_dimension and height <= max_dimension:
+        return None
+    ratio = min(max_dimension / width, max_dimension / height)
+    return max(1, int(width * ratio)), max(1, int(height * ratio))
+
+
+def _read_source(source):
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def encode_for_ocr(img):
+    """
+    Codifica una imagen en escala de grises para OCR: PNG si parece un
+    documento (blanco y negro predominante), JPEG en otro caso.
+
+    Retorno:
+        tuple: (datos, mime_type)
+    """
+    # JPEG para imágenes fotográficas, PNG para documentos/texto
+    save_format = "JPEG"
+    save_quality = 95
+
+    # Detectar si es más probable que sea un documento (blanco/negro predominante)
+    histogram = img.histogram()
+    if img.mode == "L" and (histogram[0] + histogram[-1]) > sum(histogram) * 0.8:
+        save_format = "PNG"
+
+    # Guardar con parámetros optimizados
+    buffer = BytesIO()
+    if save_format == "JPEG":
+        img.save(buffer, format=save_format, quality=save_quality, optimize=True)
+    else:
+        img.save(buffer, format=save_format, optimize=True)
+    return buffer.getvalue(), f"image/{save_format.lower()}"
+
+
+def optimize_image_for_ocr(file_data):
+    """
+    Prepara una imagen para ser procesada con OCR,
+    optimizando formato y calidad para mejorar resultados.
+    Las imágenes grandes se reducen al decodificar (modo draft de JPEG y
+    reducción entera antes del LANCZOS) para no decodificarlas completas.
+
+    Parámetros:
+        file_data: Datos binarios de la imagen o ruta del archivo en disco
+
+    Retorno:
+        tuple: (datos_optimizados, mime_type); los datos originales si la
+               optimización no los reduce
+    """
+    try:
+        # Abrir la imagen con PIL (solo lee el encabezado)
+        img = Image.open(BytesIO(file_data) if isinstance(file_data, (bytes, bytearray)) else file_data)
+        original_format = img.format
+        target = _target_size(img.width, img.height)
+
+        # 1. Reducción al decodificar: el decodificador JPEG entrega
+        # directamente escala de grises y una escala 1/2, 1/4 o 1/8
+        if original_format == "JPEG":
+            img.draft("L", target or img.size)
+
+        # 2. Convertir a escala de grises si tiene más de un canal
+        if img.mode != "L" and img.mode != "1":
+            img = img.convert("L")
+
+        # 3. Ajustar tamaño si es muy grande (reduce() entero y luego LANCZOS)
+        if target and img.size != target:
+            img = img.resize(target, Image.LANCZOS, reducing_gap=2.0)
+
+        # 4. Guardar en el formato más adecuado
+        optimized, mime_type = encode_for_ocr(img)
+
+        # 5. Conservar el original si la optimización no lo reduce
+        if target is None and original_format in _PASSTHROUGH_FORMATS:
+            original = _read_source(file_data)
+            if len(optimized) >= len(original):
+                return original, Image.MIME[original_format]
+
+        return optimized, mime_type
+
+    except Exception as e:
+        logger.warning(f"Optimización de imagen fallida: {str(e)}")
+        return _read_source(file_data), "image/jpeg"  # Formato por defecto
+
+
+def image_hash(file_data):
+    """Huella SHA-256 de los bytes de una imagen."""
+    return hashlib.sha256(file_data).hexdigest()
+
+
+class PreparedImageCache:
+    """
+    Caché LRU en memoria de imágenes preparadas, indexada por la huella de
+    la imagen original y acotada por bytes. Evita repetir la preparación
+    cuando se reintenta el OCR o se vuelve a cargar la misma imagen.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def _key(content_hash):
+        return f"{content_hash}:{MAX_OCR_DIMENSION}"
+
+    def get(self, content_hash):
+        """
+        Retorno:
+            tuple o None: (datos, mime_type) guardados, o None si no existen
+        """
+        key = self._key(content_hash)
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.stats["hits"] += 1
+                return self._items[key]
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, content_hash, prepared):
+        data = prepared[0]
+        if len(data) > self.max_bytes:
+            return
+        key = self._key(content_hash)
+        with self._lock:
+            if key in self._items:
+                self._total -= len(self._items.pop(key)[0])
+            self._items[key] = prepared
+            self._total += len(data)
+            while self._total > self.max_bytes:
+                _, (evicted, _) = self._items.popitem(last=False)
+                self._total -= len(evicted)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["items"] = len(self._items)
+            stats["bytes"] = self._total
+        return stats
+
+
+def get_prepared_image_cache():
+    """
+    Obtiene la caché de imágenes preparadas del proceso, creándola la primera vez.
+
+    Variables de entorno:
+        IMAGE_CACHE_MAX_MB: Tamaño máximo de la caché (0 para desactivarla)
+
+    Retorno:
+        PreparedImageCache o None: Caché compartida, o None si está desactivada
+    """
+    global _cache
+    value = os.environ.get("IMAGE_CACHE_MAX_MB")
+    try:
+        max_mb = float(value) if value else DEFAULT_CACHE_MB
+    except ValueError:
+        logger.warning(f"Valor inválido para IMAGE_CACHE_MAX_MB: {value}. Usando {DEFAULT_CACHE_MB}")
+        max_mb = DEFAULT_CACHE_MB
+    if max_mb <= 0:
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = PreparedImageCache(int(max_mb * 1024 * 1024))
+        return _cache
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Módulo de OCR por mosaicos para imágenes grandes en Expert Nexus.
+En lugar de reducir los planos y formularios que superan la dimensión
+máxima de OCR, la imagen se divide en mosaicos solapados a resolución
+completa que se envían a OCR en paralelo. Los textos se unen en orden de
+lectura (columnas de mosaicos de izquierda a derecha, cada una de arriba
+abajo) eliminando las líneas repetidas por el solapamiento y recomponiendo
+las líneas que cruzan el corte entre columnas.
+"""
+
+import difflib
+import logging
+import os
+import re
+from io import BytesIO
+
+from PIL import Image
+
+import image_preprocessing
+
+logger = logging.getLogger("image_tiling")
+
+# Valores predeterminados (configurables por variables de entorno)
+DEFAULT_TILE_SIZE = 2000  # Lado de cada mosaico en píxeles
+DEFAULT_TILE_OVERLAP = 160  # Solapamiento entre mosaicos vecinos en píxeles
+MAX_OVERLAP_LINES = 30  # Líneas comparadas al buscar el solapamiento
+LINE_SIMILARITY = 0.85  # Similitud mínima para considerar dos líneas iguales
+MIN_FRAGMENT_CHARS = 4  # Caracteres repetidos mínimos para unir líneas entre columnas
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    try:
+        return int(value) if value else default
+    except ValueError:
+        logger.warning(f"Valor inválido para {name}: {value}. Usando {default}")
+        return default
+
+
+def tiling_enabled():
+    """Indica si las imágenes grandes se procesan por mosaicos (OCR_IMAGE_TILING)."""
+    return os.environ.get("OCR_IMAGE_TILING", "false").lower() in ("1", "true", "yes")
+
+
+def tile_settings():
+    """
+    Variables de entorno:
+        OCR_TILE_SIZE: Lado de cada mosaico en píxeles
+        OCR_TILE_OVERLAP: Solapamiento entre mosaicos vecinos en píxeles
+
+    Retorno:
+        tuple: (tamaño, solapamiento) validados
+    """
+    tile_size = min(
+        max(256, _env_int("OCR_TILE_SIZE", DEFAULT_TILE_SIZE)), image_preprocessing.MAX_OCR_DIMENSION
+    )
+    overlap = min(max(0, _env_int("OCR_TILE_OVERLAP", DEFAULT_TILE_OVERLAP)), tile_size // 2)
+    return tile_size, overlap
+
+
+def _axis_starts(length, tile_size, overlap, max_dimension):
+    """Posiciones de inicio de los mosaicos a lo largo de un eje."""
+    if length <= max_dimension:
+        return [0], length
+    step = tile_size - overlap
+    count = max(2, -(-(length - overlap) // step))
+    # Repartir los mosaicos uniformemente para cubrir el eje exacto
+    return [round(index * (length - tile_size) / (count - 1)) for index in range(count)], tile_size
+
+
+def plan_tiles(width, height, tile_size, overlap, max_dimension=image_preprocessing.MAX_OCR_DIMENSION):
+    """
+    Calcula los mosaicos de una imagen en orden de lectura. Solo se divide
+    el eje que supera la dimensión máxima, para no cortar líneas de texto
+    que caben enteras.
+
+    Parámetros:
+        width, height: Dimensiones de la imagen
+        tile_size: Lado de cada mosaico
+        overlap: Solapamiento entre mosaicos vecinos
+        max_dimension: Dimensión a partir de la cual se divide un eje
+
+    Retorno:
+        list: Mosaicos {"row", "col", "box": (izq, arriba, der, abajo)}
+              ordenados por columna y, dentro de cada columna, por fila
+    """
+    lefts, tile_width = _axis_starts(width, tile_size, overlap, max_dimension)
+    tops, tile_height = _axis_starts(height, tile_size, overlap, max_dimension)
+    return [
+        {"row": row, "col": col, "box": (left, top, left + tile_width, top + tile_height)}
+        for col, left in enumerate(lefts)
+        for row, top in enumerate(tops)
+    ]
+
+
+def split_image(file_data, tile_size, overlap):
+    """
+    Divide una imagen grande en mosaicos codificados para OCR. Se ejecuta
+    en el pool de procesos de ingesta.
+
+    Parámetros:
+        file_data: Datos binarios de la imagen o ruta del archivo en disco
+        tile_size: Lado de cada mosaico
+        overlap: Solapamiento entre mosaicos vecinos
+
+    Retorno:
+        list o None: Mosaicos de plan_tiles con "data" y "mime_type", o
+                     None si la imagen no supera la dimensión máxima
+    """
+    img = Image.open(BytesIO(file_data) if isinstance(file_data, (bytes, bytearray)) else file_data)
+    limit = image_preprocessing.MAX_OCR_DIMENSION
+    if img.width <= limit and img.height <= limit:
+        return None
+
+    # Decodificar una sola vez, en escala de grises y a resolución completa
+    if img.mode != "L" and img.mode != "1":
+        img = img.convert("L")
+
+    tiles = plan_tiles(img.width, img.height, tile_size, overlap)
+    for tile in tiles:
+        tile["data"], tile["mime_type"] = image_preprocessing.encode_for_ocr(img.crop(tile["box"]))
+    logger.info(f"Imagen de {img.width}x{img.height} dividida en {len(tiles)} mosaicos")
+    return tiles
+
+
+def _normalize_line(line):
+    return re.sub(r"\s+", " ", line).strip().lower()
+
+
+def _lines_match(first, second):
+    """Dos lecturas de la misma línea: iguales o muy similares con los mismos números."""
+    if first == second:
+        return True
+    if re.findall(r"\d+", first) != re.findall(r"\d+", second):
+        return False
+    return difflib.SequenceMatcher(None, first, second).ratio() >= LINE_SIMILARITY
+
+
+def find_overlap(previous_lines, lines, max_lines=MAX_OVERLAP_LINES):
+    """
+    Busca el texto repetido entre el final de un mosaico y el inicio del
+    siguiente (la franja solapada). Admite que el corte deje una línea
+    partida al final del anterior o al inicio del siguiente. Las líneas
+    vacías se ignoran en la comparación.
+
+    Retorno:
+        tuple: (líneas a quitar del final de ``previous_lines``, líneas de
+                ``lines`` a omitir), ambas contando líneas vacías
+    """
+    tail_positions = [index for index, line in enumerate(previous_lines) if line.strip()][-max_lines - 1:]
+    head_positions = [index for index, line in enumerate(lines) if line.strip()][:max_lines + 1]
+    tail = [_normalize_line(previous_lines[index]) for index in tail_positions]
+    head = [_normalize_line(lines[index]) for index in head_positions]
+
+    best = None
+    for drop_tail in (0, 1):
+        for skip_head in (0, 1):
+            candidate_tail = tail[:len(tail) - drop_tail]
+            candidate_head = head[skip_head:]
+            # Con una línea partida se exige más de una coincidencia
+            minimum = 1 if drop_tail == skip_head == 0 else 2
+            for size in range(min(len(candidate_tail), len(candidate_head)), minimum - 1, -1):
+                if all(_lines_match(a, b) for a, b in zip(candidate_tail[-size:], candidate_head[:size])):
+                    if best is None or size > best[0]:
+                        best = (size, drop_tail, skip_head)
+                    break
+
+    if best is None:
+        return 0, 0
+    size, drop_tail, skip_head = best
+    trim = len(previous_lines) - tail_positions[-1] if drop_tail else 0
+    return trim, head_positions[skip_head + size - 1] + 1
+
+
+def join_fragments(left, right, min_chars=MIN_FRAGMENT_CHARS):
+    """
+    Une dos lecturas de una línea cortada por el borde entre columnas de
+    mosaicos: el final de ``left`` y el inicio de ``right`` repiten el texto
+    de la franja solapada.
+
+    Retorno:
+        string o None: Línea unida (``left`` si ``right`` cabe entera en el
+                       solapamiento), o None si no comparten un fragmento
+                       de al menos ``min_chars`` caracteres
+    """
+    left_text, right_text = left.rstrip(), right.strip()
+    left_key, right_key = left_text.lower(), right_text.lower()
+    for size in range(min(len(left_key), len(right_key)), min_chars - 1, -1):
+        if left_key[-size:] == right_key[:size]:
+            return left_text + right_text[size:]
+    return None
+
+
+def stitch_tile_texts(tiles, texts):
+    """
+    Une los textos de los mosaicos en orden de lectura sin las líneas
+    repetidas por el solapamiento entre mosaicos consecutivos. Las líneas
+    de una columna que continúan una línea de la columna anterior se unen
+    a ella; el resto forma el bloque de su columna.
+
+    Parámetros:
+        tiles: Mosaicos en orden de lectura (ver plan_tiles)
+        texts: {índice_mosaico: texto} de los mosaicos procesados
+
+    Retorno:
+        string: Texto unido; cada columna de mosaicos en un bloque
+    """
+    columns = {}
+    for index, tile in enumerate(tiles):
+        columns.setdefault(tile["col"], []).append(index)
+
+    blocks = []
+    edge = []  # Líneas de la columna anterior que llegan a su borde derecho
+    for col in sorted(columns):
+        column_lines = []
+        previous_row = None
+        for index in columns[col]:
+            if index not in texts:
+                previous_row = None
+                continue
+            lines = texts[index].strip("\n").splitlines()
+            # Solo los mosaicos contiguos de una columna comparten franja
+            if previous_row is not None and tiles[index]["row"] == previous_row + 1:
+                trim, skip = find_overlap(column_lines, lines)
+                del column_lines[len(column_lines) - trim:]
+                lines = lines[skip:]
+            elif column_lines:
+                column_lines.append("")
+            column_lines.extend(lines)
+            previous_row = tiles[index]["row"]
+
+        # Unir con la columna anterior, de arriba abajo y sin retroceder
+        block, next_edge, position = [], [], 0
+        for line in column_lines:
+            cell = None
+            if line.strip():
+                for offset in range(position, len(edge)):
+                    joined = join_fragments(edge[offset][0], line)
+                    if joined is not None:
+                        edge[offset][0] = joined
+                        cell, position = edge[offset], offset + 1
+                        break
+            if cell is None:
+                cell = [line]
+                block.append(cell)
+            next_edge.append(cell)
+        blocks.append(block)
+        edge = next_edge
+
+    texts_by_block = ("\n".join(cell[0] for cell in block).strip() for block in blocks)
+    return "\n\n".join(text for text in texts_by_block if text)
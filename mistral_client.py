@@ -0,0 +1,428 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Módulo de acceso a la API de Mistral para Expert Nexus.
+Mantiene un cliente por clave API compartido por todo el proceso, con un
+pool de conexiones HTTP persistentes (keep-alive), HTTP/2 opcional y
+timeouts por endpoint, de modo que los archivos y rangos de páginas
+procesados en paralelo reutilizan las conexiones en lugar de repetir la
+resolución DNS y el handshake TCP/TLS en cada solicitud. Para lotes grandes
+ofrece un cliente asíncrono con concurrencia acotada y una fachada síncrona.
+Todas las solicitudes pasan por el planificador de tasa compartido
+(rate_limit.py), que reparte la cuota entre sesiones.
+También permite enviar documentos a OCR mediante carga de archivos
+(multipart), leyendo el archivo por bloques desde disco en lugar de
+incrustarlo en la solicitud como una URL data: en base64.
+"""
+
+import asyncio
+import concurrent.futures
+import hashlib
+import logging
+import os
+import threading
+
+import httpx
+
+import rate_limit
+
+logger = logging.getLogger("mistral_client")
+
+MISTRAL_API_BASE = "https://api.mistral.ai/v1"
+
+# Valores predeterminados (configurables por variables de entorno)
+DEFAULT_UPLOAD_MODE = "auto"  # "auto", "multipart" o "inline"
+DEFAULT_INLINE_MAX_MB = 4  # Tamaño máximo para enviar un documento en base64
+DEFAULT_SIGNED_URL_EXPIRY_HOURS = 1
+DEFAULT_POOL_MAX_CONNECTIONS = 20
+DEFAULT_POOL_MAX_KEEPALIVE = 10
+DEFAULT_KEEPALIVE_EXPIRY = 60  # Segundos que una conexión inactiva se mantiene abierta
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_OCR_TIMEOUT = 90  # Timeout de lectura del OCR (documentos grandes)
+DEFAULT_UPLOAD_TIMEOUT = 120  # Timeout de la carga de archivos
+DEFAULT_FILES_TIMEOUT = 30  # Timeout de las operaciones breves sobre archivos
+
+# Clientes compartidos por el proceso, indexados por huella de la clave API
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _env_number(name, default):
+    """
+    Lee una variable de entorno numérica, usando el valor predeterminado
+    si no existe o no es válida.
+    """
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return type(default)(float(value))
+    except ValueError:
+        logger.warning(f"Valor inválido para {name}: {value}. Usando {default}")
+        return default
+
+
+def _key_fingerprint(api_key):
+    """Huella corta de la clave API para indexar y registrar sin exponerla."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def _http2_enabled():
+    """
+    Indica si se debe negociar HTTP/2 (variable MISTRAL_HTTP2). Requiere el
+    paquete opcional h2; si no está instalado se usa HTTP/1.1.
+    """
+    if os.environ.get("MISTRAL_HTTP2", "false").lower() not in ("1", "true", "yes"):
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("MISTRAL_HTTP2 activo pero el paquete h2 no está instalado; se usa HTTP/1.1")
+        return False
+    return True
+
+
+def endpoint_timeouts():
+    """
+    Timeouts de cada endpoint de la API.
+
+    Variables de entorno:
+        MISTRAL_CONNECT_TIMEOUT: Timeout de conexión en segundos
+        MISTRAL_OCR_TIMEOUT: Timeout de lectura del OCR
+        MISTRAL_UPLOAD_TIMEOUT: Timeout de la carga de archivos
+        MISTRAL_FILES_TIMEOUT: Timeout de URLs firmadas y eliminación de archivos
+
+    Retorno:
+        dict: {"ocr", "upload", "files"} con objetos httpx.Timeout
+    """
+    connect = _env_number("MISTRAL_CONNECT_TIMEOUT", float(DEFAULT_CONNECT_TIMEOUT))
+    return {
+        "ocr": httpx.Timeout(_env_number("MISTRAL_OCR_TIMEOUT", float(DEFAULT_OCR_TIMEOUT)), connect=connect),
+        "upload": httpx.Timeout(
+            _env_number("MISTRAL_UPLOAD_TIMEOUT", float(DEFAULT_UPLOAD_TIMEOUT)), connect=connect
+        ),
+        "files": httpx.Timeout(_env_number("MISTRAL_FILES_TIMEOUT", float(DEFAULT_FILES_TIMEOUT)), connect=connect),
+    }
+
+
+def build_http_client(base_url=MISTRAL_API_BASE):
+    """
+    Crea el cliente HTTP con pool de conexiones persistentes (keep-alive).
+
+    Variables de entorno:
+        MISTRAL_POOL_MAX_CONNECTIONS: Conexiones simultáneas máximas
+        MISTRAL_POOL_MAX_KEEPALIVE: Conexiones inactivas que se conservan
+        MISTRAL_KEEPALIVE_EXPIRY: Segundos antes de cerrar una conexión inactiva
+        MISTRAL_HTTP2: Negocia HTTP/2 si el paquete h2 está instalado
+
+    Retorno:
+        httpx.Client: Cliente HTTP con pool de conexiones
+    """
+    limits = httpx.Limits(
+        max_connections=_env_number("MISTRAL_POOL_MAX_CONNECTIONS", DEFAULT_POOL_MAX_CONNECTIONS),
+        max_keepalive_connections=_env_number("MISTRAL_POOL_MAX_KEEPALIVE", DEFAULT_POOL_MAX_KEEPALIVE),
+        keepalive_expiry=_env_number("MISTRAL_KEEPALIVE_EXPIRY", float(DEFAULT_KEEPALIVE_EXPIRY)),
+    )
+    return httpx.Client(
+        base_url=base_url,
+        limits=limits,
+        timeout=endpoint_timeouts()["files"],
+        http2=_http2_enabled(),
+    )
+
+
+class MistralClient:
+    """
+    Cliente de la API de Mistral con pool de conexiones compartido.
+
+    Es seguro usarlo desde varios hilos: httpx.Client reparte las
+    solicitudes simultáneas entre las conexiones del pool. Cada solicitud
+    espera su turno en el planificador de tasa, identificada por la sesión
+    (``queue_key``) que la origina.
+    """
+
+    def __init__(self, api_key, base_url=MISTRAL_API_BASE, scheduler=None):
+        self.fingerprint = _key_fingerprint(api_key)
+        self.timeouts = endpoint_timeouts()
+        self.scheduler = scheduler or rate_limit.get_scheduler()
+        self.http = build_http_client(base_url)
+        self.http.headers["Authorization"] = f"Bearer {api_key}"
+
+    def _send(self, method, url, queue_key=None, **kwargs):
+        """Envía una solicitud tras obtener turno e informa la respuesta al planificador."""
+        self.scheduler.acquire(queue_key)
+        response = self.http.request(method, url, **kwargs)
+        self.scheduler.observe(response.status_code, response.headers)
+        return response
+
+    def ocr(self, payload, queue_key=None):
+        """
+        Envía una solicitud de OCR. El resultado se devuelve sin interpretar
+        para que quien llama decida cómo tratar cada código de estado.
+
+        Parámetros:
+            payload: Cuerpo JSON de la solicitud ({"model", "document"})
+            queue_key: Sesión que origina la solicitud (para el reparto justo)
+
+        Retorno:
+            httpx.Response: Respuesta de la API
+
+        Excepciones:
+            httpx.TimeoutException, httpx.TransportError: Errores de red
+            TimeoutError: Si el turno en la cola no llega a tiempo
+        """
+        return self._send("POST", "/ocr", queue_key, json=payload, timeout=self.timeouts["ocr"])
+
+    def upload_file(self, fileobj, file_name, purpose="ocr", queue_key=None):
+        """
+        Carga un archivo con una solicitud multipart. El cuerpo se genera
+        leyendo el archivo por bloques, sin cargarlo completo en memoria.
+
+        Parámetros:
+            fileobj: Archivo abierto en modo binario
+            file_name: Nombre con el que se carga el archivo
+            purpose: Propósito del archivo en la API
+
+        Retorno:
+            string: ID del archivo cargado
+
+        Excepciones:
+            httpx.HTTPStatusError: Si la API rechaza la carga
+        """
+        response = self._send(
+            "POST",
+            "/files",
+            queue_key,
+            data={"purpose": purpose},
+            files={"file": (file_name, fileobj)},
+            timeout=self.timeouts["upload"],
+        )
+        response.raise_for_status()
+        file_id = response.json()["id"]
+        logger.info(f"Archivo {file_name} cargado en Mistral (ID: {file_id})")
+        return file_id
+
+    def get_signed_url(self, file_id, expiry_hours=DEFAULT_SIGNED_URL_EXPIRY_HOURS, queue_key=None):
+        """
+        Obtiene una URL firmada y temporal para que el OCR lea un archivo cargado.
+
+        Retorno:
+            string: URL firmada del archivo
+        """
+        response = self._send(
+            "GET", f"/files/{file_id}/url", queue_key,
+            params={"expiry": expiry_hours}, timeout=self.timeouts["files"],
+        )
+        response.raise_for_status()
+        return response.json()["url"]
+
+    def delete_file(self, file_id, queue_key=None):
+        """
+        Elimina un archivo cargado. Los errores se registran sin propagarse.
+        """
+        try:
+            response = self._send("DELETE", f"/files/{file_id}", queue_key, timeout=self.timeouts["files"])
+            response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"No se pudo eliminar el archivo {file_id} de Mistral: {str(e)}")
+
+    def close(self):
+        self.http.close()
+
+
+def get_mistral_client(api_key):
+    """
+    Obtiene el cliente Mistral compartido para una clave API, creándolo
+    la primera vez.
+
+    Parámetros:
+        api_key: API key de Mistral
+
+    Retorno:
+        MistralClient: Cliente compartido por todo el proceso
+    """
+    fingerprint = _key_fingerprint(api_key)
+    with _clients_lock:
+        client = _clients.get(fingerprint)
+        if client is None:
+            client = MistralClient(api_key)
+            _clients[fingerprint] = client
+            logger.info(f"Cliente Mistral creado para la clave {fingerprint}")
+        return client
+
+
+def use_file_upload(size_bytes):
+    """
+    Indica si un documento debe enviarse a OCR mediante carga de archivo
+    en lugar de una URL data: en base64.
+
+    Variables de entorno:
+        OCR_UPLOAD_MODE: "auto" (según tamaño), "multipart" o "inline"
+        OCR_INLINE_MAX_MB: Tamaño máximo para el envío en base64 en modo "auto"
+    """
+    mode = os.environ.get("OCR_UPLOAD_MODE", DEFAULT_UPLOAD_MODE).lower()
+    if mode == "multipart":
+        return True
+    if mode == "inline":
+        return False
+    inline_max_mb = _env_number("OCR_INLINE_MAX_MB", float(DEFAULT_INLINE_MAX_MB))
+    return size_bytes > inline_max_mb * 1024 * 1024
+
+
+# ==============================================
+# CLIENTE ASÍNCRONO PARA OCR EN LOTE
+# ==============================================
+
+DEFAULT_ASYNC_CONCURRENCY = 16  # Solicitudes de OCR en curso simultáneamente
+DEFAULT_REQUEST_DEADLINE = 120  # Segundos máximos por solicitud de OCR
+
+# Bucle de eventos compartido por el proceso, en un hilo propio
+_loop = None
+_loop_lock = threading.Lock()
+_async_clients = {}
+
+
+class AsyncMistralClient:
+    """
+    Cliente asíncrono de OCR sobre httpx.AsyncClient. Un semáforo limita
+    las solicitudes en curso de todo el proceso, cada solicitud espera su
+    turno en el planificador de tasa y tiene un plazo máximo tras el cual
+    se cancela.
+    """
+
+    def __init__(self, api_key, base_url=MISTRAL_API_BASE, max_concurrency=None, scheduler=None):
+        self.fingerprint = _key_fingerprint(api_key)
+        self.scheduler = scheduler or rate_limit.get_scheduler()
+        self.max_concurrency = max_concurrency or _env_number(
+            "OCR_ASYNC_CONCURRENCY", DEFAULT_ASYNC_CONCURRENCY
+        )
+        self.timeouts = endpoint_timeouts()
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+                keepalive_expiry=_env_number("MISTRAL_KEEPALIVE_EXPIRY", float(DEFAULT_KEEPALIVE_EXPIRY)),
+            ),
+            timeout=self.timeouts["ocr"],
+            http2=_http2_enabled(),
+            headers={"Authorization": f"Bearer {api_key}"},
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def ocr(self, payload, deadline=None, queue_key=None):
+        """
+        Envía una solicitud de OCR cuando hay un hueco libre en el semáforo
+        y el planificador concede el turno.
+
+        Parámetros:
+            payload: Cuerpo JSON de la solicitud ({"model", "document"})
+            deadline: Segundos máximos de la solicitud, incluida la espera
+            queue_key: Sesión que origina la solicitud
+
+        Retorno:
+            httpx.Response: Respuesta de la API
+
+        Excepciones:
+            asyncio.TimeoutError: Si se supera el plazo
+        """
+        async def send():
+            async with self._semaphore:
+                await self.scheduler.acquire_async(queue_key)
+                response = await self.http.post("/ocr", json=payload)
+                self.scheduler.observe(response.status_code, response.headers)
+                return response
+
+        return await asyncio.wait_for(send(), deadline)
+
+    async def ocr_many(self, payloads, deadline=None, queue_key=None):
+        """
+        Envía varias solicitudes de OCR a la vez.
+
+        Retorno:
+            list: Respuesta o excepción de cada solicitud, en el mismo orden
+        """
+        return await asyncio.gather(
+            *(self.ocr(payload, deadline, queue_key) for payload in payloads), return_exceptions=True
+        )
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+def _get_event_loop():
+    """
+    Obtiene el bucle de eventos compartido, iniciando su hilo la primera vez.
+    Así la fachada síncrona puede llamarse desde cualquier hilo, incluido
+    el del script de Streamlit, y los clientes asíncronos conservan sus
+    conexiones entre llamadas.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="mistral-async", daemon=True
+            ).start()
+        return _loop
+
+
+async def _get_async_client(api_key, base_url):
+    key = (_key_fingerprint(api_key), base_url)
+    client = _async_clients.get(key)
+    if client is None:
+        client = AsyncMistralClient(api_key, base_url)
+        _async_clients[key] = client
+        logger.info(
+            f"Cliente Mistral asíncrono creado para la clave {client.fingerprint} "
+            f"({client.max_concurrency} solicitudes simultáneas)"
+        )
+    return client
+
+
+def run_ocr_batch(api_key, payloads, deadline=None, cancel_event=None, base_url=MISTRAL_API_BASE,
+                  queue_key=None):
+    """
+    Fachada síncrona del OCR asíncrono: envía un lote de solicitudes desde
+    el hilo que llama y espera sus respuestas. Si ``cancel_event`` se activa
+    o el hilo que espera se interrumpe, las solicitudes pendientes se cancelan.
+
+    Variables de entorno:
+        OCR_ASYNC_CONCURRENCY: Solicitudes simultáneas del proceso
+        OCR_REQUEST_DEADLINE: Segundos máximos por solicitud
+
+    Parámetros:
+        api_key: API key de Mistral
+        payloads: Lista de cuerpos JSON de OCR
+        deadline: Segundos máximos por solicitud (OCR_REQUEST_DEADLINE por defecto)
+        cancel_event: threading.Event que cancela el lote (opcional)
+        base_url: URL base de la API
+        queue_key: Sesión que origina el lote (para el reparto justo)
+
+    Retorno:
+        list: httpx.Response o excepción de cada solicitud, en orden
+
+    Excepciones:
+        concurrent.futures.CancelledError: Si el lote se cancela
+    """
+    if deadline is None:
+        deadline = _env_number("OCR_REQUEST_DEADLINE", float(DEFAULT_REQUEST_DEADLINE))
+
+    async def batch():
+        client = await _get_async_client(api_key, base_url)
+        return await client.ocr_many(payloads, deadline, queue_key)
+
+    future = asyncio.run_coroutine_threadsafe(batch(), _get_event_loop())
+    try:
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                future.cancel()
+                logger.info("Lote de OCR cancelado")
+            try:
+                return future.result(timeout=0.1)
+            except concurrent.futures.TimeoutError:
+                continue
+    finally:
+        if not future.done():
+            future.cancel()
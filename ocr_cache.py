@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Módulo de caché de resultados OCR para Expert Nexus.
+Guarda el texto extraído de cada documento indexado por la huella SHA-256
+de sus bytes junto con el modelo y las opciones de OCR, en dos niveles:
+memoria (LRU acotado, compartido por todas las sesiones del proceso) y
+disco (comprimido, con tamaño máximo y desalojo de lo menos usado), de modo
+que volver a cargar un documento no repite la llamada a la API.
+"""
+
+import copy
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("ocr_cache")
+
+# Valores predeterminados (configurables por variables de entorno)
+DEFAULT_MEMORY_ITEMS = 128  # Resultados máximos en memoria
+DEFAULT_DISK_MAX_MB = 512  # Tamaño máximo de la caché en disco
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "expert_nexus", "ocr")
+
+_CACHE_SUFFIX = ".json.gz"
+
+# Caché compartida por el proceso
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def cache_key(file_bytes, model, options=None, content_hash=None):
+    """
+    Calcula la clave de caché de un documento: huella de sus bytes más
+    el modelo y las opciones de OCR con que se procesa.
+
+    Parámetros:
+        file_bytes: Bytes del archivo (puede ser None si se indica content_hash)
+        model: Modelo de OCR utilizado
+        options: Diccionario de opciones que afectan el resultado (opcional)
+        content_hash: Huella SHA-256 ya calculada de los bytes (opcional)
+
+    Retorno:
+        string: Clave hexadecimal SHA-256
+    """
+    if content_hash is None:
+        content_hash = hashlib.sha256(file_bytes).hexdigest()
+    settings = json.dumps({"model": model, "options": options or {}}, sort_keys=True)
+    return hashlib.sha256(f"{content_hash}:{settings}".encode("utf-8")).hexdigest()
+
+
+class OCRCache:
+    """
+    Caché de resultados OCR con un nivel en memoria y otro en disco.
+
+    Los resultados se devuelven como copias para que las modificaciones de
+    una sesión no afecten a las demás.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, memory_items=DEFAULT_MEMORY_ITEMS,
+                 disk_max_bytes=DEFAULT_DISK_MAX_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.memory_items = memory_items
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"No se pudo crear el directorio de caché OCR: {str(e)}")
+                self.cache_dir = None
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + _CACHE_SUFFIX)
+
+    def _remember(self, key, result):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """
+        Busca un resultado en memoria y, si no está, en disco.
+
+        Retorno:
+            dict o None: Copia del resultado guardado, o None si no existe
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return copy.deepcopy(self._memory[key])
+
+            if self.cache_dir:
+                path = self._path(key)
+                try:
+                    with gzip.open(path, "rt", encoding="utf-8") as f:
+                        result = json.load(f)
+                    # Actualizar la fecha de uso para el desalojo LRU
+                    os.utime(path, None)
+                    self._remember(key, result)
+                    self.stats["disk_hits"] += 1
+                    return copy.deepcopy(result)
+                except FileNotFoundError:
+                    pass
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Entrada de caché OCR ilegible, se descarta: {str(e)}")
+                    self._remove_file(path)
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key, result):
+        """
+        Guarda un resultado en memoria y en disco, desalojando las entradas
+        de disco menos usadas si se supera el tamaño máximo. Los resultados
+        parciales (con "partial") no se guardan: un fallo pasajero de la API
+        no debe quedar como páginas perdidas tras un reinicio.
+        """
+        if result.get("partial"):
+            logger.info(f"Resultado OCR parcial, no se guarda en la caché: {key}")
+            return
+        result = copy.deepcopy(result)
+        with self._lock:
+            self._remember(key, result)
+            self.stats["stores"] += 1
+            if not self.cache_dir:
+                return
+
+            # Escritura atómica para no dejar entradas a medio escribir
+            temp_path = None
+            try:
+                fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+                with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                    f.write(json.dumps(result, ensure_ascii=False).encode("utf-8"))
+                os.replace(temp_path, self._path(key))
+            except (OSError, TypeError, ValueError) as e:
+                logger.warning(f"No se pudo guardar el resultado OCR en disco: {str(e)}")
+                if temp_path:
+                    self._remove_file(temp_path)
+                return
+
+            self._evict_disk()
+
+    def _remove_file(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _evict_disk(self):
+        """Elimina las entradas de disco menos usadas hasta respetar el tamaño máximo."""
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(_CACHE_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            entries.append((info.st_mtime, info.st_size, path))
+            total += info.st_size
+
+        entries.sort()
+        while total > self.disk_max_bytes and entries:
+            _, size, path = entries.pop(0)
+            self._remove_file(path)
+            total -= size
+            self.stats["evictions"] += 1
+
+    def get_stats(self):
+        """
+        Retorno:
+            dict: Contadores de aciertos, fallos, escrituras y desalojos
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_items"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    try:
+        return int(value) if value else default
+    except ValueError:
+        logger.warning(f"Valor inválido para {name}: {value}. Usando {default}")
+        return default
+
+
+def get_ocr_cache():
+    """
+    Obtiene la caché OCR compartida por el proceso, creándola la primera vez.
+
+    Variables de entorno:
+        OCR_CACHE: Activa la caché (true por defecto)
+        OCR_CACHE_DIR: Directorio de la caché en disco (vacío para solo memoria)
+        OCR_CACHE_MEMORY_ITEMS: Resultados máximos en memoria
+        OCR_CACHE_MAX_MB: Tamaño máximo de la caché en disco
+
+    Retorno:
+        OCRCache o None: Caché compartida, o None si está desactivada
+    """
+    global _cache
+    if os.environ.get("OCR_CACHE", "true").lower() in ("0", "false", "no"):
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = OCRCache(
+                cache_dir=os.environ.get("OCR_CACHE_DIR", DEFAULT_CACHE_DIR),
+                memory_items=_env_int("OCR_CACHE_MEMORY_ITEMS", DEFAULT_MEMORY_ITEMS),
+                disk_max_bytes=_env_int("OCR_CACHE_MAX_MB", DEFAULT_DISK_MAX_MB) * 1024 * 1024,
+            )
+            logger.info(f"Caché OCR inicializada en {_cache.cache_dir or 'memoria'}")
+        return _cache
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Módulo para gestionar los clientes OpenAI de Expert Nexus.
+Mantiene un cliente por clave API compartido por todo el proceso, con un pool
+de conexiones HTTP persistentes, y una verificación de conectividad que se
+repite solo cuando vence su tiempo de validez (TTL), no en cada rerun.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import httpx
+from openai import OpenAI, DefaultHttpxClient
+
+logger = logging.getLogger("openai_clients")
+
+# Valores predeterminados del pool HTTP (configurables por variables de entorno)
+DEFAULT_POOL_MAX_CONNECTIONS = 20
+DEFAULT_POOL_MAX_KEEPALIVE = 10
+DEFAULT_KEEPALIVE_EXPIRY = 60  # Segundos que una conexión inactiva se mantiene abierta
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 120
+DEFAULT_PROBE_TTL = 600  # Segundos de validez de la verificación de conectividad
+
+# Clientes compartidos por el proceso, indexados por huella de la clave API
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _env_number(name, default):
+    """
+    Lee una variable de entorno numérica, usando el valor predeterminado
+    si no existe o no es válida.
+    """
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return type(default)(float(value))
+    except ValueError:
+        logger.warning(f"Valor inválido para {name}: {value}. Usando {default}")
+        return default
+
+
+def _key_fingerprint(api_key):
+    """Huella corta de la clave API para indexar y registrar sin exponerla."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def build_http_client():
+    """
+    Crea el cliente HTTP con pool de conexiones persistentes (keep-alive).
+
+    Variables de entorno:
+        OPENAI_POOL_MAX_CONNECTIONS: Conexiones simultáneas máximas
+        OPENAI_POOL_MAX_KEEPALIVE: Conexiones inactivas que se conservan
+        OPENAI_KEEPALIVE_EXPIRY: Segundos antes de cerrar una conexión inactiva
+        OPENAI_CONNECT_TIMEOUT: Timeout de conexión en segundos
+        OPENAI_READ_TIMEOUT: Timeout de lectura en segundos
+
+    Retorno:
+        DefaultHttpxClient: Cliente HTTP compatible con el SDK de OpenAI
+    """
+    limits = httpx.Limits(
+        max_connections=_env_number("OPENAI_POOL_MAX_CONNECTIONS", DEFAULT_POOL_MAX_CONNECTIONS),
+        max_keepalive_connections=_env_number("OPENAI_POOL_MAX_KEEPALIVE", DEFAULT_POOL_MAX_KEEPALIVE),
+        keepalive_expiry=_env_number("OPENAI_KEEPALIVE_EXPIRY", float(DEFAULT_KEEPALIVE_EXPIRY)),
+    )
+    timeout = httpx.Timeout(
+        _env_number("OPENAI_READ_TIMEOUT", float(DEFAULT_READ_TIMEOUT)),
+        connect=_env_number("OPENAI_CONNECT_TIMEOUT", float(DEFAULT_CONNECT_TIMEOUT)),
+    )
+    return DefaultHttpxClient(limits=limits, timeout=timeout)
+
+
+def get_openai_client(api_key):
+    """
+    Obtiene el cliente OpenAI compartido para una clave API, creándolo
+    la primera vez con encabezados de Assistants v2 y pool de conexiones.
+
+    Parámetros:
+        api_key: Clave API de OpenAI
+
+    Retorno:
+        OpenAI: Cliente compartido por todo el proceso
+    """
+    fingerprint = _key_fingerprint(api_key)
+    with _clients_lock:
+        entry = _clients.get(fingerprint)
+        if entry is None:
+            client = OpenAI(
+                api_key=api_key,
+                default_headers={"OpenAI-Beta": "assistants=v2"},
+                http_client=build_http_client(),
+            )
+            entry = {"client": client, "verified_at": None, "model_ids": []}
+            _clients[fingerprint] = entry
+            logger.info(f"Cliente OpenAI creado para la clave {fingerprint}")
+        return entry["client"]
+
+
+def check_connectivity(api_key, ttl=None, force=False):
+    """
+    Verifica la conectividad del cliente compartido con una llamada simple
+    a la API. El resultado exitoso se reutiliza hasta que vence el TTL.
+
+    Parámetros:
+        api_key: Clave API de OpenAI
+        ttl: Segundos de validez de la verificación (OPENAI_PROBE_TTL por defecto)
+        force: Si se debe verificar aunque el resultado previo siga vigente
+
+    Retorno:
+        list: IDs de algunos modelos disponibles según la última verificación
+
+    Excepciones:
+        Exception: Error de la API si la verificación falla
+    """
+    if ttl is None:
+        ttl = _env_number("OPENAI_PROBE_TTL", DEFAULT_PROBE_TTL)
+
+    client = get_openai_client(api_key)
+    entry = _clients[_key_fingerprint(api_key)]
+
+    verified_at = entry["verified_at"]
+    if not force and verified_at is not None and time.monotonic() - verified_at < ttl:
+        return entry["model_ids"]
+
+    models = client.models.list()
+    if not models:
+        raise Exception("No se pudo obtener la lista de modelos")
+
+    entry["model_ids"] = [model.id for model in models.data[:5]]
+    entry["verified_at"] = time.monotonic()
+    logger.info(f"Conectividad con OpenAI verificada (modelos: {entry['model_ids']})")
+    return entry["model_ids"]
+
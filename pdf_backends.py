@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Módulo de detección de motores PDF para Expert Nexus.
+Averigua una sola vez por proceso qué motores de exportación a PDF están
+disponibles (WeasyPrint, wkhtmltopdf mediante pdfkit, ReportLab, FPDF y
+pandoc), con sus binarios resueltos, versiones y el tiempo que costó
+cargarlos, para que cada exportación vaya directamente al mejor motor sin
+volver a importar ni buscar binarios.
+"""
+
+import importlib
+import logging
+import os
+import platform
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger("pdf_backends")
+
+# Motores conocidos, en el orden en que se informan
+ENGINES = ("weasyprint", "wkhtmltopdf", "reportlab", "fpdf", "pandoc")
+
+# Bibliotecas auxiliares de las exportaciones (Markdown a HTML, resaltado y ensamblado de PDF)
+HELPER_MODULES = ("markdown", "markdown2", "pygments", "html2text", "PyPDF2")
+
+# Segundos máximos para consultar la versión de un binario
+VERSION_TIMEOUT = 5
+
+# Registro compartido por el proceso
+_registry = None
+_registry_lock = threading.Lock()
+_detection_thread = None
+
+
+def _wkhtmltopdf_candidates():
+    """Ubicaciones conocidas de wkhtmltopdf según el sistema operativo."""
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    system = platform.system().lower()
+    if system == "darwin":  # macOS
+        return [
+            "/usr/local/bin/wkhtmltopdf",
+            "/opt/homebrew/bin/wkhtmltopdf",
+            os.path.join(app_dir, "bin", "wkhtmltopdf"),
+        ]
+    if system == "linux":
+        return [
+            "/usr/bin/wkhtmltopdf",
+            "/usr/local/bin/wkhtmltopdf",
+            "/app/.heroku/python/bin/wkhtmltopdf",  # Streamlit Cloud
+            os.path.join(app_dir, "bin", "wkhtmltopdf"),
+        ]
+    return [
+        "C:\\Program Files\\wkhtmltopdf\\bin\\wkhtmltopdf.exe",
+        os.path.join(app_dir, "bin", "wkhtmltopdf.exe"),
+    ]
+
+
+def _binary_version(binary):
+    """Primera versión que informa un binario con --version, o None."""
+    try:
+        result = subprocess.run(
+            [binary, "--version"], capture_output=True, text=True, timeout=VERSION_TIMEOUT
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.search(r"\d+(?:\.\d+)+", result.stdout or result.stderr or "")
+    return match.group(0) if match else None
+
+
+def _probe_weasyprint():
+    import weasyprint
+    return {"version": weasyprint.__version__}
+
+
+def _probe_wkhtmltopdf():
+    importlib.import_module("pdfkit")
+    binary = os.environ.get("WKHTMLTOPDF_PATH") or shutil.which("wkhtmltopdf")
+    if not binary:
+        binary = next((path for path in _wkhtmltopdf_candidates() if os.path.exists(path)), None)
+    if not binary:
+        raise FileNotFoundError("No se encontró wkhtmltopdf en el PATH ni en ubicaciones conocidas")
+    return {"binary": binary, "version": _binary_version(binary)}
+
+
+def _probe_reportlab():
+    import reportlab
+    importlib.import_module("reportlab.platypus")
+    return {"version": reportlab.Version}
+
+
+def _probe_fpdf():
+    try:
+        module = importlib.import_module("fpdf")
+    except ImportError:
+        module = importlib.import_module("fpdf2")
+    return {"version": getattr(module, "__version__", None) or getattr(module, "FPDF_VERSION", None)}
+
+
+def _probe_pandoc():
+    import pypandoc
+    # pandoc genera PDF a través de LaTeX (pdflatex por defecto)
+    binary = pypandoc.get_pandoc_path()
+    pdf_engine = shutil.which("pdflatex")
+    if not pdf_engine:
+        raise FileNotFoundError("pandoc no tiene motor PDF (pdflatex) disponible")
+    return {"binary": binary, "version": pypandoc.get_pandoc_version(), "pdf_engine": pdf_engine}
+
+
+_PROBES = {
+    "weasyprint": _probe_weasyprint,
+    "wkhtmltopdf": _probe_wkhtmltopdf,
+    "reportlab": _probe_reportlab,
+    "fpdf": _probe_fpdf,
+    "pandoc": _probe_pandoc,
+}
+
+
+def probe_engine(name, probe=None):
+    """
+    Comprueba un motor PDF midiendo lo que cuesta cargarlo.
+
+    Parámetros:
+        name: Nombre del motor (ver ENGINES)
+        probe: Función de comprobación (por defecto, la del motor)
+
+    Retorno:
+        dict: {"name", "available", "version", "binary", "warmup_seconds",
+               "reason"} más los datos propios del motor
+    """
+    info = {"name": name, "available": False, "version": None, "binary": None, "reason": None}
+    started = time.perf_counter()
+    try:
+        info.update((probe or _PROBES[name])())
+        info["available"] = True
+    except Exception as e:
+        # WeasyPrint lanza OSError si faltan las bibliotecas del sistema
+        message = str(e).strip()
+        info["reason"] = f"{type(e).__name__}: {message.splitlines()[0]}" if message else type(e).__name__
+    info["warmup_seconds"] = time.perf_counter() - started
+    return info
+
+
+class BackendRegistry:
+    """
+    Capacidades de exportación a PDF del proceso, detectadas una sola vez.
+    """
+
+    def __init__(self, probes=None):
+        probes = probes or _PROBES
+        started = time.perf_counter()
+        self.engines = {name: probe_engine(name, probes[name]) for name in probes}
+        self.helpers = {}
+        for module in HELPER_MODULES:
+            try:
+                importlib.import_module(module)
+                self.helpers[module] = True
+            except Exception:
+                self.helpers[module] = False
+        self.detection_seconds = time.perf_counter() - started
+
+    def available(self, *names):
+        """Indica si todos los motores o bibliotecas auxiliares indicados están disponibles."""
+        return all(
+            self.engines[name]["available"] if name in self.engines else self.helpers.get(name, False)
+            for name in names
+        )
+
+    def binary(self, name):
+        """Ruta resuelta del binario de un motor, o None."""
+        info = self.engines.get(name)
+        return info["binary"] if info else None
+
+    def ranked(self, strategies):
+        """
+        Filtra estrategias de exportación a las que tienen sus requisitos.
+
+        Parámetros:
+            strategies: Lista de (nombre, requisitos, función) en orden de preferencia
+
+        Retorno:
+            list: Las estrategias utilizables, en el mismo orden
+        """
+        return [strategy for strategy in strategies if self.available(*strategy[1])]
+
+    def describe(self):
+        """
+        Retorno:
+            string: Resumen legible de los motores disponibles y sus versiones
+        """
+        parts = []
+        for name, info in self.engines.items():
+            if info["available"]:
+                version = f" {info['version']}" if info["version"] else ""
+                parts.append(f"{name}{version} ({info['warmup_seconds'] * 1000:.0f} ms)")
+        return ", ".join(parts) if parts else "ninguno"
+
+
+def get_backend_registry():
+    """
+    Obtiene el registro de motores PDF del proceso, detectándolos la
+    primera vez. Si la detección está en curso en segundo plano, espera a
+    que termine.
+
+    Retorno:
+        BackendRegistry: Registro compartido
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = BackendRegistry()
+            logger.info(
+                f"Motores PDF detectados en {_registry.detection_seconds:.2f}s: {_registry.describe()}"
+            )
+            for name, info in _registry.engines.items():
+                if not info["available"]:
+                    logger.info(f"Motor PDF {name} no disponible: {info['reason']}")
+        return _registry
+
+
+def detect_in_background():
+    """
+    Inicia la detección de motores en un hilo de fondo (una sola vez por
+    proceso) para que la primera exportación no pague su costo.
+    """
+    global _detection_thread
+    with _registry_lock:
+        if _registry is not None or _detection_thread is not None:
+            return
+        _detection_thread = threading.Thread(
+            target=get_backend_registry, name="pdf-backends", daemon=True
+        )
+    _detection_thread.start()
@@ -0,0 +1,1621 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Módulo de renderizado de conversaciones a PDF para Expert Nexus.
+Contiene los motores de exportación (MDPDFusion, WeasyPrint, pdfkit, FPDF,
+ReportLab y el respaldo simple) sin depender de Streamlit, para que puedan
+ejecutarse en los procesos de renderizado (render_pool.py). Cada motor
+recibe los mensajes, el Markdown de la conversación ya generado en el hilo
+principal y la identidad de la aplicación, y devuelve (bytes, "pdf").
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from datetime import datetime
+
+import export_cache
+import pdf_backends
+
+logger = logging.getLogger("pdf_export")
+
+# Valores predeterminados (configurables por variables de entorno)
+DEFAULT_RACE_TOP_N = 3  # Motores que compiten en el modo carrera
+DEFAULT_RACE_MIN_QUALITY = 0.6  # Calidad mínima para aceptar un PDF en la carrera
+QUALITY_SAMPLE_WORDS = 400  # Palabras del Markdown comparadas con el texto del PDF
+DEFAULT_FRAGMENT_MESSAGES = 10  # Mensajes por fragmento renderizado
+DEFAULT_FRAGMENT_MEMORY_MB = 32  # Tamaño máximo de la caché de fragmentos en memoria
+DEFAULT_FRAGMENT_DISK_MAX_MB = 256  # Tamaño máximo de la caché de fragmentos en disco
+DEFAULT_FRAGMENT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "expert_nexus", "fragments")
+FRAGMENT_RENDERER_VERSION = 1  # Cambiarla invalida los fragmentos guardados
+
+# Estrategia que ensambla fragmentos renderizados por separado
+FRAGMENT_STRATEGY = "fragmentos"
+FRAGMENT_REQUIREMENTS = ("reportlab", "markdown", "PyPDF2")
+
+# Caché de fragmentos del proceso (cada proceso de renderizado tiene la suya en memoria)
+_fragment_cache = None
+_fragment_cache_lock = threading.Lock()
+
+
+def render_pdfkit(messages, markdown_text, identity):
+    """
+    Método optimizado para Streamlit Cloud usando pdfkit.
+    Esta implementación es compatible con el entorno de Streamlit Cloud
+    y no requiere dependencias del sistema.
+    """
+    try:
+        import pdfkit
+        import markdown2
+        import tempfile
+        from pygments import highlight
+        from pygments.lexers import get_lexer_by_name, guess_lexer
+        from pygments.formatters import HtmlFormatter
+        import re
+
+        # Generar el contenido Markdown
+        md_content = markdown_text
+
+        # Preprocesar el contenido Markdown para manejar casos especiales
+
+        # 1. Preservar diagramas ASCII
+        ascii_diagrams = []
+
+        def preserve_ascii_diagram(match):
+            diagram = match.group(1)
+            ascii_diagrams.append(diagram)
+            return f"\n\n```ascii-diagram-{len(ascii_diagrams)-1}\n{diagram}\n```\n\n"
+
+        # Detectar diagramas ASCII (bloques con caracteres como │, ┌, └, ┐, ┘, ─, etc.)
+        ascii_pattern = r"```(?:ascii|diagram)?\n((?:[^\n]*?[│┌└┐┘─┬┴┼┤├]+[^\n]*\n)+)```"
+        md_content = re.sub(ascii_pattern, preserve_ascii_diagram, md_content)
+
+        # 2. Manejar bloques de código con resaltado de sintaxis personalizado
+        code_blocks = []
+
+        def process_code_block(match):
+            language = match.group(1) or ""
+            code = match.group(2)
+
+            # Guardar el bloque de código para procesamiento posterior
+            code_blocks.append((language.strip(), code))
+            return f"\n\n{{code-block-{len(code_blocks)-1}}}\n\n"
+
+        # Extraer bloques de código
+        md_content = re.sub(r"```([a-zA-Z0-9_+-]*)\n(.*?)```", process_code_block, md_content, flags=re.DOTALL)
+
+        # 3. Convertir Markdown a HTML con markdown2 (más compatible con Streamlit Cloud)
+        html_content = markdown2.markdown(
+            md_content,
+            extras=[
+                "tables",
+                "fenced-code-blocks",
+                "code-friendly",
+                "toc",
+                "break-on-newline",
+                "smarty-pants",
+                "cuddled-lists",
+                "footnotes"
+            ]
+        )
+
+        # 4. Reemplazar los marcadores de código con HTML resaltado
+        for i, (language, code) in enumerate(code_blocks):
+            try:
+                # Manejar diagramas ASCII preservados
+                if language.startswith("ascii-diagram-"):
+                    idx = int(language.split("-")[-1])
+                    html_code = f'<pre class="ascii-diagram"><code>{ascii_diagrams[idx]}</code></pre>'
+                else:
+                    # Resaltar código con Pygments
+                    if language and language != "text":
+                        try:
+                            lexer = get_lexer_by_name(language)
+                        except:
+                            lexer = guess_lexer(code)
+                    else:
+                        lexer = guess_lexer(code)
+
+                    formatter = HtmlFormatter(style='default', cssclass='codehilite')
+                    html_code = highlight(code, lexer, formatter)
+            except Exception as e:
+                # Si falla el resaltado, usar un bloque de código simple
+                html_code = f'<pre><code>{code}</code></pre>'
+
+            html_content = html_content.replace(f"{{code-block-{i}}}", html_code)
+
+        # 5. Añadir estilos CSS avanzados para mejorar la apariencia
+        css_styles = """
+        body {
+            font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif;
+            line-height: 1.6;
+            font-size: 11pt;
+            color: #333;
+            max-width: 100%;
+            margin: 2cm;
+            overflow-wrap: break-word;
+        }
+
+        h1, h2, h3, h4, h5, h6 {
+            font-weight: 600;
+            margin-top: 24px;
+            margin-bottom: 16px;
+            line-height: 1.25;
+        }
+
+        h1 {
+            font-size: 2em;
+            padding-bottom: 0.3em;
+            border-bottom: 1px solid #eaecef;
+            color: #24292e;
+        }
+
+        h2 {
+            font-size: 1.5em;
+            padding-bottom: 0.3em;
+            border-bottom: 1px solid #eaecef;
+            color: #24292e;
+        }
+
+        h3 {
+            font-size: 1.25em;
+            color: #24292e;
+        }
+
+        h4 {
+            font-size: 1em;
+            color: #24292e;
+        }
+
+        p, ul, ol, dl, table, pre {
+            margin-top: 0;
+            margin-bottom: 16px;
+        }
+
+        ul, ol {
+            padding-left: 2em;
+        }
+
+        li + li {
+            margin-top: 0.25em;
+        }
+
+        a {
+            color: #0366d6;
+            text-decoration: none;
+        }
+
+        table {
+            border-spacing: 0;
+            border-collapse: collapse;
+            width: 100%;
+            overflow: auto;
+            margin-bottom: 16px;
+        }
+
+        table th {
+            font-weight: 600;
+            padding: 6px 13px;
+            border: 1px solid #dfe2e5;
+            background-color: #f6f8fa;
+        }
+
+        table td {
+            padding: 6px 13px;
+            border: 1px solid #dfe2e5;
+        }
+
+        table tr:nth-child(2n) {
+            background-color: #f6f8fa;
+        }
+
+        img {
+            max-width: 100%;
+            height: auto;
+            box-sizing: content-box;
+            background-color: #fff;
+        }
+
+        code {
+            font-family: "SFMono-Regular", Consolas, "Liberation Mono", Menlo, monospace;
+            padding: 0.2em 0.4em;
+            margin: 0;
+            font-size: 85%;
+            background-color: rgba(27, 31, 35, 0.05);
+            border-radius: 3px;
+        }
+
+        pre {
+            font-family: "SFMono-Regular", Consolas, "Liberation Mono", Menlo, monospace;
+            word-wrap: normal;
+            padding: 16px;
+            overflow: auto;
+            font-size: 85%;
+            line-height: 1.45;
+            background-color: #f6f8fa;
+            border-radius: 3px;
+            margin-bottom: 16px;
+        }
+
+        pre code {
+            background-color: transparent;
+            padding: 0;
+            margin: 0;
+            font-size: inherit;
+            word-break: normal;
+            white-space: pre;
+            overflow: visible;
+        }
+
+        .codehilite {
+            background-color: #f6f8fa;
+            border-radius: 3px;
+            padding: 16px;
+            overflow: auto;
+        }
+
+        .codehilite .hll { background-color: #ffffcc }
+        .codehilite .c { color: #999988; font-style: italic } /* Comment */
+        .codehilite .err { color: #a61717; background-color: #e3d2d2 } /* Error */
+        .codehilite .k { color: #000000; font-weight: bold } /* Keyword */
+        .codehilite .o { color: #000000; font-weight: bold } /* Operator */
+        .codehilite .cm { color: #999988; font-style: italic } /* Comment.Multiline */
+        .codehilite .cp { color: #999999; font-weight: bold; font-style: italic } /* Comment.Preproc */
+        .codehilite .c1 { color: #999988; font-style: italic } /* Comment.Single */
+        .codehilite .cs { color: #999999; font-weight: bold; font-style: italic } /* Comment.Special */
+        .codehilite .gd { color: #000000; background-color: #ffdddd } /* Generic.Deleted */
+        .codehilite .ge { color: #000000; font-style: italic } /* Generic.Emph */
+        .codehilite .gr { color: #aa0000 } /* Generic.Error */
+        .codehilite .gh { color: #999999 } /* Generic.Heading */
+        .codehilite .gi { color: #000000; background-color: #ddffdd } /* Generic.Inserted */
+        .codehilite .go { color: #888888 } /* Generic.Output */
+        .codehilite .gp { color: #555555 } /* Generic.Prompt */
+        .codehilite .gs { font-weight: bold } /* Generic.Strong */
+        .codehilite .gu { color: #aaaaaa } /* Generic.Subheading */
+        .codehilite .gt { color: #aa0000 } /* Generic.Traceback */
+        .codehilite .kc { color: #000000; font-weight: bold } /* Keyword.Constant */
+        .codehilite .kd { color: #000000; font-weight: bold } /* Keyword.Declaration */
+        .codehilite .kn { color: #000000; font-weight: bold } /* Keyword.Namespace */
+        .codehilite .kp { color: #000000; font-weight: bold } /* Keyword.Pseudo */
+        .codehilite .kr { color: #000000; font-weight: bold } /* Keyword.Reserved */
+        .codehilite .kt { color: #445588; font-weight: bold } /* Keyword.Type */
+        .codehilite .m { color: #009999 } /* Literal.Number */
+        .codehilite .s { color: #d01040 } /* Literal.String */
+        .codehilite .na { color: #008080 } /* Name.Attribute */
+        .codehilite .nb { color: #0086B3 } /* Name.Builtin */
+        .codehilite .nc { color: #445588; font-weight: bold } /* Name.Class */
+        .codehilite .no { color: #008080 } /* Name.Constant */
+        .codehilite .nd { color: #3c5d5d; font-weight: bold } /* Name.Decorator */
+        .codehilite .ni { color: #800080 } /* Name.Entity */
+        .codehilite .ne { color: #990000; font-weight: bold } /* Name.Exception */
+        .codehilite .nf { color: #990000; font-weight: bold } /* Name.Function */
+        .codehilite .nl { color: #990000; font-weight: bold } /* Name.Label */
+        .codehilite .nn { color: #555555 } /* Name.Namespace */
+        .codehilite .nt { color: #000080 } /* Name.Tag */
+        .codehilite .nv { color: #008080 } /* Name.Variable */
+        .codehilite .ow { color: #000000; font-weight: bold } /* Operator.Word */
+        .codehilite .w { color: #bbbbbb } /* Text.Whitespace */
+        .codehilite .mf { color: #009999 } /* Literal.Number.Float */
+        .codehilite .mh { color: #009999 } /* Literal.Number.Hex */
+        .codehilite .mi { color: #009999 } /* Literal.Number.Integer */
+        .codehilite .mo { color: #009999 } /* Literal.Number.Oct */
+        .codehilite .sb { color: #d01040 } /* Literal.String.Backtick */
+        .codehilite .sc { color: #d01040 } /* Literal.String.Char */
+        .codehilite .sd { color: #d01040 } /* Literal.String.Doc */
+        .codehilite .s2 { color: #d01040 } /* Literal.String.Double */
+        .codehilite .se { color: #d01040 } /* Literal.String.Escape */
+        .codehilite .sh { color: #d01040 } /* Literal.String.Heredoc */
+        .codehilite .si { color: #d01040 } /* Literal.String.Interpol */
+        .codehilite .sx { color: #d01040 } /* Literal.String.Other */
+        .codehilite .sr { color: #009926 } /* Literal.String.Regex */
+        .codehilite .s1 { color: #d01040 } /* Literal.String.Single */
+        .codehilite .ss { color: #990073 } /* Literal.String.Symbol */
+        .codehilite .bp { color: #999999 } /* Name.Builtin.Pseudo */
+        .codehilite .vc { color: #008080 } /* Name.Variable.Class */
+        .codehilite .vg { color: #008080 } /* Name.Variable.Global */
+        .codehilite .vi { color: #008080 } /* Name.Variable.Instance */
+        .codehilite .il { color: #009999 } /* Literal.Number.Integer.Long */
+
+        .ascii-diagram {
+            font-family: "SFMono-Regular", Consolas, "Liberation Mono", Menlo, monospace;
+            line-height: 1.2;
+            white-space: pre;
+            background-color: #f6f8fa;
+            padding: 16px;
+            border-radius: 3px;
+        }
+
+        blockquote {
+            padding: 0 1em;
+            color: #6a737d;
+            border-left: 0.25em solid #dfe2e5;
+            margin: 0 0 16px 0;
+        }
+
+        hr {
+            height: 0.25em;
+            padding: 0;
+            margin: 24px 0;
+            background-color: #e1e4e8;
+            border: 0;
+        }
+
+        .footnote {
+            font-size: 0.8em;
+            color: #6a737d;
+        }
+
+        /* Estilos específicos para la conversación */
+        .message {
+            margin-bottom: 20px;
+            padding: 10px;
+            border-radius: 5px;
+        }
+
+        .user-message {
+            background-color: #f1f8ff;
+            border-left: 4px solid #0366d6;
+        }
+
+        .assistant-message {
+            background-color: #f6f8fa;
+            border-left: 4px solid #28a745;
+        }
+
+        .message-header {
+            font-weight: bold;
+            margin-bottom: 5px;
+            color: #24292e;
+        }
+
+        .timestamp {
+            font-size: 0.8em;
+            color: #6a737d;
+        }
+        """
+
+        # 6. Crear HTML completo con estilos
+        full_html = f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="UTF-8">
+            <title>{identity["conversation_export_name"]}</title>
+            <style>
+                {css_styles}
+            </style>
+        </head>
+        <body>
+            <h1>{identity["conversation_export_name"]}</h1>
+            <p class="timestamp">Exportado el {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}</p>
+            <hr>
+            {html_content}
+        </body>
+        </html>
+        """
+
+        # 7. Crear un archivo temporal para el HTML
+        with tempfile.NamedTemporaryFile(suffix='.html', delete=False) as html_file:
+            html_file.write(full_html.encode('utf-8'))
+            html_path = html_file.name
+
+        # 8. Configurar opciones para pdfkit
+        options = {
+            'page-size': 'A4',
+            'margin-top': '2cm',
+            'margin-right': '2cm',
+            'margin-bottom': '2cm',
+            'margin-left': '2cm',
+            'encoding': 'UTF-8',
+            'no-outline': None,
+            'enable-local-file-access': None
+        }
+
+        # 9. Crear un archivo temporal para el PDF
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as pdf_file:
+            pdf_path = pdf_file.name
+
+        # 10. Convertir HTML a PDF usando pdfkit o métodos alternativos
+        pdf_generated = False
+
+        # Método 1: pdfkit con el wkhtmltopdf resuelto por el registro de motores
+        try:
+            wkhtmltopdf_path = pdf_backends.get_backend_registry().binary("wkhtmltopdf")
+            if not wkhtmltopdf_path:
+                raise FileNotFoundError("No se encontró wkhtmltopdf en ninguna ubicación conocida")
+            config = pdfkit.configuration(wkhtmltopdf=wkhtmltopdf_path)
+            pdfkit.from_file(html_path, pdf_path, options=options, configuration=config)
+            pdf_generated = True
+            logger.info(f"PDF generado con pdfkit usando wkhtmltopdf en: {wkhtmltopdf_path}")
+        except Exception as e:
+            logger.warning(f"Error al usar wkhtmltopdf: {str(e)}")
+
+            # Método 2: Usar un método alternativo si pdfkit falló
+            if not pdf_generated:
+                try:
+                    # Intentar usar FPDF para convertir el HTML a PDF
+                    from fpdf import FPDF
+                    import html2text
+
+                    # Convertir HTML a texto plano
+                    h = html2text.HTML2Text()
+                    h.ignore_links = False
+                    text_content = h.handle(full_html)
+
+                    # Crear PDF con FPDF
+                    pdf = FPDF()
+                    pdf.add_page()
+                    pdf.set_font("Arial", size=12)
+
+                    # Dividir el texto en líneas y añadirlas al PDF
+                    for line in text_content.split('\n'):
+                        if line.strip():
+                            pdf.multi_cell(0, 10, line)
+
+                    # Guardar el PDF
+                    pdf.output(pdf_path)
+                    pdf_generated = True
+                    logger.info("PDF generado con FPDF como alternativa")
+                except Exception as e3:
+                    logger.warning(f"Error al usar FPDF como alternativa: {str(e3)}")
+
+                    # Si todo lo anterior falló, lanzar la excepción original
+                    if not pdf_generated:
+                        raise e
+
+        # 11. Leer el contenido del PDF
+        with open(pdf_path, 'rb') as f:
+            pdf_content = f.read()
+
+        # 12. Limpiar archivos temporales
+        try:
+            os.unlink(html_path)
+            os.unlink(pdf_path)
+        except Exception as e:
+            logger.warning(f"Error al eliminar archivos temporales: {str(e)}")
+
+        return pdf_content, "pdf"
+
+    except Exception as e:
+        logger.error(f"Error en la conversión de Markdown a PDF con pdfkit: {str(e)}")
+        raise e
+
+def render_weasyprint(messages, markdown_text, identity):
+    """
+    Método avanzado basado en WeasyPrint para convertir Markdown a PDF.
+    Utiliza la técnica del proyecto MDPDFusion con soporte mejorado para:
+    - Sintaxis Markdown completa
+    - Bloques de código con resaltado de sintaxis
+    - Tablas con formato visual adecuado
+    - Enlaces internos funcionales
+    - Imágenes con ajuste automático
+    - Diagramas ASCII preservados
+    """
+    try:
+        # Importar las bibliotecas necesarias
+        import os
+        import tempfile
+        import re
+        import base64
+        import markdown
+
+        # Intentar importar WeasyPrint y sus dependencias
+        try:
+            from weasyprint import HTML, CSS
+            from weasyprint.text.fonts import FontConfiguration
+        except ImportError:
+            logger.warning("WeasyPrint no está disponible. No se puede usar el método avanzado de conversión.")
+            raise
+
+        # Intentar importar Pygments para resaltado de sintaxis
+        try:
+            from pygments import highlight
+            from pygments.lexers import get_lexer_by_name, guess_lexer
+            from pygments.formatters import HtmlFormatter
+        except ImportError:
+            logger.warning("Pygments no está disponible. El resaltado de sintaxis será limitado.")
+            raise
+
+        # Generar el contenido Markdown
+        md_content = markdown_text
+
+        # Preprocesar el contenido Markdown para manejar casos especiales
+
+        # 1. Preservar diagramas ASCII
+        ascii_diagrams = []
+
+        def preserve_ascii_diagram(match):
+            diagram = match.group(1)
+            ascii_diagrams.append(diagram)
+            return f"\n\n```ascii-diagram-{len(ascii_diagrams)-1}\n{diagram}\n```\n\n"
+
+        # Detectar diagramas ASCII (bloques con caracteres como │, ┌, └, ┐, ┘, ─, etc.)
+        ascii_pattern = r"```(?:ascii|diagram)?\n((?:[^\n]*?[│┌└┐┘─┬┴┼┤├]+[^\n]*\n)+)```"
+        md_content = re.sub(ascii_pattern, preserve_ascii_diagram, md_content)
+
+        # 2. Manejar bloques de código con resaltado de sintaxis personalizado
+        code_blocks = []
+
+        def process_code_block(match):
+            language = match.group(1) or ""
+            code = match.group(2)
+
+            # Guardar el bloque de código para procesamiento posterior
+            code_blocks.append((language.strip(), code))
+            return f"\n\n{{code-block-{len(code_blocks)-1}}}\n\n"
+
+        # Extraer bloques de código
+        md_content = re.sub(r"```([a-zA-Z0-9_+-]*)\n(.*?)```", process_code_block, md_content, flags=re.DOTALL)
+
+        # 3. Convertir Markdown a HTML con extensiones avanzadas
+        # Definir las extensiones básicas que siempre están disponibles
+        extensions = [
+            'markdown.extensions.tables',
+            'markdown.extensions.fenced_code',
+            'markdown.extensions.codehilite',
+            'markdown.extensions.toc',
+            'markdown.extensions.nl2br'
+        ]
+
+        # Intentar añadir extensiones adicionales si están disponibles
+        try:
+            import importlib
+            additional_extensions = [
+                'markdown.extensions.sane_lists',
+                'markdown.extensions.smarty',
+                'markdown.extensions.attr_list',
+                'markdown.extensions.def_list',
+                'markdown.extensions.abbr',
+                'markdown.extensions.footnotes',
+                'markdown.extensions.md_in_html'
+            ]
+
+            # Verificar cada extensión antes de añadirla
+            for ext in additional_extensions:
+                try:
+                    importlib.import_module(ext)
+                    extensions.append(ext)
+                except ImportError:
+                    logger.warning(f"Extensión Markdown no disponible: {ext}")
+        except Exception as e:
+            logger.warning(f"Error al cargar extensiones adicionales de Markdown: {str(e)}")
+
+        # Convertir Markdown a HTML con las extensiones disponibles
+        html_content = markdown.markdown(
+            md_content,
+            extensions=extensions,
+            extension_configs={
+                'markdown.extensions.codehilite': {
+                    'linenums': False,
+                    'guess_lang': False
+                }
+            }
+        )
+
+        # 4. Reemplazar los marcadores de código con HTML resaltado
+        for i, (language, code) in enumerate(code_blocks):
+            try:
+                # Manejar diagramas ASCII preservados
+                if language.startswith("ascii-diagram-"):
+                    idx = int(language.split("-")[-1])
+                    html_code = f'<pre class="ascii-diagram"><code>{ascii_diagrams[idx]}</code></pre>'
+                else:
+                    # Resaltar código con Pygments
+                    if language and language != "text":
+                        try:
+                            lexer = get_lexer_by_name(language)
+                        except:
+                            lexer = guess_lexer(code)
+                    else:
+                        lexer = guess_lexer(code)
+
+                    formatter = HtmlFormatter(style='default', cssclass='codehilite')
+                    html_code = highlight(code, lexer, formatter)
+            except Exception as e:
+                # Si falla el resaltado, usar un bloque de código simple
+                html_code = f'<pre><code>{code}</code></pre>'
+
+            html_content = html_content.replace(f"{{code-block-{i}}}", html_code)
+
+        # 5. Añadir estilos CSS avanzados para mejorar la apariencia
+        css_styles = """
+        @page {
+            margin: 2cm;
+            @top-right {
+                content: "Expert Nexus";
+                font-size: 9pt;
+                color: #888;
+            }
+            @bottom-center {
+                content: counter(page);
+                font-size: 9pt;
+            }
+        }
+
+        body {
+            font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif;
+            line-height: 1.6;
+            font-size: 11pt;
+            color: #333;
+            max-width: 100%;
+            overflow-wrap: break-word;
+        }
+
+        h1, h2, h3, h4, h5, h6 {
+            font-weight: 600;
+            margin-top: 24px;
+            margin-bottom: 16px;
+            line-height: 1.25;
+        }
+
+        h1 {
+            font-size: 2em;
+            padding-bottom: 0.3em;
+            border-bottom: 1px solid #eaecef;
+            color: #24292e;
+        }
+
+        h2 {
+            font-size: 1.5em;
+            padding-bottom: 0.3em;
+            border-bottom: 1px solid #eaecef;
+            color: #24292e;
+        }
+
+        h3 {
+            font-size: 1.25em;
+            color: #24292e;
+        }
+
+        h4 {
+            font-size: 1em;
+            color: #24292e;
+        }
+
+        p, ul, ol, dl, table, pre {
+            margin-top: 0;
+            margin-bottom: 16px;
+        }
+
+        ul, ol {
+            padding-left: 2em;
+        }
+
+        li + li {
+            margin-top: 0.25em;
+        }
+
+        a {
+            color: #0366d6;
+            text-decoration: none;
+        }
+
+        a:hover {
+            text-decoration: underline;
+        }
+
+        table {
+            border-spacing: 0;
+            border-collapse: collapse;
+            width: 100%;
+            overflow: auto;
+            margin-bottom: 16px;
+        }
+
+        table th {
+            font-weight: 600;
+            padding: 6px 13px;
+            border: 1px solid #dfe2e5;
+            background-color: #f6f8fa;
+        }
+
+        table td {
+            padding: 6px 13px;
+            border: 1px solid #dfe2e5;
+        }
+
+        table tr:nth-child(2n) {
+            background-color: #f6f8fa;
+        }
+
+        img {
+            max-width: 100%;
+            height: auto;
+            box-sizing: content-box;
+            background-color: #fff;
+        }
+
+        code {
+            font-family: "SFMono-Regular", Consolas, "Liberation Mono", Menlo, monospace;
+            padding: 0.2em 0.4em;
+            margin: 0;
+            font-size: 85%;
+            background-color: rgba(27, 31, 35, 0.05);
+            border-radius: 3px;
+        }
+
+        pre {
+            font-family: "SFMono-Regular", Consolas, "Liberation Mono", Menlo, monospace;
+            word-wrap: normal;
+            padding: 16px;
+            overflow: auto;
+            font-size: 85%;
+            line-height: 1.45;
+            background-color: #f6f8fa;
+            border-radius: 3px;
+            margin-bottom: 16px;
+        }
+
+        pre code {
+            background-color: transparent;
+            padding: 0;
+            margin: 0;
+            font-size: inherit;
+            word-break: normal;
+            white-space: pre;
+            overflow: visible;
+        }
+
+        .codehilite {
+            background-color: #f6f8fa;
+            border-radius: 3px;
+            padding: 16px;
+            overflow: auto;
+        }
+
+        .codehilite .hll { background-color: #ffffcc }
+        .codehilite .c { color: #999988; font-style: italic } /* Comment */
+        .codehilite .err { color: #a61717; background-color: #e3d2d2 } /* Error */
+        .codehilite .k { color: #000000; font-weight: bold } /* Keyword */
+        .codehilite .o { color: #000000; font-weight: bold } /* Operator */
+        .codehilite .cm { color: #999988; font-style: italic } /* Comment.Multiline */
+        .codehilite .cp { color: #999999; font-weight: bold; font-style: italic } /* Comment.Preproc */
+        .codehilite .c1 { color: #999988; font-style: italic } /* Comment.Single */
+        .codehilite .cs { color: #999999; font-weight: bold; font-style: italic } /* Comment.Special */
+        .codehilite .gd { color: #000000; background-color: #ffdddd } /* Generic.Deleted */
+        .codehilite .ge { color: #000000; font-style: italic } /* Generic.Emph */
+        .codehilite .gr { color: #aa0000 } /* Generic.Error */
+        .codehilite .gh { color: #999999 } /* Generic.Heading */
+        .codehilite .gi { color: #000000; background-color: #ddffdd } /* Generic.Inserted */
+        .codehilite .go { color: #888888 } /* Generic.Output */
+        .codehilite .gp { color: #555555 } /* Generic.Prompt */
+        .codehilite .gs { font-weight: bold } /* Generic.Strong */
+        .codehilite .gu { color: #aaaaaa } /* Generic.Subheading */
+        .codehilite .gt { color: #aa0000 } /* Generic.Traceback */
+        .codehilite .kc { color: #000000; font-weight: bold } /* Keyword.Constant */
+        .codehilite .kd { color: #000000; font-weight: bold } /* Keyword.Declaration */
+        .codehilite .kn { color: #000000; font-weight: bold } /* Keyword.Namespace */
+        .codehilite .kp { color: #000000; font-weight: bold } /* Keyword.Pseudo */
+        .codehilite .kr { color: #000000; font-weight: bold } /* Keyword.Reserved */
+        .codehilite .kt { color: #445588; font-weight: bold } /* Keyword.Type */
+        .codehilite .m { color: #009999 } /* Literal.Number */
+        .codehilite .s { color: #d01040 } /* Literal.String */
+        .codehilite .na { color: #008080 } /* Name.Attribute */
+        .codehilite .nb { color: #0086B3 } /* Name.Builtin */
+        .codehilite .nc { color: #445588; font-weight: bold } /* Name.Class */
+        .codehilite .no { color: #008080 } /* Name.Constant */
+        .codehilite .nd { color: #3c5d5d; font-weight: bold } /* Name.Decorator */
+        .codehilite .ni { color: #800080 } /* Name.Entity */
+        .codehilite .ne { color: #990000; font-weight: bold } /* Name.Exception */
+        .codehilite .nf { color: #990000; font-weight: bold } /* Name.Function */
+        .codehilite .nl { color: #990000; font-weight: bold } /* Name.Label */
+        .codehilite .nn { color: #555555 } /* Name.Namespace */
+        .codehilite .nt { color: #000080 } /* Name.Tag */
+        .codehilite .nv { color: #008080 } /* Name.Variable */
+        .codehilite .ow { color: #000000; font-weight: bold } /* Operator.Word */
+        .codehilite .w { color: #bbbbbb } /* Text.Whitespace */
+        .codehilite .mf { color: #009999 } /* Literal.Number.Float */
+        .codehilite .mh { color: #009999 } /* Literal.Number.Hex */
+        .codehilite .mi { color: #009999 } /* Literal.Number.Integer */
+        .codehilite .mo { color: #009999 } /* Literal.Number.Oct */
+        .codehilite .sb { color: #d01040 } /* Literal.String.Backtick */
+        .codehilite .sc { color: #d01040 } /* Literal.String.Char */
+        .codehilite .sd { color: #d01040 } /* Literal.String.Doc */
+        .codehilite .s2 { color: #d01040 } /* Literal.String.Double */
+        .codehilite .se { color: #d01040 } /* Literal.String.Escape */
+        .codehilite .sh { color: #d01040 } /* Literal.String.Heredoc */
+        .codehilite .si { color: #d01040 } /* Literal.String.Interpol */
+        .codehilite .sx { color: #d01040 } /* Literal.String.Other */
+        .codehilite .sr { color: #009926 } /* Literal.String.Regex */
+        .codehilite .s1 { color: #d01040 } /* Literal.String.Single */
+        .codehilite .ss { color: #990073 } /* Literal.String.Symbol */
+        .codehilite .bp { color: #999999 } /* Name.Builtin.Pseudo */
+        .codehilite .vc { color: #008080 } /* Name.Variable.Class */
+        .codehilite .vg { color: #008080 } /* Name.Variable.Global */
+        .codehilite .vi { color: #008080 } /* Name.Variable.Instance */
+        .codehilite .il { color: #009999 } /* Literal.Number.Integer.Long */
+
+        .ascii-diagram {
+            font-family: "SFMono-Regular", Consolas, "Liberation Mono", Menlo, monospace;
+            line-height: 1.2;
+            white-space: pre;
+            background-color: #f6f8fa;
+            padding: 16px;
+            border-radius: 3px;
+        }
+
+        blockquote {
+            padding: 0 1em;
+            color: #6a737d;
+            border-left: 0.25em solid #dfe2e5;
+            margin: 0 0 16px 0;
+        }
+
+        hr {
+            height: 0.25em;
+            padding: 0;
+            margin: 24px 0;
+            background-color: #e1e4e8;
+            border: 0;
+        }
+
+        .footnote {
+            font-size: 0.8em;
+            color: #6a737d;
+        }
+
+        /* Estilos específicos para la conversación */
+        .message {
+            margin-bottom: 20px;
+            padding: 10px;
+            border-radius: 5px;
+        }
+
+        .user-message {
+            background-color: #f1f8ff;
+            border-left: 4px solid #0366d6;
+        }
+
+        .assistant-message {
+            background-color: #f6f8fa;
+            border-left: 4px solid #28a745;
+        }
+
+        .message-header {
+            font-weight: bold;
+            margin-bottom: 5px;
+            color: #24292e;
+        }
+
+        .timestamp {
+            font-size: 0.8em;
+            color: #6a737d;
+        }
+        """
+
+        # 6. Crear HTML completo con estilos
+        full_html = f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="UTF-8">
+            <title>{identity["conversation_export_name"]}</title>
+            <style>
+                {css_styles}
+            </style>
+        </head>
+        <body>
+            <h1>{identity["conversation_export_name"]}</h1>
+            <p class="timestamp">Exportado el {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}</p>
+            <hr>
+            {html_content}
+        </body>
+        </html>
+        """
+
+        # 7. Configurar fuentes
+        font_config = FontConfiguration()
+
+        # 8. Crear PDF desde HTML
+        html = HTML(string=full_html)
+
+        # 9. Crear un archivo temporal para el PDF
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
+            # Generar el PDF
+            html.write_pdf(
+                tmp.name,
+                font_config=font_config,
+                presentational_hints=True
+            )
+
+            # Leer el contenido del PDF
+            tmp.seek(0)
+            pdf_content = tmp.read()
+
+        return pdf_content, "pdf"
+
+    except Exception as e:
+        logger.error(f"Error en la conversión de Markdown a PDF: {str(e)}")
+        raise e
+
+
+def render_fpdf(messages, markdown_text, identity):
+    """
+    Método primario: FPDF optimizado con manejo de errores mejorado
+    y división inteligente de texto para evitar problemas de espacio.
+    Este método está optimizado para funcionar en Streamlit Cloud.
+    """
+    try:
+        from fpdf import FPDF
+    except ImportError:
+        # Intentar con fpdf2 que es más compatible con Streamlit Cloud
+        from fpdf2 import FPDF
+    import re
+
+    class CustomPDF(FPDF):
+        def header(self):
+            self.set_font("helvetica", "B", 12)
+            self.cell(
+                0,
+                10,
+                f'{identity["name"]} - Historial de Conversación',
+                0,
+                new_y="NEXT",
+                align="C",
+            )
+            self.ln(5)
+
+        def footer(self):
+            self.set_y(-15)
+            self.set_font("helvetica", "I", 8)
+            self.cell(0, 10, f"Página {self.page_no()}", 0, 0, "C")
+
+        def add_message(self, role, content):
+            # Añadir título del mensaje
+            self.set_font("helvetica", "B", 11)
+            self.cell(0, 10, role, 0, new_y="NEXT", align="L")
+            self.ln(2)
+
+            # Añadir contenido con procesamiento seguro
+            self.set_font("helvetica", "", 10)
+            self._safe_add_content(content)
+            self.ln(5)
+
+        def _safe_add_content(self, content):
+            # Procesar markdown básico
+            content = self._process_markdown(content)
+
+            # Dividir en párrafos
+            paragraphs = content.split("\n\n")
+
+            for paragraph in paragraphs:
+                if not paragraph.strip():
+                    self.ln(5)
+                    continue
+
+                # Dividir párrafos largos en líneas seguras
+                lines = self._safe_wrap_text(paragraph, max_width=180)
+
+                for line in lines:
+                    if not line.strip():
+                        continue
+
+                    if line.startswith("- ") or line.startswith("* "):
+                        # Elemento de lista
+                        self.cell(5, 10, "", 0, 0)
+                        self.cell(5, 10, "•", 0, 0)
+                        self._safe_multi_cell(0, 10, line[2:])
+                    else:
+                        # Párrafo normal
+                        self._safe_multi_cell(0, 10, line)
+
+                # Espacio entre párrafos
+                self.ln(2)
+
+        def _process_markdown(self, text):
+            # Simplificar encabezados
+            text = re.sub(r"^#{1,6}\s+(.*?)$", r"\1", text, flags=re.MULTILINE)
+
+            # Eliminar elementos multimedia
+            text = re.sub(r"!\[.*?\]\(.*?\)", "[IMAGEN]", text)
+
+            # Simplificar enlaces
+            text = re.sub(r"\[(.*?)\]\(.*?\)", r"\1", text)
+
+            return text
+
+        def _safe_wrap_text(self, text, max_width=180):
+            """Divide texto en líneas seguras para renderizar"""
+            lines = []
+            for raw_line in text.split("\n"):
+                if len(raw_line) < max_width:
+                    lines.append(raw_line)
+                    continue
+
+                # Dividir líneas largas en palabras
+                words = raw_line.split(" ")
+                current_line = ""
+
+                for word in words:
+                    test_line = current_line + " " + word if current_line else word
+
+                    if len(test_line) <= max_width:
+                        current_line = test_line
+                    else:
+                        lines.append(current_line)
+                        current_line = word
+
+                if current_line:
+                    lines.append(current_line)
+
+            return lines
+
+        def _safe_multi_cell(self, w, h, txt, border=0, align="J", fill=False):
+            """Versión segura de multi_cell con manejo de errores integrado"""
+            try:
+                # Eliminar caracteres no ASCII si es necesario
+                if not all(ord(c) < 128 for c in txt):
+                    txt = "".join(c if ord(c) < 128 else "?" for c in txt)
+
+                # Limitar longitud de línea si es necesario
+                if len(txt) > 200:
+                    chunks = [txt[i : i + 200] for i in range(0, len(txt), 200)]
+                    for chunk in chunks:
+                        self.multi_cell(w, h, chunk, border, align, fill)
+                else:
+                    self.multi_cell(w, h, txt, border, align, fill)
+            except Exception as e:
+                logger.warning(
+                    f"Error en multi_cell: {str(e)}. Intentando versión simplificada."
+                )
+                # Versión de respaldo extremadamente simplificada
+                safe_txt = "".join(c for c in txt if c.isalnum() or c in " .,;:-?!()")
+                self.multi_cell(w, h, safe_txt[:100] + "...", border, align, fill)
+
+    # Crear el PDF
+    pdf = CustomPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+
+    # Añadir fecha
+    pdf.set_font("helvetica", "I", 10)
+    pdf.cell(
+        0, 10, f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", 0, new_y="NEXT"
+    )
+    pdf.ln(5)
+
+    # Añadir mensajes
+    for msg in messages:
+        role = "Usuario" if msg["role"] == "user" else identity["name"]
+        pdf.add_message(role, msg["content"])
+
+    # Generar PDF
+    output = io.BytesIO()
+    pdf.output(output)
+    return output.getvalue(), "pdf"
+
+
+def render_reportlab(messages, markdown_text, identity):
+    """
+    Método secundario: ReportLab para generación alternativa de PDF
+    con manejo mejorado de texto extenso.
+    Este método está optimizado para funcionar en Streamlit Cloud.
+    """
+    try:
+        # Importar con manejo de errores para mayor compatibilidad
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+        from reportlab.platypus import PageBreak  # Importar por separado para evitar errores
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib.pagesizes import letter
+        from reportlab.lib.units import inch
+    except ImportError as e:
+        logger.error(f"Error importando ReportLab: {str(e)}")
+        raise e
+    from reportlab.lib import colors
+
+    # Crear buffer y documento
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=letter,
+        rightMargin=72,
+        leftMargin=72,
+        topMargin=72,
+        bottomMargin=72,
+    )
+
+    # Configurar estilos
+    styles = getSampleStyleSheet()
+    styles.add(
+        ParagraphStyle(
+            name="Title",
+            fontName="Helvetica-Bold",
+            fontSize=14,
+            alignment=1,
+            spaceAfter=12,
+        )
+    )
+    styles.add(
+        ParagraphStyle(
+            name="User",
+            fontName="Helvetica-Bold",
+            fontSize=12,
+            textColor=colors.blue,
+            spaceAfter=6,
+        )
+    )
+    styles.add(
+        ParagraphStyle(
+            name="Assistant",
+            fontName="Helvetica-Bold",
+            fontSize=12,
+            textColor=colors.green,
+            spaceAfter=6,
+        )
+    )
+
+    # Elementos del documento
+    elements = []
+
+    # Título y fecha
+    elements.append(
+        Paragraph(
+            f"{identity['name']} - Historial de Conversación", styles["Title"]
+        )
+    )
+    elements.append(Spacer(1, 0.25 * inch))
+    elements.append(
+        Paragraph(
+            f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles["Italic"]
+        )
+    )
+    elements.append(Spacer(1, 0.25 * inch))
+
+    # Función de seguridad para procesar texto
+    def safe_process_text(text, max_chunk=2000):
+        # Escapar caracteres especiales HTML
+        text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+        # Convertir newlines a <br/>
+        text = text.replace("\n", "<br/>")
+
+        # Dividir texto muy largo en secciones manejables
+        if len(text) > max_chunk:
+            chunks = []
+            for i in range(0, len(text), max_chunk):
+                chunks.append(text[i : i + max_chunk])
+            return chunks
+        return [text]
+
+    # Procesar mensajes
+    for msg in messages:
+        role = "Usuario" if msg["role"] == "user" else identity["name"]
+        style = styles["User"] if msg["role"] == "user" else styles["Assistant"]
+
+        # Título del mensaje
+        elements.append(Paragraph(role, style))
+
+        # Contenido procesado en porciones seguras
+        content_chunks = safe_process_text(msg["content"])
+        for i, chunk in enumerate(content_chunks):
+            try:
+                elements.append(Paragraph(chunk, styles["Normal"]))
+                if i < len(content_chunks) - 1:
+                    elements.append(Spacer(1, 0.1 * inch))
+            except Exception as e:
+                logger.warning(f"Error al procesar chunk {i}: {str(e)}")
+                # Versión ultra simplificada como respaldo
+                elements.append(
+                    Paragraph(
+                        "[Contenido simplificado debido a error de formato]",
+                        styles["Normal"],
+                    )
+                )
+
+        elements.append(Spacer(1, 0.2 * inch))
+
+    # Generar documento con manejo de errores
+    try:
+        doc.build(elements)
+        pdf_data = buffer.getvalue()
+        buffer.close()
+        return pdf_data, "pdf"
+    except Exception as e:
+        logger.error(f"Error en ReportLab: {str(e)}")
+        raise e
+
+
+def render_fallback(messages, markdown_text, identity):
+    """
+    Método de último recurso: PDF simple sin formato avanzado
+    diseñado para máxima compatibilidad y robustez
+    """
+    from fpdf import FPDF
+
+    # PDF básico con manejo mínimo
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("helvetica", size=12)
+
+    # Título
+    pdf.set_font("helvetica", style="B", size=16)
+    pdf.cell(
+        200,
+        10,
+        f"{identity['name']} - Historial de Conversación",
+        ln=True,
+        align="C",
+    )
+    pdf.ln(5)
+
+    # Fecha
+    pdf.set_font("helvetica", style="I", size=10)
+    pdf.cell(200, 10, f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", ln=True)
+    pdf.ln(10)
+
+    # Mensajes - formato mínimo con máxima seguridad
+    pdf.set_font("helvetica", size=11)
+    for msg in messages:
+        role = "Usuario" if msg["role"] == "user" else identity["name"]
+
+        # Encabezado del mensaje
+        pdf.set_font("helvetica", style="B", size=12)
+        pdf.cell(200, 10, role, ln=True)
+        pdf.ln(2)
+
+        # Contenido ultra-simple, sin formato
+        pdf.set_font("helvetica", size=10)
+
+        # Extraer texto plano con máxima seguridad
+        simple_text = "".join(c if ord(c) < 128 else "?" for c in msg["content"])
+        simple_text = simple_text.replace("\n", " ").replace("\r", "")
+
+        # Dividir texto en líneas muy cortas para evitar errores
+        line_length = 50  # Longitud muy conservadora
+        for i in range(0, len(simple_text), line_length):
+            chunk = simple_text[i : i + line_length]
+            try:
+                pdf.cell(0, 10, chunk, ln=True)
+            except:
+                # Si falla incluso con texto simplificado, usar solo alfanuméricos
+                ultra_safe = "".join(c for c in chunk if c.isalnum() or c == " ")
+                try:
+                    pdf.cell(0, 10, ultra_safe, ln=True)
+                except:
+                    # Abandonar este chunk si todo falla
+                    pass
+
+        pdf.ln(10)
+
+    # Generar PDF
+    try:
+        output = io.BytesIO()
+        pdf.output(output)
+        return output.getvalue(), "pdf"
+    except Exception as e:
+        logger.error(f"Error incluso en fallback: {str(e)}")
+        raise e
+
+
+def render_mdpdfusion(messages, markdown_text, identity):
+    """
+    Método MDPDFusion: convierte el Markdown de la conversación con pandoc
+    si el registro de motores lo detectó, o con el conversor ReportLab de
+    MDPDFusion en caso contrario (sin intentar antes un pandoc ausente).
+    """
+    import mdpdfusion
+
+    # Generar el contenido Markdown
+    md_content = markdown_text
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_pdf = os.path.join(temp_dir, f"{identity['conversation_export_name']}.pdf")
+        if pdf_backends.get_backend_registry().available("pandoc"):
+            converted = mdpdfusion.convert_with_pypandoc(md_content, output_pdf)
+        else:
+            converted = False
+        if not converted:
+            converted = mdpdfusion.convert_with_reportlab(md_content, output_pdf)
+
+        # Leer el contenido del PDF
+        if not converted or not os.path.exists(output_pdf):
+            raise RuntimeError("MDPDFusion no generó un archivo PDF válido")
+        with open(output_pdf, "rb") as pdf_file:
+            return pdf_file.read(), "pdf"
+
+
+# Estrategias de exportación a PDF en orden de preferencia:
+# (nombre, motores o bibliotecas requeridos, función)
+PDF_EXPORT_STRATEGIES = [
+    ("mdpdfusion", ("reportlab", "markdown"), render_mdpdfusion),
+    ("weasyprint", ("weasyprint", "markdown", "pygments"), render_weasyprint),
+    ("pdfkit", ("wkhtmltopdf", "markdown2", "pygments"), render_pdfkit),
+    ("fpdf", ("fpdf",), render_fpdf),
+    ("reportlab", ("reportlab",), render_reportlab),
+    ("respaldo", ("fpdf",), render_fallback),
+]
+
+
+def warm_up():
+    """
+    Carga los motores disponibles y sus fuentes en el proceso actual. Es
+    el inicializador de los procesos de renderizado, para que la primera
+    exportación no pague las importaciones ni la carga de fuentes.
+    """
+    registry = pdf_backends.get_backend_registry()
+    if registry.available("reportlab"):
+        try:
+            from reportlab.lib.styles import getSampleStyleSheet
+            from reportlab.pdfbase import pdfmetrics
+
+            getSampleStyleSheet()
+            pdfmetrics.getFont("Helvetica")
+        except Exception as e:
+            logger.warning(f"No se pudieron precargar las fuentes de ReportLab: {str(e)}")
+    if registry.available("fpdf"):
+        try:
+            from fpdf import FPDF
+
+            FPDF().set_font("Helvetica", size=12)
+        except Exception as e:
+            logger.warning(f"No se pudieron precargar las fuentes de FPDF: {str(e)}")
+
+
+def render_pdf(messages, markdown_text, identity, parts=None):
+    """
+    Genera el PDF de una conversación con la primera estrategia disponible
+    que funcione, en el orden de PDF_EXPORT_STRATEGIES. Solo se intentan
+    las estrategias cuyos motores detectó el registro (pdf_backends.py).
+    Con PDF_FRAGMENTS activo se intenta antes el ensamblado incremental
+    de fragmentos (render_fragments).
+
+    Parámetros:
+        messages: Lista de mensajes de la conversación
+        markdown_text: Markdown de la conversación (export_chat_to_markdown)
+        identity: Identidad de la aplicación (nombre y nombre de exportación)
+        parts: (encabezado, secciones por mensaje, pie) del Markdown (opcional)
+
+    Retorno:
+        tuple: (contenido en bytes, "pdf")
+
+    Excepciones:
+        RuntimeError: Si todas las estrategias fallan
+    """
+    registry = pdf_backends.get_backend_registry()
+
+    if parts and fragments_enabled() and registry.available(*FRAGMENT_REQUIREMENTS):
+        try:
+            return render_fragments(*parts, identity)
+        except Exception as e:
+            logger.warning(f"Método {FRAGMENT_STRATEGY} falló: {str(e)}")
+
+    for name, _, render_function in registry.ranked(PDF_EXPORT_STRATEGIES):
+        try:
+            logger.info(f"Intentando método {name} para exportación a PDF")
+            content, content_type = render_function(messages, markdown_text, identity)
+            logger.info(f"Conversión exitosa con {name}")
+            return content, content_type
+        except Exception as e:
+            logger.warning(f"Método {name} falló: {str(e)}")
+
+    raise RuntimeError(
+        f"Todos los métodos de exportación a PDF fallaron (motores disponibles: {registry.describe()})"
+    )
+
+
+def _words(text):
+    return re.findall(r"[^\W\d_]{4,}", text.lower())
+
+
+def pdf_quality(content, markdown_text, sample_words=QUALITY_SAMPLE_WORDS):
+    """
+    Estima la calidad de un PDF como la fracción de las palabras del
+    Markdown que aparecen en su capa de texto. Detecta los PDF vacíos,
+    truncados o con caracteres perdidos por fuentes sin soporte.
+
+    Retorno:
+        float: Entre 0.0 (no es un PDF o no contiene el texto) y 1.0
+    """
+    if not content.startswith(b"%PDF"):
+        return 0.0
+    words = list(dict.fromkeys(_words(markdown_text)))[:sample_words]
+    if not words:
+        return 1.0
+    try:
+        from PyPDF2 import PdfReader
+    except ImportError:
+        return 1.0
+    try:
+        reader = PdfReader(io.BytesIO(content))
+        found = set(_words(" ".join(page.extract_text() or "" for page in reader.pages)))
+    except Exception as e:
+        logger.warning(f"No se pudo leer el PDF generado: {str(e)}")
+        return 0.0
+    return sum(word in found for word in words) / len(words)
+
+
+def render_strategy(name, messages, markdown_text, identity, parts=None):
+    """
+    Genera el PDF con una estrategia concreta y mide su calidad. Es la
+    función que ejecuta cada competidor del modo carrera.
+
+    Retorno:
+        tuple: ((contenido en bytes, "pdf"), calidad entre 0.0 y 1.0)
+    """
+    if name == FRAGMENT_STRATEGY:
+        content, content_type = render_fragments(*parts, identity)
+    else:
+        render_function = {strategy[0]: strategy[2] for strategy in PDF_EXPORT_STRATEGIES}[name]
+        content, content_type = render_function(messages, markdown_text, identity)
+    return (content, content_type), pdf_quality(content, markdown_text)
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    try:
+        return int(value) if value else default
+    except ValueError:
+        logger.warning(f"Valor inválido para {name}: {value}. Usando {default}")
+        return default
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    try:
+        return float(value) if value else default
+    except ValueError:
+        logger.warning(f"Valor inválido para {name}: {value}. Usando {default}")
+        return default
+
+
+def race_enabled():
+    """Indica si los motores compiten en paralelo en lugar de probarse en orden (PDF_EXPORT_RACE)."""
+    return os.environ.get("PDF_EXPORT_RACE", "false").lower() in ("1", "true", "yes")
+
+
+def race_min_quality():
+    """Calidad mínima para aceptar el PDF de un competidor (PDF_RACE_MIN_QUALITY)."""
+    return min(1.0, max(0.0, _env_float("PDF_RACE_MIN_QUALITY", DEFAULT_RACE_MIN_QUALITY)))
+
+
+def race_top_n():
+    """Número de motores que compiten en cada carrera (PDF_RACE_TOP_N)."""
+    return max(1, _env_int("PDF_RACE_TOP_N", DEFAULT_RACE_TOP_N))
+
+
+def race_candidates(messages, markdown_text, identity, top_n=None, parts=None):
+    """
+    Prepara los competidores del modo carrera: las primeras estrategias
+    disponibles de PDF_EXPORT_STRATEGIES, precedidas por el ensamblado de
+    fragmentos si PDF_FRAGMENTS está activo y se reciben las partes.
+
+    Variables de entorno:
+        PDF_RACE_TOP_N: Número de motores que compiten
+
+    Retorno:
+        list: Competidores (nombre, función, argumentos) para render_pool.race_render
+    """
+    if top_n is None:
+        top_n = race_top_n()
+    registry = pdf_backends.get_backend_registry()
+    names = [name for name, _, _ in registry.ranked(PDF_EXPORT_STRATEGIES)]
+    if parts and fragments_enabled() and registry.available(*FRAGMENT_REQUIREMENTS):
+        names.insert(0, FRAGMENT_STRATEGY)
+    return [
+        (name, render_strategy, (name, messages, markdown_text, identity, parts))
+        for name in names[:top_n]
+    ]
+
+
+def fragments_enabled():
+    """Indica si el PDF se ensambla a partir de fragmentos en caché (PDF_FRAGMENTS)."""
+    return os.environ.get("PDF_FRAGMENTS", "false").lower() in ("1", "true", "yes")
+
+
+def get_fragment_cache():
+    """
+    Obtiene la caché de fragmentos renderizados del proceso, creándola la
+    primera vez. El nivel en disco es compartido por todos los procesos de
+    renderizado.
+
+    Variables de entorno:
+        PDF_FRAGMENT_CACHE_DIR: Directorio de la caché en disco (vacío para solo memoria)
+        PDF_FRAGMENT_CACHE_MEMORY_MB: Tamaño máximo de la caché en memoria
+        PDF_FRAGMENT_CACHE_MAX_MB: Tamaño máximo de la caché en disco
+
+    Retorno:
+        export_cache.ExportCache: Caché de fragmentos PDF
+    """
+    global _fragment_cache
+    with _fragment_cache_lock:
+        if _fragment_cache is None:
+            _fragment_cache = export_cache.ExportCache(
+                cache_dir=os.environ.get("PDF_FRAGMENT_CACHE_DIR", DEFAULT_FRAGMENT_CACHE_DIR),
+                memory_max_bytes=_env_int("PDF_FRAGMENT_CACHE_MEMORY_MB", DEFAULT_FRAGMENT_MEMORY_MB) * 1024 * 1024,
+                disk_max_bytes=_env_int("PDF_FRAGMENT_CACHE_MAX_MB", DEFAULT_FRAGMENT_DISK_MAX_MB) * 1024 * 1024,
+            )
+        return _fragment_cache
+
+
+def fragment_key(first_index, sections):
+    """
+    Calcula la clave de un fragmento: la posición de sus mensajes en la
+    conversación y la huella del Markdown de cada uno.
+
+    Parámetros:
+        first_index: Índice del primer mensaje del fragmento
+        sections: Secciones Markdown de los mensajes del fragmento
+
+    Retorno:
+        string: Clave hexadecimal SHA-256
+    """
+    payload = json.dumps(
+        {
+            "version": FRAGMENT_RENDERER_VERSION,
+            "messages": [
+                [first_index + offset, hashlib.sha256(section.encode("utf-8")).hexdigest()]
+                for offset, section in enumerate(sections)
+            ],
+        }
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _markdown_to_pdf(md_content):
+    """Convierte un fragmento de Markdown a PDF con el conversor ReportLab de MDPDFusion."""
+    import mdpdfusion
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_pdf = os.path.join(temp_dir, "fragmento.pdf")
+        if not mdpdfusion.convert_with_reportlab(md_content, output_pdf) or not os.path.exists(output_pdf):
+            raise RuntimeError("MDPDFusion no generó el PDF de un fragmento")
+        with open(output_pdf, "rb") as pdf_file:
+            return pdf_file.read()
+
+
+def render_fragments(header, sections, footer, identity, fragment_messages=None):
+    """
+    Genera el PDF ensamblando fragmentos: los mensajes se renderizan en
+    grupos de posición fija (PDF_FRAGMENT_MESSAGES mensajes) que se guardan
+    en caché, de modo que una exportación solo renderiza el encabezado, el
+    pie y los grupos con mensajes nuevos o modificados. Cada fragmento
+    empieza en una página nueva.
+
+    Parámetros:
+        header: Markdown del encabezado (título, fecha e historial de expertos)
+        sections: Markdown de cada mensaje, en orden
+        footer: Markdown del pie (archivos adjuntos)
+        identity: Identidad de la aplicación
+        fragment_messages: Mensajes por fragmento (por defecto, PDF_FRAGMENT_MESSAGES)
+
+    Retorno:
+        tuple: (contenido en bytes, "pdf")
+    """
+    import PyPDF2
+
+    if fragment_messages is None:
+        fragment_messages = max(1, _env_int("PDF_FRAGMENT_MESSAGES", DEFAULT_FRAGMENT_MESSAGES))
+    cache = get_fragment_cache()
+
+    documents = [_markdown_to_pdf(header)]
+    reused = 0
+    for start in range(0, len(sections), fragment_messages):
+        group = sections[start:start + fragment_messages]
+        key = fragment_key(start, group)
+        cached = cache.get(key)
+        if cached is not None:
+            documents.append(cached[0])
+            reused += 1
+            continue
+        content = _markdown_to_pdf("".join(group))
+        cache.put(key, content, "pdf")
+        documents.append(content)
+    if footer.strip():
+        documents.append(_markdown_to_pdf(footer))
+
+    writer = PyPDF2.PdfWriter()
+    for content in documents:
+        writer.append(io.BytesIO(content))
+    writer.add_metadata({"/Title": f"{identity['name']} - Historial de Conversación"})
+    output = io.BytesIO()
+    writer.write(output)
+
+    total = -(-len(sections) // fragment_messages)
+    logger.info(f"PDF ensamblado con {total} fragmentos ({reused} reutilizados de la caché)")
+    return output.getvalue(), "pdf"
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Módulo de procesamiento por páginas de PDFs para Expert Nexus.
+Lee cada PDF una sola vez, clasifica sus páginas según la densidad de su
+capa de texto y agrupa las páginas escaneadas en rangos que se envían a
+OCR de forma concurrente (con un límite de solicitudes simultáneas). Solo
+se reintentan los rangos que fallan y las páginas se unen en su orden
+original, combinando la capa de texto con el resultado del OCR.
+"""
+
+import io
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger("pdf_pages")
+
+# Valores predeterminados (configurables por variables de entorno)
+DEFAULT_SPLIT_PAGES = 30  # Páginas a partir de las cuales se divide el PDF
+DEFAULT_SPLIT_MB = 20  # Tamaño a partir del cual se divide el PDF
+DEFAULT_RANGE_PAGES = 10  # Páginas por rango
+DEFAULT_RANGE_CONCURRENCY = 4  # Rangos enviados a OCR simultáneamente
+DEFAULT_RANGE_RETRIES = 1  # Reintentos adicionales por rango fallido
+DEFAULT_TEXT_MIN_CHARS = 50  # Caracteres alfanuméricos mínimos de una página con texto
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    try:
+        return max(1, int(value)) if value else default
+    except ValueError:
+        logger.warning(f"Valor inválido para {name}: {value}. Usando {default}")
+        return default
+
+
+def should_split(page_count, size_bytes):
+    """
+    Indica si un PDF supera el umbral de páginas o de tamaño para
+    procesarse por rangos.
+
+    Variables de entorno:
+        OCR_SPLIT_PAGES: Número de páginas a partir del cual se divide
+        OCR_SPLIT_MB: Tamaño en MB a partir del cual se divide
+    """
+    if page_count < 2:
+        return False
+    max_pages = _env_int("OCR_SPLIT_PAGES", DEFAULT_SPLIT_PAGES)
+    max_bytes = _env_int("OCR_SPLIT_MB", DEFAULT_SPLIT_MB) * 1024 * 1024
+    return page_count > max_pages or size_bytes > max_bytes
+
+
+def _pages_per_range(page_count, size_bytes, pages_per_range=None):
+    """
+    Páginas por rango, reducidas si el PDF es pesado para que cada rango
+    quede por debajo del umbral de tamaño.
+    """
+    pages_per_range = pages_per_range or _env_int("OCR_RANGE_PAGES", DEFAULT_RANGE_PAGES)
+    max_bytes = _env_int("OCR_SPLIT_MB", DEFAULT_SPLIT_MB) * 1024 * 1024
+    if size_bytes > max_bytes and page_count:
+        pieces = math.ceil(size_bytes / max_bytes)
+        pages_per_range = min(pages_per_range, max(1, math.ceil(page_count / pieces)))
+    return pages_per_range
+
+
+def plan_page_ranges(page_count, size_bytes=0, pages_per_range=None):
+    """
+    Calcula los rangos de páginas en que se divide un PDF. Si el PDF es
+    pesado con pocas páginas, los rangos se reducen para que cada uno
+    quede por debajo del umbral de tamaño.
+
+    Parámetros:
+        page_count: Número de páginas del PDF
+        size_bytes: Tamaño del PDF en bytes
+        pages_per_range: Páginas por rango (OCR_RANGE_PAGES por defecto)
+
+    Retorno:
+        list: Tuplas (inicio, fin) con índices de página, fin exclusivo
+    """
+    return group_ocr_ranges([True] * page_count, _pages_per_range(page_count, size_bytes, pages_per_range))
+
+
+def group_ocr_ranges(needs_ocr, pages_per_range):
+    """
+    Agrupa las páginas que requieren OCR en rangos de páginas consecutivas,
+    con un máximo de páginas por rango.
+
+    Parámetros:
+        needs_ocr: Lista de booleanos, uno por página
+        pages_per_range: Páginas máximas por rango
+
+    Retorno:
+        list: Tuplas (inicio, fin) con índices de página, fin exclusivo
+    """
+    ranges = []
+    start = None
+    for index, flag in enumerate(list(needs_ocr) + [False]):
+        if flag and start is None:
+            start = index
+        if start is not None and (not flag or index - start == pages_per_range):
+            ranges.append((start, index))
+            start = index if flag else None
+    return ranges
+
+
+def text_min_chars():
+    """
+    Caracteres alfanuméricos mínimos para considerar que una página tiene
+    capa de texto (variable de entorno PDF_TEXT_MIN_CHARS).
+    """
+    return _env_int("PDF_TEXT_MIN_CHARS", DEFAULT_TEXT_MIN_CHARS)
+
+
+def page_needs_ocr(text, min_chars=None):
+    """
+    Indica si una página debe pasar por OCR porque su capa de texto es
+    inexistente o demasiado escasa (por ejemplo, una página escaneada).
+
+    Parámetros:
+        text: Texto extraído de la capa de texto de la página
+        min_chars: Caracteres alfanuméricos mínimos (PDF_TEXT_MIN_CHARS por defecto)
+    """
+    if min_chars is None:
+        min_chars = text_min_chars()
+    return sum(1 for char in text or "" if char.isalnum()) < min_chars
+
+
+def page_has_images(page):
+    """
+    Indica si una página de PyPDF2 dibuja imágenes (por ejemplo, una página
+    escaneada). Ante cualquier duda se asume que sí.
+    """
+    try:
+        resources = page.get("/Resources")
+        resources = resources.get_object() if resources is not None else {}
+        xobjects = resources.get("/XObject")
+        if xobjects is None:
+            return False
+        xobjects = xobjects.get_object()
+        return any(xobjects[name].get_object().get("/Subtype") in ("/Image", "/Form") for name in xobjects)
+    except Exception:
+        return True
+
+
+def analyze_pdf(source, min_chars=None, pages_per_range=None):
+    """
+    Lee un PDF una sola vez: extrae la capa de texto de cada página,
+    clasifica las páginas que requieren OCR y genera los PDFs de los rangos
+    a enviar. Se ejecuta en el pool de procesos de ingesta.
+
+    Parámetros:
+        source: Bytes del PDF o ruta del archivo en disco
+        min_chars: Caracteres alfanuméricos mínimos de una página con texto
+        pages_per_range: Páginas máximas por rango de OCR
+
+    Retorno:
+        dict: {"page_count", "page_texts", "needs_ocr", "ocr_ranges",
+               "range_pdfs"}; un PDF de rango None indica que el rango es el
+               documento completo y puede enviarse tal cual
+    """
+    import PyPDF2
+
+    if isinstance(source, (bytes, bytearray)):
+        size_bytes = len(source)
+        reader = PyPDF2.PdfReader(io.BytesIO(source))
+    else:
+        size_bytes = os.path.getsize(source)
+        reader = PyPDF2.PdfReader(source)
+    page_texts = [page.extract_text() or "" for page in reader.pages]
+    # Una página con poco texto solo se envía a OCR si contiene imágenes
+    # (las páginas en blanco o casi vacías no ganan nada con el OCR)
+    needs_ocr = [
+        page_needs_ocr(text, min_chars) and page_has_images(page)
+        for page, text in zip(reader.pages, page_texts)
+    ]
+    page_count = len(page_texts)
+
+    if page_count and all(needs_ocr) and not should_split(page_count, size_bytes):
+        ocr_ranges = [(0, page_count)]
+        range_pdfs = [None]
+    else:
+        per_range = _pages_per_range(page_count, size_bytes, pages_per_range)
+        ocr_ranges = group_ocr_ranges(needs_ocr, per_range)
+        range_pdfs = [write_page_range(reader, start, end) for start, end in ocr_ranges]
+
+    return {
+        "page_count": page_count,
+        "page_texts": page_texts,
+        "needs_ocr": needs_ocr,
+        "ocr_ranges": ocr_ranges,
+        "range_pdfs": range_pdfs,
+    }
+
+
+def write_page_range(reader, start, end):
+    """
+    Crea un PDF nuevo con las páginas [inicio, fin) de un PDF ya leído.
+
+    Parámetros:
+        reader: PyPDF2.PdfReader del documento original
+        start: Índice de la primera página
+        end: Índice de la página siguiente a la última
+
+    Retorno:
+        bytes: Contenido del PDF con el rango de páginas
+    """
+    import PyPDF2
+
+    writer = PyPDF2.PdfWriter()
+    for index in range(start, end):
+        writer.add_page(reader.pages[index])
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def ocr_page_ranges(ranges, ocr_range, max_concurrency=None, retries=None, on_progress=None):
+    """
+    Ejecuta el OCR de varios rangos de páginas de forma concurrente.
+    Los rangos que fallan se reintentan sin repetir los que terminaron bien.
+
+    Parámetros:
+        ranges: Lista de rangos (inicio, fin)
+        ocr_range: Función (índice_rango) que devuelve la lista de páginas
+                   del rango o lanza una excepción
+        max_concurrency: Rangos simultáneos (OCR_RANGE_CONCURRENCY por defecto)
+        retries: Reintentos por rango fallido (OCR_RANGE_RETRIES por defecto)
+        on_progress: Función (completados, total) llamada en el hilo actual
+
+    Retorno:
+        tuple: (páginas por índice de rango, {índice_rango: último error})
+    """
+    max_concurrency = max_concurrency or _env_int("OCR_RANGE_CONCURRENCY", DEFAULT_RANGE_CONCURRENCY)
+    if retries is None:
+        retries = int(os.environ.get("OCR_RANGE_RETRIES", DEFAULT_RANGE_RETRIES))
+
+    results = {}
+    errors = {}
+    pending = list(range(len(ranges)))
+
+    with ThreadPoolExecutor(
+        max_workers=min(max_concurrency, max(1, len(ranges))), thread_name_prefix="ocr-range"
+    ) as executor:
+        for attempt in range(retries + 1):
+            if not pending:
+                break
+            if attempt > 0:
+                logger.info(f"Reintentando {len(pending)} rangos de páginas fallidos")
+
+            futures = {executor.submit(ocr_range, index): index for index in pending}
+            pending = []
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                    errors.pop(index, None)
+                except Exception as e:
+                    start, end = ranges[index]
+                    logger.warning(f"Fallo el OCR de las páginas {start + 1}-{end}: {str(e)}")
+                    errors[index] = e
+                    pending.append(index)
+                if on_progress:
+                    on_progress(len(results), len(ranges))
+
+    return results, errors
+
+
+def describe_ranges(ranges):
+    """
+    Describe rangos de páginas para el usuario, numerados desde 1.
+
+    Retorno:
+        string: Por ejemplo "3-5, 9"
+    """
+    return ", ".join(f"{start + 1}-{end}" if end - start > 1 else f"{start + 1}" for start, end in ranges)
+
+
+def merge_range_pages(ranges, results, page_texts=None, placeholder="[Página {page}: no se pudo aplicar OCR]"):
+    """
+    Une las páginas en el orden original del documento: las de los rangos
+    con OCR toman el resultado del OCR y el resto conserva su capa de texto.
+    Las páginas de los rangos sin resultado se sustituyen por un aviso para
+    conservar la numeración.
+
+    Parámetros:
+        ranges: Lista de rangos (inicio, fin) enviados a OCR
+        results: Diccionario {índice_rango: lista de páginas}
+        page_texts: Capa de texto de todas las páginas (opcional)
+        placeholder: Texto de aviso para las páginas sin OCR
+
+    Retorno:
+        list: Páginas en orden, con la forma {"index": n, "markdown": texto}
+    """
+    if page_texts is None:
+        page_texts = [""] * (ranges[-1][1] if ranges else 0)
+    pages = [{"index": index, "markdown": text} for index, text in enumerate(page_texts)]
+
+    for range_index, (start, end) in enumerate(ranges):
+        range_pages = results.get(range_index)
+        for page in range(start, end):
+            if range_pages is None:
+                markdown = placeholder.format(page=page + 1)
+            elif page - start < len(range_pages):
+                markdown = range_pages[page - start].get("markdown", "")
+            else:
+                markdown = ""
+            pages[page]["markdown"] = markdown
+    return pages
@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Módulo de control de tasa de las solicitudes a Mistral para Expert Nexus.
+Un planificador compartido por el proceso reparte las solicitudes con un
+cubo de fichas (token bucket): cada sesión tiene su propia cola y se
+atienden por turnos, de modo que una sesión con muchos documentos no deja
+sin servicio a las demás. Las respuestas 429 y los encabezados de límite
+de tasa pausan a todas las sesiones durante el tiempo que indica el
+servidor (o un backoff exponencial con variación aleatoria si no lo indica)
+y ajustan la tasa a la cuota real.
+"""
+
+import asyncio
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+
+logger = logging.getLogger("rate_limit")
+
+# Valores predeterminados (configurables por variables de entorno)
+DEFAULT_RATE = 5.0  # Solicitudes por segundo
+DEFAULT_BURST = 10  # Solicitudes que pueden iniciarse de golpe
+DEFAULT_BACKOFF_BASE = 1.0  # Segundos del primer backoff sin Retry-After
+DEFAULT_BACKOFF_MAX = 60.0  # Segundos máximos de backoff
+DEFAULT_ACQUIRE_TIMEOUT = 300.0  # Segundos máximos de espera en la cola
+
+# Planificador compartido por el proceso
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    try:
+        return float(value) if value else default
+    except ValueError:
+        logger.warning(f"Valor inválido para {name}: {value}. Usando {default}")
+        return default
+
+
+def parse_retry_after(value, now=None):
+    """
+    Interpreta un encabezado Retry-After, en segundos o como fecha HTTP.
+
+    Retorno:
+        float o None: Segundos de espera, o None si no se puede interpretar
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at - (now if now is not None else time.time()))
+
+
+class TokenBucket:
+    """
+    Cubo de fichas: se recarga a ``rate`` fichas por segundo hasta
+    ``capacity`` y cada solicitud consume una. No es seguro entre hilos;
+    el planificador lo usa bajo su propio lock.
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self):
+        """Segundos hasta que haya una ficha disponible."""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+
+class RequestScheduler:
+    """
+    Planificador de solicitudes con cola justa por sesión.
+
+    Cada solicitud obtiene un turno en la cola de su sesión; el turno que
+    se atiende es el primero de la sesión que más tiempo lleva sin ser
+    atendida. Un turno se concede cuando hay una ficha disponible y no hay
+    una pausa activa por límite de tasa.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, backoff_base=DEFAULT_BACKOFF_BASE,
+                 backoff_max=DEFAULT_BACKOFF_MAX, clock=time.monotonic):
+        self.configured_rate = rate
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._clock = clock
+        self._bucket = TokenBucket(rate, burst, clock)
+        self._queues = OrderedDict()  # Sesión -> turnos pendientes en orden
+        self._enqueued_at = {}
+        self._paused_until = 0.0
+        self._throttle_streak = 0
+        self._condition = threading.Condition()
+        self.stats = {
+            "granted": 0,
+            "throttled": 0,
+            "timeouts": 0,
+            "total_wait": 0.0,
+            "max_wait": 0.0,
+        }
+
+    # Cola ------------------------------------------------------------
+
+    def enqueue(self, queue_key):
+        """Registra una solicitud en la cola de su sesión y devuelve su turno."""
+        ticket = object()
+        with self._condition:
+            self._queues.setdefault(queue_key or "default", deque()).append(ticket)
+            self._enqueued_at[ticket] = self._clock()
+        return ticket, queue_key or "default"
+
+    def cancel(self, entry):
+        """Retira un turno no concedido (por ejemplo, al cancelar la solicitud)."""
+        ticket, queue_key = entry
+        with self._condition:
+            queue = self._queues.get(queue_key)
+            if queue and ticket in queue:
+                queue.remove(ticket)
+                if not queue:
+                    del self._queues[queue_key]
+                self._enqueued_at.pop(ticket, None)
+                self._condition.notify_all()
+
+    def try_grant(self, entry):
+        """
+        Concede el turno si es el siguiente y hay capacidad.
+
+        Retorno:
+            float: 0 si se concedió; si no, segundos sugeridos de espera
+        """
+        ticket, queue_key = entry
+        with self._condition:
+            now = self._clock()
+            next_key = next(iter(self._queues), None)
+            if next_key != queue_key or self._queues[queue_key][0] is not ticket:
+                return 0.05
+            if now < self._paused_until:
+                return self._paused_until - now
+            wait = self._bucket.wait_time()
+            if wait > 0:
+                return wait
+
+            self._bucket.take()
+            queue = self._queues.pop(queue_key)
+            queue.popleft()
+            if queue:
+                # La sesión pasa al final de la rotación
+                self._queues[queue_key] = queue
+            waited = now - self._enqueued_at.pop(ticket)
+            self.stats["granted"] += 1
+            self.stats["total_wait"] += waited
+            self.stats["max_wait"] = max(self.stats["max_wait"], waited)
+            self._condition.notify_all()
+            return 0.0
+
+    def acquire(self, queue_key=None, timeout=None):
+        """
+        Espera el turno de una solicitud en el hilo actual.
+
+        Parámetros:
+            queue_key: Sesión a la que pertenece la solicitud
+            timeout: Segundos máximos de espera (MISTRAL_QUEUE_TIMEOUT por defecto)
+
+        Excepciones:
+            TimeoutError: Si el turno no llega dentro del plazo
+        """
+        if timeout is None:
+            timeout = _env_float("MISTRAL_QUEUE_TIMEOUT", DEFAULT_ACQUIRE_TIMEOUT)
+        entry = self.enqueue(queue_key)
+        deadline = self._clock() + timeout
+        while True:
+            wait = self.try_grant(entry)
+            if wait == 0:
+                return
+            remaining = deadline - self._clock()
+            if remaining <= 0:
+                self.cancel(entry)
+                with self._condition:
+                    self.stats["timeouts"] += 1
+                raise TimeoutError("Tiempo de espera agotado en la cola de solicitudes a Mistral")
+            with self._condition:
+                self._condition.wait(min(wait, remaining))
+
+    async def acquire_async(self, queue_key=None, timeout=None):
+        """
+        Variante asíncrona de acquire: espera sin bloquear el bucle de
+        eventos y retira el turno si la tarea se cancela.
+        """
+        if timeout is None:
+            timeout = _env_float("MISTRAL_QUEUE_TIMEOUT", DEFAULT_ACQUIRE_TIMEOUT)
+        entry = self.enqueue(queue_key)
+        deadline = self._clock() + timeout
+        try:
+            while True:
+                wait = self.try_grant(entry)
+                if wait == 0:
+                    return
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    with self._condition:
+                        self.stats["timeouts"] += 1
+                    raise TimeoutError("Tiempo de espera agotado en la cola de solicitudes a Mistral")
+                await asyncio.sleep(min(wait, remaining, 0.05))
+        except BaseException:
+            self.cancel(entry)
+            raise
+
+    # Respuestas ------------------------------------------------------
+
+    def backoff_delay(self, attempt):
+        """
+        Backoff exponencial con variación aleatoria completa ("full jitter"),
+        para que las solicitudes que fallan juntas no se repitan juntas.
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def observe(self, status_code, headers=None):
+        """
+        Ajusta el planificador según una respuesta: un 429 (o 503) pausa la
+        cola el tiempo de Retry-After o un backoff con variación aleatoria,
+        y los encabezados de cuota reducen la tasa si la real es menor.
+
+        Parámetros:
+            status_code: Código de estado HTTP
+            headers: Encabezados de la respuesta (mapeo insensible a mayúsculas)
+
+        Retorno:
+            float: Segundos de pausa aplicados (0 si no hubo pausa)
+        """
+        headers = headers or {}
+        with self._condition:
+            self._adjust_rate(headers)
+            if status_code not in (429, 503):
+                self._throttle_streak = 0
+                return 0.0
+
+            self.stats["throttled"] += 1
+            delay = parse_retry_after(headers.get("retry-after"))
+            if delay is None:
+                delay = self.backoff_delay(self._throttle_streak)
+            self._throttle_streak += 1
+            self._paused_until = max(self._paused_until, self._clock() + delay)
+            self._condition.notify_all()
+            logger.warning(f"Límite de tasa de Mistral alcanzado; cola en pausa {delay:.1f}s")
+            return delay
+
+    def _adjust_rate(self, headers):
+        """Limita la tasa a la cuota por minuto anunciada por la API."""
+        limit = headers.get("x-ratelimit-limit-req-minute")
+        try:
+            per_second = float(limit) / 60 if limit else None
+        except ValueError:
+            per_second = None
+        if per_second and per_second < self._bucket.rate:
+            logger.info(f"Tasa de solicitudes a Mistral ajustada a la cuota: {per_second:.2f}/s")
+            self._bucket.rate = per_second
+        elif per_second and self._bucket.rate < min(per_second, self.configured_rate):
+            self._bucket.rate = min(per_second, self.configured_rate)
+
+    def pause_remaining(self):
+        """Segundos que quedan de la pausa por límite de tasa."""
+        with self._condition:
+            return max(0.0, self._paused_until - self._clock())
+
+    def get_stats(self):
+        """
+        Retorno:
+            dict: Profundidad de la cola, sesiones en espera, turnos
+                  concedidos, respuestas 429, esperas media y máxima, tasa
+                  vigente y pausa restante
+        """
+        with self._condition:
+            stats = dict(self.stats)
+            stats["queue_depth"] = sum(len(queue) for queue in self._queues.values())
+            stats["waiting_sessions"] = len(self._queues)
+            stats["rate"] = self._bucket.rate
+            stats["paused_for"] = max(0.0, self._paused_until - self._clock())
+        stats["avg_wait"] = stats["total_wait"] / stats["granted"] if stats["granted"] else 0.0
+        return stats
+
+
+def get_scheduler():
+    """
+    Obtiene el planificador compartido por el proceso, creándolo la primera vez.
+
+    Variables de entorno:
+        MISTRAL_RATE_LIMIT: Solicitudes por segundo
+        MISTRAL_RATE_BURST: Solicitudes que pueden iniciarse de golpe
+        MISTRAL_BACKOFF_MAX: Segundos máximos de backoff sin Retry-After
+
+    Retorno:
+        RequestScheduler: Planificador compartido
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler(
+                rate=_env_float("MISTRAL_RATE_LIMIT", DEFAULT_RATE),
+                burst=max(1, int(_env_float("MISTRAL_RATE_BURST", DEFAULT_BURST))),
+                backoff_max=_env_float("MISTRAL_BACKOFF_MAX", DEFAULT_BACKOFF_MAX),
+            )
+            logger.info(
+                f"Planificador de Mistral creado ({_scheduler.configured_rate}/s, "
+                f"ráfaga de {_scheduler._bucket.capacity})"
+            )
+        return _scheduler
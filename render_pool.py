@@ -0,0 +1,590 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Módulo de procesos de renderizado de PDF para Expert Nexus.
+Las exportaciones a PDF se ejecutan en un pool de procesos dedicado, con
+los motores y las fuentes ya cargados (pdf_export.warm_up), en lugar de en
+el hilo del script de Streamlit. Cada trabajo tiene un plazo máximo: si un
+motor se cuelga, solo se termina (y se reemplaza) el proceso que lo
+ejecuta, sin que la sesión ni los demás trabajos queden bloqueados. Quien envía el trabajo recibe un RenderJob que
+puede consultar o esperar un tiempo acotado.
+"""
+
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import pdf_export
+
+logger = logging.getLogger("render_pool")
+
+# Valores predeterminados (configurables por variables de entorno)
+DEFAULT_RENDER_WORKERS = min(2, os.cpu_count() or 1)  # Procesos de renderizado
+DEFAULT_RENDER_DEADLINE = 60.0  # Segundos máximos por exportación
+DEFAULT_INLINE_WAIT = 2.0  # Segundos que la interfaz espera antes de mostrar el progreso
+RACE_LATENCY_WINDOW = 100  # Latencias recientes conservadas por motor
+
+# Pools de renderizado compartidos por el proceso de la aplicación
+_render_pool = None
+_race_pool = None
+_render_pool_lock = threading.Lock()
+
+# Estadísticas de las carreras de motores del proceso
+_race_stats = None
+_race_stats_lock = threading.Lock()
+
+
+class RenderDeadlineExceeded(RuntimeError):
+    """El trabajo de renderizado superó su plazo y su proceso se terminó."""
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    try:
+        return int(value) if value else default
+    except ValueError:
+        logger.warning(f"Valor inválido para {name}: {value}. Usando {default}")
+        return default
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    try:
+        return float(value) if value else default
+    except ValueError:
+        logger.warning(f"Valor inválido para {name}: {value}. Usando {default}")
+        return default
+
+
+def deadline_seconds():
+    """Plazo de cada exportación en segundos (RENDER_DEADLINE_SECONDS)."""
+    return max(1.0, _env_float("RENDER_DEADLINE_SECONDS", DEFAULT_RENDER_DEADLINE))
+
+
+def inline_wait_seconds():
+    """Espera de la interfaz antes de mostrar el progreso (RENDER_INLINE_WAIT_SECONDS)."""
+    return max(0.0, _env_float("RENDER_INLINE_WAIT_SECONDS", DEFAULT_INLINE_WAIT))
+
+
+class RenderPool:
+    """
+    Procesos de renderizado precargados. Cada proceso lo atiende un hilo
+    propio que le envía los trabajos de la cola de uno en uno, de modo que
+    se sabe qué proceso ejecuta cada trabajo: un trabajo colgado se termina
+    junto con su proceso, que se reemplaza, sin afectar a los demás.
+    """
+
+    def __init__(self, workers, name="render"):
+        self.workers = workers
+        self.name = name
+        self._context = multiprocessing.get_context("spawn")
+        self._queue = queue.Queue()
+        self._running = {}  # Future -> proceso que lo ejecuta
+        self._killed = set()  # Procesos terminados que su hilo aún no reemplazó
+        self._lock = threading.Lock()
+        for number in range(workers):
+            threading.Thread(target=self._serve, name=f"{name}-worker-{number}", daemon=True).start()
+
+    def submit(self, func, *args):
+        """
+        Encola un trabajo.
+
+        Retorno:
+            Future: Resultado del trabajo (cancelable mientras está en cola)
+        """
+        future = Future()
+        self._queue.put((future, func, args))
+        return future
+
+    def terminate(self, future):
+        """
+        Detiene un trabajo: lo cancela si está en cola o termina el proceso
+        que lo ejecuta, cuyo hilo inicia otro.
+
+        Retorno:
+            bool: True si el trabajo se canceló o se terminó su proceso
+        """
+        with self._lock:
+            if future.cancel():
+                return True
+            process = self._running.get(future)
+            if process is None:
+                return False
+            # Dentro del bloqueo: el proceso aún ejecuta este trabajo y no otro
+            self._killed.add(process)
+            process.terminate()
+        return True
+
+    def _start_worker(self):
+        try:
+            connection, child_connection = self._context.Pipe()
+            process = self._context.Process(
+                target=_worker_main, args=(child_connection,), name=f"{self.name}-process", daemon=True
+            )
+            process.start()
+            child_connection.close()
+            return process, connection
+        except Exception as e:
+            logger.warning(f"No se pudo iniciar un proceso de renderizado: {str(e)}")
+            return None
+
+    def _replace_worker(self, worker):
+        """Cierra un proceso terminado o caído e inicia otro en su lugar."""
+        if worker is not None:
+            process, connection = worker
+            connection.close()
+            process.join(timeout=5)
+            with self._lock:
+                self._killed.discard(process)
+        return self._start_worker()
+
+    def _serve(self):
+        """Bucle del hilo que atiende un proceso de renderizado."""
+        worker = self._start_worker()
+        while True:
+            future, func, args = self._queue.get()
+            if future.cancelled():
+                continue
+            # Un proceso terminado puede seguir vivo unos instantes: no reutilizarlo
+            with self._lock:
+                killed = worker is not None and worker[0] in self._killed
+            if worker is None or killed or not worker[0].is_alive():
+                worker = self._replace_worker(worker)
+            # Empezar y registrar el proceso a la vez, para que terminate lo encuentre
+            with self._lock:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if worker is not None:
+                    self._running[future] = worker[0]
+            if worker is None:
+                future.set_exception(RuntimeError("No se pudo iniciar un proceso de renderizado"))
+                continue
+
+            process, connection = worker
+            try:
+                connection.send((func, args))
+                status, value = connection.recv()
+            except (EOFError, OSError):
+                # Proceso terminado (por su plazo o porque el motor se cayó): reemplazarlo
+                status = "error"
+                value = RuntimeError(f"El proceso de renderizado terminó (código {process.exitcode})")
+                worker = self._replace_worker(worker)
+            except Exception as e:
+                # El trabajo no se pudo enviar (no serializable); el proceso sigue sano
+                status, value = "error", e
+            finally:
+                with self._lock:
+                    self._running.pop(future, None)
+
+            if status == "ok":
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+def _worker_main(connection):
+    """Proceso de renderizado: carga los motores y ejecuta los trabajos que recibe."""
+    pdf_export.warm_up()
+    while True:
+        try:
+            func, args = connection.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            reply = ("ok", func(*args))
+        except Exception as e:
+            reply = ("error", e)
+        try:
+            connection.send(reply)
+        except Exception as e:
+            connection.send(("error", RuntimeError(f"Resultado de renderizado no serializable: {str(e)}")))
+
+
+def get_render_pool():
+    """
+    Obtiene el pool de procesos de renderizado, creándolo la primera vez.
+    Cada proceso carga los motores PDF y sus fuentes al iniciar.
+
+    Variables de entorno:
+        RENDER_WORKERS: Número de procesos (0 renderiza en el hilo que lo pide)
+
+    Retorno:
+        RenderPool o None: Pool compartido, o None si está desactivado
+    """
+    global _render_pool
+    workers = _env_int("RENDER_WORKERS", DEFAULT_RENDER_WORKERS)
+    if workers <= 0:
+        return None
+
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = RenderPool(workers)
+            logger.info(f"Pool de renderizado creado con {workers} procesos")
+        return _render_pool
+
+
+def get_race_pool():
+    """
+    Obtiene el pool de las carreras de motores, creándolo la primera vez.
+    Está separado del pool de renderizado y tiene un proceso por
+    competidor, para que todos corran a la vez y terminar a los
+    perdedores no afecte a otras exportaciones.
+
+    Variables de entorno:
+        RENDER_WORKERS: 0 desactiva también este pool
+        PDF_RACE_TOP_N: Número de procesos (uno por competidor)
+
+    Retorno:
+        RenderPool o None: Pool compartido, o None si está desactivado
+    """
+    global _race_pool
+    if _env_int("RENDER_WORKERS", DEFAULT_RENDER_WORKERS) <= 0:
+        return None
+
+    with _render_pool_lock:
+        if _race_pool is None:
+            workers = pdf_export.race_top_n()
+            _race_pool = RenderPool(workers, name="render-race")
+            logger.info(f"Pool de carreras de renderizado creado con {workers} procesos")
+        return _race_pool
+
+
+def warm_in_background():
+    """
+    Crea los pools de renderizado para que sus procesos carguen los motores
+    en segundo plano y la primera exportación los encuentre listos.
+    """
+    get_render_pool()
+    if pdf_export.race_enabled():
+        get_race_pool()
+
+
+class RenderJob:
+    """
+    Trabajo de renderizado enviado al pool, con plazo propio. Al vencer el
+    plazo solo se termina el proceso que ejecuta este trabajo.
+    """
+
+    def __init__(self, func, args, deadline, pool=None):
+        self.func = func
+        self.args = args
+        self.deadline = deadline
+        self.started = time.monotonic()
+        self._pool = None
+        self._future = self._submit(pool)
+
+    def _submit(self, pool):
+        if pool is None:
+            pool = get_render_pool()
+        if pool is not None:
+            self._pool = pool
+            return pool.submit(self.func, *self.args)
+
+        # Sin pool: renderizar en el hilo actual (sin plazo aplicable)
+        future = Future()
+        try:
+            future.set_result(self.func(*self.args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def elapsed(self):
+        """Segundos transcurridos desde el envío."""
+        return time.monotonic() - self.started
+
+    def remaining(self):
+        """Segundos que quedan antes del plazo."""
+        return max(0.0, self.deadline - self.elapsed())
+
+    def done(self):
+        """Indica si el resultado está listo o el plazo ya venció."""
+        return self._future.done() or self.remaining() <= 0
+
+    def cancel(self):
+        """Cancela el trabajo si aún no empezó; devuelve True si se canceló."""
+        return self._future.cancel()
+
+    def terminate(self):
+        """
+        Detiene el trabajo: lo cancela si está en cola o termina su proceso
+        si ya se está ejecutando.
+
+        Retorno:
+            bool: True si el trabajo se detuvo antes de terminar
+        """
+        if self._pool is None:
+            return self._future.cancel()
+        return self._pool.terminate(self._future)
+
+    def result(self, timeout=None):
+        """
+        Espera el resultado del trabajo.
+
+        Parámetros:
+            timeout: Segundos máximos de espera (por defecto, hasta el plazo)
+
+        Retorno:
+            Resultado de la función de renderizado
+
+        Excepciones:
+            TimeoutError: Si pasó ``timeout`` y el trabajo sigue en curso
+            RenderDeadlineExceeded: Si venció el plazo del trabajo
+            Exception: La excepción lanzada por la función de renderizado
+        """
+        remaining = self.remaining()
+        wait_seconds = remaining if timeout is None else min(timeout, remaining)
+        try:
+            return self._future.result(timeout=wait_seconds)
+        except FutureTimeoutError:
+            if self.remaining() > 0:
+                raise TimeoutError(f"Renderizado en curso ({self.elapsed():.1f}s)")
+            self._expire()
+            raise RenderDeadlineExceeded(
+                f"El renderizado superó el plazo de {self.deadline:.0f}s"
+            )
+
+    def _expire(self):
+        running = self._future.running()
+        if self.terminate() and running:
+            logger.warning(
+                f"Renderizado sin terminar tras {self.deadline:.0f}s; se termina su proceso de renderizado"
+            )
+
+
+def submit_render(func, *args, deadline=None):
+    """
+    Envía un trabajo de renderizado al pool y devuelve su manejador sin esperar.
+
+    Parámetros:
+        func: Función definida a nivel de módulo (serializable)
+        *args: Argumentos de la función
+        deadline: Plazo en segundos (por defecto, RENDER_DEADLINE_SECONDS)
+
+    Retorno:
+        RenderJob: Manejador para consultar o esperar el resultado
+    """
+    return RenderJob(func, args, deadline if deadline is not None else deadline_seconds())
+
+
+class RaceStats:
+    """
+    Resultados de los motores en las carreras: victorias, fallos,
+    rechazos por calidad y latencias recientes de cada uno.
+    """
+
+    OUTCOMES = ("win", "lost", "rejected", "failed", "cancelled")
+
+    def __init__(self, window=RACE_LATENCY_WINDOW):
+        self.window = window
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, outcome, seconds=None):
+        """
+        Registra el resultado de un motor en una carrera.
+
+        Parámetros:
+            name: Nombre del motor
+            outcome: "win", "lost" (terminó después del ganador), "rejected"
+                     (calidad insuficiente), "failed" o "cancelled"
+            seconds: Latencia del renderizado, si terminó
+        """
+        with self._lock:
+            engine = self._engines.setdefault(
+                name, {**{outcome_name: 0 for outcome_name in self.OUTCOMES},
+                       "latencies": deque(maxlen=self.window)}
+            )
+            engine[outcome] += 1
+            if seconds is not None:
+                engine["latencies"].append(seconds)
+
+    def get_stats(self):
+        """
+        Retorno:
+            dict: Por motor, carreras, tasa de victorias, contadores de cada
+                  resultado y latencia media y mediana recientes en segundos
+        """
+        with self._lock:
+            stats = {}
+            for name, engine in self._engines.items():
+                races = sum(engine[outcome] for outcome in self.OUTCOMES)
+                latencies = sorted(engine["latencies"])
+                stats[name] = {outcome: engine[outcome] for outcome in self.OUTCOMES}
+                stats[name].update({
+                    "races": races,
+                    "win_rate": engine["win"] / races if races else 0.0,
+                    "mean_seconds": sum(latencies) / len(latencies) if latencies else None,
+                    "median_seconds": latencies[len(latencies) // 2] if latencies else None,
+                })
+            return stats
+
+
+def get_race_stats():
+    """Obtiene las estadísticas de carreras compartidas por el proceso."""
+    global _race_stats
+    with _race_stats_lock:
+        if _race_stats is None:
+            _race_stats = RaceStats()
+        return _race_stats
+
+
+class RaceJob:
+    """
+    Carrera entre varios motores: cada competidor es un RenderJob en su
+    propio proceso del pool de carreras y gana el primero que termina con
+    una puntuación suficiente. Al aceptar un ganador (o vencer el plazo)
+    los competidores restantes se cancelan y sus procesos se terminan.
+
+    Tiene la misma interfaz que RenderJob (result, done, elapsed, remaining).
+    """
+
+    def __init__(self, candidates, min_score, deadline, stats=None):
+        self.min_score = min_score
+        self.deadline = deadline
+        self.started = time.monotonic()
+        self.stats = stats or get_race_stats()
+        self._jobs = {}
+        self._pending = {}
+        self._errors = {}
+        self._best = None
+        self._winner = None
+        self._finished = False
+        pool = get_race_pool()
+        for name, func, args in candidates:
+            job = RenderJob(func, args, deadline, pool=pool)
+            self._jobs[name] = job
+            self._pending[name] = job
+            if job._pool is None:
+                # Sin pool los competidores se ejecutan en orden: parar al primero aceptable
+                self._collect(name)
+                if self._winner:
+                    break
+
+    def elapsed(self):
+        """Segundos transcurridos desde el inicio de la carrera."""
+        return time.monotonic() - self.started
+
+    def remaining(self):
+        """Segundos que quedan antes del plazo."""
+        return max(0.0, self.deadline - self.elapsed())
+
+    def done(self):
+        """Indica si la carrera terminó, algún competidor tiene resultado o venció el plazo."""
+        return (
+            self._finished
+            or self.remaining() <= 0
+            or any(job._future.done() for job in self._pending.values())
+        )
+
+    def _collect(self, name):
+        """Evalúa un competidor que terminó."""
+        job = self._pending.pop(name)
+        try:
+            value, score = job.result(timeout=0)
+        except Exception as e:
+            self._errors[name] = e
+            self.stats.record(name, "failed", job.elapsed())
+            logger.warning(f"Motor {name} falló en la carrera: {str(e)}")
+            return
+
+        if score < self.min_score:
+            outcome = "rejected"
+            logger.info(f"Motor {name} terminó con calidad insuficiente ({score:.2f})")
+        elif self._winner is None:
+            outcome = "win"
+            self._winner = (name, value)
+        else:
+            outcome = "lost"
+        self.stats.record(name, outcome, job.elapsed())
+        if self._best is None or score > self._best[0]:
+            self._best = (score, name, value)
+
+    def _finish(self):
+        """Termina los competidores restantes y registra el resultado."""
+        if self._finished:
+            return
+        self._finished = True
+        for name, job in list(self._pending.items()):
+            if job._future.done():
+                self._collect(name)
+                continue
+            if job.terminate():
+                self.stats.record(name, "cancelled")
+            else:
+                self._collect(name)
+        self._pending = {}
+        if self._winner:
+            logger.info(f"Carrera de motores PDF ganada por {self._winner[0]} en {self.elapsed():.2f}s")
+        logger.info(f"Estadísticas de carreras de motores PDF: {self.stats.get_stats()}")
+
+    def result(self, timeout=None):
+        """
+        Espera al ganador de la carrera.
+
+        Parámetros:
+            timeout: Segundos máximos de espera (por defecto, hasta el plazo)
+
+        Retorno:
+            Resultado del ganador o, si ninguno alcanzó la puntuación mínima,
+            el de mayor puntuación
+
+        Excepciones:
+            TimeoutError: Si pasó ``timeout`` y la carrera sigue en curso
+            RenderDeadlineExceeded: Si venció el plazo sin ningún resultado
+            RuntimeError: Si todos los competidores fallaron
+        """
+        limit = self.remaining() if timeout is None else min(timeout, self.remaining())
+        end = time.monotonic() + limit
+        while not self._finished and self._winner is None and self._pending:
+            for name in [name for name, job in self._pending.items() if job._future.done()]:
+                self._collect(name)
+                if self._winner:
+                    break
+            if self._winner or not self._pending:
+                break
+            wait_seconds = end - time.monotonic()
+            if wait_seconds <= 0:
+                if self.remaining() > 0:
+                    raise TimeoutError(f"Carrera de renderizado en curso ({self.elapsed():.1f}s)")
+                break
+            wait(
+                [job._future for job in self._pending.values()],
+                timeout=wait_seconds,
+                return_when=FIRST_COMPLETED,
+            )
+        self._finish()
+
+        if self._winner:
+            return self._winner[1]
+        if self._best:
+            score, name, value = self._best
+            logger.warning(f"Ningún motor alcanzó la calidad mínima; se usa {name} ({score:.2f})")
+            return value
+        if self.remaining() <= 0:
+            raise RenderDeadlineExceeded(f"Ningún motor terminó en el plazo de {self.deadline:.0f}s")
+        errors = "; ".join(f"{name}: {error}" for name, error in self._errors.items())
+        raise RuntimeError(f"Todos los motores de la carrera fallaron ({errors})")
+
+
+def race_render(candidates, min_score=0.0, deadline=None):
+    """
+    Ejecuta varios motores a la vez y se queda con el primero que termina
+    con una puntuación suficiente.
+
+    Parámetros:
+        candidates: Lista de (nombre, función, argumentos); cada función
+                    devuelve (resultado, puntuación)
+        min_score: Puntuación mínima para ganar
+        deadline: Plazo en segundos (por defecto, RENDER_DEADLINE_SECONDS)
+
+    Retorno:
+        RaceJob: Manejador de la carrera
+    """
+    return RaceJob(candidates, min_score, deadline if deadline is not None else deadline_seconds())
@@ -21,8 +21,8 @@ logger = logging.getLogger('md_files_to_pdf_test')
 
 # Importar las funciones necesarias
 try:
-    from app import _export_chat_to_pdf_streamlit_cloud
-    from app import export_chat_to_markdown
+    import pdf_export
+    from app import APP_IDENTITY, export_chat_to_markdown
 except ImportError as e:
     logger.error(f"Error al importar módulos de la aplicación: {e}")
     sys.exit(1)
@@ -115,30 +115,27 @@ def test_markdown_files_to_pdf():
             # Primero intentamos con el método optimizado para Streamlit Cloud
             start_time = datetime.now()
             try:
-                pdf_content, _ = _export_chat_to_pdf_streamlit_cloud(messages)
+                pdf_content, _ = pdf_export.render_pdfkit(messages, export_chat_to_markdown(messages), APP_IDENTITY)
                 logger.info("Conversión exitosa con método Streamlit Cloud")
             except Exception as e:
                 logger.warning(f"Error con método Streamlit Cloud: {str(e)}")
 
                 # Si falla, intentamos con el método primario (FPDF)
                 try:
-                    from app import _export_chat_to_pdf_primary
-                    pdf_content, _ = _export_chat_to_pdf_primary(messages)
+                    pdf_content, _ = pdf_export.render_fpdf(messages, export_chat_to_markdown(messages), APP_IDENTITY)
                     logger.info("Conversión exitosa con método FPDF")
                 except Exception as e2:
                     logger.warning(f"Error con método FPDF: {str(e2)}")
 
                     # Si falla, intentamos con el método secundario (ReportLab)
                     try:
-                        from app import _export_chat_to_pdf_secondary
-                        pdf_content, _ = _export_chat_to_pdf_secondary(messages)
+                        pdf_content, _ = pdf_export.render_reportlab(messages, export_chat_to_markdown(messages), APP_IDENTITY)
                         logger.info("Conversión exitosa con método ReportLab")
                     except Exception as e3:
                         logger.warning(f"Error con método ReportLab: {str(e3)}")
 
                         # Si todo falla, usamos el método de respaldo
-                        from app import _export_chat_to_pdf_fallback
-                        pdf_content, _ = _export_chat_to_pdf_fallback(messages)
+                        pdf_content, _ = pdf_export.render_fallback(messages, export_chat_to_markdown(messages), APP_IDENTITY)
                         logger.info("Conversión exitosa con método de respaldo")
 
             end_time = datetime.now()
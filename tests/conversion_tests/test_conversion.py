@@ -27,8 +27,8 @@ print(f"Directorio raíz: {root_dir}")
 
 # Importar las funciones de conversión de la aplicación
 try:
-    from app import _export_chat_to_pdf_streamlit_cloud, _export_chat_to_pdf_primary, _export_chat_to_pdf_secondary, _export_chat_to_pdf_fallback
-    from app import export_chat_to_markdown
+    import pdf_export
+    from app import APP_IDENTITY, export_chat_to_markdown
 except ImportError as e:
     logger.error(f"Error al importar módulos de la aplicación: {e}")
     sys.exit(1)
@@ -75,6 +75,10 @@ def format_markdown_as_messages(markdown_content):
     ]
     return messages
 
+def with_markdown(renderer):
+    """Adapta un motor de pdf_export a la firma (mensajes) de los métodos de conversión."""
+    return lambda messages: renderer(messages, export_chat_to_markdown(messages), APP_IDENTITY)
+
 def test_conversion_method(method_name, conversion_func, markdown_content, output_path):
     """Prueba un método específico de conversión de Markdown a PDF."""
     logger.info(f"Probando método de conversión: {method_name}")
@@ -128,10 +132,10 @@ def run_all_tests():
 
     # Métodos de conversión a probar
     conversion_methods = [
-        ("streamlit_cloud", _export_chat_to_pdf_streamlit_cloud),
-        ("primary", _export_chat_to_pdf_primary),
-        ("secondary", _export_chat_to_pdf_secondary),
-        ("fallback", _export_chat_to_pdf_fallback)
+        ("streamlit_cloud", with_markdown(pdf_export.render_pdfkit)),
+        ("primary", with_markdown(pdf_export.render_fpdf)),
+        ("secondary", with_markdown(pdf_export.render_reportlab)),
+        ("fallback", with_markdown(pdf_export.render_fallback))
     ]
 
     # Ejecutar pruebas para cada archivo y método
@@ -38,7 +38,8 @@ except ImportError as e:
 
 # Importar la función de conversión específica
 try:
-    from app import _export_chat_to_pdf_streamlit_cloud
+    import pdf_export
+    from app import APP_IDENTITY, export_chat_to_markdown
 except ImportError as e:
     logger.error(f"Error al importar la función de conversión: {e}")
     sys.exit(1)
@@ -122,7 +123,7 @@ def test_streamlit_cloud_conversion():
         # Realizar la conversión
         try:
             start_time = datetime.now()
-            pdf_content, _ = _export_chat_to_pdf_streamlit_cloud(messages)
+            pdf_content, _ = pdf_export.render_pdfkit(messages, export_chat_to_markdown(messages), APP_IDENTITY)
             end_time = datetime.now()
             duration = (end_time - start_time).total_seconds()
 
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de prueba para el módulo assistant_runs de Expert Nexus.
+Simula el cliente de OpenAI para verificar la ejecución de runs
+sin realizar llamadas reales a la API.
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+# Añadir el directorio raíz al path para importar módulos de la aplicación
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+import assistant_runs
+
+
+# Simulación del flujo de eventos de la API de Assistants
+class StreamMock:
+    def __init__(self, deltas, fail_after=None):
+        self.deltas = deltas
+        self.fail_after = fail_after
+        self.current_run = SimpleNamespace(id="run_1", status="in_progress")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    @property
+    def text_deltas(self):
+        for i, delta in enumerate(self.deltas):
+            if self.fail_after is not None and i >= self.fail_after:
+                raise ConnectionError("Conexión interrumpida")
+            yield delta
+
+    def get_final_run(self):
+        return SimpleNamespace(id="run_1", status="completed")
+
+    def get_final_messages(self):
+        return [SimpleNamespace(id="msg_1", role="assistant")]
+
+
+# Simulación de respuestas crudas de runs.retrieve con encabezados
+class RawResponseMock:
+    def __init__(self, run, headers=None):
+        self.run = run
+        self.headers = headers or {}
+
+    def parse(self):
+        return self.run
+
+
+class PollingRunsMock:
+    def __init__(self, statuses, headers=None):
+        self.statuses = list(statuses)
+        self.headers = headers
+        self.calls = 0
+        self.with_raw_response = SimpleNamespace(retrieve=self.retrieve)
+
+    def retrieve(self, thread_id, run_id):
+        self.calls += 1
+        status = self.statuses.pop(0) if self.statuses else "in_progress"
+        return RawResponseMock(SimpleNamespace(id=run_id, status=status), self.headers)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def time(self):
+        return self.now
+
+
+class ClientMock:
+    def __init__(self, stream=None, runs=None):
+        runs = runs or SimpleNamespace(stream=lambda **kwargs: stream)
+        self.beta = SimpleNamespace(threads=SimpleNamespace(runs=runs))
+
+
+def test_stream_run_accumulates_text():
+    """El texto se entrega acumulado a medida que llegan los deltas"""
+    received = []
+    client = ClientMock(StreamMock(["Hola", ", ", "mundo"]))
+
+    result = assistant_runs.stream_run(client, "thread_1", "asst_1", on_text=received.append)
+
+    assert received == ["Hola", "Hola, ", "Hola, mundo"]
+    assert result["text"] == "Hola, mundo"
+    assert result["run"].status == "completed"
+    assert result["messages"][0].id == "msg_1"
+
+
+def test_stream_run_exposes_run_on_failure():
+    """Si el streaming se interrumpe, el run creado queda disponible para consultarlo"""
+    client = ClientMock(StreamMock(["Hola", "mundo"], fail_after=1))
+
+    try:
+        assistant_runs.stream_run(client, "thread_1", "asst_1")
+        assert False, "Debería lanzar RunStreamError"
+    except assistant_runs.RunStreamError as e:
+        assert e.run is not None
+        assert e.run.id == "run_1"
+
+
+def test_wait_for_run_backs_off():
+    """Las consultas empiezan rápido y se espacian progresivamente"""
+    runs = PollingRunsMock(["in_progress", "in_progress", "in_progress", "completed"])
+    clock = FakeClock()
+    run = SimpleNamespace(id="run_1", status="queued")
+
+    result = assistant_runs.wait_for_run(
+        ClientMock(runs=runs), "thread_1", run,
+        initial_interval=0.2, backoff=2.0, jitter=0.0,
+        sleep=clock.sleep, clock=clock.time,
+    )
+
+    assert result["run"].status == "completed"
+    assert result["polls"] == 4
+    assert not result["timed_out"]
+    assert clock.sleeps == [0.2, 0.4, 0.8, 1.6]
+
+
+def test_wait_for_run_honours_server_hint():
+    """El intervalo sugerido por el servidor reemplaza al calculado"""
+    runs = PollingRunsMock(["in_progress", "completed"], headers={"openai-poll-after-ms": "500"})
+    clock = FakeClock()
+    run = SimpleNamespace(id="run_1", status="queued")
+
+    assistant_runs.wait_for_run(
+        ClientMock(runs=runs), "thread_1", run,
+        initial_interval=0.2, jitter=0.0, sleep=clock.sleep, clock=clock.time,
+    )
+
+    assert clock.sleeps == [0.2, 0.5]
+
+
+def test_wait_for_run_clamps_zero_hint():
+    """Una pista de espera nula no provoca consultas sin pausa"""
+    runs = PollingRunsMock([], headers={"openai-poll-after-ms": "0", "retry-after": "0"})
+    clock = FakeClock()
+    run = SimpleNamespace(id="run_1", status="queued")
+
+    result = assistant_runs.wait_for_run(
+        ClientMock(runs=runs), "thread_1", run, timeout=2,
+        initial_interval=0.2, jitter=0.0, sleep=clock.sleep, clock=clock.time,
+    )
+
+    assert result["timed_out"]
+    # Solo la última espera puede acortarse para no pasar del plazo
+    assert all(seconds >= 0.2 - 1e-9 for seconds in clock.sleeps[:-1])
+    assert runs.calls <= 11
+
+
+def test_wait_for_run_respects_deadline():
+    """La espera nunca supera el plazo total"""
+    runs = PollingRunsMock([])
+    clock = FakeClock()
+    run = SimpleNamespace(id="run_1", status="queued")
+
+    result = assistant_runs.wait_for_run(
+        ClientMock(runs=runs), "thread_1", run, timeout=5,
+        max_interval=2.0, jitter=0.0, sleep=clock.sleep, clock=clock.time,
+    )
+
+    assert result["timed_out"]
+    assert clock.now == 5
+    assert result["polls"] == runs.calls
+
+
+def test_list_run_messages_scoped_to_run():
+    """Solo se solicitan los mensajes del run actual, con límite"""
+    requests = []
+
+    def fake_list(**kwargs):
+        requests.append(kwargs)
+        return SimpleNamespace(data=[
+            SimpleNamespace(id="msg_user", role="user"),
+            SimpleNamespace(id="msg_2", role="assistant"),
+        ])
+
+    messages_api = SimpleNamespace(list=fake_list)
+    client = SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(messages=messages_api)))
+
+    messages = assistant_runs.list_run_messages(client, "thread_1", "run_2", limit=5)
+
+    assert [m.id for m in messages] == ["msg_2"]
+    assert requests[0]["run_id"] == "run_2"
+    assert requests[0]["limit"] == 5
+
+
+def test_select_new_messages_uses_seen_index():
+    """Los mensajes ya registrados en la sesión se descartan"""
+    messages = [
+        SimpleNamespace(id="msg_1", role="assistant"),
+        SimpleNamespace(id="msg_2", role="assistant"),
+        SimpleNamespace(id="msg_3", role="user"),
+    ]
+
+    new_messages = assistant_runs.select_new_messages(messages, {"msg_1"})
+
+    assert [m.id for m in new_messages] == ["msg_2"]
+
+
+if __name__ == "__main__":
+    test_stream_run_accumulates_text()
+    test_stream_run_exposes_run_on_failure()
+    test_wait_for_run_backs_off()
+    test_wait_for_run_honours_server_hint()
+    test_wait_for_run_clamps_zero_hint()
+    test_wait_for_run_respects_deadline()
+    test_list_run_messages_scoped_to_run()
+    test_select_new_messages_uses_seen_index()
+    print("Todas las pruebas de assistant_runs pasaron correctamente")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de prueba para el armado del contexto de documentos con presupuesto
+de tokens en Expert Nexus. Usa el contador sin conexión para no depender
+de un tokenizador instalado.
+"""
+
+import os
+import sys
+
+# Añadir el directorio raíz al path para importar módulos de la aplicación
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+import document_context
+
+counter = document_context.HeuristicTokenCounter()
+
+
+def test_allocate_budget_is_fair():
+    """Los documentos pequeños entran completos y el sobrante se reparte"""
+    allocation = document_context.allocate_budget({"a": 100, "b": 5000, "c": 5000}, 3000)
+
+    assert allocation["a"] == 100
+    assert allocation["b"] == allocation["c"] == 1450
+    assert sum(allocation.values()) <= 3000
+
+
+def test_assemble_reports_inclusion():
+    """El informe indica cuánto se incluyó de cada documento"""
+    documents = {
+        "corto.txt": {"text": "x" * 40},
+        "largo.pdf": {"text": "y" * 40000},
+        "roto.pdf": {"error": "OCR falló"},
+    }
+
+    context = document_context.assemble_document_context(documents, 1000, counter)
+    report = context["report"]
+
+    assert not report["corto.txt"]["truncated"]
+    assert report["corto.txt"]["included_tokens"] == 10
+    assert report["largo.pdf"]["truncated"]
+    assert report["largo.pdf"]["included_tokens"] == 990
+    assert context["tokens"] <= 1000
+    assert "-- Documento: roto.pdf -- (Error: OCR falló)" in context["text"]
+    assert "contenido truncado" in context["text"]
+
+
+def test_raw_response_text_is_used():
+    """Se aprovecha el texto de la respuesta cruda cuando el OCR reportó error"""
+    documents = {"doc.pdf": {"error": "parcial", "raw_response": {"text": "texto útil"}}}
+
+    context = document_context.assemble_document_context(documents, 100, counter)
+
+    assert "texto útil" in context["text"]
+
+
+def test_retriever_replaces_oversized_documents():
+    """Los documentos que no caben se representan con pasajes relevantes"""
+    documents = {"corto.txt": {"text": "x" * 40}, "largo.pdf": {"text": "y" * 40000}}
+
+    def retriever(doc_names, budget):
+        assert doc_names == ["largo.pdf"]
+        return [{"doc_name": "largo.pdf", "text": "pasaje relevante", "label": "pág. 7", "start": 0}]
+
+    context = document_context.assemble_document_context(documents, 1000, counter, retriever)
+
+    assert "-- Documento: largo.pdf (pág. 7) --\npasaje relevante" in context["text"]
+    assert context["report"]["largo.pdf"]["passages"] == 1
+    assert context["complete"] == ["corto.txt"]
+
+
+def test_passages_and_prefixes_respect_budget():
+    """Los prefijos de documentos sin pasajes solo usan lo que dejan los pasajes"""
+    documents = {"a.pdf": {"text": "a" * 8000}, "b.pdf": {"text": "b" * 8000}}
+
+    def retriever(doc_names, budget):
+        return [{"doc_name": "a.pdf", "text": "p" * 3600, "label": "pág. 1", "start": 0}]
+
+    context = document_context.assemble_document_context(documents, 1000, counter, retriever)
+    report = context["report"]
+
+    assert report["a.pdf"]["included_tokens"] == 900
+    assert report["b.pdf"]["included_tokens"] <= 100
+    assert context["tokens"] <= 1000
+
+    def greedy_retriever(doc_names, budget):
+        return [{"doc_name": "a.pdf", "text": "p" * 4000, "label": "pág. 1", "start": 0}]
+
+    context = document_context.assemble_document_context(documents, 1000, counter, greedy_retriever)
+
+    assert context["tokens"] == 1000
+    assert context["report"]["b.pdf"]["included_tokens"] == 0
+    assert "-- Documento: b.pdf -- [contenido omitido" in context["text"]
+
+
+def test_budget_shrinks_with_history():
+    """El presupuesto se reduce cuando la ventana del modelo se llena"""
+    os.environ["OPENAI_CONTEXT_WINDOW"] = "10000"
+    os.environ["OPENAI_RESPONSE_RESERVE_TOKENS"] = "1000"
+    try:
+        full = document_context.document_token_budget("hola", [], counter)
+        reduced = document_context.document_token_budget("hola", ["z" * 20000], counter)
+    finally:
+        del os.environ["OPENAI_CONTEXT_WINDOW"]
+        del os.environ["OPENAI_RESPONSE_RESERVE_TOKENS"]
+
+    assert full == 8999
+    assert reduced == 3999
+
+
+if __name__ == "__main__":
+    test_allocate_budget_is_fair()
+    test_assemble_reports_inclusion()
+    test_raw_response_text_is_used()
+    test_retriever_replaces_oversized_documents()
+    test_passages_and_prefixes_respect_budget()
+    test_budget_shrinks_with_history()
+    print("Todas las pruebas del contexto de documentos pasaron correctamente")
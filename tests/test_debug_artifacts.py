@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de prueba para el módulo debug_artifacts de Expert Nexus.
+Verifica que los artefactos estén desactivados por defecto, que se guarden
+comprimidos en segundo plano, que el muestreo sea consistente por
+procesamiento y que la retención respete el tamaño y la antigüedad.
+"""
+
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Añadir el directorio raíz al path para importar módulos de la aplicación
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+import debug_artifacts
+
+
+def test_disabled_by_default():
+    """Sin DEBUG_ARTIFACTS no se crea ningún registro de depuración"""
+    saved = os.environ.pop("DEBUG_ARTIFACTS", None)
+    try:
+        assert debug_artifacts.get_debug_recorder() is None
+    finally:
+        if saved is not None:
+            os.environ["DEBUG_ARTIFACTS"] = saved
+
+
+def test_artifacts_written_compressed():
+    """Los artefactos se escriben con gzip y la copia de archivos no depende del original"""
+    with tempfile.TemporaryDirectory() as directory:
+        recorder = debug_artifacts.DebugRecorder(os.path.join(directory, "debug"), sample_rate=1)
+        source = os.path.join(directory, "carga.pdf")
+        with open(source, "wb") as f:
+            f.write(b"%PDF-1.4 " * 1000)
+
+        assert recorder.record("trabajo", "debug_trabajo_carga.pdf", path=source)
+        os.remove(source)  # La carga temporal puede eliminarse antes de la escritura
+        assert recorder.record("trabajo", "response_trabajo_carga.pdf.json", {"pages": [{"index": 0}]})
+        recorder.flush()
+
+        path = os.path.join(recorder.directory, "debug_trabajo_carga.pdf.gz")
+        with gzip.open(path, "rb") as f:
+            assert f.read() == b"%PDF-1.4 " * 1000
+        assert os.path.getsize(path) < 9000
+        response = json.loads(recorder.read("response_trabajo_carga.pdf.json"))
+        assert response == {"pages": [{"index": 0}]}
+        assert recorder.get_stats()["written"] == 2
+
+
+def test_source_files_are_not_held_open():
+    """La copia de un archivo no deja descriptores abiertos ni copias pendientes"""
+    with tempfile.TemporaryDirectory() as directory:
+        debug_dir = os.path.join(directory, "debug")
+        os.makedirs(debug_dir)
+        with open(os.path.join(debug_dir, "huerfano.pending"), "wb") as f:
+            f.write(b"restos de una ejecucion anterior")
+
+        recorder = debug_artifacts.DebugRecorder(debug_dir, sample_rate=1)
+        assert not os.path.exists(os.path.join(debug_dir, "huerfano.pending"))
+
+        sources = []
+        for number in range(20):
+            source = os.path.join(directory, f"carga-{number}.pdf")
+            with open(source, "wb") as f:
+                f.write(b"%PDF-1.4 " + str(number).encode())
+            sources.append(source)
+            assert recorder.record("trabajo", f"carga-{number}.pdf", path=source)
+
+        if os.path.isdir("/proc/self/fd"):
+            open_files = set()
+            for fd in os.listdir("/proc/self/fd"):
+                try:
+                    open_files.add(os.readlink(os.path.join("/proc/self/fd", fd)))
+                except OSError:
+                    pass
+            assert not open_files & set(sources)
+        for source in sources:
+            os.remove(source)
+
+        recorder.flush()
+        assert recorder.read("carga-7.pdf") == b"%PDF-1.4 7"
+        assert recorder.get_stats()["written"] == 20
+        assert not [name for name in os.listdir(debug_dir) if not name.endswith(".gz")]
+
+
+def test_sampling_is_per_job():
+    """Todos los artefactos de un procesamiento se guardan o se omiten juntos"""
+    with tempfile.TemporaryDirectory() as directory:
+        recorder = debug_artifacts.DebugRecorder(directory, sample_rate=0.5)
+        decisions = [recorder.sampled(f"trabajo-{number}") for number in range(200)]
+        assert 50 < sum(decisions) < 150
+        assert all(recorder.sampled(f"trabajo-{number}") == decisions[number] for number in range(200))
+
+        skipped = next(number for number, kept in enumerate(decisions) if not kept)
+        assert not recorder.record(f"trabajo-{skipped}", "omitido.txt", "texto")
+        recorder.flush()
+        assert recorder.get_stats()["skipped"] == 1
+        assert recorder.read("omitido.txt") is None
+
+
+def test_retention_by_size_and_age():
+    """Se eliminan los artefactos vencidos y luego los menos usados"""
+    with tempfile.TemporaryDirectory() as directory:
+        old_path = os.path.join(directory, "antiguo.gz")
+        with gzip.open(old_path, "wb") as f:
+            f.write(b"antiguo")
+        stale = time.time() - 7200
+        os.utime(old_path, (stale, stale))
+
+        recorder = debug_artifacts.DebugRecorder(directory, sample_rate=1, max_bytes=3000, max_age_hours=1)
+        for number in range(3):
+            recorder.record("trabajo", f"artefacto-{number}", os.urandom(1200))
+            recorder.flush()
+            if number == 1:
+                # Usar el primero lo convierte en el más reciente
+                assert recorder.read("artefacto-0") is not None
+
+        recorder.flush()
+        remaining = sorted(os.listdir(directory))
+        assert "antiguo.gz" not in remaining
+        assert remaining == ["artefacto-0.gz", "artefacto-2.gz"]
+        assert recorder.get_stats()["stored_bytes"] <= 3000
+
+
+if __name__ == "__main__":
+    test_disabled_by_default()
+    test_artifacts_written_compressed()
+    test_source_files_are_not_held_open()
+    test_sampling_is_per_job()
+    test_retention_by_size_and_age()
+    print("Todas las pruebas de debug_artifacts pasaron correctamente")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de prueba para el módulo document_ingestion de Expert Nexus.
+Verifica que los archivos se procesen en paralelo, que los resultados
+conserven el orden de carga y que el progreso llegue al hilo principal.
+"""
+
+import os
+import sys
+import threading
+import time
+
+# Añadir el directorio raíz al path para importar módulos de la aplicación
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+import document_ingestion
+
+
+def test_results_keep_upload_order():
+    """Los resultados respetan el orden de carga aunque terminen en otro orden"""
+    delays = {"a.pdf": 0.3, "b.pdf": 0.1, "c.pdf": 0.2}
+
+    def process_file(name, status):
+        time.sleep(delays[name])
+        return {"name": name}
+
+    results = document_ingestion.ingest_files(list(delays), process_file, max_workers=3)
+
+    assert [result["name"] for result in results] == ["a.pdf", "b.pdf", "c.pdf"]
+
+
+def test_files_are_processed_concurrently():
+    """El tiempo total se acerca al del archivo más lento"""
+    def process_file(name, status):
+        time.sleep(0.3)
+        return name
+
+    start = time.monotonic()
+    document_ingestion.ingest_files(["1", "2", "3", "4"], process_file, max_workers=4)
+    elapsed = time.monotonic() - start
+
+    assert elapsed < 0.9
+
+
+def test_progress_is_delivered_on_calling_thread():
+    """Las actualizaciones de progreso se aplican en el hilo que llama"""
+    caller = threading.current_thread()
+    updates = []
+
+    def process_file(name, status):
+        status.update(label=f"{name}: procesando", state="running")
+        status.update(label=f"{name}: listo", state="complete")
+        return name
+
+    def on_progress(index, changes):
+        assert threading.current_thread() is caller
+        updates.append((index, changes["label"]))
+
+    document_ingestion.ingest_files(["x", "y"], process_file, on_progress=on_progress)
+
+    assert (0, "x: listo") in updates
+    assert (1, "y: listo") in updates
+    assert updates.index((0, "x: procesando")) < updates.index((0, "x: listo"))
+
+
+def test_failures_are_isolated():
+    """Un archivo que falla no impide procesar los demás"""
+    def process_file(name, status):
+        if name == "roto.pdf":
+            raise ValueError("PDF dañado")
+        return {"name": name}
+
+    results = document_ingestion.ingest_files(["ok.pdf", "roto.pdf"], process_file)
+
+    assert results[0] == {"name": "ok.pdf"}
+    assert results[1] == {"error": "PDF dañado"}
+
+
+def test_cpu_work_runs_in_process_pool():
+    """El trabajo de CPU se ejecuta en otro proceso y devuelve su resultado"""
+    worker_pid = document_ingestion.run_cpu_bound(os.getpid)
+
+    assert isinstance(worker_pid, int)
+    assert worker_pid != os.getpid()
+
+
+if __name__ == "__main__":
+    test_results_keep_upload_order()
+    test_files_are_processed_concurrently()
+    test_progress_is_delivered_on_calling_thread()
+    test_failures_are_isolated()
+    test_cpu_work_runs_in_process_pool()
+    print("Todas las pruebas de document_ingestion pasaron correctamente")
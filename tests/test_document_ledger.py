@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de prueba para el módulo document_context de Expert Nexus.
+Verifica que cada documento se envíe una sola vez por thread y que
+los turnos posteriores solo lo referencien.
+"""
+
+import os
+import sys
+
+# Añadir el directorio raíz al path para importar módulos de la aplicación
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+import document_context
+
+
+def test_documents_are_sent_once_per_thread():
+    """Un documento enviado al thread pasa a ser solo una referencia"""
+    ledgers = {}
+    documents = {"contrato.pdf": {"text": "Cláusula primera", "format": "pdf_direct"}}
+
+    ledger = document_context.get_thread_ledger(ledgers, "thread_1")
+    pending, shared = document_context.partition_documents(documents, ledger)
+    assert list(pending) == ["contrato.pdf"]
+    assert shared == []
+
+    document_context.mark_documents_sent(ledger, pending)
+
+    pending, shared = document_context.partition_documents(documents, ledger)
+    assert pending == {}
+    assert shared == ["contrato.pdf"]
+
+
+def test_ledger_is_scoped_to_thread_and_content():
+    """Un thread nuevo o un contenido modificado vuelven a enviarse"""
+    ledgers = {}
+    ledger = document_context.get_thread_ledger(ledgers, "thread_1")
+    document_context.mark_documents_sent(ledger, {"a.txt": {"text": "versión 1"}})
+
+    other_ledger = document_context.get_thread_ledger(ledgers, "thread_2")
+    pending, _ = document_context.partition_documents({"a.txt": {"text": "versión 1"}}, other_ledger)
+    assert list(pending) == ["a.txt"]
+
+    pending, _ = document_context.partition_documents({"a.txt": {"text": "versión 2"}}, ledger)
+    assert list(pending) == ["a.txt"]
+
+
+def test_shared_documents_note():
+    """La nota de referencia solo aparece si hay documentos compartidos"""
+    assert document_context.shared_documents_note([]) == ""
+    assert "contrato.pdf" in document_context.shared_documents_note(["contrato.pdf"])
+
+
+if __name__ == "__main__":
+    test_documents_are_sent_once_per_thread()
+    test_ledger_is_scoped_to_thread_and_content()
+    test_shared_documents_note()
+    print("Todas las pruebas de document_context pasaron correctamente")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de prueba para el módulo document_retrieval de Expert Nexus.
+Verifica la tokenización en español, la fragmentación con procedencia de
+página y la búsqueda BM25 sobre documentos cargados.
+"""
+
+import os
+import sys
+
+# Añadir el directorio raíz al path para importar módulos de la aplicación
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+import document_retrieval
+
+
+def test_tokenize_folds_accents_and_stopwords():
+    """Las tildes y las palabras vacías no afectan la búsqueda"""
+    assert document_retrieval.tokenize("La Acción de Tutela") == ["accion", "tutela"]
+    assert document_retrieval.tokenize("acciones") == document_retrieval.tokenize("acción")
+
+
+def test_chunks_cover_text_with_overlap():
+    """Los fragmentos cubren todo el texto y se solapan"""
+    text = " ".join(f"palabra{i}" for i in range(500))
+    spans = document_retrieval.chunk_text(text, chunk_chars=300, overlap=50)
+
+    assert spans[0][0] == 0
+    assert spans[-1][1] == len(text)
+    for (_, previous_end), (start, _) in zip(spans, spans[1:]):
+        assert start < previous_end
+
+
+def test_search_ranks_relevant_page():
+    """La búsqueda devuelve el pasaje de la página que trata la pregunta"""
+    pages = [
+        "Introducción general al contrato de arrendamiento. " * 20,
+        "La cláusula penal por incumplimiento asciende al diez por ciento. " * 20,
+        "Disposiciones finales y firmas de las partes. " * 20,
+    ]
+    text = "\n\n".join(pages)
+    index = document_retrieval.DocumentIndex(chunk_chars=800, overlap=100)
+    index.add_document("contrato.pdf", text, document_retrieval.page_offsets_for(pages))
+
+    passages = index.search("¿Cuál es la clausula penal por incumplimiento?", top_k=3)
+
+    assert passages
+    assert passages[0]["page"] == 2
+    assert "cláusula penal" in passages[0]["text"]
+    assert "pág. 2" in document_retrieval.passage_label(passages[0])
+
+
+def test_sync_reindexes_and_prunes():
+    """El índice sigue a los documentos de la sesión"""
+    index = document_retrieval.DocumentIndex()
+    index.sync({"a.md": {"text": "norma sobre pensiones"}}, lambda doc: doc.get("text"))
+    assert "a.md" in index
+
+    index.sync({"b.md": {"text": "sentencia de tutela"}}, lambda doc: doc.get("text"))
+    assert "a.md" not in index
+    assert index.search("pensiones") == []
+    assert index.search("tutela")[0]["doc_name"] == "b.md"
+
+
+
+def test_clear_empties_index():
+    """Tras vaciar el índice no se devuelven pasajes y se puede reindexar"""
+    index = document_retrieval.DocumentIndex()
+    index.add_document("a.md", "norma sobre pensiones")
+    index.clear()
+
+    assert "a.md" not in index
+    assert index.search("pensiones") == []
+    index.add_document("a.md", "sentencia de tutela")
+    assert index.search("tutela")[0]["doc_name"] == "a.md"
+
+
+if __name__ == "__main__":
+    test_tokenize_folds_accents_and_stopwords()
+    test_chunks_cover_text_with_overlap()
+    test_search_ranks_relevant_page()
+    test_sync_reindexes_and_prunes()
+    test_clear_empties_index()
+    print("Todas las pruebas de document_retrieval pasaron correctamente")
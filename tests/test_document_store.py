@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de prueba para el módulo document_store de Expert Nexus.
+Verifica que el texto se guarde comprimido por bloques y se lea por
+fragmentos, que la sesión solo conserve identificadores, que el contexto
+de documentos funcione con documentos guardados y la limpieza por TTL.
+"""
+
+import gc
+import os
+import sys
+import tempfile
+
+# Añadir el directorio raíz al path para importar módulos de la aplicación
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+import document_context
+import document_retrieval
+import document_store
+
+
+class FakeClock:
+    """Reloj manual para controlar el tiempo en las pruebas"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def sample_document():
+    pages = [f"Página {number}: " + "contenido del informe anual " * 40 for number in range(1, 6)]
+    return {
+        "text": "".join(page + "\n\n" for page in pages),
+        "format": "pdf_direct",
+        "page_offsets": document_retrieval.page_offsets_for(pages),
+    }
+
+
+def test_slices_read_only_needed_blocks():
+    """Los fragmentos leídos coinciden con el texto original en cualquier posición"""
+    content = sample_document()
+    text = content["text"]
+    with tempfile.TemporaryDirectory() as directory:
+        store = document_store.DocumentStore(os.path.join(directory, "docs.sqlite3"), block_chars=500)
+        doc_id = store.put("sesion", "informe.pdf", content)
+
+        assert store.read_text(doc_id) == text
+        for start, end in [(0, 10), (495, 1005), (1234, 1250), (len(text) - 7, None)]:
+            assert store.read_text(doc_id, start, end) == text[start:end]
+
+        info = store.info(doc_id)
+        assert info["length"] == len(text)
+        assert info["meta"]["page_offsets"] == content["page_offsets"]
+        assert store.get_stats()["stored_bytes"] < len(text.encode("utf-8"))
+
+
+def test_session_keeps_only_ids():
+    """La sesión guarda identificadores y entrega documentos de solo lectura perezosa"""
+    store = document_store.DocumentStore(":memory:")
+    documents = document_store.SessionDocuments(store)
+    content = sample_document()
+    documents["informe.pdf"] = content
+
+    assert list(documents.ids) == ["informe.pdf"]
+    assert all(isinstance(doc_id, str) for doc_id in documents.ids.values())
+
+    stored = documents["informe.pdf"]
+    assert "text" in stored
+    assert stored["format"] == "pdf_direct"
+    assert stored.length == len(content["text"])
+    assert document_context.document_hash(stored) == document_context.document_hash(content)
+    assert stored["text"] == content["text"]
+
+    del documents["informe.pdf"]
+    assert store.get_stats()["documents"] == 0
+
+
+def test_context_with_stored_documents():
+    """El contexto con presupuesto trunca un documento guardado leyendo solo su inicio"""
+    store = document_store.DocumentStore(":memory:", block_chars=256)
+    documents = document_store.SessionDocuments(store)
+    documents["informe.pdf"] = sample_document()
+    documents["nota.txt"] = {"text": "Nota breve", "format": "text"}
+
+    counter = document_context.HeuristicTokenCounter()
+    context = document_context.assemble_document_context(dict(documents.items()), 120, counter)
+
+    assert "Nota breve" in context["text"]
+    assert context["complete"] == ["nota.txt"]
+    assert context["report"]["informe.pdf"]["truncated"]
+    # El conteo de tokens queda guardado para los turnos siguientes
+    assert store.info(documents.ids["informe.pdf"])["token_counts"][counter.name] > 0
+
+
+def test_index_reads_passages_from_store():
+    """El índice no conserva el texto de los fragmentos y lo lee del almacén al buscar"""
+    store = document_store.DocumentStore(":memory:")
+    documents = document_store.SessionDocuments(store)
+    content = {"text": "El presupuesto de mantenimiento aumentó un diez por ciento.", "format": "text"}
+    documents["presupuesto.txt"] = content
+
+    index = document_retrieval.DocumentIndex(text_reader=documents.read_text)
+    index.sync(documents, document_context.document_text)
+    assert all(chunk["text"] is None for chunk in index.chunks.values())
+
+    passages = index.search("presupuesto mantenimiento")
+    assert passages and "mantenimiento" in passages[0]["text"]
+
+
+def test_ttl_cleanup_and_session_release():
+    """Las sesiones inactivas se eliminan al vencer el TTL y al liberarse"""
+    clock = FakeClock()
+    store = document_store.DocumentStore(":memory:", clock=clock)
+    store.put("inactiva", "viejo.txt", {"text": "viejo"})
+    clock.now += 3 * 3600
+    store.put("activa", "nuevo.txt", {"text": "nuevo"})
+
+    assert store.cleanup(ttl_hours=2) == 1
+    assert store.get_stats()["documents"] == 1
+
+    documents = document_store.SessionDocuments(store)
+    documents["otro.txt"] = {"text": "otro"}
+    assert store.get_stats()["documents"] == 2
+    del documents
+    gc.collect()
+    assert store.get_stats()["documents"] == 1
+
+
+if __name__ == "__main__":
+    test_slices_read_only_needed_blocks()
+    test_session_keeps_only_ids()
+    test_context_with_stored_documents()
+    test_index_reads_passages_from_store()
+    test_ttl_cleanup_and_session_release()
+    print("Todas las pruebas de document_store pasaron correctamente")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de prueba para el módulo export_cache de Expert Nexus.
+Verifica que la clave dependa de los mensajes, el historial de expertos y
+el formato, que las exportaciones se recuperen de memoria y de disco y que
+ambos niveles respeten su tamaño máximo.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# Añadir el directorio raíz al path para importar módulos de la aplicación
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+import export_cache
+
+MESSAGES = [
+    {"role": "user", "content": "¿Qué dice el contrato?"},
+    {"role": "assistant", "content": "El contrato establece un plazo de 30 días."},
+]
+HISTORY = [{"timestamp": "10:00:00 AM", "expert": "legal", "reason": "Selección manual"}]
+
+
+def test_key_depends_on_content_and_format():
+    """La clave cambia con los mensajes, el historial o el formato"""
+    key = export_cache.export_key(MESSAGES, HISTORY, "PDF")
+
+    assert key == export_cache.export_key([dict(m) for m in MESSAGES], list(HISTORY), "PDF")
+    assert key != export_cache.export_key(MESSAGES, HISTORY, "Markdown")
+    assert key != export_cache.export_key(MESSAGES + [{"role": "user", "content": "Gracias"}], HISTORY, "PDF")
+    assert key != export_cache.export_key(MESSAGES, [], "PDF")
+    assert key != export_cache.export_key(MESSAGES, HISTORY, "PDF", extra=[["contrato.pdf", 1024]])
+
+
+def test_memory_and_disk_hits():
+    """Una exportación guardada se recupera de memoria y, en otro proceso, de disco"""
+    with tempfile.TemporaryDirectory() as directory:
+        key = export_cache.export_key(MESSAGES, HISTORY, "PDF")
+        cache = export_cache.ExportCache(cache_dir=directory)
+        assert cache.get(key) is None
+        cache.put(key, b"%PDF-1.4 contenido", "pdf")
+        assert cache.get(key) == (b"%PDF-1.4 contenido", "pdf")
+
+        reopened = export_cache.ExportCache(cache_dir=directory)
+        assert reopened.get(key) == (b"%PDF-1.4 contenido", "pdf")
+        stats = reopened.get_stats()
+        assert stats["disk_hits"] == 1
+        assert stats["memory_items"] == 1
+
+
+def test_bounded_memory_and_disk():
+    """Los dos niveles desalojan las exportaciones menos usadas"""
+    with tempfile.TemporaryDirectory() as directory:
+        cache = export_cache.ExportCache(cache_dir=directory, memory_max_bytes=250, disk_max_bytes=250)
+        for number in range(3):
+            cache.put(f"clave-{number}", bytes([number]) * 100, "markdown")
+            # Fechas de uso distintas para el desalojo en disco
+            past = time.time() - 100 + number
+            os.utime(os.path.join(directory, f"clave-{number}.markdown"), (past, past))
+
+        stats = cache.get_stats()
+        assert stats["memory_items"] == 2
+        assert stats["memory_bytes"] == 200
+        assert sorted(os.listdir(directory)) == ["clave-1.markdown", "clave-2.markdown"]
+        assert cache.get("clave-0") is None
+        assert cache.get("clave-2") == (bytes([2]) * 100, "markdown")
+
+
+if __name__ == "__main__":
+    test_key_depends_on_content_and_format()
+    test_memory_and_disk_hits()
+    test_bounded_memory_and_disk()
+    print("Todas las pruebas de export_cache pasaron correctamente")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de prueba para el módulo image_preprocessing de Expert Nexus.
+Verifica la reducción de imágenes grandes al decodificar, que se conserve
+el original cuando la optimización no lo reduce, la lectura desde disco y
+la caché de imágenes preparadas.
+"""
+
+import os
+import sys
+import tempfile
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+# Añadir el directorio raíz al path para importar módulos de la aplicación
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+import image_preprocessing
+
+
+def encode(img, image_format, **options):
+    buffer = BytesIO()
+    img.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def test_large_jpeg_is_reduced():
+    """Una foto más grande que el máximo se entrega en gris dentro del límite"""
+    img = Image.new("RGB", (6000, 4500), "white")
+    draw = ImageDraw.Draw(img)
+    for y in range(0, 4500, 150):
+        draw.text((100, y), "Línea de texto del documento escaneado", fill="black")
+    data, mime_type = image_preprocessing.optimize_image_for_ocr(encode(img, "JPEG", quality=90))
+
+    result = Image.open(BytesIO(data))
+    assert max(result.size) == image_preprocessing.MAX_OCR_DIMENSION
+    assert result.size == (4000, 3000)
+    assert result.mode == "L"
+    assert mime_type in ("image/jpeg", "image/png")
+
+
+def test_original_kept_when_not_smaller():
+    """Un JPEG pequeño y muy comprimido se envía sin recodificar"""
+    img = Image.effect_noise((800, 600), 40).convert("RGB")
+    original = encode(img, "JPEG", quality=30)
+    data, mime_type = image_preprocessing.optimize_image_for_ocr(original)
+
+    assert data == original
+    assert mime_type == "image/jpeg"
+
+
+def test_reads_image_from_path():
+    """La preparación acepta la ruta de la imagen en disco"""
+    img = Image.new("RGB", (5000, 1000), "white")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "plano.png")
+        img.save(path)
+        data, _ = image_preprocessing.optimize_image_for_ocr(path)
+
+    assert Image.open(BytesIO(data)).size == (4000, 800)
+
+
+def test_prepared_image_cache_is_bounded():
+    """La caché devuelve lo guardado y desaloja lo menos usado al superar su tamaño"""
+    cache = image_preprocessing.PreparedImageCache(max_bytes=250)
+    cache.put("a", (b"a" * 100, "image/png"))
+    cache.put("b", (b"b" * 100, "image/png"))
+    assert cache.get("a") == (b"a" * 100, "image/png")
+
+    cache.put("c", (b"c" * 100, "image/png"))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    stats = cache.get_stats()
+    assert stats["items"] == 2
+    assert stats["bytes"] == 200
+
+
+if __name__ == "__main__":
+    test_large_jpeg_is_reduced()
+    test_original_kept_when_not_smaller()
+    test_reads_image_from_path()
+    test_prepared_image_cache_is_bounded()
+    print("Todas las pruebas de image_preprocessing pasaron correctamente")
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de prueba para el módulo image_tiling de Expert Nexus.
+Verifica que los mosaicos cubran la imagen con solapamiento, que solo se
+dividan las imágenes grandes y que los textos se unan en orden de lectura
+sin las líneas repetidas por el solapamiento.
+"""
+
+import os
+import sys
+from io import BytesIO
+
+from PIL import Image
+
+# Añadir el directorio raíz al path para importar módulos de la aplicación
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+import image_tiling
+
+
+def test_tiles_cover_image_with_overlap():
+    """Los mosaicos cubren todo el eje dividido y se solapan al menos lo pedido"""
+    tiles = image_tiling.plan_tiles(9000, 3000, 2000, 160)
+
+    assert all(tile["row"] == 0 for tile in tiles)
+    boxes = [tile["box"] for tile in tiles]
+    assert boxes[0][0] == 0 and boxes[-1][2] == 9000
+    assert all(box[1] == 0 and box[3] == 3000 for box in boxes)
+    for previous, current in zip(boxes, boxes[1:]):
+        assert previous[2] - current[0] >= 160
+
+
+def test_reading_order_is_column_major():
+    """Cada columna de mosaicos se lee de arriba abajo antes de pasar a la siguiente"""
+    tiles = image_tiling.plan_tiles(6000, 6000, 2000, 100)
+    order = [(tile["col"], tile["row"]) for tile in tiles]
+    assert order == sorted(order)
+    assert max(tile["box"][2] for tile in tiles) == 6000
+
+
+def test_small_images_are_not_split():
+    """Las imágenes dentro de la dimensión máxima no se dividen"""
+    buffer = BytesIO()
+    Image.new("RGB", (1200, 800), "white").save(buffer, format="PNG")
+    assert image_tiling.split_image(buffer.getvalue(), 2000, 160) is None
+
+    buffer = BytesIO()
+    Image.new("RGB", (4500, 1000), "white").save(buffer, format="PNG")
+    tiles = image_tiling.split_image(buffer.getvalue(), 2000, 160)
+    assert len(tiles) == 3
+    assert Image.open(BytesIO(tiles[0]["data"])).size == (2000, 1000)
+    assert tiles[0]["mime_type"] == "image/png"
+
+
+def test_overlap_with_cut_lines():
+    """El texto solapado se detecta aunque el corte deje líneas partidas"""
+    previous = ["Cuadro de cargas", "Circuito 1: iluminación", "Circuito 2: tomas", "~~ .,"]
+    current = ["Circuito 1: iluminacion", "Circuito 2: tomas", "Circuito 3: motores"]
+
+    trim, skip = image_tiling.find_overlap(previous, current)
+    assert trim == 1
+    assert current[skip:] == ["Circuito 3: motores"]
+    assert image_tiling.find_overlap(["Sin relación"], ["Otro texto"]) == (0, 0)
+
+
+def test_stitch_removes_duplicates_and_keeps_order():
+    """La unión elimina el solapamiento y respeta columnas y mosaicos faltantes"""
+    tiles = image_tiling.plan_tiles(6000, 6000, 3200, 400)
+    assert len(tiles) == 4
+    texts = {
+        0: "Columna A línea 1\nColumna A línea 2\nColumna A línea 3",
+        1: "Columna A línea 3\nColumna A línea 4",
+        2: "Columna B línea 1",
+    }
+    stitched = image_tiling.stitch_tile_texts(tiles, texts)
+
+    assert stitched == (
+        "Columna A línea 1\nColumna A línea 2\nColumna A línea 3\nColumna A línea 4"
+        "\n\nColumna B línea 1"
+    )
+
+
+def test_stitch_joins_lines_across_columns():
+    """En una rejilla de 2 columnas el solapamiento horizontal no se repite y las líneas cortadas se unen"""
+    tiles = image_tiling.plan_tiles(6000, 6000, 3200, 400)
+    texts = {
+        0: "Plano de planta baja - Hoja\nCircuito 1: ilumina\nNota A",
+        1: "Nota A\nCuadro general",
+        2: "Hoja 3 de 5\nilumina pasillo norte\nNota B",
+        3: "Nota B\ngeneral de protecciones",
+    }
+    stitched = image_tiling.stitch_tile_texts(tiles, texts)
+
+    assert stitched == (
+        "Plano de planta baja - Hoja 3 de 5\nCircuito 1: ilumina pasillo norte\nNota A"
+        "\nCuadro general de protecciones\n\nNota B"
+    )
+    assert image_tiling.join_fragments("Nota A", "Nota B") is None
+    assert image_tiling.join_fragments("Escala 1:100", "1:100") == "Escala 1:100"
+
+
+if __name__ == "__main__":
+    test_tiles_cover_image_with_overlap()
+    test_reading_order_is_column_major()
+    test_small_images_are_not_split()
+    test_overlap_with_cut_lines()
+    test_stitch_removes_duplicates_and_keeps_order()
+    test_stitch_joins_lines_across_columns()
+    print("Todas las pruebas de image_tiling pasaron correctamente")
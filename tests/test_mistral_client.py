@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de prueba para el módulo mistral_client de Expert Nexus.
+Verifica que el cliente se comparta por clave API, que las solicitudes
+reutilicen las conexiones del pool, que cada endpoint use su timeout y que
+el OCR asíncrono respete el límite de concurrencia, los plazos y la
+cancelación.
+"""
+
+import concurrent.futures
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+
+# Añadir el directorio raíz al path para importar módulos de la aplicación
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+import mistral_client
+
+
+def start_ocr_server():
+    """Inicia un servidor local con keep-alive que responde como la API de OCR"""
+    connections = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            connections.append(self.client_address)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            payload = json.dumps(
+                {"pages": [{"index": 0, "markdown": body["document"]["document_url"]}]}
+            ).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, connections
+
+
+def test_client_shared_per_key():
+    """Cada clave API obtiene un único cliente compartido"""
+    first = mistral_client.get_mistral_client("clave-a")
+    assert mistral_client.get_mistral_client("clave-a") is first
+    assert mistral_client.get_mistral_client("clave-b") is not first
+    assert "clave-a" not in first.fingerprint
+
+
+def test_requests_reuse_connection():
+    """Varias solicitudes de OCR seguidas usan una sola conexión"""
+    server, connections = start_ocr_server()
+    client = mistral_client.MistralClient("clave", base_url=f"http://127.0.0.1:{server.server_address[1]}")
+    try:
+        for number in range(5):
+            response = client.ocr(
+                {"model": "modelo", "document": {"type": "document_url", "document_url": f"doc-{number}"}}
+            )
+            assert response.status_code == 200
+            assert response.json()["pages"][0]["markdown"] == f"doc-{number}"
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+
+    assert len(connections) == 1
+
+
+def test_endpoint_timeouts():
+    """El OCR y la carga de archivos tienen timeouts propios configurables"""
+    saved = os.environ.get("MISTRAL_OCR_TIMEOUT")
+    try:
+        os.environ["MISTRAL_OCR_TIMEOUT"] = "45"
+        timeouts = mistral_client.endpoint_timeouts()
+    finally:
+        if saved is None:
+            os.environ.pop("MISTRAL_OCR_TIMEOUT", None)
+        else:
+            os.environ["MISTRAL_OCR_TIMEOUT"] = saved
+
+    assert timeouts["ocr"].read == 45
+    assert timeouts["upload"].read == mistral_client.DEFAULT_UPLOAD_TIMEOUT
+    assert timeouts["files"].connect == mistral_client.DEFAULT_CONNECT_TIMEOUT
+
+
+def start_slow_server(delays):
+    """
+    Inicia un servidor local concurrente que tarda en responder según el
+    documento recibido y registra el máximo de solicitudes simultáneas.
+    """
+    state = {"active": 0, "max_active": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            name = body["document"]["document_url"]
+            with lock:
+                state["active"] += 1
+                state["max_active"] = max(state["max_active"], state["active"])
+            time.sleep(delays.get(name, 0.05))
+            with lock:
+                state["active"] -= 1
+            payload = json.dumps({"pages": [{"index": 0, "markdown": name}]}).encode("utf-8")
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            except OSError:
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def payload_for(name):
+    return {"model": "modelo", "document": {"type": "document_url", "document_url": name}}
+
+
+def test_async_batch_respects_concurrency():
+    """El lote asíncrono devuelve las respuestas en orden sin superar el límite"""
+    server, state = start_slow_server({})
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    saved = os.environ.get("OCR_ASYNC_CONCURRENCY")
+    os.environ["OCR_ASYNC_CONCURRENCY"] = "3"
+    try:
+        names = [f"doc-{number}" for number in range(10)]
+        responses = mistral_client.run_ocr_batch(
+            "clave-lote", [payload_for(name) for name in names], base_url=base_url
+        )
+    finally:
+        if saved is None:
+            os.environ.pop("OCR_ASYNC_CONCURRENCY", None)
+        else:
+            os.environ["OCR_ASYNC_CONCURRENCY"] = saved
+        server.shutdown()
+        server.server_close()
+
+    assert [response.json()["pages"][0]["markdown"] for response in responses] == names
+    assert 1 < state["max_active"] <= 3
+
+
+def test_async_deadline_per_request():
+    """Una solicitud que supera su plazo falla sin afectar a las demás"""
+    server, _ = start_slow_server({"lento": 2})
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        responses = mistral_client.run_ocr_batch(
+            "clave-plazo", [payload_for("rapido"), payload_for("lento")], deadline=0.5, base_url=base_url
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert responses[0].status_code == 200
+    assert isinstance(responses[1], Exception)
+
+
+def test_async_batch_cancellation():
+    """Activar el evento de cancelación interrumpe el lote en curso"""
+    server, _ = start_slow_server({"lento": 3})
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    cancel_event = threading.Event()
+    threading.Timer(0.3, cancel_event.set).start()
+    started = time.monotonic()
+    try:
+        mistral_client.run_ocr_batch(
+            "clave-cancelar", [payload_for("lento")], cancel_event=cancel_event, base_url=base_url
+        )
+        raise AssertionError("El lote debía cancelarse")
+    except concurrent.futures.CancelledError:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert time.monotonic() - started < 2
+
+
+if __name__ == "__main__":
+    test_client_shared_per_key()
+    test_requests_reuse_connection()
+    test_endpoint_timeouts()
+    test_async_batch_respects_concurrency()
+    test_async_deadline_per_request()
+    test_async_batch_cancellation()
+    print("Todas las pruebas de mistral_client pasaron correctamente")
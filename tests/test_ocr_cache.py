@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de prueba para el módulo ocr_cache de Expert Nexus.
+Verifica las claves por contenido, los niveles de memoria y disco,
+el desalojo por tamaño y los contadores de aciertos.
+"""
+
+import os
+import sys
+import tempfile
+
+# Añadir el directorio raíz al path para importar módulos de la aplicación
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+import ocr_cache
+import pdf_pages
+
+
+def test_key_depends_on_content_and_options():
+    """La clave cambia con los bytes, el modelo o las opciones"""
+    key = ocr_cache.cache_key(b"pdf", "mistral-ocr-latest", {"file_type": "PDF"})
+
+    assert key == ocr_cache.cache_key(b"pdf", "mistral-ocr-latest", {"file_type": "PDF"})
+    assert key != ocr_cache.cache_key(b"otro", "mistral-ocr-latest", {"file_type": "PDF"})
+    assert key != ocr_cache.cache_key(b"pdf", "otro-modelo", {"file_type": "PDF"})
+    assert key != ocr_cache.cache_key(b"pdf", "mistral-ocr-latest", {"file_type": "Imagen"})
+
+
+def test_memory_and_disk_tiers():
+    """Un resultado guardado sobrevive a un reinicio gracias al disco"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ocr_cache.OCRCache(cache_dir=cache_dir, memory_items=2)
+        result = {"text": "contrato", "format": "markdown"}
+
+        assert cache.get("k1") is None
+        cache.put("k1", result)
+        assert cache.get("k1") == result
+
+        # Una instancia nueva (como tras reiniciar) lee desde disco
+        restarted = ocr_cache.OCRCache(cache_dir=cache_dir, memory_items=2)
+        assert restarted.get("k1") == result
+        assert restarted.get("k1") == result
+
+        stats = restarted.get_stats()
+        assert stats["disk_hits"] == 1
+        assert stats["memory_hits"] == 1
+        assert cache.get_stats()["misses"] == 1
+
+
+def test_results_are_copies():
+    """Modificar un resultado devuelto no altera la caché"""
+    cache = ocr_cache.OCRCache(cache_dir=None)
+    cache.put("k", {"text": "original"})
+
+    cache.get("k")["text"] = "modificado"
+
+    assert cache.get("k")["text"] == "original"
+
+
+def test_disk_tier_evicts_least_recently_used():
+    """El nivel de disco respeta su tamaño máximo desalojando lo más antiguo"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ocr_cache.OCRCache(cache_dir=cache_dir, memory_items=1, disk_max_bytes=1500)
+        for i in range(10):
+            cache.put(f"k{i}", {"text": os.urandom(200).hex()})
+            path = os.path.join(cache_dir, f"k{i}.json.gz")
+            os.utime(path, (i, i))
+
+        files = [name for name in os.listdir(cache_dir) if name.endswith(".json.gz")]
+        total = sum(os.path.getsize(os.path.join(cache_dir, name)) for name in files)
+
+        assert total <= 1500
+        assert "k9.json.gz" in files
+        assert "k0.json.gz" not in files
+        assert cache.get_stats()["evictions"] > 0
+
+
+def test_partial_results_are_not_cached():
+    """Un documento con un rango de páginas fallido no se guarda en ningún nivel"""
+    ranges = [(0, 2), (2, 4)]
+
+    def ocr_range(index):
+        if index == 1:
+            raise ConnectionError("Mistral no disponible")
+        return [{"markdown": "página 1"}, {"markdown": "página 2"}]
+
+    results, errors = pdf_pages.ocr_page_ranges(ranges, ocr_range, retries=0)
+    assert list(errors) == [1]
+    pages = pdf_pages.merge_range_pages(ranges, results)
+    failed_ranges = [ranges[index] for index in errors]
+    result = {
+        "text": "\n\n".join(page["markdown"] for page in pages),
+        "partial": True,
+        "failed_ranges": failed_ranges,
+    }
+    assert pdf_pages.describe_ranges(failed_ranges) == "3-4"
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ocr_cache.OCRCache(cache_dir=cache_dir)
+        cache.put("documento", result)
+        assert cache.get("documento") is None
+        assert ocr_cache.OCRCache(cache_dir=cache_dir).get("documento") is None
+        assert cache.get_stats()["stores"] == 0
+        assert os.listdir(cache_dir) == []
+
+
+if __name__ == "__main__":
+    test_key_depends_on_content_and_options()
+    test_memory_and_disk_tiers()
+    test_results_are_copies()
+    test_disk_tier_evicts_least_recently_used()
+    test_partial_results_are_not_cached()
+    print("Todas las pruebas de ocr_cache pasaron correctamente")
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de prueba para el módulo openai_clients de Expert Nexus.
+Verifica la reutilización de clientes por clave API y la verificación
+de conectividad con TTL sin realizar llamadas reales a la API.
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+# Añadir el directorio raíz al path para importar módulos de la aplicación
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+import openai_clients
+
+
+def test_client_is_shared_per_api_key():
+    """La misma clave API devuelve siempre el mismo cliente"""
+    first = openai_clients.get_openai_client("sk-test-shared-1")
+    second = openai_clients.get_openai_client("sk-test-shared-1")
+    other = openai_clients.get_openai_client("sk-test-shared-2")
+
+    assert first is second
+    assert first is not other
+    assert first.default_headers.get("OpenAI-Beta") == "assistants=v2"
+
+
+def test_connectivity_probe_is_cached_until_ttl():
+    """La verificación de conectividad solo se repite al vencer el TTL"""
+    api_key = "sk-test-probe"
+    client = openai_clients.get_openai_client(api_key)
+    calls = []
+
+    def fake_list():
+        calls.append(1)
+        return SimpleNamespace(data=[SimpleNamespace(id="gpt-test")])
+
+    client.models.list = fake_list
+
+    assert openai_clients.check_connectivity(api_key, ttl=600) == ["gpt-test"]
+    assert openai_clients.check_connectivity(api_key, ttl=600) == ["gpt-test"]
+    assert len(calls) == 1
+
+    openai_clients.check_connectivity(api_key, ttl=0)
+    assert len(calls) == 2
+
+
+if __name__ == "__main__":
+    test_client_is_shared_per_api_key()
+    test_connectivity_probe_is_cached_until_ttl()
+    print("Todas las pruebas de openai_clients pasaron correctamente")
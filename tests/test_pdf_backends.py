@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de prueba para el módulo pdf_backends de Expert Nexus.
+Verifica que cada motor se compruebe una sola vez con su versión, binario
+y tiempo de carga, que los motores ausentes informen el motivo y que las
+estrategias de exportación se filtren por sus requisitos.
+"""
+
+import os
+import sys
+
+# Añadir el directorio raíz al path para importar módulos de la aplicación
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+import pdf_backends
+
+
+def _available():
+    return {"version": "1.2.3", "binary": "/usr/bin/motor"}
+
+
+def _missing():
+    raise OSError("cannot load library 'libpango-1.0-0'\nmás detalles")
+
+
+def test_probe_engine_reports_version_and_reason():
+    """Un motor disponible informa versión y binario; uno ausente, el motivo"""
+    info = pdf_backends.probe_engine("wkhtmltopdf", _available)
+    assert info["available"] is True
+    assert info["version"] == "1.2.3"
+    assert info["binary"] == "/usr/bin/motor"
+    assert info["reason"] is None
+    assert info["warmup_seconds"] >= 0
+
+    info = pdf_backends.probe_engine("weasyprint", _missing)
+    assert info["available"] is False
+    assert info["reason"] == "OSError: cannot load library 'libpango-1.0-0'"
+
+
+def test_registry_probes_once_and_ranks_strategies():
+    """Cada motor se comprueba una vez y las estrategias sin requisitos se descartan"""
+    calls = []
+
+    def counted(result):
+        def probe():
+            calls.append(result)
+            if result is None:
+                raise ImportError("No module named 'motor'")
+            return result
+        return probe
+
+    registry = pdf_backends.BackendRegistry(
+        probes={"reportlab": counted({"version": "4.0"}), "weasyprint": counted(None)}
+    )
+    strategies = [
+        ("weasyprint", ("weasyprint",), None),
+        ("reportlab", ("reportlab",), None),
+        ("desconocido", ("reportlab", "biblioteca_inexistente"), None),
+    ]
+    assert [name for name, _, _ in registry.ranked(strategies)] == ["reportlab"]
+    assert [name for name, _, _ in registry.ranked(strategies)] == ["reportlab"]
+    assert len(calls) == 2
+    assert registry.binary("reportlab") is None
+    assert registry.binary("inexistente") is None
+    assert registry.describe().startswith("reportlab 4.0")
+
+
+def test_shared_registry_is_detected_once():
+    """La detección en segundo plano y las exportaciones comparten el mismo registro"""
+    pdf_backends.detect_in_background()
+    registry = pdf_backends.get_backend_registry()
+    pdf_backends.detect_in_background()
+
+    assert pdf_backends.get_backend_registry() is registry
+    assert set(registry.engines) == set(pdf_backends.ENGINES)
+    for info in registry.engines.values():
+        assert info["available"] or info["reason"]
+
+
+if __name__ == "__main__":
+    test_probe_engine_reports_version_and_reason()
+    test_registry_probes_once_and_ranks_strategies()
+    test_shared_registry_is_detected_once()
+    print("Todas las pruebas de pdf_backends pasaron correctamente")
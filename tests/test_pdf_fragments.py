@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de prueba para el ensamblado incremental de PDF de pdf_export.
+Verifica que la clave de un fragmento dependa de la posición y el contenido
+de sus mensajes, que una exportación solo renderice los fragmentos con
+mensajes nuevos y que el PDF ensamblado conserve todo el texto.
+"""
+
+import io
+import os
+import sys
+import tempfile
+
+import PyPDF2
+
+# Añadir el directorio raíz al path para importar módulos de la aplicación
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+import pdf_export
+
+IDENTITY = {"name": "Expert Nexus", "conversation_export_name": "conversacion"}
+HEADER = "# Expert Nexus - Historial de Conversación\n\nFecha: 2024-01-01 10:00:00\n\n"
+
+
+def _sections(count):
+    return [
+        f"## {'Usuario' if index % 2 == 0 else 'Experto Legal'}\n\n"
+        f"Mensaje {index}: consulta sobre el arrendamiento del local comercial.\n\n---\n\n"
+        for index in range(count)
+    ]
+
+
+def test_fragment_key_depends_on_position_and_content():
+    """La clave cambia si cambia el contenido o la posición de los mensajes"""
+    sections = _sections(3)
+    key = pdf_export.fragment_key(0, sections)
+
+    assert key == pdf_export.fragment_key(0, list(sections))
+    assert key != pdf_export.fragment_key(10, sections)
+    assert key != pdf_export.fragment_key(0, sections[:2] + ["## Usuario\n\nOtro texto\n\n---\n\n"])
+    assert key != pdf_export.fragment_key(0, sections[:2])
+
+
+def test_only_new_fragments_are_rendered():
+    """Una exportación posterior solo renderiza el encabezado y el fragmento con mensajes nuevos"""
+    rendered = []
+    original = pdf_export._markdown_to_pdf
+
+    def counting(md_content):
+        rendered.append(md_content)
+        return original(md_content)
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["PDF_FRAGMENT_CACHE_DIR"] = directory
+        pdf_export._fragment_cache = None
+        pdf_export._markdown_to_pdf = counting
+        try:
+            sections = _sections(25)
+            content, content_type = pdf_export.render_fragments(
+                HEADER, sections, "", IDENTITY, fragment_messages=10
+            )
+            assert content_type == "pdf"
+            assert len(rendered) == 4  # Encabezado y tres fragmentos
+
+            rendered.clear()
+            sections.append("## Usuario\n\nMensaje 25: ¿y la fianza?\n\n---\n\n")
+            content, _ = pdf_export.render_fragments(
+                HEADER, sections, "## Archivos Adjuntos\n\n- **contrato.pdf**\n", IDENTITY,
+                fragment_messages=10,
+            )
+            assert len(rendered) == 3  # Encabezado, último fragmento y pie
+            assert rendered[1].startswith("## Usuario\n\nMensaje 20")
+        finally:
+            pdf_export._markdown_to_pdf = original
+            pdf_export._fragment_cache = None
+            os.environ.pop("PDF_FRAGMENT_CACHE_DIR", None)
+
+    reader = PyPDF2.PdfReader(io.BytesIO(content))
+    text = " ".join(page.extract_text() for page in reader.pages)
+    assert "Mensaje 0" in text and "Mensaje 25" in text and "contrato.pdf" in text
+    assert pdf_export.pdf_quality(content, HEADER + "".join(sections)) > 0.9
+
+
+def test_quality_rejects_non_pdf():
+    """Un contenido que no es PDF tiene calidad nula"""
+    assert pdf_export.pdf_quality(b"# Markdown", "Texto de la conversación") == 0.0
+
+
+if __name__ == "__main__":
+    test_fragment_key_depends_on_position_and_content()
+    test_only_new_fragments_are_rendered()
+    test_quality_rejects_non_pdf()
+    print("Todas las pruebas de fragmentos PDF pasaron correctamente")
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de prueba para el módulo pdf_pages de Expert Nexus.
+Verifica la división de PDFs en rangos de páginas, el OCR concurrente con
+límite de simultaneidad, el reintento de rangos fallidos y la unión en orden.
+"""
+
+import io
+import os
+import sys
+import threading
+import time
+
+# Añadir el directorio raíz al path para importar módulos de la aplicación
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+import pdf_pages
+
+
+def build_pdf(page_count):
+    """Genera un PDF de prueba con el número de página en cada hoja"""
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    pdf.set_font("Helvetica", size=12)
+    for number in range(1, page_count + 1):
+        pdf.add_page()
+        pdf.cell(0, 10, f"Pagina {number}")
+    return bytes(pdf.output())
+
+
+def build_mixed_pdf():
+    """Genera un PDF con páginas de texto y páginas que solo contienen una imagen"""
+    from fpdf import FPDF
+    from PIL import Image
+
+    image = Image.new("RGB", (200, 100), "white")
+    pdf = FPDF()
+    pdf.set_font("Helvetica", size=12)
+    for kind in ("texto", "imagen", "imagen", "texto", "vacia"):
+        pdf.add_page()
+        if kind == "texto":
+            pdf.multi_cell(0, 10, "Clausula primera del contrato de arrendamiento. " * 5)
+        elif kind == "imagen":
+            pdf.image(image, x=10, y=10, w=100)
+    return bytes(pdf.output())
+
+
+def test_group_ocr_ranges():
+    """Las páginas escaneadas consecutivas se agrupan respetando el máximo"""
+    flags = [False, True, True, True, False, True]
+
+    assert pdf_pages.group_ocr_ranges(flags, 2) == [(1, 3), (3, 4), (5, 6)]
+    assert pdf_pages.group_ocr_ranges([False, False], 10) == []
+
+
+def test_analyze_pdf_classifies_pages():
+    """Solo las páginas sin capa de texto y con imágenes requieren OCR"""
+    analysis = pdf_pages.analyze_pdf(build_mixed_pdf())
+
+    assert analysis["page_count"] == 5
+    assert analysis["needs_ocr"] == [False, True, True, False, False]
+    assert analysis["ocr_ranges"] == [(1, 3)]
+    assert len(analysis["range_pdfs"]) == 1
+    assert "Clausula primera" in analysis["page_texts"][0]
+
+
+def test_merge_keeps_text_layer_pages():
+    """Las páginas con texto se conservan y las escaneadas toman el OCR"""
+    page_texts = ["texto 1", "", "", "texto 4"]
+    results = {0: [{"markdown": "ocr 2"}, {"markdown": "ocr 3"}]}
+
+    pages = pdf_pages.merge_range_pages([(1, 3)], results, page_texts)
+
+    assert [page["markdown"] for page in pages] == ["texto 1", "ocr 2", "ocr 3", "texto 4"]
+
+
+def test_plan_page_ranges():
+    """Los rangos cubren todas las páginas y se reducen si el PDF es pesado"""
+    assert pdf_pages.plan_page_ranges(25, pages_per_range=10) == [(0, 10), (10, 20), (20, 25)]
+
+    heavy = pdf_pages.plan_page_ranges(8, size_bytes=80 * 1024 * 1024, pages_per_range=10)
+    assert len(heavy) == 4
+    assert heavy[-1][1] == 8
+
+
+def test_should_split_thresholds():
+    """Solo se dividen los PDFs que superan el umbral de páginas o de tamaño"""
+    assert not pdf_pages.should_split(5, 1024)
+    assert pdf_pages.should_split(pdf_pages.DEFAULT_SPLIT_PAGES + 1, 1024)
+    assert pdf_pages.should_split(3, (pdf_pages.DEFAULT_SPLIT_MB + 1) * 1024 * 1024)
+    assert not pdf_pages.should_split(1, (pdf_pages.DEFAULT_SPLIT_MB + 1) * 1024 * 1024)
+
+
+def test_write_page_range():
+    """Cada rango produce un PDF con sus páginas"""
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(io.BytesIO(build_pdf(5)))
+    part = PyPDF2.PdfReader(io.BytesIO(pdf_pages.write_page_range(reader, 2, 4)))
+
+    assert len(part.pages) == 2
+    assert "Pagina 3" in part.pages[0].extract_text()
+
+
+def test_concurrency_cap_and_order():
+    """Los rangos se procesan en paralelo sin superar el límite y se unen en orden"""
+    ranges = pdf_pages.plan_page_ranges(12, pages_per_range=2)
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def ocr_range(index):
+        with lock:
+            active.append(index)
+            peak.append(len(active))
+        time.sleep(0.05 * (len(ranges) - index))
+        with lock:
+            active.remove(index)
+        start, end = ranges[index]
+        return [{"markdown": f"p{page + 1}"} for page in range(start, end)]
+
+    results, errors = pdf_pages.ocr_page_ranges(ranges, ocr_range, max_concurrency=3, retries=0)
+    pages = pdf_pages.merge_range_pages(ranges, results)
+
+    assert not errors
+    assert max(peak) <= 3
+    assert [page["markdown"] for page in pages] == [f"p{n}" for n in range(1, 13)]
+
+
+def test_only_failed_ranges_are_retried():
+    """Un rango fallido se reintenta sin repetir los demás"""
+    ranges = [(0, 2), (2, 4), (4, 6)]
+    calls = []
+
+    def ocr_range(index):
+        calls.append(index)
+        if index == 1 and calls.count(1) == 1:
+            raise TimeoutError("timeout")
+        return [{"markdown": f"r{index}"}, {"markdown": f"r{index}"}]
+
+    progress = []
+    results, errors = pdf_pages.ocr_page_ranges(
+        ranges, ocr_range, max_concurrency=2, retries=1,
+        on_progress=lambda done, total: progress.append((done, total)),
+    )
+
+    assert not errors
+    assert sorted(calls) == [0, 1, 1, 2]
+    assert progress[-1] == (3, 3)
+
+
+def test_failed_range_keeps_page_numbering():
+    """Las páginas de un rango sin OCR se reemplazan por avisos individuales"""
+    ranges = [(0, 2), (2, 4)]
+    pages = pdf_pages.merge_range_pages(ranges, {0: [{"markdown": "a"}, {"markdown": "b"}]})
+
+    assert len(pages) == 4
+    assert pages[3]["markdown"] == "[Página 4: no se pudo aplicar OCR]"
+    assert pdf_pages.describe_ranges([(2, 4), (8, 9)]) == "3-4, 9"
+
+
+if __name__ == "__main__":
+    test_group_ocr_ranges()
+    test_analyze_pdf_classifies_pages()
+    test_merge_keeps_text_layer_pages()
+    test_plan_page_ranges()
+    test_should_split_thresholds()
+    test_write_page_range()
+    test_concurrency_cap_and_order()
+    test_only_failed_ranges_are_retried()
+    test_failed_range_keeps_page_numbering()
+    print("Todas las pruebas de pdf_pages pasaron correctamente")
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de prueba para el módulo rate_limit de Expert Nexus.
+Verifica el cubo de fichas, el reparto por turnos entre sesiones, la pausa
+por Retry-After, el backoff con variación aleatoria y las métricas de cola.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+# Añadir el directorio raíz al path para importar módulos de la aplicación
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+import rate_limit
+
+
+class FakeClock:
+    """Reloj manual para controlar el tiempo en las pruebas"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refill():
+    """El cubo permite la ráfaga inicial y luego se recarga a la tasa fijada"""
+    clock = FakeClock()
+    bucket = rate_limit.TokenBucket(rate=2, capacity=3, clock=clock)
+    for _ in range(3):
+        assert bucket.wait_time() == 0
+        bucket.take()
+    assert abs(bucket.wait_time() - 0.5) < 1e-9
+
+    clock.now += 0.5
+    assert bucket.wait_time() == 0
+
+
+def test_fair_rotation_between_sessions():
+    """Las sesiones se atienden por turnos aunque una encole más solicitudes"""
+    clock = FakeClock()
+    scheduler = rate_limit.RequestScheduler(rate=1, burst=100, clock=clock)
+    entries = [scheduler.enqueue("a") for _ in range(3)] + [scheduler.enqueue("b") for _ in range(2)]
+
+    order = []
+    pending = list(entries)
+    while pending:
+        for entry in list(pending):
+            if scheduler.try_grant(entry) == 0:
+                order.append(entry[1])
+                pending.remove(entry)
+                break
+
+    assert order == ["a", "b", "a", "b", "a"]
+    stats = scheduler.get_stats()
+    assert stats["granted"] == 5
+    assert stats["queue_depth"] == 0
+
+
+def test_retry_after_pauses_all_sessions():
+    """Un 429 con Retry-After pausa la cola para todas las sesiones"""
+    clock = FakeClock()
+    scheduler = rate_limit.RequestScheduler(rate=10, burst=10, clock=clock)
+
+    delay = scheduler.observe(429, {"retry-after": "7"})
+    assert delay == 7
+
+    entry = scheduler.enqueue("otra-sesion")
+    assert abs(scheduler.try_grant(entry) - 7) < 1e-9
+    clock.now += 7
+    assert scheduler.try_grant(entry) == 0
+    assert scheduler.get_stats()["throttled"] == 1
+
+
+def test_jittered_backoff_without_retry_after():
+    """Sin Retry-After la pausa es un backoff acotado con variación aleatoria"""
+    scheduler = rate_limit.RequestScheduler(backoff_base=1, backoff_max=8)
+    delays = {round(scheduler.backoff_delay(3), 6) for _ in range(20)}
+
+    assert all(0 <= delay <= 8 for delay in delays)
+    assert len(delays) > 1
+    assert scheduler.backoff_delay(10) <= 8
+
+
+def test_rate_follows_quota_headers():
+    """La tasa se reduce a la cuota por minuto anunciada por la API"""
+    scheduler = rate_limit.RequestScheduler(rate=5, burst=5)
+    scheduler.observe(200, {"x-ratelimit-limit-req-minute": "60"})
+    assert scheduler.get_stats()["rate"] == 1
+
+
+def test_parse_retry_after_http_date():
+    """Retry-After también puede expresarse como fecha HTTP"""
+    now = time.time()
+    value = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(now + 30))
+    assert 28 <= rate_limit.parse_retry_after(value, now=now) <= 30
+    assert rate_limit.parse_retry_after("no-es-una-fecha") is None
+
+
+def test_blocking_and_async_acquire():
+    """Los hilos y las tareas asíncronas esperan su turno y registran la espera"""
+    scheduler = rate_limit.RequestScheduler(rate=20, burst=1)
+    threads = [threading.Thread(target=scheduler.acquire, args=("hilos",)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    async def acquire_all():
+        await asyncio.gather(*(scheduler.acquire_async("tareas") for _ in range(3)))
+
+    asyncio.run(acquire_all())
+    stats = scheduler.get_stats()
+    assert stats["granted"] == 6
+    assert stats["max_wait"] > 0
+
+
+if __name__ == "__main__":
+    test_token_bucket_refill()
+    test_fair_rotation_between_sessions()
+    test_retry_after_pauses_all_sessions()
+    test_jittered_backoff_without_retry_after()
+    test_rate_follows_quota_headers()
+    test_parse_retry_after_http_date()
+    test_blocking_and_async_acquire()
+    print("Todas las pruebas de rate_limit pasaron correctamente")
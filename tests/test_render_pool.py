@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de prueba para el módulo render_pool de Expert Nexus.
+Verifica que los trabajos de renderizado devuelvan su resultado desde los
+procesos de renderizado, que una espera corta no bloquee hasta el final,
+que un trabajo colgado se cancele al vencer su plazo sin arrastrar a los
+demás, que sin pool se renderice en el hilo actual y que en las carreras
+gane el primer motor con calidad suficiente y se terminen los perdedores.
+"""
+
+import operator
+import os
+import sys
+import tempfile
+import time
+
+# Añadir el directorio raíz al path para importar módulos de la aplicación
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+# Procesos suficientes para que un trabajo colgado no retrase a los demás
+os.environ.setdefault("RENDER_WORKERS", "3")
+
+import render_pool
+
+
+def _scored(value, score, delay):
+    """Competidor de prueba: tarda ``delay`` segundos y devuelve (valor, puntuación)."""
+    time.sleep(delay)
+    return value, score
+
+
+def _slow_marker(path, delay):
+    """Competidor de prueba lento: escribe una marca en ``path`` si llega a terminar."""
+    time.sleep(delay)
+    with open(path, "w") as f:
+        f.write("terminado")
+    return "lento", 1.0
+
+
+def _failing(value, score, delay):
+    raise ValueError("motor roto")
+
+
+def test_job_returns_result_from_pool():
+    """Un trabajo devuelve el resultado calculado en un proceso de renderizado"""
+    job = render_pool.submit_render(operator.mul, 6, 7, deadline=60)
+    assert job.result() == 42
+    assert job.done()
+
+
+def test_short_wait_returns_progress():
+    """Una espera corta informa que el trabajo sigue en curso sin cancelarlo"""
+    job = render_pool.submit_render(time.sleep, 1.5, deadline=60)
+    try:
+        job.result(timeout=0)
+        assert False, "El trabajo no debería haber terminado"
+    except TimeoutError:
+        pass
+    assert not job.done()
+    assert job.result() is None
+    assert job.elapsed() >= 1.5
+
+
+def _sleep_pid(delay):
+    """Trabajo de prueba: tarda ``delay`` segundos y devuelve el PID de su proceso."""
+    time.sleep(delay)
+    return os.getpid()
+
+
+def test_deadline_terminates_hung_job_only():
+    """Un trabajo colgado vence su plazo y solo se termina su proceso"""
+    # Iniciar los procesos antes de medir los plazos
+    render_pool.submit_render(operator.add, 1, 1, deadline=60).result()
+
+    hung = render_pool.submit_render(_sleep_pid, 60, deadline=1)
+    other = render_pool.submit_render(_sleep_pid, 2, deadline=60)
+    started = time.monotonic()
+    try:
+        hung.result()
+        assert False, "El trabajo colgado debería vencer su plazo"
+    except render_pool.RenderDeadlineExceeded:
+        pass
+    assert time.monotonic() - started < 10
+
+    # El otro trabajo termina en su proceso, sin reiniciarse ni reenviarse
+    assert other.result() != os.getpid()
+    assert other.elapsed() < 4
+    assert render_pool.submit_render(operator.add, 2, 3, deadline=60).result() == 5
+
+
+def test_job_finishing_at_deadline_spares_next_job():
+    """Un trabajo que termina justo al vencer su plazo no arrastra al siguiente del mismo proceso"""
+    pool = render_pool.RenderPool(1, name="render-test")
+    pool.submit(operator.add, 1, 1).result()
+
+    for _ in range(5):
+        job = render_pool.RenderJob(_sleep_pid, (0.5,), deadline=0.5, pool=pool)
+        following = pool.submit(_sleep_pid, 0.1)
+        try:
+            job.result()
+        except render_pool.RenderDeadlineExceeded:
+            pass
+        # El trabajo siguiente nunca recibe la terminación dirigida al anterior
+        assert following.result(timeout=30) != os.getpid()
+
+    finished = pool.submit(_sleep_pid, 0)
+    finished.result()
+    assert not pool.terminate(finished)
+    assert pool.submit(operator.add, 2, 2).result(timeout=30) == 4
+
+
+def test_without_pool_renders_inline():
+    """Con RENDER_WORKERS=0 el trabajo se ejecuta en el hilo actual"""
+    previous = os.environ.get("RENDER_WORKERS")
+    os.environ["RENDER_WORKERS"] = "0"
+    try:
+        assert render_pool.get_render_pool() is None
+        assert render_pool.submit_render(operator.add, 2, 2).result(timeout=0) == 4
+        job = render_pool.submit_render(operator.truediv, 1, 0)
+        try:
+            job.result()
+            assert False, "El error del renderizado debería propagarse"
+        except ZeroDivisionError:
+            pass
+    finally:
+        if previous is None:
+            os.environ.pop("RENDER_WORKERS", None)
+        else:
+            os.environ["RENDER_WORKERS"] = previous
+
+
+def test_race_returns_first_acceptable_result():
+    """Gana el primer motor con calidad suficiente; los de baja calidad no ganan"""
+    # Iniciar los procesos de carreras antes de medir los tiempos
+    pool = render_pool.get_race_pool()
+    for future in [pool.submit(_sleep_pid, 0.3) for _ in range(pool.workers)]:
+        future.result()
+
+    stats = render_pool.RaceStats()
+    race = render_pool.RaceJob(
+        [
+            ("lento", _scored, ("lento", 1.0, 5)),
+            ("pobre", _scored, ("pobre", 0.1, 0)),
+            ("medio", _scored, ("medio", 0.9, 0.5)),
+        ],
+        min_score=0.6, deadline=60, stats=stats,
+    )
+    started = time.monotonic()
+    assert race.result() == "medio"
+    assert time.monotonic() - started < 4
+
+    recorded = stats.get_stats()
+    assert recorded["medio"]["win"] == 1
+    assert recorded["medio"]["win_rate"] == 1.0
+    assert recorded["medio"]["mean_seconds"] >= 0.5
+    assert recorded["pobre"]["rejected"] == 1
+    # El perdedor en curso se termina en lugar de esperarlo
+    assert recorded["lento"]["cancelled"] == 1
+    assert recorded["lento"]["win"] == 0
+
+
+def test_race_kills_running_losers():
+    """Un competidor lento que sigue en ejecución se termina al aceptar un ganador"""
+    with tempfile.TemporaryDirectory() as directory:
+        marker = os.path.join(directory, "lento.txt")
+        stats = render_pool.RaceStats()
+        race = render_pool.RaceJob(
+            [
+                ("lento", _slow_marker, (marker, 2)),
+                ("rapido", _scored, ("rapido", 1.0, 0.5)),
+            ],
+            min_score=0.6, deadline=60, stats=stats,
+        )
+        assert race.result() == "rapido"
+        assert stats.get_stats()["lento"]["cancelled"] == 1
+
+        # Si el perdedor siguiera vivo, escribiría su marca al terminar
+        time.sleep(3)
+        assert not os.path.exists(marker)
+
+        # El proceso terminado se reemplaza y el pool de carreras sigue disponible
+        race = render_pool.RaceJob(
+            [("nuevo", _scored, ("nuevo", 1.0, 0))], min_score=0.6, deadline=60, stats=stats,
+        )
+        assert race.result() == "nuevo"
+
+
+def test_race_falls_back_to_best_or_fails():
+    """Sin calidad suficiente se usa el mejor resultado; si todos fallan, se informa"""
+    stats = render_pool.RaceStats()
+    race = render_pool.RaceJob(
+        [("a", _scored, ("a", 0.2, 0)), ("b", _scored, ("b", 0.4, 0))],
+        min_score=0.9, deadline=60, stats=stats,
+    )
+    assert race.result() == "b"
+    assert stats.get_stats()["a"]["rejected"] == 1
+
+    race = render_pool.RaceJob(
+        [("roto", _failing, ("roto", 1.0, 0))], min_score=0.5, deadline=60, stats=stats,
+    )
+    try:
+        race.result()
+        assert False, "Una carrera sin resultados debería fallar"
+    except RuntimeError as e:
+        assert "motor roto" in str(e)
+    assert stats.get_stats()["roto"]["failed"] == 1
+
+
+def test_race_without_pool_stops_at_first_acceptable():
+    """Sin pool los competidores se prueban en orden y se para en el primero aceptable"""
+    previous = os.environ.get("RENDER_WORKERS")
+    os.environ["RENDER_WORKERS"] = "0"
+    try:
+        stats = render_pool.RaceStats()
+        race = render_pool.RaceJob(
+            [("primero", _scored, ("primero", 1.0, 0)), ("segundo", _scored, ("segundo", 1.0, 0))],
+            min_score=0.5, deadline=60, stats=stats,
+        )
+        assert race.result(timeout=0) == "primero"
+        assert "segundo" not in stats.get_stats()
+    finally:
+        if previous is None:
+            os.environ.pop("RENDER_WORKERS", None)
+        else:
+            os.environ["RENDER_WORKERS"] = previous
+
+
+if __name__ == "__main__":
+    test_job_returns_result_from_pool()
+    test_short_wait_returns_progress()
+    test_deadline_terminates_hung_job_only()
+    test_job_finishing_at_deadline_spares_next_job()
+    test_without_pool_renders_inline()
+    test_race_returns_first_acceptable_result()
+    test_race_kills_running_losers()
+    test_race_falls_back_to_best_or_fails()
+    test_race_without_pool_stops_at_first_acceptable()
+    print("Todas las pruebas de render_pool pasaron correctamente")
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script de prueba para el volcado de cargas a disco y la carga multipart de
+documentos en Expert Nexus.
+Verifica que el archivo se copie por bloques con su huella, que el tamaño
+decida el medio de envío y que la carga multipart lea el archivo desde disco.
+"""
+
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Añadir el directorio raíz al path para importar módulos de la aplicación
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+import document_ingestion
+import mistral_client
+import ocr_cache
+
+
+class ChunkCountingFile(io.BytesIO):
+    """Archivo en memoria que cuenta las lecturas realizadas"""
+
+    name = "informe.pdf"
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return super().read(size)
+
+
+def test_spool_hashes_while_copying():
+    """El volcado se hace por bloques y calcula la misma huella que los bytes"""
+    data = os.urandom(300 * 1024)
+    file = ChunkCountingFile(data)
+    with tempfile.TemporaryDirectory() as directory:
+        upload = document_ingestion.spool_upload(file, directory=directory, chunk_size=64 * 1024)
+
+        assert upload.sha256 == hashlib.sha256(data).hexdigest()
+        assert upload.size == len(data)
+        assert upload.path.endswith(".pdf")
+        assert upload.read_bytes() == data
+        assert file.reads > 1
+        assert file.tell() == 0
+
+        upload.cleanup()
+        assert not os.path.exists(upload.path)
+
+
+def test_cache_key_reuses_content_hash():
+    """La clave de caché con huella precalculada coincide con la de los bytes"""
+    data = b"contenido del documento"
+    expected = ocr_cache.cache_key(data, "modelo", {"file_type": "PDF"})
+    reused = ocr_cache.cache_key(
+        None, "modelo", {"file_type": "PDF"}, content_hash=hashlib.sha256(data).hexdigest()
+    )
+    assert reused == expected
+
+
+def test_upload_mode_thresholds():
+    """El modo automático carga los documentos grandes y envía en base64 los pequeños"""
+    saved = {name: os.environ.get(name) for name in ("OCR_UPLOAD_MODE", "OCR_INLINE_MAX_MB")}
+    try:
+        os.environ["OCR_UPLOAD_MODE"] = "auto"
+        os.environ["OCR_INLINE_MAX_MB"] = "1"
+        assert not mistral_client.use_file_upload(512 * 1024)
+        assert mistral_client.use_file_upload(2 * 1024 * 1024)
+
+        os.environ["OCR_UPLOAD_MODE"] = "inline"
+        assert not mistral_client.use_file_upload(50 * 1024 * 1024)
+
+        os.environ["OCR_UPLOAD_MODE"] = "multipart"
+        assert mistral_client.use_file_upload(10)
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def test_multipart_upload_from_disk():
+    """La carga envía el archivo en una solicitud multipart a un servidor local"""
+    received = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            received["content_type"] = self.headers["Content-Type"]
+            received["authorization"] = self.headers["Authorization"]
+            received["body"] = body
+            payload = b'{"id": "file-123"}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    client = mistral_client.MistralClient("clave", base_url=f"http://127.0.0.1:{server.server_address[1]}")
+    data = os.urandom(128 * 1024)
+    try:
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as spool:
+            spool.write(data)
+            spool.flush()
+            with open(spool.name, "rb") as fileobj:
+                file_id = client.upload_file(fileobj, "informe.pdf")
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+
+    assert file_id == "file-123"
+    assert received["content_type"].startswith("multipart/form-data")
+    assert received["authorization"] == "Bearer clave"
+    assert data in received["body"]
+    assert b'name="purpose"' in received["body"]
+
+
+if __name__ == "__main__":
+    test_spool_hashes_while_copying()
+    test_cache_key_reuses_content_hash()
+    test_upload_mode_thresholds()
+    test_multipart_upload_from_disk()
+    print("Todas las pruebas de carga de documentos pasaron correctamente")